@@ -23,6 +23,7 @@ from stratified_bayesian_optimization.lib.util import (
     wrapper_gradient_acquisition_function,
     wrapper_sgd,
     wrapper_evaluate_gradient_ei_sample_params,
+    screen_points,
 )
 from stratified_bayesian_optimization.lib.constant import (
     LBFGS_NAME,
@@ -89,11 +90,12 @@ class EI(object):
         :return: np.array(k)
         """
 
+        # Only the marginal variances are needed.
         post_parameters = self.gp.compute_posterior_parameters(
-            point, var_noise, mean, parameters_kernel)
+            point, var_noise, mean, parameters_kernel, only_variance=True)
+        cov = post_parameters['var']
 
         mu = post_parameters['mean']
-        cov = post_parameters['cov']
 
         cov = np.clip(cov, 0, None)
 
@@ -111,6 +113,32 @@ class EI(object):
 
         return evaluation
 
+    def evaluate_samples_parameters(self, point, parameters):
+        """
+        Compute the EI acquisition function for several samples of the parameters of the model,
+        using the batched posterior parameters of the model.
+
+        :param point: np.array(kxn)
+        :param parameters: np.array(Sxl), each row is [var_noise, mean, parameters_kernel]
+        :return: np.array(Sxk)
+        """
+
+        post_parameters = self.gp.compute_posterior_parameters_samples(point, parameters)
+
+        mu = post_parameters['mean']
+        var = np.clip(post_parameters['var'], 0, None)
+
+        best = np.array([self.gp.get_historical_best_solution(
+            parameter[0], parameter[1], parameter[2:], self.noisy_evaluations)
+            for parameter in parameters]).reshape((parameters.shape[0], 1))
+
+        normalized_factor = (mu - best) / np.sqrt(var)
+        first_term = (mu - best) * norm.cdf(normalized_factor)
+
+        second_term = np.sqrt(var) * norm.pdf(normalized_factor)
+
+        return first_term + second_term
+
     def evaluate_gradient_sample_params(self, point, random_seed=None):
         """
         Computes the gradient of EI taking a random sample of the parameters of the model.
@@ -238,10 +266,15 @@ class EI(object):
             point_dict = {}
             for j in xrange(start.shape[0]):
                 point_dict[j] = start[j, :]
-            args = (False, None, True, 0, self, DEFAULT_N_PARAMETERS)
-            ei_values = Parallel.run_function_different_arguments_parallel(
-                wrapper_objective_acquisition_function, point_dict, *args)
-            values = [ei_values[i] for i in ei_values]
+            # The starting points are screened with chunked vectorized evaluations, using only
+            # marginal variances.
+            if self.gp.name_model == BAYESIAN_QUADRATURE:
+                samples_parameters = self.gp.gp.samples_parameters
+            else:
+                samples_parameters = self.gp.samples_parameters
+            parameters = np.array(samples_parameters[-DEFAULT_N_PARAMETERS:])
+            f = lambda x: np.mean(self.evaluate_samples_parameters(x, parameters), axis=0)
+            values = list(screen_points(f, start))
             values_index = sorted(range(len(values)), key=lambda k: values[k])
             values_index = values_index[-n_best_restarts:]
             start = []
@@ -313,6 +346,7 @@ class EI(object):
         logger.info(optimal_solutions.get(ind_max))
 
         self.optimization_results.append(optimal_solutions.get(ind_max))
+        Parallel.update_version(self)
 
         return optimal_solutions.get(ind_max)
 
@@ -439,20 +473,8 @@ class EI(object):
 
         # TODO: extend to the case where w can be continuous
 
-        n = vectors.shape[0]
-
-        points = {}
-        for i in xrange(n):
-            points[i] = vectors[i, :]
-
-        args = (False, None, False, 0, self,)
-        val = Parallel.run_function_different_arguments_parallel(
-            wrapper_objective_acquisition_function, points, *args)
-
-        values = np.zeros(n)
-        for i in xrange(n):
-            values[i] = val.get(i)
-
+        # EI only needs the marginal variances, so the whole grid is evaluated at once.
+        values = self.evaluate(vectors)
 
 
         f_name = self._filename_ei_evaluations(iteration=iteration,
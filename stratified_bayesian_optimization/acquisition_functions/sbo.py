@@ -32,6 +32,7 @@ from stratified_bayesian_optimization.bayesian.bayesian_evaluations import Bayes
 from stratified_bayesian_optimization.lib.affine_break_points import (
     AffineBreakPointsPrep,
     AffineBreakPoints,
+    upper_envelope,
 )
 from stratified_bayesian_optimization.services.domain import (
     DomainService,
@@ -61,9 +62,15 @@ from stratified_bayesian_optimization.lib.util import (
     wrapper_evaluate_sbo_by_sample_no_sp,
     wrapper_optimize_posterior_mean,
 )
-from stratified_bayesian_optimization.lib.constant import DEFAULT_N_PARAMETERS, DEFAULT_N_SAMPLES
+from stratified_bayesian_optimization.lib.constant import (
+    DEFAULT_N_PARAMETERS,
+    DEFAULT_N_SAMPLES,
+    SBO_SCREENING_STD,
+)
 from stratified_bayesian_optimization.util.json_file import JSONFile
 from stratified_bayesian_optimization.lib.util import wrapper_evaluate_sbo
+from stratified_bayesian_optimization.lib.la_functions import posterior_cov_solve
+from stratified_bayesian_optimization.lib.lru_cache import LRUCache
 from stratified_bayesian_optimization.acquisition_functions.ei import EI
 from stratified_bayesian_optimization.acquisition_functions.multi_task import MultiTasks
 from stratified_bayesian_optimization.numerical_tools.bayesian_quadrature import BayesianQuadrature
@@ -87,16 +94,41 @@ class SBO(object):
                                 'json'.format
 
 
-    def __init__(self, bayesian_quadrature, discretization_domain=None):
+    def __init__(self, bayesian_quadrature, discretization_domain=None,
+                 adaptive_discretization=False):
         """
 
         :param bayesian_quadrature: a bayesian quadrature instance.
         :param discretization_domain: np.array(mxl), discretization of the domain of x.
+        :param adaptive_discretization: (boolean) If True, the SBO is computed only on the points
+            of discretization_domain that are likely to be in the upper envelope of the lines
+            a(x) + b(x, candidate)z (see update_active_discretization). It's ignored by the Monte
+            Carlo estimation of the SBO (monte_carlo=True), which doesn't use the discretization,
+            and by the evaluations with other samples of the parameters of the model.
         """
 
         self.bq = bayesian_quadrature
+        self.discretization_domain = discretization_domain
+
+        # Points of discretization_domain used to compute the SBO
         self.discretization = discretization_domain
 
+        self.adaptive_discretization = adaptive_discretization
+
+        # Data of the adaptive discretization: indexes of the active points of
+        # discretization_domain, points that have been in the upper envelope, and the number of
+        # training points and the parameters of the model used to compute the active points.
+        self.active_indexes = None
+        self.envelope_points = None
+        if adaptive_discretization:
+            self.envelope_points = np.zeros(discretization_domain.shape[0], dtype=bool)
+        self.state_active = None
+
+        # Quadratures used to screen the points of discretization_domain, for each parameters of
+        # the kernel: {'historical_points': np.array(nxk), 'vec_covs': np.array(mxn), B(x, i),
+        # 'prior_var': np.array(m), Var(G(x))}
+        self.screening_quadratures = LRUCache()
+
         self.bounds_opt = deepcopy(self.bq.bounds)
         if self.bq.separate_tasks and not self.bq.task_continue:
             self.bounds_opt.append([None, None])
@@ -138,7 +170,7 @@ class SBO(object):
                                random_seed, n_samples_parameters)
 
     def evaluate_sample(self, point, candidate_point, sample, var_noise=None, mean=None,
-                        parameters_kernel=None, cache=True, n_threads=0, clear_cache=True):
+                        parameters_kernel=None, cache=True, n_threads=0, clear_cache=False):
         """
         Evaluate a sample of a_{n+1}(point) given that candidate_point is chosen.
 
@@ -150,6 +182,8 @@ class SBO(object):
         :param parameters_kernel: np.array(l)
         :param cache: (boolean) Use cached data and cache data if cache is True
         :param n_threads: (int)
+        :param clear_cache: (boolean) If True, the cached data of the other samples of the
+            hyperparameters is removed.
         :return: float
         """
 
@@ -371,6 +405,7 @@ class SBO(object):
 
         if cache:
             self.samples = samples
+            Parallel.update_version(self)
         start = self.generate_starting_points_evaluate_mc(n_restarts, cache=cache)
 
         return samples, start
@@ -395,6 +430,7 @@ class SBO(object):
 
         if cache:
             self.starting_points_sbo = start
+            Parallel.update_version(self)
         return start
 
 
@@ -517,6 +553,7 @@ class SBO(object):
 
         self.mc_bayesian = {}
         self.mc_bayesian[tuple(candidate_point[0,:])] = sbo_value
+        Parallel.update_version(self)
 
         return sbo_value
 
@@ -618,6 +655,7 @@ class SBO(object):
                         self.bq.optimal_solutions[index_cache] = []
 
                     self.bq.optimal_solutions[index_cache].append(opt)
+                Parallel.update_version(self.bq)
 
         for l in xrange(n_candidate_points):
             gradients = []
@@ -1325,6 +1363,8 @@ class SBO(object):
                 self.optimal_samples[index_cache_2]['max'][i] = max_value['max']
                 self.optimal_samples[index_cache_2]['optimum'][i] = maximum
 
+        Parallel.update_version(self)
+
         return {'value': np.mean(max_values) - max_mean, 'std': np.std(max_values) / n_samples}
 
     def gradient_mc(self, candidate_point, var_noise=None, mean=None, parameters_kernel=None,
@@ -1406,7 +1446,9 @@ class SBO(object):
         :return: float
         """
 
-        vectors = self.bq.compute_posterior_parameters_kg(self.discretization, point,
+        discretization, active = self._get_discretization(var_noise, mean, parameters_kernel)
+
+        vectors = self.bq.compute_posterior_parameters_kg(discretization, point,
                                                           var_noise=var_noise, mean=mean,
                                                           parameters_kernel=parameters_kernel,
                                                           cache=cache, n_threads=n_threads)
@@ -1422,6 +1464,9 @@ class SBO(object):
         keep1, c = AffineBreakPoints(a, b)
         keep1 = keep1.astype(np.int64)
 
+        if active:
+            self._track_envelope(keep[keep1])
+
         return self.hvoi(b, c, keep1)
 
 
@@ -1440,7 +1485,9 @@ class SBO(object):
         :return: np.array(n)
         """
 
-        vectors = self.bq.compute_posterior_parameters_kg(self.discretization, point,
+        discretization = self._get_discretization(var_noise, mean, parameters_kernel)[0]
+
+        vectors = self.bq.compute_posterior_parameters_kg(discretization, point,
                                                           var_noise=var_noise, mean=mean,
                                                           parameters_kernel=parameters_kernel,
                                                           cache=cache, n_threads=n_threads)
@@ -1462,7 +1509,7 @@ class SBO(object):
         c2=np.abs(c[0:M-1])
         evalC=norm.pdf(c2)
 
-        gradients = self.bq.gradient_vector_b(point, self.discretization[keep, :],
+        gradients = self.bq.gradient_vector_b(point, discretization[keep, :],
                                               var_noise=var_noise, mean=mean,
                                               parameters_kernel=parameters_kernel, cache=cache,
                                               keep_indexes=keep, n_threads=n_threads)
@@ -1473,6 +1520,280 @@ class SBO(object):
 
         return gradient
 
+    def evaluate_candidate_points(self, candidate_points, var_noise=None, mean=None,
+                                  parameters_kernel=None, cache=True, compute_gradient=False):
+        """
+        Evaluate the acquisition function, and optionally its gradient, at several points at once.
+        The posterior mean on the discretization, the Cholesky solve and the quadratures of the
+        discretization are computed once and shared by all the points.
+
+        :param candidate_points: np.array(rxn)
+        :param var_noise: float
+        :param mean: float
+        :param parameters_kernel: np.array(l)
+        :param cache: (boolean) Use cached data and cache data if cache is True
+        :param compute_gradient: (boolean)
+
+        :return: {
+            'evaluations': np.array(r),
+            'gradient': np.array(rxn) or None,
+        }
+        """
+
+        discretization, active = self._get_discretization(var_noise, mean, parameters_kernel)
+
+        vectors = self.bq.compute_posterior_parameters_kg_many_cp(
+            discretization, candidate_points, cache=cache, var_noise=var_noise, mean=mean,
+            parameters_kernel=parameters_kernel)
+
+        a = vectors['a']
+        b = vectors['b']
+
+        r = candidate_points.shape[0]
+        evaluations = np.zeros(r)
+
+        gradient = None
+        if compute_gradient:
+            gradient = np.zeros(candidate_points.shape)
+
+        # The VOI of the candidates whose vectors b aren't finite is zero.
+        finite = np.where(np.all(np.isfinite(b), axis=0))[0]
+
+        if len(finite) == 0:
+            return {
+                'evaluations': evaluations,
+                'gradient': gradient,
+            }
+
+        b = b[:, finite]
+        envelope = upper_envelope(a, b)
+        evaluations[finite] = self.hvoi_batch(b, envelope)
+
+        if active:
+            self._track_envelope(np.concatenate((envelope['lines'], envelope['next_lines'])))
+
+        if compute_gradient and len(envelope['columns']) > 0:
+            columns = finite[envelope['columns']]
+            n_pairs = len(columns)
+
+            lines = np.concatenate((envelope['lines'], envelope['next_lines']))
+            columns_lines = np.concatenate((columns, columns))
+
+            gradients = self.bq.gradient_vector_b_many_cp(
+                discretization, candidate_points, lines, columns_lines, vectors,
+                parameters_kernel=parameters_kernel)
+
+            eval_c = norm.pdf(np.abs(envelope['breakpoints']))
+            contributions = (gradients[n_pairs:, :] - gradients[0: n_pairs, :]) * eval_c[:, None]
+
+            for i in xrange(candidate_points.shape[1]):
+                gradient[:, i] = np.bincount(columns, weights=contributions[:, i], minlength=r)
+
+        return {
+            'evaluations': evaluations,
+            'gradient': gradient,
+        }
+
+    def screen_discretization(self):
+        """
+        Screens the points of discretization_domain using the posterior mean a(x) and the posterior
+        standard deviation s(x) of G(x), computed with the current parameters of the model. Let x*
+        be the maximizer of a. Since |b(x, candidate)| <= s(x) for every candidate, the line
+        a(x) + b(x, candidate)z can only be above the line of x* when
+        |z| >= (a(x*) - a(x)) / (s(x) + s(x*)). The points where this bound is at most
+        SBO_SCREENING_STD pass the screening.
+
+        This is a heuristic: the points that don't pass the screening can still be in the upper
+        envelope, but only for |z| > SBO_SCREENING_STD.
+
+        :return: np.array(m), boolean
+        """
+
+        var_noise = self.bq.gp.var_noise.value[0]
+        mean = self.bq.gp.mean.value[0]
+        parameters_kernel = self.bq.gp.kernel.hypers_values_as_array
+
+        quadratures = self.get_screening_quadratures(parameters_kernel)
+        vec_covs = quadratures['vec_covs']
+
+        chol_solve = self.bq.gp._cholesky_solve_vectors_for_posterior(
+            var_noise, mean, parameters_kernel)
+
+        mean = mean + np.dot(vec_covs, chol_solve['solve'])
+        solve = posterior_cov_solve(chol_solve['chol'], vec_covs.transpose())
+        var = quadratures['prior_var'] - np.einsum('ij,ji->i', vec_covs, solve)
+        std = np.sqrt(np.clip(var, 0, None))
+
+        index_max = np.argmax(mean)
+
+        return mean + SBO_SCREENING_STD * (std + std[index_max]) >= mean[index_max]
+
+    def get_screening_quadratures(self, parameters_kernel):
+        """
+        Gets the quadratures B(x, i) and the prior variances of G(x) for all the points of
+        discretization_domain. They're cached for each parameters of the kernel, and if new points
+        were added to the data of the GP, only the columns of the new points are computed.
+
+        :param parameters_kernel: np.array(l)
+        :return: {'historical_points': np.array(nxk), 'vec_covs': np.array(mxn),
+            'prior_var': np.array(m)}
+        """
+
+        historical_points = self.bq.gp.data['points']
+        index = tuple(parameters_kernel)
+        quadratures = self.screening_quadratures.get(index)
+
+        if quadratures is not None:
+            n_cached = quadratures['vec_covs'].shape[1]
+            if n_cached <= historical_points.shape[0] and np.array_equal(
+                    quadratures['historical_points'], historical_points[0: n_cached, :]):
+                if n_cached < historical_points.shape[0]:
+                    new_columns = self.bq.compute_vectors_b(
+                        self.discretization_domain, None, historical_points[n_cached:, :],
+                        parameters_kernel, True, False, True)['vec_covs']
+                    quadratures = {
+                        'historical_points': historical_points.copy(),
+                        'vec_covs': np.concatenate((quadratures['vec_covs'], new_columns),
+                                                   axis=1),
+                        'prior_var': quadratures['prior_var'],
+                    }
+                    self.screening_quadratures[index] = quadratures
+                return quadratures
+
+        vec_covs = self.bq.compute_vectors_b(
+            self.discretization_domain, None, historical_points, parameters_kernel, True, False,
+            True)['vec_covs']
+
+        prior_var = self.bq.evaluate_quadrate_cov_points(self.discretization_domain,
+                                                         parameters_kernel)
+
+        quadratures = {
+            'historical_points': historical_points.copy(),
+            'vec_covs': vec_covs,
+            'prior_var': prior_var,
+        }
+        self.screening_quadratures[index] = quadratures
+
+        return quadratures
+
+    def _is_current_model(self, var_noise=None, mean=None, parameters_kernel=None):
+        """
+        Checks if the parameters are the current parameters of the model. The parameters that are
+        None are the current ones.
+
+        :param var_noise: float
+        :param mean: float
+        :param parameters_kernel: np.array(l)
+        :return: boolean
+        """
+        gp = self.bq.gp
+
+        if var_noise is not None and var_noise != gp.var_noise.value[0]:
+            return False
+
+        if mean is not None and mean != gp.mean.value[0]:
+            return False
+
+        return parameters_kernel is None or \
+            np.array_equal(parameters_kernel, gp.kernel.hypers_values_as_array)
+
+    def _get_discretization(self, var_noise=None, mean=None, parameters_kernel=None):
+        """
+        Gets the points of the discretization used to compute the SBO with the parameters of the
+        model. The adaptive discretization is screened with the current parameters of the model,
+        so the other parameters use all the points of discretization_domain.
+
+        :param var_noise: float
+        :param mean: float
+        :param parameters_kernel: np.array(l)
+        :return: (np.array(mxl), boolean), the points and True if they're the active points of the
+            adaptive discretization. The upper envelope is only tracked on the active points.
+        """
+
+        if not self.adaptive_discretization:
+            return self.discretization, False
+
+        self.update_active_discretization()
+
+        if self._is_current_model(var_noise, mean, parameters_kernel):
+            return self.discretization, True
+
+        return self.discretization_domain, False
+
+    def update_active_discretization(self, force=False):
+        """
+        Updates the points of discretization_domain used to compute the SBO if the discretization
+        is adaptive. The active points are the points that pass the screening of
+        screen_discretization, and the points that have been in the upper envelope of the lines
+        a(x) + b(x, candidate)z. The active points are only refreshed when the GP has new training
+        points or new parameters, or if force is True, e.g. before each optimization of the SBO.
+        So the SBO doesn't change during an optimization.
+
+        The quadratures cached by the Bayesian quadrature for the current parameters of the kernel
+        follow the active points: the rows of the points that leave are dropped, and the rows of
+        the new points are taken from the quadratures of the screening. The quadratures of the
+        other parameters are computed on all the points of discretization_domain.
+
+        :param force: (boolean) If True, the active points are refreshed.
+        """
+
+        if not self.adaptive_discretization:
+            return
+
+        parameters_kernel = self.bq.gp.kernel.hypers_values_as_array
+        state = (self.bq.gp.data['points'].shape[0], self.bq.gp.var_noise.value[0],
+                 self.bq.gp.mean.value[0], tuple(parameters_kernel))
+
+        if not force and self.active_indexes is not None and state == self.state_active:
+            return
+
+        active_indexes = np.where(self.screen_discretization() | self.envelope_points)[0]
+
+        index = (tuple(parameters_kernel), )
+        previous_indexes = self.active_indexes
+
+        if self.state_active is not None and self.state_active[3] != index[0]:
+            # The quadratures of the previous parameters followed the active points.
+            if (self.state_active[3], ) in self.bq.cache_quadratures:
+                del self.bq.cache_quadratures[(self.state_active[3], )]
+            previous_indexes = None
+
+        if previous_indexes is None:
+            previous_indexes = np.arange(self.discretization_domain.shape[0])
+
+        if not np.array_equal(active_indexes, np.sort(previous_indexes)):
+            rows = np.where(np.in1d(previous_indexes, active_indexes))[0]
+            new_indexes = np.setdiff1d(active_indexes, previous_indexes)
+
+            known_rows = {
+                index: self.get_screening_quadratures(parameters_kernel)['vec_covs'][
+                    new_indexes, :]}
+
+            self.bq.change_points_cached_quadratures(
+                rows, self.discretization_domain[new_indexes, :], known_rows=known_rows,
+                indexes=[index])
+
+            # The kept points are followed by the new points, as the rows of the cached data.
+            previous_indexes = np.concatenate((previous_indexes[rows], new_indexes))
+
+            logger.info("The adaptive discretization has %d of %d points" % (
+                len(active_indexes), self.discretization_domain.shape[0]))
+
+        self.active_indexes = previous_indexes
+        self.discretization = self.discretization_domain[self.active_indexes, :]
+        self.state_active = state
+        Parallel.update_version(self)
+
+    def _track_envelope(self, indexes):
+        """
+        Saves the points of the active discretization that are in the upper envelope.
+
+        :param indexes: np.array(int), indexes of the rows of self.discretization
+        """
+
+        self.envelope_points[self.active_indexes[indexes]] = True
+        Parallel.update_version(self)
+
     def objective_voi(self, point, monte_carlo=False, n_samples=1, n_restarts=1, n_best_restarts=0,
                       n_threads=0, method_opt=None, *model_params, **opt_params_mc):
         """
@@ -1631,6 +1952,10 @@ class SBO(object):
         elif n_samples_parameters > 0 and len(self.bq.gp.samples_parameters) < n_parameters:
             self.bq.gp.sample_parameters(n_parameters - len(self.bq.gp.samples_parameters))
 
+        # The active points only change between optimizations, so the points that were in the
+        # upper envelope during the last optimization are added now.
+        self.update_active_discretization(force=True)
+
         # if n_samples_parameters > 0 and compute_max_mean_bayesian:
         #     parameters = self.bq.gp.samples_parameters[-n_parameters:]
         #
@@ -1772,12 +2097,24 @@ class SBO(object):
                         candidate_points.append(start[i, :])
                     candidate_points = np.array(candidate_points)
 
-                    output = self.evaluate_mc_bayesian_candidate_points_no_restarts(
-                        candidate_points, n_parameters, default_n_samples, default_restarts_mc,
-                        n_threads=0, compute_max_mean=True,
-                        compute_gradient=False, method_opt=method_opt_mc, **opt_params_mc)
-
-                    evaluations = output['evaluations']
+                    if not monte_carlo and n_samples_parameters == 0:
+                        evaluations = self.evaluate_candidate_points(
+                            candidate_points)['evaluations']
+                    elif not monte_carlo:
+                        parameters = self.bq.gp.samples_parameters[-n_parameters:]
+                        evaluations = []
+                        for parameter in parameters:
+                            evaluations.append(self.evaluate_candidate_points(
+                                candidate_points, var_noise=parameter[0], mean=parameter[1],
+                                parameters_kernel=parameter[2:])['evaluations'])
+                        evaluations = np.mean(evaluations, axis=0)
+                    else:
+                        output = self.evaluate_mc_bayesian_candidate_points_no_restarts(
+                            candidate_points, n_parameters, default_n_samples,
+                            default_restarts_mc, n_threads=0, compute_max_mean=True,
+                            compute_gradient=False, method_opt=method_opt_mc, **opt_params_mc)
+
+                        evaluations = output['evaluations']
 
                     values = values_ei + list(evaluations)
                     values_index = sorted(range(len(values)), key=lambda k: values[k])
@@ -1946,6 +2283,7 @@ class SBO(object):
             optimal_solutions.get(ind_max)['gradient'] = 'unavailable'
 
         self.optimization_results.append(optimal_solutions.get(ind_max))
+        Parallel.update_version(self)
 
         return optimal_solutions.get(ind_max)
 
@@ -1960,6 +2298,23 @@ class SBO(object):
         else:
             return 0
 
+    @staticmethod
+    def hvoi_batch(b, envelope):
+        """
+        Computes hvoi for each column of b at once.
+
+        :param b: np.array(nxr)
+        :param envelope: upper envelope of the lines defined by the columns of b, as returned by
+            upper_envelope
+        :return: np.array(r)
+        """
+        columns = envelope['columns']
+        c = -np.abs(envelope['breakpoints'])
+        tmp = norm.pdf(c) + c * norm.cdf(c)
+        values = (b[envelope['next_lines'], columns] - b[envelope['lines'], columns]) * tmp
+
+        return np.bincount(columns, weights=values, minlength=b.shape[1])
+
     def clean_cache(self):
         """
         Cleans the cache
@@ -1970,6 +2325,7 @@ class SBO(object):
         self.starting_points_sbo = None
         self.mc_bayesian = {}
         self.bq.optimal_solutions = {}
+        Parallel.update_version(self)
 
     def write_debug_data(self, problem_name, model_type, training_name, n_training, random_seed,
                          monte_carlo=False, n_samples_parameters=0):
@@ -47,11 +47,13 @@ class RunSpecEntity(Model):
     simplex_domain = IntType(required=False)
 
     name_model = StringType(required=False)
+    n_inducing_points = IntType(required=False)  # Used only for the sparse GP model
     type_kernel = ListType(StringType, required=True)
     dimensions = ListType(IntType, required=True)
     mle = BooleanType(required=False)
     thinning = IntType(required=False)
     n_burning = IntType(required=False)
+    n_chains = IntType(required=False)
     max_steps_out = IntType(required=False)
     training_data = BaseType()
 
@@ -84,6 +86,10 @@ class RunSpecEntity(Model):
     n_restarts = IntType(required=False)
     n_best_restarts = IntType(required=False)
 
+    # Computes sbo only on the points of the discretization that can be in the upper envelope
+    # (ignored when the sbo is estimated by Monte Carlo)
+    adaptive_discretization = BooleanType(required=False)
+
 
     # We use only training points when reading GP model from cache
     use_only_training_points = BooleanType(required=False)
@@ -151,11 +157,13 @@ class RunSpecEntity(Model):
         parallel = spec.get('parallel', True)
 
         name_model = spec.get('name_model', 'gp_fitting_gaussian')
+        n_inducing_points = spec.get('n_inducing_points')
         type_kernel = spec.get('type_kernel')
         dimensions = spec.get('dimensions')
         mle = spec.get('mle', True)
         thinning = spec.get('thinning', 0)
         n_burning = spec.get('n_burning', 0)
+        n_chains = spec.get('n_chains', 1)
         max_steps_out = spec.get('max_steps_out', 1)
         training_data = spec.get('training_data')
 
@@ -226,12 +234,14 @@ class RunSpecEntity(Model):
             'parallel': parallel,
             'type_bounds': type_bounds,
             'name_model': name_model,
+            'n_inducing_points': n_inducing_points,
             'type_kernel': type_kernel,
             'dimensions': dimensions,
             'mle': mle,
             'optimize_only_posterior_mean': optimize_only_posterior_mean,
             'thinning': thinning,
             'n_burning': n_burning,
+            'n_chains': n_chains,
             'max_steps_out': max_steps_out,
             'training_data': training_data,
             'x_domain': x_domain,
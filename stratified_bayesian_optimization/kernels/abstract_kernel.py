@@ -2,10 +2,40 @@ from __future__ import absolute_import
 
 from abc import ABCMeta, abstractmethod
 
+import copy
+
+import numpy as np
+
+from stratified_bayesian_optimization.lib.constant import CACHE_MAX_SIZE_KERNELS
+from stratified_bayesian_optimization.lib.lru_cache import LRUCache
+
+
+def hashable_parameters(value):
+    """
+    Converts arrays, lists and dictionaries of parameters to nested tuples, so they can be used as
+    keys of a dictionary.
+
+    :param value: np.array, list, tuple, dict or number
+    :return: hashable object
+    """
+    if isinstance(value, np.ndarray):
+        return value.dtype.str, value.shape, value.tobytes()
+    if isinstance(value, (list, tuple)):
+        return tuple(hashable_parameters(element) for element in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, hashable_parameters(element))
+                            for key, element in value.iteritems()))
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
 
 class AbstractKernel(object):
     __metaclass__ = ABCMeta
 
+    # Kernels defined by compiled_kernel, shared by all the models of the process.
+    _compiled_kernels = LRUCache(max_size=CACHE_MAX_SIZE_KERNELS)
+
     def __init__(self, name, dimension, dimension_parameters):
         """
 
@@ -47,6 +77,31 @@ class AbstractKernel(object):
     def define_kernel_from_array(cls, dimension, params):
         raise NotImplementedError("Not implemented")
 
+    @classmethod
+    def compiled_kernel(cls, dimension, params, *args, **kernel_parameters):
+        """
+        Gets the kernel defined by params, as define_kernel_from_array. The kernels are cached by
+        the value of their parameters, so the evaluate_*_defined_by_params methods don't define
+        the ParameterEntity objects, or compute the covariance matrix of the tasks, on every call.
+        The returned kernel is shared, and it must not be modified.
+
+        :param dimension: dimension of the kernel, as in define_kernel_from_array
+        :param params: parameters of the kernel, as in define_kernel_from_array
+        :return: kernel instance
+        """
+        key = (cls, hashable_parameters(dimension), hashable_parameters(params),
+               hashable_parameters(args), hashable_parameters(kernel_parameters))
+
+        kernel = cls._compiled_kernels.get(key)
+
+        if kernel is None:
+            # The parameters are copied because the caller may modify its arrays later.
+            kernel = cls.define_kernel_from_array(
+                dimension, copy.deepcopy(params), *args, **kernel_parameters)
+            cls._compiled_kernels[key] = kernel
+
+        return kernel
+
     @classmethod
     @abstractmethod
     def define_default_kernel(cls, dimension, bounds, default_values, parameters_priors):
@@ -60,14 +115,58 @@ class AbstractKernel(object):
     def cross_cov(self, inputs_1, inputs_2):
         raise NotImplementedError("Not implemented")
 
+    def cov_diagonal(self, inputs):
+        """
+        Computes the diagonal of cov(inputs) without computing the other entries.
+
+        :param inputs: np.array(nxd)
+        :return: np.array(n)
+        """
+        return np.array([self.cross_cov(inputs[i: i + 1, :], inputs[i: i + 1, :])[0, 0]
+                         for i in xrange(inputs.shape[0])])
+
     @abstractmethod
     def gradient_respect_parameters(self, inputs):
         raise NotImplementedError("Not implemented")
 
+    def cov_and_gradient_respect_parameters(self, inputs):
+        """
+        Computes cov(inputs) and its gradient respect to the parameters. Kernels whose covariance
+        and gradient share computations should override it.
+
+        :param inputs: np.array(nxd)
+        :return: (np.array(nxn), gradient as in gradient_respect_parameters)
+        """
+        return self.cov(inputs), self.gradient_respect_parameters(inputs)
+
     @abstractmethod
     def grad_respect_point(self, point, inputs):
         raise NotImplementedError("Not implemented")
 
+    def grad_respect_points(self, points, inputs):
+        """
+        Computes the gradients of cov(points[i, :], inputs) respect points[i, :], for all the
+        points at once. Kernels that can broadcast over the points should override it.
+
+        :param points: np.array(mxd)
+        :param inputs: np.array(nxd)
+        :return: np.array(mxnxd)
+        """
+        return np.array([self.grad_respect_point(points[i:i + 1, :], inputs)
+                         for i in xrange(points.shape[0])])
+
+    def hessian_respect_points(self, points, inputs):
+        """
+        Computes the hessians of cov(points[i, :], inputs) respect points[i, :], for all the
+        points at once. Kernels that can broadcast over the points should override it.
+
+        :param points: np.array(mxd)
+        :param inputs: np.array(nxd)
+        :return: np.array(mxnxdxd)
+        """
+        return np.array([self.hessian_respect_point(points[i:i + 1, :], inputs)
+                         for i in xrange(points.shape[0])])
+
     # The following two functions are useful to estimate the MLE
     @classmethod
     @abstractmethod
@@ -79,6 +178,21 @@ class AbstractKernel(object):
     def evaluate_grad_defined_by_params_respect_params(cls, params, inputs, dimension):
         raise NotImplementedError("Not implemented")
 
+    @classmethod
+    def evaluate_cov_and_grad_defined_by_params_respect_params(cls, params, inputs, dimension,
+                                                               *args, **kernel_parameters):
+        """
+        Evaluate the covariance and its gradient respect the parameters of the kernel defined by
+        params.
+
+        :return: (np.array(nxn), {(int) i: np.array(nxn), derivative respect to the ith parameter})
+        """
+        cov = cls.evaluate_cov_defined_by_params(params, inputs, dimension, *args,
+                                                 **kernel_parameters)
+        gradient = cls.evaluate_grad_defined_by_params_respect_params(
+            params, inputs, dimension, *args, **kernel_parameters)
+        return cov, gradient
+
     @classmethod
     @abstractmethod
     def evaluate_cross_cov_defined_by_params(cls, params, inputs_1, inputs_2, dimension):
@@ -89,6 +203,36 @@ class AbstractKernel(object):
     def evaluate_grad_respect_point(cls, params, point, inputs, dimension):
         raise NotImplementedError("Not implemented")
 
+    @classmethod
+    def evaluate_grad_respect_points(cls, params, points, inputs, dimension, *args,
+                                     **kernel_parameters):
+        """
+        Evaluate the gradients of the kernel defined by params respect to each one of the points.
+
+        :param params: np.array(k)
+        :param points: np.array(mxd)
+        :param inputs: np.array(nxd)
+        :param dimension: (int) dimension of the domain of the kernel
+        :return: np.array(mxnxd)
+        """
+        kernel = cls.compiled_kernel(dimension, params, *args, **kernel_parameters)
+        return kernel.grad_respect_points(points, inputs)
+
+    @classmethod
+    def evaluate_hessian_respect_points(cls, params, points, inputs, dimension, *args,
+                                        **kernel_parameters):
+        """
+        Evaluate the hessians of the kernel defined by params respect to each one of the points.
+
+        :param params: np.array(k)
+        :param points: np.array(mxd)
+        :param inputs: np.array(nxd)
+        :param dimension: (int) dimension of the domain of the kernel
+        :return: np.array(mxnxdxd)
+        """
+        kernel = cls.compiled_kernel(dimension, params, *args, **kernel_parameters)
+        return kernel.hessian_respect_points(points, inputs)
+
     @abstractmethod
     def sample_parameters(self, number_samples, random_seed):
         raise NotImplementedError("Not implemented")
@@ -170,6 +170,14 @@ class Matern52(AbstractKernel):
         """
         return self.cross_cov(inputs, inputs)
 
+    def cov_diagonal(self, inputs):
+        """
+
+        :param inputs: np.array(nxd)
+        :return: np.array(n)
+        """
+        return np.ones(inputs.shape[0])
+
     def cross_cov(self, inputs_1, inputs_2):
         """
 
@@ -194,6 +202,15 @@ class Matern52(AbstractKernel):
 
         return grad
 
+    def cov_and_gradient_respect_parameters(self, inputs):
+        """
+        Computes cov(inputs) and its gradient using the same pairwise differences.
+
+        :param inputs: np.array(nxd)
+        :return: (np.array(nxn), {'length_scale': {'entry (int)': nxn}})
+        """
+        return GradientLSMatern52.cov_and_gradient_respect_parameters_ls(inputs, self.length_scale)
+
     def grad_respect_point(self, point, inputs):
         """
         Computes the vector of the gradients of cov(point, inputs) respect point.
@@ -217,6 +234,27 @@ class Matern52(AbstractKernel):
         hessian = GradientLSMatern52.hessian_respect_point(self.length_scale, point, inputs)
         return hessian
 
+    def grad_respect_points(self, points, inputs):
+        """
+        Computes the gradients of cov(points[i, :], inputs) respect points[i, :].
+
+        :param points: np.array(mxd)
+        :param inputs: np.array(nxd)
+
+        :return: np.array(mxnxd)
+        """
+        return GradientLSMatern52.grad_respect_points(self.length_scale, points, inputs)
+
+    def hessian_respect_points(self, points, inputs):
+        """
+        Computes the hessians of cov(points[i, :], inputs) respect points[i, :].
+
+        :param points: np.array(mxd)
+        :param inputs: np.array(nxd)
+        :return: np.array(mxnxdxd)
+        """
+        return GradientLSMatern52.hessian_respect_points(self.length_scale, points, inputs)
+
     @classmethod
     def evaluate_grad_respect_point(cls, params, point, inputs, dimension):
         """
@@ -229,7 +267,7 @@ class Matern52(AbstractKernel):
         :return: np.array(nxd)
 
         """
-        matern52 = cls.define_kernel_from_array(dimension, params)
+        matern52 = cls.compiled_kernel(dimension, params)
         return matern52.grad_respect_point(point, inputs)
 
     @classmethod
@@ -243,7 +281,7 @@ class Matern52(AbstractKernel):
         :param dimension: int
         :return:
         """
-        matern52 = cls.define_kernel_from_array(dimension, params)
+        matern52 = cls.compiled_kernel(dimension, params)
         return matern52.hessian_respect_point(point, inputs)
 
     @classmethod
@@ -256,9 +294,22 @@ class Matern52(AbstractKernel):
         :param dimension: (int) dimension of the domain of the kernel
         :return: (np.array(nxn)) cov(inputs) where the kernel is defined with params
         """
-        matern52 = cls.define_kernel_from_array(dimension, params)
+        matern52 = cls.compiled_kernel(dimension, params)
         return matern52.cov(inputs)
 
+    @classmethod
+    def evaluate_cov_diagonal_defined_by_params(cls, params, inputs, dimension, **kwargs):
+        """
+        Evaluate the diagonal of the covariance of the kernel defined by params.
+
+        :param params: (np.array(k)) The first part are the parameters for length_scale.
+        :param inputs: np.array(nxm)
+        :param dimension: (int) dimension of the domain of the kernel
+        :return: (np.array(n)) diagonal of cov(inputs) where the kernel is defined with params
+        """
+        matern52 = cls.compiled_kernel(dimension, params)
+        return matern52.cov_diagonal(inputs)
+
     @classmethod
     def evaluate_grad_defined_by_params_respect_params(cls, params, inputs, dimension, **kwargs):
         """
@@ -271,7 +322,7 @@ class Matern52(AbstractKernel):
             (int) i: (nxn), derivative respect to the ith parameter
         }
         """
-        matern52 = cls.define_kernel_from_array(dimension, params)
+        matern52 = cls.compiled_kernel(dimension, params)
         gradient = matern52.gradient_respect_parameters(inputs)
 
         names = matern52.name_parameters_as_list
@@ -279,6 +330,26 @@ class Matern52(AbstractKernel):
         gradient = convert_dictionary_gradient_to_simple_dictionary(gradient, names)
         return gradient
 
+    @classmethod
+    def evaluate_cov_and_grad_defined_by_params_respect_params(cls, params, inputs, dimension,
+                                                               **kwargs):
+        """
+        Evaluate the covariance and its gradient respect the parameters of the kernel defined by
+        params, computing the pairwise distances only once.
+
+        :param params: (np.array(k)) The first part are the parameters for length_scale.
+        :param inputs: np.array(nxm)
+        :param dimension: (int) dimension of the domain of the kernel
+        :return: (np.array(nxn), {(int) i: (nxn), derivative respect to the ith parameter})
+        """
+        matern52 = cls.compiled_kernel(dimension, params)
+        cov, gradient = matern52.cov_and_gradient_respect_parameters(inputs)
+
+        names = matern52.name_parameters_as_list
+
+        gradient = convert_dictionary_gradient_to_simple_dictionary(gradient, names)
+        return cov, gradient
+
     @classmethod
     def evaluate_cross_cov_defined_by_params(cls, params, inputs_1, inputs_2, dimension, **kwargs):
         """
@@ -291,7 +362,7 @@ class Matern52(AbstractKernel):
 
         :return: (np.array(nxk)) cov(inputs_1, inputs_2) where the kernel is defined with params
         """
-        matern52 = cls.define_kernel_from_array(dimension, params)
+        matern52 = cls.compiled_kernel(dimension, params)
         return matern52.cross_cov(inputs_1, inputs_2)
 
     @staticmethod
@@ -381,17 +452,38 @@ class GradientLSMatern52(object):
         }
         """
 
-        derivate_respect_to_r = cls.gradient_respect_distance(ls, inputs)
+        return cls.cov_and_gradient_respect_parameters_ls(inputs, ls)[1]
+
+    @classmethod
+    def cov_and_gradient_respect_parameters_ls(cls, inputs, ls):
+        """
+        Computes the covariance and its gradient respect to the length scales from the same
+        pairwise differences. Since
+            dcov/dr = -(5/3) * r * (1 + sqrt(5) * r) * exp(-sqrt(5) * r), and
+            dr/dls_i = -(x_i - y_i)^2 / (ls_i^3 * r),
+        the factor r cancels, and the derivatives are also defined when r is zero.
+
+        :param inputs: np.array(nxd)
+        :param ls: (ParameterEntity) length_scale
+        :return: (np.array(nxn), {'length_scale': {'entry (int)': nxn}})
+        """
+        scaled_inputs = inputs / ls.value
+        differences_2 = (scaled_inputs[:, np.newaxis, :] - scaled_inputs[np.newaxis, :, :]) ** 2
+
+        r2 = np.sum(differences_2, axis=2)
+        r = np.sqrt(r2)
+
+        exp_r = np.exp(-np.sqrt(5) * r)
+        cov = (1.0 + np.sqrt(5) * r + (5.0 / 3.0) * r2) * exp_r
+        factor = (5.0 / 3.0) * (1.0 + np.sqrt(5) * r) * exp_r
 
         grad = {}
         grad[ls.name] = {}
 
-        grad_distance_ls = Distances.gradient_distance_length_scale_respect_ls(ls.value, inputs)
-
-        for i in range(ls.dimension):
-            grad[ls.name][i] = grad_distance_ls[i] * derivate_respect_to_r
+        for i in xrange(ls.dimension):
+            grad[ls.name][i] = factor * differences_2[:, :, i] / ls.value[i]
 
-        return grad
+        return cov, grad
 
     @classmethod
     def gradient_respect_distance(cls, ls, inputs):
@@ -451,17 +543,31 @@ class GradientLSMatern52(object):
         :return: np.array(nxd)
         """
 
-        derivate_respect_to_r = cls.gradient_respect_distance_cross(ls, point, inputs)
+        return cls.grad_respect_points(ls, point[0:1, :], inputs)[0, :, :]
+
+    @classmethod
+    def grad_respect_points(cls, ls, points, inputs):
+        """
+        Computes the gradients of cov(points[i, :], inputs) respect points[i, :], for all the
+        points at once.
+
+        :param ls: (ParameterEntity) length_scale
+        :param points: np.array(mxd)
+        :param inputs: np.array(nxd)
+
+        :return: np.array(mxnxd)
+        """
+
+        derivate_respect_to_r = cls.gradient_respect_distance_cross(ls, points, inputs)
         grad_distance_point = \
-            Distances.gradient_distance_length_scale_respect_point(ls.value, point, inputs)
+            Distances.gradient_distance_length_scale_respect_points(ls.value, points, inputs)
 
-        gradient = grad_distance_point * derivate_respect_to_r.transpose()
+        gradient = grad_distance_point * derivate_respect_to_r[:, :, np.newaxis]
 
         gradient = np.nan_to_num(gradient)
 
         return gradient
 
-
     @classmethod
     def hessian_respect_point(cls, ls, point, inputs):
         """
@@ -473,31 +579,33 @@ class GradientLSMatern52(object):
         :return: np.array(nxdxd)
         """
 
-        derivatives_resp_r = cls.gradient_respect_distance_cross(ls, point, inputs, second=True)
+        return cls.hessian_respect_points(ls, point[0:1, :], inputs)[0, :, :, :]
 
-        hessian_respect_point = Distances.gradient_distance_length_scale_respect_point(
-            ls.value, point, inputs, second=True
+    @classmethod
+    def hessian_respect_points(cls, ls, points, inputs):
+        """
+        Computes the Hessians of cov(points[i, :], inputs) respect points[i, :], for all the
+        points at once.
+
+        :param ls: (ParameterEntity) length_scale
+        :param points: np.array(mxd)
+        :param inputs: np.array(nxd)
+        :return: np.array(mxnxdxd)
+        """
+
+        derivatives_resp_r = cls.gradient_respect_distance_cross(ls, points, inputs, second=True)
+
+        hessian_respect_point = Distances.gradient_distance_length_scale_respect_points(
+            ls.value, points, inputs, second=True
         )
 
         hess = hessian_respect_point['second']
-        part_1 = hess * derivatives_resp_r['first'][0, :][:, np.newaxis, np.newaxis]
+        hessian = hess * derivatives_resp_r['first'][:, :, np.newaxis, np.newaxis]
 
         grad = hessian_respect_point['first']
-        part_2 = grad[:, :, None] * grad[:, None, :]
-        part_2 *= derivatives_resp_r['second'][0, :][:, np.newaxis, np.newaxis]
-
-        hessian = part_1 + part_2
-
-
-        # hessian = {}
-        # for i in xrange(inputs.shape[0]):
-        #     hess = hessian_respect_point['second'][i]
-        #     part_1 = hess * derivatives_resp_r['first'][0, i]
-        #
-        #     grad = hessian_respect_point['first'][i:i+1, :]
-        #     part_2 = np.dot(grad.transpose(), grad)
-        #     part_2 *= derivatives_resp_r['second'][0, i]
-        #
-        #     hessian[i] = part_1 + part_2
+        part_2 = grad[:, :, :, np.newaxis] * grad[:, :, np.newaxis, :]
+        part_2 *= derivatives_resp_r['second'][:, :, np.newaxis, np.newaxis]
+
+        hessian += part_2
 
         return hessian
@@ -192,6 +192,14 @@ class Ornstein(AbstractKernel):
         """
         return self.cross_cov(inputs, inputs)
 
+    def cov_diagonal(self, inputs):
+        """
+
+        :param inputs: np.array(nxd)
+        :return: np.array(n)
+        """
+        return self.sigma.value[0] * np.ones(inputs.shape[0])
+
     def cross_cov(self, inputs_1, inputs_2):
         """
 
@@ -210,62 +218,87 @@ class Ornstein(AbstractKernel):
 
     def gradient_respect_parameters(self, inputs):
         """
+        The covariance is sigma * exp(-r), where r = |x - y|_1 / ls, so
+            dcov/dls = cov * r / ls, and
+            dcov/dsigma = exp(-r).
 
         :param inputs: np.array(nxd)
         :return: {
-            'length_scale': {'entry (int)': nxn},
+            'length_scale_ornstein': nxn,
+            'sigma2': nxn,
         }
         """
-        pass
+        ls = self.ls.value[0]
+
+        r = cdist(inputs / ls, inputs / ls, 'minkowski', p=1.)
+        exp_r = np.exp(-r)
+
+        grad = {}
+        grad[self.ls.name] = self.sigma.value[0] * exp_r * r / ls
+        grad[self.sigma.name] = exp_r
+
+        return grad
 
     def grad_respect_point(self, point, inputs):
         """
-        Computes the vector of the gradients of cov(point, inputs) respect point.
+        Computes the vector of the gradients of cov(point, inputs) respect point. The derivative
+        isn't defined when an entry of the point is equal to the entry of an input, and zero is
+        used in that case.
 
         :param point: np.array(1xd)
         :param inputs: np.array(nxd)
 
         :return: np.array(nxd)
         """
-        pass
+        cov = self.cross_cov(point, inputs)[0, :]
+        signs = np.sign(point - inputs)
 
+        return - cov[:, np.newaxis] * signs / self.ls.value[0]
 
     def hessian_respect_point(self, point, inputs):
         """
-        Computes the hessians of cov(point, inputs) respect point
+        Computes the hessians of cov(point, inputs) respect point, out of the points where an entry
+        of the point is equal to the entry of an input.
 
-        :param point:
-        :param inputs:
+        :param point: np.array(1xd)
+        :param inputs: np.array(nxd)
         :return: np.array(nxdxd)
         """
-        pass
+        cov = self.cross_cov(point, inputs)[0, :]
+        signs = np.sign(point - inputs)
+
+        hessian = signs[:, :, np.newaxis] * signs[:, np.newaxis, :]
+
+        return hessian * (cov / (self.ls.value[0] ** 2))[:, np.newaxis, np.newaxis]
 
     @classmethod
     def evaluate_grad_respect_point(cls, params, point, inputs, dimension):
         """
         Evaluate the gradient of the kernel defined by params respect to the point.
 
-        :param params: (np.array(k)) The first part are the parameters for length_scale.
+        :param params: (np.array(k)) length scale and sigma2
         :param point: np.array(1xd)
         :param inputs: np.array(nxd)
         :param dimension: (int) dimension of the domain of the kernel
         :return: np.array(nxd)
 
         """
-        pass
+        kernel = cls.compiled_kernel(dimension, params)
+        return kernel.grad_respect_point(point, inputs)
 
     @classmethod
     def evaluate_hessian_respect_point(cls, params, point, inputs, dimension):
         """
         Evaluate the hessian of the kernel defined by params respect to the point.
 
-        :param params:
-        :param point:
-        :param inputs:
+        :param params: (np.array(k)) length scale and sigma2
+        :param point: np.array(1xd)
+        :param inputs: np.array(nxd)
         :param dimension: int
-        :return:
+        :return: np.array(nxdxd)
         """
-        pass
+        kernel = cls.compiled_kernel(dimension, params)
+        return kernel.hessian_respect_point(point, inputs)
 
     @classmethod
     def evaluate_cov_defined_by_params(cls, params, inputs, dimension, **kwargs):
@@ -277,10 +310,23 @@ class Ornstein(AbstractKernel):
         :param dimension: (int) dimension of the domain of the kernel
         :return: (np.array(nxn)) cov(inputs) where the kernel is defined with params
         """
-        kernel = cls.define_kernel_from_array(dimension, params)
+        kernel = cls.compiled_kernel(dimension, params)
 
         return kernel.cov(inputs)
 
+    @classmethod
+    def evaluate_cov_diagonal_defined_by_params(cls, params, inputs, dimension, **kwargs):
+        """
+        Evaluate the diagonal of the covariance of the kernel defined by params.
+
+        :param params: (np.array(k)) The first part are the parameters for length_scale.
+        :param inputs: np.array(nxm)
+        :param dimension: (int) dimension of the domain of the kernel
+        :return: (np.array(n)) diagonal of cov(inputs) where the kernel is defined with params
+        """
+        kernel = cls.compiled_kernel(dimension, params)
+        return kernel.cov_diagonal(inputs)
+
     @classmethod
     def evaluate_grad_defined_by_params_respect_params(cls, params, inputs, dimension, **kwargs):
         """
@@ -293,7 +339,13 @@ class Ornstein(AbstractKernel):
             (int) i: (nxn), derivative respect to the ith parameter
         }
         """
-        pass
+        kernel = cls.compiled_kernel(dimension, params)
+        gradient = kernel.gradient_respect_parameters(inputs)
+
+        names = kernel.name_parameters_as_list
+
+        gradient = convert_dictionary_gradient_to_simple_dictionary(gradient, names)
+        return gradient
 
     @classmethod
     def evaluate_cross_cov_defined_by_params(cls, params, inputs_1, inputs_2, dimension, **kwargs):
@@ -307,7 +359,7 @@ class Ornstein(AbstractKernel):
 
         :return: (np.array(nxk)) cov(inputs_1, inputs_2) where the kernel is defined with params
         """
-        kernel = cls.define_kernel_from_array(dimension, params)
+        kernel = cls.compiled_kernel(dimension, params)
         return kernel.cross_cov(inputs_1, inputs_2)
 
     @staticmethod
@@ -226,6 +226,15 @@ class ProductKernels(AbstractKernel):
 
         return self.cross_cov(inputs, inputs)
 
+    def cov_diagonal(self, inputs):
+        """
+
+        :param inputs: np.array(nxd)
+        :return: np.array(n)
+        """
+
+        return self.cov_diagonal_dict(self.inputs_from_array_to_dict(inputs))
+
     def cross_cov(self, inputs_1, inputs_2):
         """
 
@@ -257,6 +266,16 @@ class ProductKernels(AbstractKernel):
 
         return self.cross_cov_dict(inputs, inputs)
 
+    def cov_diagonal_dict(self, inputs):
+        """
+
+        :param inputs: {(str) kernel_name: np.array(nxd)}
+        :return: np.array(n)
+        """
+
+        return reduce(lambda K1, K2: K1 * K2,
+                      [self.kernels[name].cov_diagonal(inputs[name]) for name in self.names])
+
     def cross_cov_dict(self, inputs_1, inputs_2):
         """
 
@@ -276,14 +295,26 @@ class ProductKernels(AbstractKernel):
             (str) kernel_name: { (str) parameter_name: np.array(nxn) or {'entry (int)': nxn}}
         }
         """
+        return self.cov_and_gradient_respect_parameters(inputs)[1]
+
+    def cov_and_gradient_respect_parameters(self, inputs):
+        """
+        Computes cov(inputs) and its gradient. The covariance and the gradient of each kernel are
+        computed together.
+
+        :param inputs: {(str) kernel_name: np.array(nxd)}
+        :return: (np.array(nxn), {
+            (str) kernel_name: { (str) parameter_name: np.array(nxn) or {'entry (int)': nxn}}
+        })
+        """
         # TODO - Generalize to more than two kernels
 
         grad = {}
         cov = {}
 
         for name in self.names:
-            grad[name] = self.kernels[name].gradient_respect_parameters(inputs[name])
-            cov[name] = self.kernels[name].cov(inputs[name])
+            cov[name], grad[name] = \
+                self.kernels[name].cov_and_gradient_respect_parameters(inputs[name])
 
         grad_product = {}
 
@@ -299,7 +330,9 @@ class ProductKernels(AbstractKernel):
                     grad_product[self.names[i]][name_param] = \
                         cov[self.names[(i + 1) % 2]] * grad[self.names[i]][name_param]
 
-        return grad_product
+        cov_product = reduce(lambda K1, K2: K1 * K2, [cov[name] for name in self.names])
+
+        return cov_product, grad_product
 
     def grad_respect_point(self, point, inputs):
         """
@@ -438,6 +471,73 @@ class ProductKernels(AbstractKernel):
 
         return gradient
 
+    def grad_respect_points(self, points, inputs):
+        """
+        Computes the gradients of cov(points[i, :], inputs) respect points[i, :], for all the
+        points at once.
+
+        :param points: np.array(mxd)
+        :param inputs: np.array(nxd)
+
+        :return: np.array(mxnxd)
+        """
+        # Only works for the product of two kernels
+
+        points_dict = self.inputs_from_array_to_dict(points)
+        inputs_dict = self.inputs_from_array_to_dict(inputs)
+
+        grad = {}
+        cov = {}
+
+        for name in self.names:
+            grad[name] = self.kernels[name].grad_respect_points(points_dict[name],
+                                                                inputs_dict[name])
+            cov[name] = self.kernels[name].cross_cov(points_dict[name], inputs_dict[name])
+
+        gradient = []
+        for i in xrange(2):
+            gradient.append(
+                grad[self.names[i]] * cov[self.names[(i + 1) % 2]][:, :, np.newaxis])
+
+        return np.concatenate(gradient, 2)
+
+    def hessian_respect_points(self, points, inputs):
+        """
+        Computes the hessians of cov(points[i, :], inputs) respect points[i, :], for all the
+        points at once.
+
+        :param points: np.array(mxd)
+        :param inputs: np.array(nxd)
+        :return: np.array(mxnxdxd)
+        """
+        # Only works for the product of two kernels
+
+        points_dict = self.inputs_from_array_to_dict(points)
+        inputs_dict = self.inputs_from_array_to_dict(inputs)
+
+        hess = {}
+        grad = {}
+        cov = {}
+
+        for name in self.names:
+            hess[name] = self.kernels[name].hessian_respect_points(points_dict[name],
+                                                                   inputs_dict[name])
+            grad[name] = self.kernels[name].grad_respect_points(points_dict[name],
+                                                                inputs_dict[name])
+            cov[name] = self.kernels[name].cross_cov(points_dict[name], inputs_dict[name])
+
+        name_1 = self.names[0]
+        name_2 = self.names[1]
+
+        hessian_1 = hess[name_1] * cov[name_2][:, :, np.newaxis, np.newaxis]
+        hessian_2 = hess[name_2] * cov[name_1][:, :, np.newaxis, np.newaxis]
+        hess_diag = grad[name_1][:, :, :, np.newaxis] * grad[name_2][:, :, np.newaxis, :]
+
+        hessian = np.concatenate([hessian_1, hess_diag], 3)
+        hessian_2 = np.concatenate([np.swapaxes(hess_diag, 2, 3), hessian_2], 3)
+
+        return np.concatenate([hessian, hessian_2], axis=2)
+
     @classmethod
     def evaluate_grad_respect_point(cls, params, point, inputs, dimension, *args,
                                     **kernel_parameters):
@@ -455,7 +555,7 @@ class ProductKernels(AbstractKernel):
         :return: np.array(nxd)
 
         """
-        kernel = cls.define_kernel_from_array(dimension, params, *args, **kernel_parameters)
+        kernel = cls.compiled_kernel(dimension, params, *args, **kernel_parameters)
 
         return kernel.grad_respect_point(point, inputs)
 
@@ -476,7 +576,7 @@ class ProductKernels(AbstractKernel):
         :return:
         """
 
-        kernel = cls.define_kernel_from_array(dimension, params, *args, **kernel_parameters)
+        kernel = cls.compiled_kernel(dimension, params, *args, **kernel_parameters)
 
         return kernel.hessian_respect_point(point, inputs)
 
@@ -496,10 +596,31 @@ class ProductKernels(AbstractKernel):
         :return: cov(inputs) where the kernel is defined with params
         """
 
-        kernel = cls.define_kernel_from_array(dimension, params, *args, **kernel_parameters)
+        kernel = cls.compiled_kernel(dimension, params, *args, **kernel_parameters)
 
         return kernel.cov_dict(inputs)
 
+    @classmethod
+    def evaluate_cov_diagonal_defined_by_params(cls, params, inputs, dimension, *args,
+                                                **kernel_parameters):
+        """
+        Evaluate the diagonal of the covariance of the kernel defined by params.
+
+        :param params: [np.array(k)] The first part are related to the parameters of the first
+            kernel and so on.
+        :param inputs: {(str) kernel_name: np.array(nxd)}.
+        :param dimension: [int] list with the dimensions of the kernel
+        :param args: [str] List with the names of the kernels.
+        :param kernel_parameters: additional kernel parameters,
+            - SAME_CORRELATION: (boolean) True or False. Parameter used only for task kernel.
+
+        :return: (np.array(n)) diagonal of cov(inputs) where the kernel is defined with params
+        """
+
+        kernel = cls.compiled_kernel(dimension, params, *args, **kernel_parameters)
+
+        return kernel.cov_diagonal_dict(inputs)
+
     @classmethod
     def evaluate_grad_defined_by_params_respect_params(cls, params, inputs, dimension, *args,
                                                        **kernel_parameters):
@@ -518,7 +639,7 @@ class ProductKernels(AbstractKernel):
         }
         """
 
-        kernel = cls.define_kernel_from_array(dimension, params, *args, **kernel_parameters)
+        kernel = cls.compiled_kernel(dimension, params, *args, **kernel_parameters)
 
         gradient = kernel.gradient_respect_parameters(inputs)
 
@@ -527,6 +648,34 @@ class ProductKernels(AbstractKernel):
         gradient = convert_dictionary_gradient_to_simple_dictionary(gradient, names)
         return gradient
 
+    @classmethod
+    def evaluate_cov_and_grad_defined_by_params_respect_params(cls, params, inputs, dimension,
+                                                               *args, **kernel_parameters):
+        """
+        Evaluate the covariance and its gradient respect the parameters of the kernel defined by
+        params.
+
+        :param dimension: [int] list with the dimensions of the kernel
+        :param params: [np.array(k)] The first part are related to the parameters of the first
+            kernel and so on.
+        :param inputs: {(str) kernel_name: np.array(nxd)}
+        :param args: [str] List with the names of the kernels.
+        :param kernel_parameters: additional kernel parameters,
+            - SAME_CORRELATION: (boolean) True or False. Parameter used only for task kernel.
+        :return: (np.array(nxn), {
+            (int) i: np.array(nxn), derivative respect to the ith parameter
+        })
+        """
+
+        kernel = cls.compiled_kernel(dimension, params, *args, **kernel_parameters)
+
+        cov, gradient = kernel.cov_and_gradient_respect_parameters(inputs)
+
+        gradient = convert_dictionary_from_names_kernels_to_only_parameters(gradient, kernel.names)
+        names = kernel.name_parameters_as_list
+        gradient = convert_dictionary_gradient_to_simple_dictionary(gradient, names)
+        return cov, gradient
+
     @classmethod
     def evaluate_cross_cov_defined_by_params(cls, params, inputs_1, inputs_2, dimension, *args,
                                              **kernel_parameters):
@@ -545,7 +694,7 @@ class ProductKernels(AbstractKernel):
         :return: (np.array(nxk)) cov(inputs_1, inputs_2) where the kernel is defined with params
         """
 
-        kernel = cls.define_kernel_from_array(dimension, params, *args, **kernel_parameters)
+        kernel = cls.compiled_kernel(dimension, params, *args, **kernel_parameters)
 
         return kernel.cross_cov_dict(inputs_1, inputs_2)
 
@@ -567,7 +716,7 @@ class ProductKernels(AbstractKernel):
         :return: (np.array(nxk)) cov(inputs_1, inputs_2) where the kernel is defined with params
         """
 
-        kernel = cls.define_kernel_from_array(dimension, params, *args, **kernel_parameters)
+        kernel = cls.compiled_kernel(dimension, params, *args, **kernel_parameters)
 
         inputs_1 = kernel.inputs_from_array_to_dict(inputs_1)
         inputs_2 = kernel.inputs_from_array_to_dict(inputs_2)
@@ -183,6 +183,15 @@ class ScaledKernel(AbstractKernel):
         """
         return self.cross_cov(inputs, inputs)
 
+    def cov_diagonal(self, inputs):
+        """
+
+        :param inputs: np.array(nxd)
+        :return: np.array(n)
+        """
+
+        return self.kernel.cov_diagonal(inputs) * self.sigma2.value
+
     def cross_cov(self, inputs_1, inputs_2):
         """
 
@@ -202,16 +211,29 @@ class ScaledKernel(AbstractKernel):
             'sigma_square': nxn,
         }
         """
-        grad = self.kernel.gradient_respect_parameters(inputs)
+        return self.cov_and_gradient_respect_parameters(inputs)[1]
+
+    def cov_and_gradient_respect_parameters(self, inputs):
+        """
+        Computes cov(inputs) and its gradient. The covariance of the kernel instance is computed
+        only once.
+
+        :param inputs: np.array(nxd)
+        :return: (np.array(nxn), {
+            Parameter_Name: value,
+            'sigma_square': nxn,
+        })
+        """
+        cov, grad = self.kernel.cov_and_gradient_respect_parameters(inputs)
         for element in grad:
             if type(grad[element]) == dict:
                 for i in grad[element]:
                     grad[element][i] *= self.sigma2.value
             else:
                 grad[element] *= self.sigma2.value
-        grad[self.sigma2.name] = self.cov(inputs) / self.sigma2.value
+        grad[self.sigma2.name] = cov
 
-        return grad
+        return cov * self.sigma2.value, grad
 
     def grad_respect_point(self, point, inputs):
         """
@@ -238,6 +260,31 @@ class ScaledKernel(AbstractKernel):
 
         return self.sigma2.value * hessian
 
+    def grad_respect_points(self, points, inputs):
+        """
+        Computes the gradients of cov(points[i, :], inputs) respect points[i, :].
+
+        :param points: np.array(mxd)
+        :param inputs: np.array(nxd)
+
+        :return: np.array(mxnxd)
+        """
+        grad = self.kernel.grad_respect_points(points, inputs)
+
+        return grad * self.sigma2.value
+
+    def hessian_respect_points(self, points, inputs):
+        """
+        Computes the hessians of cov(points[i, :], inputs) respect points[i, :].
+
+        :param points: np.array(mxd)
+        :param inputs: np.array(nxd)
+        :return: np.array(mxnxdxd)
+        """
+        hessian = self.kernel.hessian_respect_points(points, inputs)
+
+        return self.sigma2.value * hessian
+
     @classmethod
     def evaluate_grad_respect_point(cls, params, point, inputs, dimension, *args):
         """
@@ -252,7 +299,7 @@ class ScaledKernel(AbstractKernel):
         :return: np.array(nxd)
 
         """
-        kernel = cls.define_kernel_from_array(dimension, params, *args)
+        kernel = cls.compiled_kernel(dimension, params, *args)
         return kernel.grad_respect_point(point, inputs)
 
     @classmethod
@@ -266,7 +313,7 @@ class ScaledKernel(AbstractKernel):
         :param dimension:
         :return:
         """
-        kernel = cls.define_kernel_from_array(dimension, params, *args)
+        kernel = cls.compiled_kernel(dimension, params, *args)
         return kernel.hessian_respect_point(point, inputs)
 
     @classmethod
@@ -282,10 +329,27 @@ class ScaledKernel(AbstractKernel):
 
         :return: cov(inputs) where the kernel is defined with params
         """
-        kernel = cls.define_kernel_from_array(dimension, params, *args)
+        kernel = cls.compiled_kernel(dimension, params, *args)
 
         return kernel.cov(inputs)
 
+    @classmethod
+    def evaluate_cov_diagonal_defined_by_params(cls, params, inputs, dimension, *args):
+        """
+        Evaluate the diagonal of the covariance of the kernel defined by params.
+
+        :param params: (np.array(k)) The first part are the parameters for the kernel instance, the
+            second part is the parameter for sigma2.
+        :param inputs: np.array(nxm)
+        :param dimension: (int) dimension of the domain of the kernel
+        :param args: [str] List with the names of the kernels.
+
+        :return: (np.array(n)) diagonal of cov(inputs) where the kernel is defined with params
+        """
+        kernel = cls.compiled_kernel(dimension, params, *args)
+
+        return kernel.cov_diagonal(inputs)
+
     @classmethod
     def evaluate_grad_defined_by_params_respect_params(cls, params, inputs, dimension, *args):
         """
@@ -301,7 +365,7 @@ class ScaledKernel(AbstractKernel):
             (int) i: (nxn), derivative respect to the ith parameter
         }
         """
-        kernel = cls.define_kernel_from_array(dimension, params, *args)
+        kernel = cls.compiled_kernel(dimension, params, *args)
 
         gradient = kernel.gradient_respect_parameters(inputs)
 
@@ -310,6 +374,30 @@ class ScaledKernel(AbstractKernel):
         gradient = convert_dictionary_gradient_to_simple_dictionary(gradient, names)
         return gradient
 
+    @classmethod
+    def evaluate_cov_and_grad_defined_by_params_respect_params(cls, params, inputs, dimension,
+                                                               *args):
+        """
+        Evaluate the covariance and its gradient respect the parameters of the kernel defined by
+        params.
+
+        :param params: (np.array(k)) The first part are the parameters for the kernel instance, the
+            second part is the parameter for sigma2.
+        :param inputs: np.array(nxm)
+        :param dimension: (int) dimension of the domain of the kernel
+        :param args: [str] List with the names of the kernels.
+
+        :return: (np.array(nxn), {(int) i: (nxn), derivative respect to the ith parameter})
+        """
+        kernel = cls.compiled_kernel(dimension, params, *args)
+
+        cov, gradient = kernel.cov_and_gradient_respect_parameters(inputs)
+
+        names = kernel.name_parameters_as_list
+
+        gradient = convert_dictionary_gradient_to_simple_dictionary(gradient, names)
+        return cov, gradient
+
     @classmethod
     def evaluate_cross_cov_defined_by_params(cls, params, inputs_1, inputs_2, dimension, *args):
         """
@@ -325,7 +413,7 @@ class ScaledKernel(AbstractKernel):
         :return: (np.array(nxk)) cov(inputs_1, inputs_2) where the kernel is defined with params
         """
 
-        kernel = cls.define_kernel_from_array(dimension, params, *args)
+        kernel = cls.compiled_kernel(dimension, params, *args)
         return kernel.cross_cov(inputs_1, inputs_2)
 
     @staticmethod
@@ -192,34 +192,45 @@ class Swk(AbstractKernel):
         :param inputs_2: np.array(mxd)
         :return: np.array(nxm)
         """
-        inputs_1 = np.array(inputs_1)
-        inputs_2 = np.array(inputs_2)
+        return (self.beta.value[0] / self._sum_inputs(inputs_1, inputs_2)) ** self.alpha.value[0]
 
-        n = inputs_1.shape[0]
-        n2 = inputs_2.shape[0]
-        covM = np.zeros((n, n2))
-        #
-        # print n, n2
-        # print inputs_1
-        for i in range(n):
-            for j in range(n2):
-                a1 = float(inputs_1[i, 0])
-                a2 = float(inputs_2[j, 0])
+    def _sum_inputs(self, inputs_1, inputs_2):
+        """
+        Computes s = x + y + beta for each x in inputs_1, and each y in inputs_2.
 
-                value = (self.beta.value[0] / (a1 + a2 + self.beta.value[0]))
-                covM[i, j] = value ** (self.alpha.value[0])
+        :param inputs_1: np.array(nxd)
+        :param inputs_2: np.array(mxd)
+        :return: np.array(nxm)
+        """
+        inputs_1 = np.array(inputs_1, dtype=float)
+        inputs_2 = np.array(inputs_2, dtype=float)
 
-        return covM
+        return inputs_1[:, 0:1] + inputs_2[:, 0].reshape((1, inputs_2.shape[0])) + \
+            self.beta.value[0]
 
     def gradient_respect_parameters(self, inputs):
         """
+        The covariance is (beta / s) ** alpha, where s = x + y + beta, so
+            dcov/dalpha = cov * log(beta / s), and
+            dcov/dbeta = cov * alpha * (x + y) / (beta * s).
 
         :param inputs: np.array(nxd)
         :return: {
-            'length_scale': {'entry (int)': nxn},
+            'alpha': nxn,
+            'beta': nxn,
         }
         """
-        pass
+        alpha = self.alpha.value[0]
+        beta = self.beta.value[0]
+
+        s = self._sum_inputs(inputs, inputs)
+        cov = (beta / s) ** alpha
+
+        grad = {}
+        grad[self.alpha.name] = cov * np.log(beta / s)
+        grad[self.beta.name] = cov * alpha * (s - beta) / (beta * s)
+
+        return grad
 
     def grad_respect_point(self, point, inputs):
         """
@@ -230,45 +241,55 @@ class Swk(AbstractKernel):
 
         :return: np.array(nxd)
         """
-        pass
+        s = self._sum_inputs(inputs, point)
+        cov = (self.beta.value[0] / s) ** self.alpha.value[0]
 
+        return - self.alpha.value[0] * cov / s
 
     def hessian_respect_point(self, point, inputs):
         """
         Computes the hessians of cov(point, inputs) respect point
 
-        :param point:
-        :param inputs:
+        :param point: np.array(1xd)
+        :param inputs: np.array(nxd)
         :return: np.array(nxdxd)
         """
-        pass
+        alpha = self.alpha.value[0]
+        s = self._sum_inputs(inputs, point)
+        cov = (self.beta.value[0] / s) ** alpha
+
+        hessian = alpha * (alpha + 1.0) * cov / (s ** 2)
+
+        return hessian[:, :, np.newaxis]
 
     @classmethod
     def evaluate_grad_respect_point(cls, params, point, inputs, dimension):
         """
         Evaluate the gradient of the kernel defined by params respect to the point.
 
-        :param params: (np.array(k)) The first part are the parameters for length_scale.
+        :param params: (np.array(k)) alpha and beta
         :param point: np.array(1xd)
         :param inputs: np.array(nxd)
         :param dimension: (int) dimension of the domain of the kernel
         :return: np.array(nxd)
 
         """
-        pass
+        kernel = cls.compiled_kernel(dimension, params)
+        return kernel.grad_respect_point(point, inputs)
 
     @classmethod
     def evaluate_hessian_respect_point(cls, params, point, inputs, dimension):
         """
         Evaluate the hessian of the kernel defined by params respect to the point.
 
-        :param params:
-        :param point:
-        :param inputs:
+        :param params: (np.array(k)) alpha and beta
+        :param point: np.array(1xd)
+        :param inputs: np.array(nxd)
         :param dimension: int
-        :return:
+        :return: np.array(nxdxd)
         """
-        pass
+        kernel = cls.compiled_kernel(dimension, params)
+        return kernel.hessian_respect_point(point, inputs)
 
     @classmethod
     def evaluate_cov_defined_by_params(cls, params, inputs, dimension, **kwargs):
@@ -280,10 +301,23 @@ class Swk(AbstractKernel):
         :param dimension: (int) dimension of the domain of the kernel
         :return: (np.array(nxn)) cov(inputs) where the kernel is defined with params
         """
-        kernel = cls.define_kernel_from_array(dimension, params)
+        kernel = cls.compiled_kernel(dimension, params)
 
         return kernel.cov(inputs)
 
+    @classmethod
+    def evaluate_cov_diagonal_defined_by_params(cls, params, inputs, dimension, **kwargs):
+        """
+        Evaluate the diagonal of the covariance of the kernel defined by params.
+
+        :param params: (np.array(k)) The first part are the parameters for length_scale.
+        :param inputs: np.array(nxm)
+        :param dimension: (int) dimension of the domain of the kernel
+        :return: (np.array(n)) diagonal of cov(inputs) where the kernel is defined with params
+        """
+        kernel = cls.compiled_kernel(dimension, params)
+        return kernel.cov_diagonal(inputs)
+
     @classmethod
     def evaluate_grad_defined_by_params_respect_params(cls, params, inputs, dimension, **kwargs):
         """
@@ -296,7 +330,13 @@ class Swk(AbstractKernel):
             (int) i: (nxn), derivative respect to the ith parameter
         }
         """
-        pass
+        kernel = cls.compiled_kernel(dimension, params)
+        gradient = kernel.gradient_respect_parameters(inputs)
+
+        names = kernel.name_parameters_as_list
+
+        gradient = convert_dictionary_gradient_to_simple_dictionary(gradient, names)
+        return gradient
 
     @classmethod
     def evaluate_cross_cov_defined_by_params(cls, params, inputs_1, inputs_2, dimension, **kwargs):
@@ -310,7 +350,7 @@ class Swk(AbstractKernel):
 
         :return: (np.array(nxk)) cov(inputs_1, inputs_2) where the kernel is defined with params
         """
-        kernel = cls.define_kernel_from_array(dimension, params)
+        kernel = cls.compiled_kernel(dimension, params)
         return kernel.cross_cov(inputs_1, inputs_2)
 
     @staticmethod
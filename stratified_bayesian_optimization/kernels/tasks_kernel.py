@@ -52,6 +52,7 @@ class TasksKernel(AbstractKernel):
         self.n_tasks = n_tasks
         self.base_cov_matrix = None
         self.chol_base_cov_matrix = None
+        self.gradient_base_cov_matrix = None
 
     @property
     def hypers(self):
@@ -111,6 +112,7 @@ class TasksKernel(AbstractKernel):
         """
 
         self.base_cov_matrix = None
+        self.gradient_base_cov_matrix = None
 
         if lower_triang is not None:
             self.lower_triang = lower_triang
@@ -122,6 +124,7 @@ class TasksKernel(AbstractKernel):
         :param params: np.array(n)
         """
         self.base_cov_matrix = None
+        self.gradient_base_cov_matrix = None
         self.lower_triang.set_value(params)
         self.compute_cov_matrix()
 
@@ -195,6 +198,17 @@ class TasksKernel(AbstractKernel):
         """
         return self.cross_cov(inputs, inputs)
 
+    def cov_diagonal(self, inputs):
+        """
+
+        :param inputs: np.array(nx1)
+        :return: np.array(n)
+        """
+        self.compute_cov_matrix()
+
+        tasks = inputs[:, 0].astype(int)
+        return np.diag(self.base_cov_matrix)[tasks]
+
     def compute_cov_matrix(self):
         """
         Compute L * L(i, j)^T from self.lower_triang if self.same_correlation is False.
@@ -212,12 +226,11 @@ class TasksKernel(AbstractKernel):
             self.base_cov_matrix = covM
 
         if not self.same_correlation:
-            count = 0
+            # The entries of lower_triang are the rows of the lower triangle, in the order given
+            # by np.tril_indices.
+            rows, columns = np.tril_indices(self.n_tasks)
             L = np.zeros((self.n_tasks, self.n_tasks))
-            for i in range(self.n_tasks):
-                for j in range(i + 1):
-                    L[i, j] = np.exp(self.lower_triang.value[count + j])
-                count += i + 1
+            L[rows, columns] = np.exp(self.lower_triang.value[0: len(rows)])
 
             covM = np.dot(L, np.transpose(L))
         else:
@@ -227,9 +240,8 @@ class TasksKernel(AbstractKernel):
                 value = self.lower_triang.value[1]
                 covM.fill(np.exp(value))
 
-                for i in xrange(self.n_tasks):
-                    covM[i, i] = np.exp(self.lower_triang.value[0]) + np.exp(value) * \
-                                                                      (self.n_tasks - 1 )
+                np.fill_diagonal(
+                    covM, np.exp(self.lower_triang.value[0]) + np.exp(value) * (self.n_tasks - 1))
             else:
                 covM[0, 0] = np.exp(self.lower_triang.value[0])
             L = covM
@@ -248,13 +260,23 @@ class TasksKernel(AbstractKernel):
 
         self.compute_cov_matrix()
 
-        s, t = np.meshgrid(inputs_1, inputs_2)
-        s = s.astype(int)
-        t = t.astype(int)
+        tasks_1 = np.asarray(inputs_1).reshape(-1).astype(int)
+        tasks_2 = np.asarray(inputs_2).reshape(-1).astype(int)
 
-        cov = self.base_cov_matrix[s, t].transpose()
+        return self.base_cov_matrix[tasks_1[:, np.newaxis], tasks_2[np.newaxis, :]]
 
-        return cov
+    def compute_gradient_base_cov_matrix(self):
+        """
+        Computes the gradient of the covariance matrix of the tasks respect to the parameters. It's
+        computed only once for each value of the parameters.
+        """
+        if self.gradient_base_cov_matrix is not None:
+            return
+
+        self.compute_cov_matrix()
+
+        self.gradient_base_cov_matrix = GradientTasksKernel.gradient_respect_parameters(
+            self.chol_base_cov_matrix, self.n_tasks, self.same_correlation)
 
     def gradient_respect_parameters(self, inputs):
         """
@@ -264,25 +286,16 @@ class TasksKernel(AbstractKernel):
             'lower_triang': {'entry (int)': np.array(nxn)}
         }
         """
-        inputs = inputs.astype(int)
-        self.compute_cov_matrix()
+        tasks = inputs[:, 0].astype(int)
+        self.compute_gradient_base_cov_matrix()
 
         gradient = {}
         gradient[self.lower_triang.name] = {}
 
-        gradient_base_tasks = GradientTasksKernel.gradient_respect_parameters(
-            self.chol_base_cov_matrix, self.n_tasks, self.same_correlation)
-
-        N = inputs.shape[0]
-
         for param_index in range(self.lower_triang.dimension):
-            der_covariance = np.zeros((N, N))
-            for i in range(N):
-                for j in range(i + 1):
-                    der_covariance[i, j] = \
-                        gradient_base_tasks[param_index][inputs[i, 0], inputs[j, 0]]
-                    der_covariance[j, i] = der_covariance[i, j]
-            gradient[self.lower_triang.name][param_index] = der_covariance
+            gradient[self.lower_triang.name][param_index] = \
+                self.gradient_base_cov_matrix[param_index][tasks[:, np.newaxis],
+                                                           tasks[np.newaxis, :]]
 
         return gradient
 
@@ -323,7 +336,7 @@ class TasksKernel(AbstractKernel):
         :return: np.array(nx1)
 
         """
-        kernel = cls.define_kernel_from_array(dimension, params)
+        kernel = cls.compiled_kernel(dimension, params)
         return kernel.grad_respect_point(point, inputs)
 
     @classmethod
@@ -339,10 +352,27 @@ class TasksKernel(AbstractKernel):
         :return: cov(inputs) where the kernel is defined with params
         """
         same_correlation = kwargs.get(SAME_CORRELATION, False)
-        task_kernels = cls.define_kernel_from_array(dimension, params,
-                                                    same_correlation=same_correlation)
+        task_kernels = cls.compiled_kernel(dimension, params,
+                                           same_correlation=same_correlation)
         return task_kernels.cov(inputs)
 
+    @classmethod
+    def evaluate_cov_diagonal_defined_by_params(cls, params, inputs, dimension, **kwargs):
+        """
+        Evaluate the diagonal of the covariance of the kernel defined by params.
+
+        :param params: (np.array(k))
+        :param inputs: np.array(nx1)
+        :param dimension: (int) number of tasks
+        :param kwargs: {SAME_CORRELATION: boolean}
+
+        :return: (np.array(n)) diagonal of cov(inputs) where the kernel is defined with params
+        """
+        same_correlation = kwargs.get(SAME_CORRELATION, False)
+        task_kernels = cls.compiled_kernel(dimension, params,
+                                           same_correlation=same_correlation)
+        return task_kernels.cov_diagonal(inputs)
+
     @classmethod
     def evaluate_cross_cov_defined_by_params(cls, params, inputs_1, inputs_2, dimension, **kwargs):
         """
@@ -357,8 +387,8 @@ class TasksKernel(AbstractKernel):
         :return: (np.array(nxk)) cov(inputs_1, inputs_2) where the kernel is defined with params
         """
         same_correlation = kwargs.get(SAME_CORRELATION, False)
-        task_kernels = cls.define_kernel_from_array(dimension, params,
-                                                    same_correlation=same_correlation)
+        task_kernels = cls.compiled_kernel(dimension, params,
+                                           same_correlation=same_correlation)
 
         return task_kernels.cross_cov(inputs_1, inputs_2)
 
@@ -373,7 +403,7 @@ class TasksKernel(AbstractKernel):
         :param dimension:
         :return:
         """
-        kernel = cls.define_kernel_from_array(dimension, params)
+        kernel = cls.compiled_kernel(dimension, params)
         return kernel.hessian_respect_point(point, inputs)
 
     @classmethod
@@ -390,8 +420,8 @@ class TasksKernel(AbstractKernel):
         }
         """
         same_correlation = kwargs.get(SAME_CORRELATION, False)
-        task_kernels = cls.define_kernel_from_array(dimension, params,
-                                                    same_correlation=same_correlation)
+        task_kernels = cls.compiled_kernel(dimension, params,
+                                           same_correlation=same_correlation)
         gradient = task_kernels.gradient_respect_parameters(inputs)
 
         names = task_kernels.name_parameters_as_list
@@ -593,15 +623,19 @@ class GradientTasksKernel(object):
         gradient = {}
 
         if not same_correlation:
-            count = 0
-            for i in range(n_tasks):
-                for j in range(i + 1):
-                    tmp_der = np.zeros((n_tasks, n_tasks))
-                    tmp_der[i, j] = chol_base_cov_matrix[i, j]
-                    tmp_der_mat = (np.dot(tmp_der, chol_base_cov_matrix.transpose()))
-                    tmp_der_mat += tmp_der_mat.transpose()
-                    gradient[count + j] = tmp_der_mat
-                count += i + 1
+            # The derivative respect to log(L[i, j]) is E * L^T + L * E^T, where E only has the
+            # entry E[i, j] = L[i, j]. Then, the ith row of E * L^T is L[i, j] * L[:, j].
+            rows, columns = np.tril_indices(n_tasks)
+            n_parameters = len(rows)
+
+            derivatives = np.zeros((n_parameters, n_tasks, n_tasks))
+            derivatives[np.arange(n_parameters), rows, :] = \
+                chol_base_cov_matrix[rows, columns][:, np.newaxis] * \
+                chol_base_cov_matrix[:, columns].transpose()
+            derivatives += derivatives.transpose((0, 2, 1))
+
+            for index in xrange(n_parameters):
+                gradient[index] = derivatives[index]
             return gradient
 
 
@@ -11,45 +11,23 @@ def AffineBreakPointsPrep(a, b):
 
     # PF: Experimental preprocessing step, which I hope will remove
     # a large number of the entries.
-    b1, i1 = min(b), np.argmin(b)  # [a1,b1] is best at z=-infinity
-    a1 = a[i1]
-    a2, i2 = max(a), np.argmax(a)  # [a2,b2] is best at z=0
-    b2 = b[i2]
-    b3, i3 = max(b), np.argmax(b)  # [a3,b3] is best at z=+infinity
-    a3 = a[i3]
-
-    cleft = (a.astype(np.float) - a1) / (b1 - b)  # instersection with leftmost line
-    cright = (a.astype(np.float) - a3) / (b3 - b)  # instersection with rightmost line
-    c2left = (a2 - a1) / (b1 - b2)  # instersection with leftmost line
-    c2right = (a2 - a3) / (b3 - b2)  # instersection with rightmost line
-    keep = [i for i in xrange(len(b)) if
-            b[i] == b1 or b[i] == b3 or cleft[i] <= c2left or cright[i] >= c2right]
+    keep = np.nonzero(_candidate_lines(a, b[:, np.newaxis])[:, 0])[0]
 
     a = a[keep]
     b = b[keep]
-    keep1 = np.array(keep)
-    del cleft, cright, keep
-
-    # Form a matrix for which ba(x,1) is the slope b(x) and ba(x,2) is the
-    # y-intercept a(x).  Sort this matrix in ascending order of slope,
-    # breaking ties in slope with the y-intercept.
-    ba = np.reshape(np.concatenate((b, a)), (len(a), 2), order='F')
-    ind = np.lexsort((ba[:, 1], ba[:, 0]))
-    ba = ba[ind, :]
-    keep1 = keep1[ind]
-    a = ba[:, 1];
-    b = ba[:, 0];
+
+    # Sort the lines in ascending order of slope, breaking ties in slope with the y-intercept.
+    ind = np.lexsort((a, b))
+    keep1 = keep[ind]
+    a = a[ind]
+    b = b[ind]
 
     # Then, from each pair of indices with the b component equal, remove
     # the one with smaller a component.  This code works because the sort
     # above enforced the condition: if b(i) == b(i+1), then a(i) <= a(i+1).
-    ind = []
-    tmp = np.diff(b)
-    keep = [i for i in xrange(len(tmp)) if tmp[i] != 0]
-    keep.append(len(tmp))
-    a = a[keep]
-    b = b[keep]
-    keep2 = keep
+    keep2 = np.append(np.nonzero(np.diff(b) != 0)[0], len(b) - 1)
+    a = a[keep2]
+    b = b[keep2]
     keep1 = keep1[keep2]
     return a, b, keep1
 
@@ -69,41 +47,180 @@ def AffineBreakPointsPrep(a, b):
 # A note about indexing:
 # For the vectors a and b,we need to reference a_1 or b_1 as a_0 or b_0, so we reference
 # a_i and b_i by a[i-1] and b[i-1] respectively.
-# A[0] is not important: it was defined by convenience
+# A is returned with 0-based indexes. Only the entries c[i + 1] for i in A are defined.
 
 def AffineBreakPoints(a, b):
-    # Preallocate for speed.  Instead of resizing the array A whenever we add
-    # to it or delete from it, we keep it the maximal size, and keep a length
-    # indicator Alen telling us how many of its entries are good.  When the
-    # function ends, we remove the unused elements from A before passing
-    # it.
-
     M = len(a)
-    c = np.zeros(M + 1)
-    A = np.zeros(M + 1)
-
-    # Step 0
-    i = 0;
-    c[i] = -float('Inf');
-    c[i + 1] = float('Inf');
-    A[1] = 1;
-    Alen = 1;
-
-    for i in xrange(1, M):
-        c[i + 1] = float('Inf')
-        while True:
-            j = int(A[Alen])  # jindex=Alen
-            c[j] = (a[j - 1] - a[i]) / (b[i] - b[j - 1])
-
-            if len(A) > 1 and c[j] <= c[int(A[Alen - 1])]:
-                Alen = Alen - 1  # Remove last element j
-                # continue in while(True) loop
-            else:
-                break  # quite while(True) loop
-
-        A[Alen + 1] = i + 1
-        Alen = Alen + 1
-
-    Alen = Alen + 1
-    A = A[1:Alen] - 1
-    return A, c
\ No newline at end of file
+
+    envelope = upper_envelope(a, b, prune=False)
+
+    A = np.nonzero(envelope['envelope'][:, 0])[0]
+
+    c = np.nan * np.ones(M + 1)
+    c[0] = -float('Inf')
+    c[envelope['lines'] + 1] = envelope['breakpoints']
+    c[A[-1] + 1] = float('Inf')
+
+    return A, c
+
+
+def _candidate_lines(a, b):
+    """
+    Preprocessing step of AffineBreakPointsPrep for each column of b. The lines that are not
+    kept can't be part of the upper envelope.
+
+    :param a: np.array(n) or np.array(nxr)
+    :param b: np.array(nxr)
+    :return: np.array(nxr) of booleans
+    """
+    if len(a.shape) == 1:
+        a = a[:, np.newaxis]
+    a = a.astype(np.float) * np.ones((1, b.shape[1]))
+
+    columns = np.arange(b.shape[1])
+
+    i1 = np.argmin(b, axis=0)  # [a1,b1] is best at z=-infinity
+    b1 = b[i1, columns]
+    a1 = a[i1, columns]
+    i2 = np.argmax(a, axis=0)  # [a2,b2] is best at z=0
+    a2 = a[i2, columns]
+    b2 = b[i2, columns]
+    i3 = np.argmax(b, axis=0)  # [a3,b3] is best at z=+infinity
+    b3 = b[i3, columns]
+    a3 = a[i3, columns]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cleft = (a - a1) / (b1 - b)  # instersection with leftmost line
+        cright = (a - a3) / (b3 - b)  # instersection with rightmost line
+        c2left = (a2 - a1) / (b1 - b2)  # instersection with leftmost line
+        c2right = (a2 - a3) / (b3 - b2)  # instersection with rightmost line
+
+        return (b == b1) | (b == b3) | (cleft <= c2left) | (cright >= c2right)
+
+
+def upper_envelope(a, b, prune=True):
+    """
+    Computes the upper envelope of the lines a[i] + b[i, j] * z, for each column j of b.
+
+    The lines of each column are sorted by slope. Then all the lines that are below or touch the
+    intersection of their two neighbors are removed at the same time, until no line is removed.
+    Every pass is vectorized over all the lines and columns.
+
+    :param a: np.array(n) or np.array(nxr), intercepts of the lines. If it's a vector, the
+        intercepts are shared by all the columns of b.
+    :param b: np.array(n) or np.array(nxr), slopes of the lines
+    :param prune: (boolean) If True, the lines discarded by the preprocessing step of
+        AffineBreakPointsPrep are removed before computing the envelope.
+    :return: {
+        'envelope': np.array(nxr) of booleans, True if the line is in the upper envelope,
+        'columns': np.array(s), column of each line of the envelope that isn't the last one,
+        'lines': np.array(s), index of those lines,
+        'next_lines': np.array(s), index of the next line in the envelope,
+        'breakpoints': np.array(s), z where the envelope changes from the line to the next line,
+    }
+    """
+    if len(b.shape) == 1:
+        b = b[:, np.newaxis]
+
+    if len(a.shape) == 1:
+        a = a[:, np.newaxis]
+
+    n, r = b.shape
+    b = b.astype(np.float)
+    a = a.astype(np.float) * np.ones((1, r))
+
+    if prune:
+        candidates = _candidate_lines(a, b)
+    else:
+        candidates = np.ones((n, r), dtype=bool)
+
+    # The candidate lines of each column are moved to the first rows, so the envelope is computed
+    # on an array with as many rows as candidates in the largest column.
+    cols, rows = np.nonzero(candidates.transpose())
+    counts = np.bincount(cols, minlength=r)
+    n_rows = max(np.max(counts), 1)
+    positions = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    lines = np.zeros((n_rows, r), dtype=np.int64)
+    lines[positions, cols] = rows
+    valid = np.zeros((n_rows, r), dtype=bool)
+    valid[positions, cols] = True
+    slopes = float('Inf') * np.ones((n_rows, r))
+    slopes[positions, cols] = b[rows, cols]
+    intercepts = -float('Inf') * np.ones((n_rows, r))
+    intercepts[positions, cols] = a[rows, cols]
+
+    # Sort the lines of each column in ascending order of slope, breaking ties with the intercept.
+    columns = np.arange(r)[np.newaxis, :]
+    order = np.lexsort((intercepts, slopes), axis=0)
+    lines = lines[order, columns]
+    alive = valid[order, columns]
+    a = intercepts[order, columns]
+    b = slopes[order, columns]
+
+    # Only the line with the largest intercept of each slope can be in the envelope.
+    alive[0: -1, :] &= (b[0: -1, :] != b[1:, :])
+
+    indexes = np.arange(n_rows)[:, np.newaxis] * np.ones((1, r), dtype=np.int64)
+
+    while True:
+        previous, following = _neighbors(alive, indexes)
+        interior = alive & (previous >= 0) & (following < n_rows)
+
+        if not np.any(interior):
+            break
+
+        rows, cols = np.nonzero(interior)
+        prev_rows = previous[rows, cols]
+        next_rows = following[rows, cols]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            c_left = (a[prev_rows, cols] - a[rows, cols]) / (b[rows, cols] - b[prev_rows, cols])
+            c_right = (a[rows, cols] - a[next_rows, cols]) / (b[next_rows, cols] - b[rows, cols])
+
+        remove = c_right <= c_left
+
+        if not np.any(remove):
+            break
+
+        alive[rows[remove], cols[remove]] = False
+
+    previous, following = _neighbors(alive, indexes)
+    rows, cols = np.nonzero(alive & (following < n_rows))
+    next_rows = following[rows, cols]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        breakpoints = (a[rows, cols] - a[next_rows, cols]) / (b[next_rows, cols] - b[rows, cols])
+
+    envelope = np.zeros((n, r), dtype=bool)
+    alive_rows, alive_cols = np.nonzero(alive)
+    envelope[lines[alive_rows, alive_cols], alive_cols] = True
+
+    return {
+        'envelope': envelope,
+        'columns': cols,
+        'lines': lines[rows, cols],
+        'next_lines': lines[next_rows, cols],
+        'breakpoints': breakpoints,
+    }
+
+
+def _neighbors(alive, indexes):
+    """
+    Computes the previous and the next alive line of each line of each column.
+
+    :param alive: np.array(nxr) of booleans
+    :param indexes: np.array(nxr), the index of the row of each entry
+    :return: (np.array(nxr), np.array(nxr)). -1 if there isn't a previous line, and n if there
+        isn't a next line.
+    """
+    n = alive.shape[0]
+
+    previous = np.maximum.accumulate(np.where(alive, indexes, -1), axis=0)
+    previous = np.concatenate((-np.ones((1, alive.shape[1]), dtype=np.int64), previous[0: -1, :]))
+
+    following = np.minimum.accumulate(np.where(alive, indexes, n)[::-1, :], axis=0)[::-1, :]
+    following = np.concatenate(
+        (following[1:, :], n * np.ones((1, alive.shape[1]), dtype=np.int64)))
+
+    return previous, following
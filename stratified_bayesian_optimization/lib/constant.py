@@ -74,6 +74,20 @@ GAMMA = 'gamma'
 WEIGHTED_UNIFORM_FINITE = 'weighted_uniform_finite'
 WEIGHTS = 'weights'
 MULTINOMIAL_DISTRIBUTION = 'multinomial_distribution'
+UNIFORM_BOX = 'uniform_box'
+LOWER_BOUNDS = 'lower_bounds'
+UPPER_BOUNDS = 'upper_bounds'
+# Number of panels of the composite Gauss-Legendre rule of the uniform box in each dimension
+N_PANELS = 'n_panels'
+DEFAULT_N_PANELS_UNIFORM_BOX = 4
+
+# Quadrature rules for the gamma and exponential distributions
+QUADRATURE_RULE = 'quadrature_rule'
+GAUSS_LAGUERRE = 'gauss_laguerre'
+QMC_HALTON = 'qmc_halton'
+DEFAULT_QUADRATURE_RULE = GAUSS_LAGUERRE
+DEFAULT_N_QUADRATURE_NODES = 10
+QMC_RANDOM_SEED = 1
 
 #Cache Quadrature
 QUADRATURES = 'quadrature'
@@ -95,7 +109,62 @@ DEBUGGING_DIR = 'data/debugging'
 
 BAYESIAN_QUADRATURE = 'bayesian_quadrature'
 
+# Names of the GP models
+GP_FITTING_GAUSSIAN = 'gp_fitting_gaussian'
+SPARSE_GP_FITTING_GAUSSIAN = 'sparse_gp_fitting_gaussian'
+ITERATIVE_GP_FITTING_GAUSSIAN = 'iterative_gp_fitting_gaussian'
+
+# Default number of inducing points of the sparse GP models
+DEFAULT_N_INDUCING_POINTS = 300
+# Minimum variance of the noise of the sparse GP models, relative to the variance of the kernel
+DTC_JITTER = 1e-6
+
+# Parameters of the conjugate gradients solver of the iterative GP models
+CG_TOLERANCE = 1e-8
+CG_MAX_ITERATIONS = 1000
+# Number of rows of the covariance matrix computed at the same time
+CG_BLOCK_SIZE = 1000
+# Minimum variance of the noise of the iterative GP models, relative to the variance of the kernel
+CG_JITTER = 1e-6
+# Parameters of the stochastic estimators of the log determinant and the traces
+DEFAULT_N_PROBE_VECTORS = 10
+DEFAULT_LANCZOS_ITERATIONS = 30
+
 # Default number of sampled parameters
 DEFAULT_N_PARAMETERS = 20
 
-DEFAULT_N_SAMPLES = 100
\ No newline at end of file
+# The Kronecker factorization of the covariance of a grid of points times tasks is used if at most
+# this fraction of the entries of the grid is missing. The correction of the missing entries costs
+# O(m^3) and loses precision as m grows, so sparser grids use the Cholesky decomposition.
+KRONECKER_MAX_MISSING_FRACTION = 0.1
+
+# Minimum number of samples of each chain of the MCMC to compute R-hat and the effective sample size
+MIN_SAMPLES_CHAINS_DIAGNOSTICS = 4
+
+DEFAULT_N_SAMPLES = 100
+
+# Bounds of the LRU caches: number of entries of each cache, and bytes used by all the caches of
+# the process
+CACHE_MAX_SIZE = 1000
+CACHE_MAX_MEMORY = 500 * 1024 ** 2
+# Cholesky decompositions are only cached for the most recent samples of the hyperparameters
+CACHE_MAX_SIZE_FACTORIZATIONS = 2 * DEFAULT_N_PARAMETERS
+# Kernels defined by arrays of parameters are reused for the most recent parameters
+CACHE_MAX_SIZE_KERNELS = 4 * DEFAULT_N_PARAMETERS
+
+# Bytes used by the blocks of kernel evaluations of the vectorized quadratures
+QUADRATURE_MEMORY_BUDGET = 100 * 1024 ** 2
+
+# Number of starting points scored by each vectorized call when the restarts of the optimizers are
+# screened
+RESTARTS_SCREENING_CHUNK_SIZE = 100
+
+# Adaptive discretization of SBO: a point x is removed from the discretization if
+# a(x) + SBO_SCREENING_STD * (s(x) + s(x*)) < a(x*), where a and s are the posterior mean and
+# standard deviation of G, and x* maximizes a. Its line can only be in the upper envelope of the
+# SBO for |z| > SBO_SCREENING_STD.
+SBO_SCREENING_STD = 3.0
+
+# Numpy arrays shared with the workers of Parallel are mapped from a shared memory file system if
+# they use at least SHARED_ARRAYS_MIN_BYTES bytes, instead of being copied to each worker.
+SHARED_ARRAYS_MIN_BYTES = 64 * 1024
\ No newline at end of file
@@ -41,27 +41,19 @@ class Distances(object):
         }
         """
 
-        N = x1.shape[0]
-
         r2 = np.abs(cls.dist_square_length_scale(ls, x1, x2))
         r = np.sqrt(r2)
 
         if x2 is None:
             x2 = x1
 
+        differences_2 = (x1[:, np.newaxis, :] - x2[np.newaxis, :, :]) ** 2
+
         gradient = {}
 
         for i in range(len(ls)):
-            x_i = x1[:, i:i + 1]
-            x_2_i = x2[:, i:i + 1]
-            x_dist = cdist(x_i, x_2_i, 'sqeuclidean')
-            product_1 = (1.0 / r) * x_dist
-            product_2 = - 1.0 / (ls[i] ** 3)
-            derivative = product_1 * product_2
-
-            for j in range(N):
-                derivative[j, j] = 0
-
+            derivative = differences_2[:, :, i] * (- 1.0 / (ls[i] ** 3)) / r
+            np.fill_diagonal(derivative, 0)
             gradient[i] = derivative
 
         return gradient
@@ -78,39 +70,41 @@ class Distances(object):
         :return: np.array(nxd) or {'first': np.array(nxd), 'second': np.array(nxdxd)}
         """
 
-        r2 = np.abs(cls.dist_square_length_scale(ls, point, x))
-        r = np.sqrt(r2)
+        gradient = cls.gradient_distance_length_scale_respect_points(ls, point[0:1, :], x, second)
 
-        gradient = np.zeros((x.shape[0], len(ls)))
+        if not second:
+            return gradient[0, :, :]
 
-        differences = {}
+        return {'first': gradient['first'][0, :, :], 'second': gradient['second'][0, :, :, :]}
 
-        for i in range(len(ls)):
-            differences[i] = (point[0:1, i] - x[:, i]) / (ls[i] ** 2)
-            factor = differences[i] / r
-            gradient[:, i] = factor
+    @classmethod
+    def gradient_distance_length_scale_respect_points(cls, ls, points, x, second=False):
+        """
+        Compute gradient of r = dist(points[i, :], x) respect to points[i, :], for all the points
+        at once.
+
+        :param ls: np.array(d)
+        :param points: np.array(mxd)
+        :param x: np.array(nxd)
+        :param second: (boolean) Hessian if it's True
+        :return: np.array(mxnxd) or {'first': np.array(mxnxd), 'second': np.array(mxnxdxd)}
+        """
+
+        r2 = np.abs(cls.dist_square_length_scale(ls, points, x))
+        r = np.sqrt(r2)
+
+        differences = (points[:, np.newaxis, :] - x[np.newaxis, :, :]) / (ls ** 2)
+        gradient = differences / r[:, :, np.newaxis]
 
         if not second:
             return gradient
 
-        cross_partial = {}
-
         r3 = r ** 3
-        gradient_2 = np.zeros((x.shape[0], len(ls)))
-        for i in xrange(len(ls)):
-            factor_1 = (r * (ls[i] ** 2)) ** -1
-            factor_2 = differences[i] ** 2 / r3
-
-            factor = factor_1 - factor_2
-            gradient_2[:, i] = factor
-            for j in xrange(i + 1, len(ls)):
-                cross_partial[(i, j)] = -1.0 * differences[i] * differences[j] /r3
-
-        hessian = np.zeros((x.shape[0], len(ls), len(ls)))
-        for j in xrange(len(ls)):
-            hessian[:, j, j] = gradient_2[:, j]
-            for h in xrange(j + 1, len(ls)):
-                hessian[:, j, h] = cross_partial[(j, h)][0, :]
-                hessian[:, h, j] = hessian[:, j, h]
+        hessian = - differences[:, :, :, np.newaxis] * differences[:, :, np.newaxis, :]
+        hessian /= r3[:, :, np.newaxis, np.newaxis]
+
+        diagonal = np.arange(len(ls))
+        hessian[:, :, diagonal, diagonal] += \
+            1.0 / (r[:, :, np.newaxis] * (ls[np.newaxis, np.newaxis, :] ** 2))
 
         return {'first': gradient, 'second': hessian}
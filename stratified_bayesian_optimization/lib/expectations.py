@@ -1,10 +1,226 @@
 from __future__ import absolute_import
 
+import itertools
+
 import numpy as np
 
+from scipy.special import roots_genlaguerre
 from scipy.stats import gamma
 
-N_SAMPLES = 10
+from stratified_bayesian_optimization.lib.constant import (
+    QUADRATURE_RULE,
+    GAUSS_LAGUERRE,
+    QMC_HALTON,
+    DEFAULT_QUADRATURE_RULE,
+    DEFAULT_N_QUADRATURE_NODES,
+    QMC_RANDOM_SEED,
+    UNIFORM_BOX,
+    LOWER_BOUNDS,
+    UPPER_BOUNDS,
+    N_PANELS,
+    DEFAULT_N_PANELS_UNIFORM_BOX,
+)
+from stratified_bayesian_optimization.lib.lru_cache import LRUCache
+
+N_SAMPLES = DEFAULT_N_QUADRATURE_NODES
+
+# Nodes and weights of the quadrature rules of the gamma and uniform box distributions, indexed
+# by the parameters of the distribution and the order of the rule.
+_quadrature_rules = LRUCache()
+
+
+def tensor_product_rule(nodes, weights):
+    """
+    Computes the tensor product of one dimensional quadrature rules.
+
+    :param nodes: [np.array(n_i)]
+    :param weights: [np.array(n_i)]
+    :return: (np.array(nxd), np.array(n)) nodes and weights, where d = len(nodes) and n is the
+        product of the n_i.
+    """
+    grid = np.array(list(itertools.product(*nodes)))
+    weights = np.prod(np.array(list(itertools.product(*weights))), axis=1)
+
+    return grid, weights
+
+
+def halton_sequence(n_points, dimension):
+    """
+    Computes the first n_points of the Halton sequence in [0, 1)^dimension.
+
+    :param n_points: int
+    :param dimension: int
+    :return: np.array(n_points x dimension)
+    """
+
+    primes = []
+    candidate = 2
+    while len(primes) < dimension:
+        if all(candidate % prime != 0 for prime in primes):
+            primes.append(candidate)
+        candidate += 1
+
+    sequence = np.zeros((n_points, dimension))
+    indexes = np.arange(1, n_points + 1)
+
+    for j, base in enumerate(primes):
+        remaining = indexes.copy()
+        factor = 1.0 / base
+        while np.any(remaining > 0):
+            sequence[:, j] += factor * (remaining % base)
+            remaining //= base
+            factor /= base
+
+    return sequence
+
+
+def gamma_quadrature_rule(parameters_dist, dim_w, n_samples=N_SAMPLES):
+    """
+    Computes the nodes and weights used to approximate expectations respect to W, where the
+    entries of W are i.i.d. gamma random variables. The rule only depends on the parameters, so
+    the expectations are deterministic.
+
+    :param parameters_dist: {'scale': [float], 'a': [float], QUADRATURE_RULE: str,
+        'n_samples': int}. If 'a' is missing, W is exponential. QUADRATURE_RULE is GAUSS_LAGUERRE
+        (tensor product of the Gauss-generalized-Laguerre rule) or QMC_HALTON (shifted Halton
+        points), and 'n_samples' is the order of the rule.
+    :param dim_w: int
+    :param n_samples: (int) order of the rule if it's not defined in parameters_dist
+    :return: (np.array(nxdim_w), np.array(n)) nodes and weights
+    """
+
+    a = float(parameters_dist.get('a', [1.0])[0])
+    scale = float(parameters_dist['scale'][0])
+    rule = parameters_dist.get(QUADRATURE_RULE, DEFAULT_QUADRATURE_RULE)
+    order = int(parameters_dist.get('n_samples') or n_samples)
+
+    index = (a, scale, rule, order, dim_w)
+    quadrature = _quadrature_rules.get(index)
+    if quadrature is not None:
+        return quadrature
+
+    if rule == GAUSS_LAGUERRE:
+        # E[g(W)] = (1 / Gamma(a)) * integral(x^(a-1) * exp(-x) * g(scale * x)) in each entry.
+        nodes, weights = roots_genlaguerre(order, a - 1.0)
+        nodes = scale * nodes
+        weights = weights / np.sum(weights)
+
+        nodes, weights = tensor_product_rule(dim_w * [nodes], dim_w * [weights])
+    elif rule == QMC_HALTON:
+        shift = np.random.RandomState(QMC_RANDOM_SEED).uniform(0, 1, dim_w)
+        uniform = (halton_sequence(order, dim_w) + shift) % 1.0
+        nodes = gamma.ppf(uniform, a, scale=scale)
+        weights = np.ones(order) / float(order)
+    else:
+        raise ValueError("Incorrect quadrature rule: %s" % rule)
+
+    _quadrature_rules[index] = (nodes, weights)
+
+    return nodes, weights
+
+
+def uniform_box_quadrature_rule(parameters_dist, dim_w, n_samples=N_SAMPLES):
+    """
+    Computes the nodes and weights used to approximate expectations respect to W, where W is
+    uniformly distributed on a box. It's the tensor product of composite Gauss-Legendre rules:
+    each side of the box is divided in N_PANELS panels, and a Gauss-Legendre rule is used in each
+    panel. A single rule resolves poorly the peak of the Matern kernel when the length scale is
+    small compared to the box, while the panels keep the rule accurate. The number of nodes is
+    (order * N_PANELS) ** dim_w.
+
+    :param parameters_dist: {LOWER_BOUNDS: [float], UPPER_BOUNDS: [float], 'n_samples': int,
+        N_PANELS: int}, where 'n_samples' is the order of the rule in each panel.
+    :param dim_w: int
+    :param n_samples: (int) order of the rule if it's not defined in parameters_dist
+    :return: (np.array(nxdim_w), np.array(n)) nodes and weights
+    """
+
+    lower_bounds = [float(bound) for bound in parameters_dist[LOWER_BOUNDS]]
+    upper_bounds = [float(bound) for bound in parameters_dist[UPPER_BOUNDS]]
+    order = int(parameters_dist.get('n_samples') or n_samples)
+    n_panels = int(parameters_dist.get(N_PANELS) or DEFAULT_N_PANELS_UNIFORM_BOX)
+
+    index = (UNIFORM_BOX, tuple(lower_bounds), tuple(upper_bounds), order, n_panels, dim_w)
+    quadrature = _quadrature_rules.get(index)
+    if quadrature is not None:
+        return quadrature
+
+    standard_nodes, standard_weights = np.polynomial.legendre.leggauss(order)
+
+    nodes = []
+    weights = []
+    for lower, upper in zip(lower_bounds, upper_bounds):
+        edges = np.linspace(lower, upper, n_panels + 1)
+        nodes.append(np.concatenate(
+            [edges[i] + 0.5 * (edges[i + 1] - edges[i]) * (standard_nodes + 1.0)
+             for i in xrange(n_panels)]))
+        weights.append(np.tile(0.5 * standard_weights / n_panels, n_panels))
+
+    nodes, weights = tensor_product_rule(nodes, weights)
+
+    _quadrature_rules[index] = (nodes, weights)
+
+    return nodes, weights
+
+
+def matern52_uniform_expect(points, lower, upper, length_scale):
+    """
+    Computes the expectation of the one dimensional Matern52 kernel m(W, point) for each point
+    in points, where W is uniformly distributed on [lower, upper]. The integral is elementary:
+        integral_0^d m(s) ds = (8 - (8 + 5as + a^2s^2) exp(-as)) / (3a), where a = sqrt(5) / l.
+
+    :param points: np.array(m)
+    :param lower: float
+    :param upper: float
+    :param length_scale: float
+    :return: np.array(m)
+    """
+    a = np.sqrt(5.0) / length_scale
+
+    def integral(t):
+        d = np.abs(t)
+        return np.sign(t) * (8.0 - (8.0 + 5.0 * a * d + (a * d) ** 2) * np.exp(-a * d)) / (3.0 * a)
+
+    return (integral(upper - points) - integral(lower - points)) / (upper - lower)
+
+
+def gradient_matern52_uniform_expect(points, lower, upper, length_scale):
+    """
+    Computes the derivative of matern52_uniform_expect respect to each point in points.
+
+    :param points: np.array(m)
+    :param lower: float
+    :param upper: float
+    :param length_scale: float
+    :return: np.array(m)
+    """
+    a = np.sqrt(5.0) / length_scale
+
+    def kernel(t):
+        d = a * np.abs(t)
+        return (1.0 + d + d ** 2 / 3.0) * np.exp(-d)
+
+    return (kernel(lower - points) - kernel(upper - points)) / (upper - lower)
+
+
+def matern52_uniform_double_expect(lower, upper, length_scale):
+    """
+    Computes the expectation of the one dimensional Matern52 kernel m(W, W'), where W and W' are
+    independent and uniformly distributed on [lower, upper]. It's equal to
+    2 * integral_0^L (L - s) m(s) ds / L^2, where L = upper - lower.
+
+    :param lower: float
+    :param upper: float
+    :param length_scale: float
+    :return: float
+    """
+    a = np.sqrt(5.0) / length_scale
+    length = float(upper - lower)
+    d = a * length
+
+    integral = (8.0 * length - (15.0 - (15.0 + 7.0 * d + d ** 2) * np.exp(-d)) / a) / (3.0 * a)
+
+    return 2.0 * integral / length ** 2
 
 
 def uniform_finite(f, point, index_points, domain_random, index_random, weights=None, double=False,
@@ -73,49 +289,180 @@ def uniform_finite(f, point, index_points, domain_random, index_random, weights=
     values = f(new_points)
     return np.average(values, axis=0, weights=weights)
 
+def uniform_finite_points(f, points, index_points, domain_random, index_random, weights=None,
+                          n_samples=None, max_evaluations=None, double=False):
+    """
+    Computes uniform_finite(f, points[i:i+1, :], ...) for each point in points. The points of all
+    the expectations are stacked, so f is evaluated once for each block of points.
+
+    If double is True, f is evaluated on the pairs of stacked blocks as in uniform_finite, and only
+    the pairs of the same point are averaged.
+
+    :param f: function that evaluates np.array(txk) and returns np.array(txm), or that evaluates
+        np.array(tx2k) and returns np.array(txt) if double is True
+    :param points: np.array(nxk)
+    :param index_points: [int]
+    :param domain_random: np.array(n_tasksx1)
+    :param index_random: [int]
+    :param weights: np.array(l), weights to compute a weighted average
+    :param n_samples: take a sample of the whole domain_random for each point instead of using all
+        the elements
+    :param max_evaluations: (int) maximum number of rows of each block evaluated by f. If it's
+        None, all the points are evaluated in one block.
+    :param double: boolean
+    :return: np.array(nxm), or np.array(n) if double is True
+    """
+
+    domain_random = np.array(domain_random)
+    n = points.shape[0]
+
+    def stack_points(random):
+        new_points = np.zeros((n, random.shape[1], random.shape[2] + points.shape[1]))
+        new_points[:, :, index_points] = points[:, np.newaxis, :]
+        new_points[:, :, index_random] = random
+        return new_points
+
+    if n_samples is not None and n_samples > 0:
+        index = np.random.choice(len(domain_random), (n, n_samples), replace=True, p=weights)
+        new_points = stack_points(domain_random[index, :])
+
+        if double:
+            index = np.random.choice(len(domain_random), (n, n_samples), replace=True, p=weights)
+            new_points_2 = stack_points(domain_random[index, :])
+        weights = None
+    else:
+        new_points = stack_points(np.repeat(domain_random[np.newaxis, :, :], n, axis=0))
+        new_points_2 = new_points
+
+    n_random = new_points.shape[1]
+    dimension = new_points.shape[2]
+
+    if max_evaluations is None:
+        chunk_size = n
+    else:
+        chunk_size = max(1, int(max_evaluations) / n_random)
+
+    if double and weights is not None:
+        weights = np.outer(weights, weights)
+
+    values = []
+    for start in xrange(0, n, chunk_size):
+        block = new_points[start: start + chunk_size, :, :]
+        n_block = block.shape[0]
+        block = block.reshape((n_block * n_random, dimension))
+
+        if double:
+            block_2 = new_points_2[start: start + chunk_size, :, :]
+            block_2 = block_2.reshape((n_block * n_random, dimension))
+            evaluations = f(np.concatenate([block, block_2], axis=1))
+            evaluations = evaluations.reshape((n_block, n_random, n_block, n_random))
+            evaluations = evaluations[np.arange(n_block), :, np.arange(n_block), :]
+            evaluations = evaluations.reshape((n_block, n_random ** 2))
+            if weights is not None:
+                values.append(np.average(evaluations, axis=1, weights=weights.reshape(-1)))
+            else:
+                values.append(np.mean(evaluations, axis=1))
+        else:
+            evaluations = f(block)
+            evaluations = evaluations.reshape((n_block, n_random, evaluations.shape[1]))
+            values.append(np.average(evaluations, axis=1, weights=weights))
+
+    return np.concatenate(values, axis=0)
+
+
+def gamma_expect_points(f, points, index_points, index_random, parameters_dist,
+                        n_samples=N_SAMPLES, max_evaluations=None, double=False):
+    """
+    Computes gamma_expect(f, points[i:i+1, :], ...) for each point in points, see
+    uniform_finite_points.
+
+    :param f: function that evaluates np.array(txk) and returns np.array(txm)
+    :param points: np.array(nxk)
+    :param index_points: [int]
+    :param index_random: [int]
+    :param parameters_dist: {'scale':[float], 'a': [int]}, see gamma_quadrature_rule
+    :param n_samples: (int) order of the quadrature rule
+    :param max_evaluations: (int) maximum number of rows of each block evaluated by f
+    :param double: boolean
+    :return: np.array(nxm), or np.array(n) if double is True
+    """
+
+    nodes, weights = gamma_quadrature_rule(parameters_dist, len(index_random), n_samples)
+
+    return uniform_finite_points(f, points, index_points, nodes, index_random, weights=weights,
+                                 max_evaluations=max_evaluations, double=double)
+
+
 def gamma_expect(f, point, index_points, index_random, parameters_dist, n_samples=N_SAMPLES,
                  double=False):
     """
-    Computes the expectation of f(z), where z=(point, x) which is equal to:
-        mean(f((point, x)): x in domain_random), where
+    Computes the expectation of f(z), where z=(point, x) and the entries of x are i.i.d. gamma
+    random variables, using the quadrature rule defined by parameters_dist, where
     z[index_points[i]] = point[i].
 
-    If double is True, it computes the mean over all the points. Used for the variance.
+    If double is True, it computes the mean over all the pairs of nodes. Used for the variance.
 
     :param f: function
     :param point: np.array(1xk)
     :param index_points: [int]
     :param index_random: [int]
-    :param parameters_dist: {'scale':[float], 'a': [int]}
-    :param n_samples: int
+    :param parameters_dist: {'scale':[float], 'a': [int]}, see gamma_quadrature_rule
+    :param n_samples: (int) order of the quadrature rule
     :param double: boolean
     :return: np.array
     """
 
-    if double:
-        n_samples = 100
+    nodes, weights = gamma_quadrature_rule(parameters_dist, len(index_random), n_samples)
 
-    a = parameters_dist['a'][0]
-    scale = parameters_dist['scale'][0]
+    return multi_expect(f, point, index_points, nodes, index_random, weights, double=double)
 
-    dim_w = len(index_random)
+def uniform_box_expect(f, point, index_points, index_random, parameters_dist,
+                       n_samples=N_SAMPLES, double=False):
+    """
+    Computes the expectation of f(z), where z=(point, x) and x is uniformly distributed on the box
+    defined by parameters_dist, where z[index_points[i]] = point[i].
 
-    new_points = np.zeros((n_samples, len(index_random) + point.shape[1]))
-    new_points[:, index_points] = np.repeat(point, n_samples, axis=0)
-    random = gamma.rvs(a, scale=scale, size=(n_samples, dim_w))
-    new_points[:, index_random] = random
+    If double is True, it computes the mean over all the pairs of nodes. Used for the variance.
 
-    if double:
-        random_2 = gamma.rvs(a, scale=scale, size=(n_samples, dim_w))
-        new_points_2 = new_points.copy()
-        new_points_2[:, index_random] = random_2
-        new_points = np.concatenate([new_points, new_points_2], axis=1)
-        values = f(new_points)
-        return np.mean(values)
+    :param f: function
+    :param point: np.array(1xk)
+    :param index_points: [int]
+    :param index_random: [int]
+    :param parameters_dist: {LOWER_BOUNDS: [float], UPPER_BOUNDS: [float]}, see
+        uniform_box_quadrature_rule
+    :param n_samples: (int) order of the quadrature rule
+    :param double: boolean
+    :return: np.array
+    """
 
-    values = f(new_points)
+    nodes, weights = uniform_box_quadrature_rule(parameters_dist, len(index_random), n_samples)
+
+    return multi_expect(f, point, index_points, nodes, index_random, weights, double=double)
+
+
+def uniform_box_expect_points(f, points, index_points, index_random, parameters_dist,
+                              n_samples=N_SAMPLES, max_evaluations=None, double=False):
+    """
+    Computes uniform_box_expect(f, points[i:i+1, :], ...) for each point in points, see
+    uniform_finite_points.
+
+    :param f: function that evaluates np.array(txk) and returns np.array(txm)
+    :param points: np.array(nxk)
+    :param index_points: [int]
+    :param index_random: [int]
+    :param parameters_dist: {LOWER_BOUNDS: [float], UPPER_BOUNDS: [float]}, see
+        uniform_box_quadrature_rule
+    :param n_samples: (int) order of the quadrature rule
+    :param max_evaluations: (int) maximum number of rows of each block evaluated by f
+    :param double: boolean
+    :return: np.array(nxm), or np.array(n) if double is True
+    """
+
+    nodes, weights = uniform_box_quadrature_rule(parameters_dist, len(index_random), n_samples)
+
+    return uniform_finite_points(f, points, index_points, nodes, index_random, weights=weights,
+                                 max_evaluations=max_evaluations, double=double)
 
-    return np.mean(values, axis=0)
 
 def multi_expect(f, point, index_points, domain_random, index_random, weights,
                  double=False):
@@ -236,26 +583,49 @@ def gradient_multi(f, point, index_points, domain_random, index_random, points_2
 
 def gradient_gamma(f, point, index_points, index_random, points_2, parameters_kernel,
                    parameters_dist, n_samples=N_SAMPLES):
+    """
+    Computes the gradient of the expectation of f(z, point_), where z=(point, x), for each
+    point_ in points_2, and the entries of x are i.i.d. gamma random variables.
+
+    :param f: function
+    :param point: np.array(1xk)
+    :param index_points: [int]
+    :param index_random: [int]
+    :param points_2: np.array(mxk')
+    :param parameters_kernel: np.array(n)
+    :param parameters_dist: {'scale':[float], 'a': [int]}, see gamma_quadrature_rule
+    :param n_samples: (int) order of the quadrature rule
+    :return: np.array(kxm)
+    """
 
-    a = parameters_dist['a'][0]
-    scale = parameters_dist['scale'][0]
+    nodes, weights = gamma_quadrature_rule(parameters_dist, len(index_random), n_samples)
 
-    dim_w = len(index_random)
+    return gradient_multi(f, point, index_points, nodes, index_random, points_2,
+                          parameters_kernel, weights)
 
-    new_points = np.zeros((n_samples, len(index_random) + point.shape[1]))
-    new_points[:, index_points] = np.repeat(point, n_samples, axis=0)
-    random = gamma.rvs(a, scale=scale, size=(n_samples, dim_w))
-    new_points[:, index_random] = random
+def gradient_uniform_box(f, point, index_points, index_random, points_2, parameters_kernel,
+                         parameters_dist, n_samples=N_SAMPLES):
+    """
+    Computes the gradient of the expectation of f(z, point_), where z=(point, x), for each
+    point_ in points_2, and x is uniformly distributed on a box.
 
-    gradients = np.zeros((new_points.shape[0], point.shape[1], points_2.shape[0]))
+    :param f: function
+    :param point: np.array(1xk)
+    :param index_points: [int]
+    :param index_random: [int]
+    :param points_2: np.array(mxk')
+    :param parameters_kernel: np.array(n)
+    :param parameters_dist: {LOWER_BOUNDS: [float], UPPER_BOUNDS: [float]}, see
+        uniform_box_quadrature_rule
+    :param n_samples: (int) order of the quadrature rule
+    :return: np.array(kxm)
+    """
 
-    for i in xrange(new_points.shape[0]):
-        value = f(new_points[i:i+1, :], points_2, parameters_kernel)[:, index_points]
-        gradients[i, :, :] = value.transpose()
+    nodes, weights = uniform_box_quadrature_rule(parameters_dist, len(index_random), n_samples)
 
-    gradient = np.mean(gradients, axis=0)
+    return gradient_multi(f, point, index_points, nodes, index_random, points_2,
+                          parameters_kernel, weights)
 
-    return gradient
 
 def hessian_uniform_finite(f, point, index_points, domain_random, index_random, points_2,
                             parameters_kernel, weights=None, n_samples=None):
@@ -301,27 +671,49 @@ def hessian_uniform_finite(f, point, index_points, domain_random, index_random,
 
 def hessian_gamma(f, point, index_points, index_random, points_2, parameters_kernel,
                   parameters_dist, n_samples=N_SAMPLES):
+    """
+    Computes the Hessian of the expectation of f(z, point_), where z=(point, x), for each
+    point_ in points_2, and the entries of x are i.i.d. gamma random variables.
 
-    a = parameters_dist['a'][0]
-    scale = parameters_dist['scale'][0]
+    :param f: function
+    :param point: np.array(1xk)
+    :param index_points: [int]
+    :param index_random: [int]
+    :param points_2: np.array(mxk')
+    :param parameters_kernel: np.array(n)
+    :param parameters_dist: {'scale':[float], 'a': [int]}, see gamma_quadrature_rule
+    :param n_samples: (int) order of the quadrature rule
+    :return: np.array(mxkxk)
+    """
 
-    dim_w = len(index_random)
+    nodes, weights = gamma_quadrature_rule(parameters_dist, len(index_random), n_samples)
 
-    new_points = np.zeros((n_samples, len(index_random) + point.shape[1]))
-    new_points[:, index_points] = np.repeat(point, n_samples, axis=0)
-    random = gamma.rvs(a, scale=scale, size=(n_samples, dim_w))
-    new_points[:, index_random] = random
+    return hessian_uniform_finite(f, point, index_points, nodes, index_random, points_2,
+                                  parameters_kernel, weights=weights)
 
-    hessian = np.zeros((new_points.shape[0], points_2.shape[0], point.shape[1], point.shape[1]))
 
-    for i in xrange(new_points.shape[0]):
-        value = f(new_points[i:i+1, :], points_2, parameters_kernel)[:, index_points]
-        value = value[:, :, index_points]
-        hessian[i, :, :, :] = value
+def hessian_uniform_box(f, point, index_points, index_random, points_2, parameters_kernel,
+                        parameters_dist, n_samples=N_SAMPLES):
+    """
+    Computes the Hessian of the expectation of f(z, point_), where z=(point, x), for each
+    point_ in points_2, and x is uniformly distributed on a box.
 
-    hessian = np.mean(hessian, axis=0)
+    :param f: function
+    :param point: np.array(1xk)
+    :param index_points: [int]
+    :param index_random: [int]
+    :param points_2: np.array(mxk')
+    :param parameters_kernel: np.array(n)
+    :param parameters_dist: {LOWER_BOUNDS: [float], UPPER_BOUNDS: [float]}, see
+        uniform_box_quadrature_rule
+    :param n_samples: (int) order of the quadrature rule
+    :return: np.array(mxkxk)
+    """
 
-    return hessian
+    nodes, weights = uniform_box_quadrature_rule(parameters_dist, len(index_random), n_samples)
+
+    return hessian_uniform_finite(f, point, index_points, nodes, index_random, points_2,
+                                  parameters_kernel, weights=weights)
 
 
 def gradient_uniform_finite_resp_candidate(f, candidate_point, index_points, domain_random,
@@ -365,21 +757,49 @@ def gradient_uniform_finite_resp_candidate(f, candidate_point, index_points, dom
 
 def gradient_gamma_resp_candidate(f, candidate_point, index_points, index_random, points,
                                   parameters_kernel, parameters_dist, n_samples=N_SAMPLES):
-    a = parameters_dist['a'][0]
-    scale = parameters_dist['scale'][0]
+    """
+    Computes the gradient of the expectation of f(z, candidate_point) respect to candidate_point,
+    where z=(point, x) for each point in points, and the entries of x are i.i.d. gamma random
+    variables.
 
-    dim_w = len(index_random)
+    :param f: function
+    :param candidate_point: np.array(1xk)
+    :param index_points: [int]
+    :param index_random: [int]
+    :param points: np.array(mxk')
+    :param parameters_kernel: np.array(n)
+    :param parameters_dist: {'scale':[float], 'a': [int]}, see gamma_quadrature_rule
+    :param n_samples: (int) order of the quadrature rule
+    :return: np.array(kxm)
+    """
 
-    new_points = np.zeros((n_samples, len(index_random) + points.shape[1]))
+    nodes, weights = gamma_quadrature_rule(parameters_dist, len(index_random), n_samples)
 
-    gradients = np.zeros((candidate_point.shape[1], points.shape[0]))
+    return gradient_uniform_finite_resp_candidate(f, candidate_point, index_points, nodes,
+                                                  index_random, points, parameters_kernel,
+                                                  weights=weights)
 
-    for i in xrange(points.shape[0]):
-        point = points[i : i+1, :]
-        new_points[:, index_points] = np.repeat(point, n_samples, axis=0)
-        random = gamma.rvs(a, scale=scale, size=(n_samples, dim_w))
-        new_points[:, index_random] = random
-        values = f(candidate_point, new_points, parameters_kernel)
-        gradients[:, i] = np.mean(values, axis=0)
 
-    return gradients
+def gradient_uniform_box_resp_candidate(f, candidate_point, index_points, index_random, points,
+                                        parameters_kernel, parameters_dist, n_samples=N_SAMPLES):
+    """
+    Computes the gradient of the expectation of f(z, candidate_point) respect to candidate_point,
+    where z=(point, x) for each point in points, and x is uniformly distributed on a box.
+
+    :param f: function
+    :param candidate_point: np.array(1xk)
+    :param index_points: [int]
+    :param index_random: [int]
+    :param points: np.array(mxk')
+    :param parameters_kernel: np.array(n)
+    :param parameters_dist: {LOWER_BOUNDS: [float], UPPER_BOUNDS: [float]}, see
+        uniform_box_quadrature_rule
+    :param n_samples: (int) order of the quadrature rule
+    :return: np.array(kxm)
+    """
+
+    nodes, weights = uniform_box_quadrature_rule(parameters_dist, len(index_random), n_samples)
+
+    return gradient_uniform_finite_resp_candidate(f, candidate_point, index_points, nodes,
+                                                  index_random, points, parameters_kernel,
+                                                  weights=weights)
@@ -41,10 +41,216 @@ def cholesky(cov, max_tries=5):
 def cho_solve(chol, y):
     """
     Solves the systems chol * chol^T * x = y
-    :param cov: np.array(nxn)
+    :param cov: np.array(nxn), or a factorization object of the covariance matrix that defines its
+        own cho_solve (e.g. the factorizations of the sparse and iterative GP models).
     :param y: np.array(n)
     :return: np.array(n)
     """
 
+    if not isinstance(chol, np.ndarray):
+        return chol.cho_solve(y)
+
     chol = np.asfortranarray(chol)
     return lapack.dpotrs(chol, y, lower=1)[0]
+
+
+def posterior_cov_solve(chol, y):
+    """
+    Computes A * y, where A is the matrix such that the posterior covariance of the GP is
+    cov(x, z) - cov(x, X) * A * cov(X, z). For the exact GP, A is the inverse of the covariance
+    matrix of the observations, so it's cho_solve. The factorizations of the approximate GP models
+    define their own A with the method posterior_cov_solve (e.g. the sparse GP models).
+
+    :param chol: np.array(nxn), or a factorization object
+    :param y: np.array(n) or np.array(nxk)
+    :return: np.array(n) or np.array(nxk)
+    """
+
+    if hasattr(chol, 'posterior_cov_solve'):
+        return chol.posterior_cov_solve(y)
+
+    return cho_solve(chol, y)
+
+
+def cholesky_append(chol, cross_cov, cov_new, max_tries=5):
+    """
+    Computes the Cholesky decomposition of the block matrix [[cov, cross_cov],
+    [cross_cov^T, cov_new]] given the Cholesky decomposition chol of cov. Only the new rows
+    are computed, so the cost is O(n^2 * k) instead of O((n + k)^3).
+
+    :param chol: (np.array(nxn)) cholesky decomposition of cov
+    :param cross_cov: np.array(nxk)
+    :param cov_new: np.array(kxk)
+    :param max_tries: int
+    :return: np.array((n+k)x(n+k))
+    """
+
+    n = chol.shape[0]
+    k = cov_new.shape[0]
+
+    chol_cross = linalg.solve_triangular(chol, cross_cov, lower=True)
+    schur_complement = cov_new - np.dot(chol_cross.transpose(), chol_cross)
+    chol_new = cholesky(schur_complement, max_tries=max_tries)
+
+    new_chol = np.zeros((n + k, n + k))
+    new_chol[0: n, 0: n] = chol
+    new_chol[n:, 0: n] = chol_cross.transpose()
+    new_chol[n:, n:] = chol_new
+
+    return new_chol
+
+
+def log_determinant(chol):
+    """
+    Computes log(det(chol * chol^T))
+    :param chol: np.array(nxn), or a factorization object that defines its own log_determinant.
+    :return: float
+    """
+
+    if not isinstance(chol, np.ndarray):
+        return chol.log_determinant()
+
+    return 2.0 * np.sum(np.log(np.diag(chol)))
+
+
+class KroneckerFactorization(object):
+    """
+    Factorization of cov = S * (cov_1 kron cov_2 + noise * I) * S^T, where S selects the training
+    points from the grid of points_1 times points_2. It's used when the training points are the
+    grid, or most of it, and the kernel is separable, e.g. a grid of points times all the tasks.
+    It only needs the eigendecompositions of cov_1 and cov_2, so the cost is O(n_1^3 + n_2^3)
+    instead of O((n_1 * n_2)^3).
+    If m entries of the grid are missing, the inverse of cov is the Schur complement of the
+    missing entries in the inverse of the covariance of the whole grid, which costs
+    O(m * n_1 * n_2 * (n_1 + n_2) + m^3) more.
+    """
+
+    def __init__(self, cov_1, cov_2, noise, positions, jitter=1e-10):
+        """
+        :param cov_1: np.array(n_1 x n_1)
+        :param cov_2: np.array(n_2 x n_2)
+        :param noise: (float) variance of the noise
+        :param positions: (np.array(n)) the training point i is the entry positions[i] of the
+            grid, where the entry a * n_2 + b is (points_1[a], points_2[b]). Each entry appears at
+            most once.
+        :param jitter: (float) the eigenvalues of the covariance of the grid are at least jitter
+            times the largest one.
+        """
+        self.positions = positions
+        self.n_1 = cov_1.shape[0]
+        self.n_2 = cov_2.shape[0]
+
+        eigenvalues_1, self.eigenvectors_1 = np.linalg.eigh(cov_1)
+        eigenvalues_2, self.eigenvectors_2 = np.linalg.eigh(cov_2)
+
+        eigenvalues = np.outer(np.clip(eigenvalues_1, 0, None), np.clip(eigenvalues_2, 0, None))
+        eigenvalues += noise
+        self.eigenvalues = np.clip(eigenvalues, jitter * np.max(eigenvalues), None)
+
+        self.missing = np.setdiff1d(np.arange(self.n_1 * self.n_2), positions)
+        self.solve_missing = None
+        self.chol_missing = None
+
+        if len(self.missing) > 0:
+            # Columns of the inverse of the covariance of the grid of the missing entries.
+            columns = np.zeros((self.n_1 * self.n_2, len(self.missing)))
+            columns[self.missing, np.arange(len(self.missing))] = 1.0
+            self.solve_missing = self._solve_grid(columns)
+            self.chol_missing = cholesky(self.solve_missing[self.missing, :])
+
+    def _solve_grid(self, values):
+        """
+        Solves the system (cov_1 kron cov_2 + noise * I) * x = values
+
+        :param values: np.array((n_1 * n_2) x k)
+        :return: np.array((n_1 * n_2) x k)
+        """
+        grid = values.reshape((self.n_1, self.n_2, -1))
+        grid = np.einsum('ia,ibk,bj->ajk', self.eigenvectors_1, grid, self.eigenvectors_2)
+        grid /= self.eigenvalues[:, :, np.newaxis]
+        grid = np.einsum('ai,ibk,jb->ajk', self.eigenvectors_1, grid, self.eigenvectors_2)
+        return grid.reshape((self.n_1 * self.n_2, -1))
+
+    def _multiply_grid(self, matrix_1, matrix_2, values):
+        """
+        Computes (matrix_1 kron matrix_2) * values
+
+        :param matrix_1: np.array(n_1 x n_1)
+        :param matrix_2: np.array(n_2 x n_2)
+        :param values: np.array((n_1 * n_2) x k)
+        :return: np.array((n_1 * n_2) x k)
+        """
+        grid = values.reshape((self.n_1, self.n_2, -1))
+        grid = np.einsum('ia,abk,jb->ijk', matrix_1, grid, matrix_2)
+        return grid.reshape((self.n_1 * self.n_2, -1))
+
+    def cho_solve(self, y):
+        """
+        Solves the system cov * x = y
+        :param y: np.array(n) or np.array(nxk)
+        :return: np.array(n) or np.array(nxk)
+        """
+        y = np.asarray(y, dtype=float)
+        vector = y.ndim == 1
+
+        values = np.zeros((self.n_1 * self.n_2, 1 if vector else y.shape[1]))
+        values[self.positions, :] = y.reshape((len(self.positions), -1))
+
+        solve = self._solve_grid(values)
+
+        if self.chol_missing is not None:
+            solve -= np.dot(self.solve_missing,
+                            cho_solve(self.chol_missing, solve[self.missing, :]))
+
+        solve = solve[self.positions, :]
+
+        if vector:
+            return solve[:, 0]
+        return solve
+
+    def log_determinant(self):
+        """
+        :return: (float) log(det(cov))
+        """
+        log_det = np.sum(np.log(self.eigenvalues))
+
+        if self.chol_missing is not None:
+            log_det += log_determinant(self.chol_missing)
+
+        return log_det
+
+    def trace_solve(self, matrix_1, matrix_2):
+        """
+        Computes trace(cov^-1 * S * (matrix_1 kron matrix_2) * S^T), e.g. the trace needed by the
+        gradient of the log likelihood when matrix_1 or matrix_2 is a derivative of cov_1 or cov_2.
+
+        :param matrix_1: np.array(n_1 x n_1)
+        :param matrix_2: np.array(n_2 x n_2)
+        :return: float
+        """
+        diagonal_1 = np.einsum('ai,ab,bi->i', self.eigenvectors_1, matrix_1, self.eigenvectors_1)
+        diagonal_2 = np.einsum('ai,ab,bi->i', self.eigenvectors_2, matrix_2, self.eigenvectors_2)
+
+        trace = np.sum(np.outer(diagonal_1, diagonal_2) / self.eigenvalues)
+
+        if self.chol_missing is not None:
+            product = np.dot(self.solve_missing.transpose(),
+                             self._multiply_grid(matrix_1, matrix_2, self.solve_missing))
+            trace -= np.trace(cho_solve(self.chol_missing, product))
+
+        return trace
+
+    def quadratic_form(self, vector, matrix_1, matrix_2):
+        """
+        Computes vector^T * S * (matrix_1 kron matrix_2) * S^T * vector
+
+        :param vector: np.array(n)
+        :param matrix_1: np.array(n_1 x n_1)
+        :param matrix_2: np.array(n_2 x n_2)
+        :return: float
+        """
+        grid = np.zeros(self.n_1 * self.n_2)
+        grid[self.positions] = vector
+        grid = grid.reshape((self.n_1, self.n_2))
+
+        return np.sum(grid * np.dot(np.dot(matrix_1, grid), matrix_2.transpose()))
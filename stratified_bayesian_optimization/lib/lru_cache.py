@@ -0,0 +1,195 @@
+from __future__ import absolute_import
+
+from collections import OrderedDict
+import threading
+import weakref
+
+import numpy as np
+
+from stratified_bayesian_optimization.lib.constant import (
+    CACHE_MAX_SIZE,
+    CACHE_MAX_MEMORY,
+)
+from stratified_bayesian_optimization.lib.parallel import Parallel
+
+
+class LRUCache(object):
+    """
+    Dictionary bounded by the number of entries and by the memory used by its numpy arrays. When
+    one of the bounds is exceeded, the least recently used entries are removed.
+    The memory used by all the caches of the process is bounded by max_total_memory
+    (CACHE_MAX_MEMORY): when it's exceeded, the least recently used entries of the caches that use
+    more memory are removed, but the most recent entry of each cache is always kept.
+    It's used to cache the computations associated to each sample of the hyperparameters (e.g.
+    Cholesky decompositions, solves, quadratures and posterior means), so alternating between
+    samples doesn't repeat those computations.
+    The writes and removals update the version of the cache (see Parallel.update_version), so the
+    objects that contain the cache are sent again to the workers of the persistent pool.
+    """
+
+    max_total_memory = CACHE_MAX_MEMORY
+
+    # All the caches share the memory budget, so they share the lock too.
+    _caches = weakref.WeakSet()
+    lock = threading.RLock()
+
+    def __init__(self, max_size=CACHE_MAX_SIZE, max_memory=None):
+        """
+        :param max_size: (int) maximum number of entries
+        :param max_memory: (int) maximum number of bytes used by the cached numpy arrays of this
+            cache. If it's None, only the memory of all the caches is bounded.
+        """
+        self.max_size = max_size
+        self.max_memory = max_memory
+
+        self.data = OrderedDict()
+        self.memory_entries = {}
+        self.memory = 0
+
+        self.hits = 0
+        self.misses = 0
+
+        LRUCache._caches.add(self)
+
+    @staticmethod
+    def memory_value(value):
+        """
+        Computes the number of bytes used by the numpy arrays in value.
+
+        :param value: np.array, or list, tuple or dict whose values are cached values.
+        :return: int
+        """
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        if isinstance(value, (list, tuple)):
+            return sum(LRUCache.memory_value(element) for element in value)
+        if isinstance(value, dict):
+            return sum(LRUCache.memory_value(element) for element in value.itervalues())
+        return 0
+
+    def get(self, key, default=None):
+        """
+        Gets the value associated to key, and marks it as the most recently used entry.
+
+        :param key: hashable object
+        :param default: returned if key is not in the cache
+        :return: cached value or default
+        """
+        with self.lock:
+            if key not in self.data:
+                self.misses += 1
+                return default
+            self.hits += 1
+            value = self.data.pop(key)
+            self.data[key] = value
+            return value
+
+    def __getitem__(self, key):
+        with self.lock:
+            if key not in self.data:
+                self.misses += 1
+                raise KeyError(key)
+            return self.get(key)
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            if key in self.data:
+                self._remove(key)
+
+            self.data[key] = value
+            self.memory_entries[key] = self.memory_value(value)
+            self.memory += self.memory_entries[key]
+
+            # The last entry is kept even if it exceeds the memory bound.
+            while len(self.data) > 1 and (len(self.data) > self.max_size or
+                                          (self.max_memory is not None and
+                                           self.memory > self.max_memory)):
+                self._remove(next(iter(self.data)))
+
+            self._bound_total_memory()
+
+            Parallel.update_version(self)
+
+    @classmethod
+    def _bound_total_memory(cls):
+        """
+        Removes the least recently used entries of the caches that use more memory, until the
+        memory used by all the caches is at most max_total_memory.
+        """
+        caches = [cache for cache in cls._caches if len(cache.data) > 1]
+        total_memory = sum(cache.memory for cache in cls._caches)
+
+        while caches and total_memory > cls.max_total_memory:
+            cache = max(caches, key=lambda cache: cache.memory)
+            key = next(iter(cache.data))
+            total_memory -= cache.memory_entries[key]
+            cache._remove(key)
+
+            if len(cache.data) == 1:
+                caches.remove(cache)
+
+    @classmethod
+    def total_memory(cls):
+        """
+        :return: (int) number of bytes used by the cached numpy arrays of all the caches
+        """
+        return sum(cache.memory for cache in cls._caches)
+
+    def __delitem__(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        """
+        Removes key from the cache.
+
+        :param key: hashable object
+        """
+        del self.data[key]
+        self.memory -= self.memory_entries.pop(key)
+        Parallel.update_version(self)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+    def keys(self):
+        """
+        :return: [keys] from the least recently used to the most recently used
+        """
+        return self.data.keys()
+
+    def items(self):
+        """
+        :return: [(key, value)] from the least recently used to the most recently used
+        """
+        return self.data.items()
+
+    def clear(self):
+        """
+        Removes all the entries, but it keeps the hits and misses counters.
+        """
+        with self.lock:
+            self.data = OrderedDict()
+            self.memory_entries = {}
+            self.memory = 0
+            Parallel.update_version(self)
+
+    @property
+    def statistics(self):
+        """
+        :return: {'hits': int, 'misses': int, 'size': int, 'memory': int}
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.data),
+            'memory': self.memory,
+        }
+
+    def __setstate__(self, state):
+        # The caches sent to other processes share the memory budget of those processes.
+        self.__dict__.update(state)
+        LRUCache._caches.add(self)
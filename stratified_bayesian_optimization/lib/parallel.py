@@ -4,14 +4,365 @@ import multiprocessing as mp
 import multiprocessing.pool
 from multiprocessing.pool import ThreadPool
 
+import atexit
+import cPickle
+from cStringIO import StringIO
+from functools import wraps
+import os
+import weakref
+
+import numpy as np
 
 from stratified_bayesian_optimization.initializers.log import SBOLog
+from stratified_bayesian_optimization.lib.shared_memory import (
+    SharedArrays,
+    write_shared_file,
+)
 
 logger = SBOLog(__name__)
 
+# Objects received by a worker of the persistent pool: {key: (version, object)}
+_worker_objects = {}
+
+
+class BroadcastReference(object):
+    """
+    Reference to an object broadcast to the workers. The pickled object is written in a file of a
+    shared memory file system, and the workers of the persistent pool load it only once per
+    version of the object. The arrays published in SharedArrays are pickled as references to
+    their own files, so the workers map them instead of copying them. If the shared memory file
+    system is full, the pickled object is sent with the reference.
+    """
+
+    def __init__(self, key, version, shared_file, data=None):
+        """
+        :param key: (int) token of the object
+        :param version: (int) number of the write of the object
+        :param shared_file: (SharedFile) file with the pickled object, or None
+        :param data: (str) pickled object if shared_file is None
+        """
+        self.key = key
+        self.version = version
+        self.shared_file = shared_file
+        self.data = data
+
+
+def _load_reference(reference):
+    """
+    Gets the object of the reference in a worker of the persistent pool. The object is loaded
+    only once per version.
+
+    :param reference: BroadcastReference
+    :return: object
+    """
+    cached = _worker_objects.get(reference.key)
+
+    if cached is not None and cached[0] == reference.version:
+        return cached[1]
+
+    if reference.shared_file is None:
+        unpickler = cPickle.Unpickler(StringIO(reference.data))
+        unpickler.persistent_load = SharedArrays.persistent_loader()
+        value = unpickler.load()
+    else:
+        with reference.shared_file.open() as f:
+            unpickler = cPickle.Unpickler(f)
+            unpickler.persistent_load = SharedArrays.persistent_loader()
+            value = unpickler.load()
+
+    _worker_objects[reference.key] = (reference.version, value)
+
+    return value
+
+
+def _initialize_worker(references):
+    """
+    Initializer of the workers of the persistent pool. The objects whose files were closed are
+    loaded later with their current version.
+
+    :param references: [BroadcastReference]
+    """
+    for reference in references:
+        try:
+            _load_reference(reference)
+        except IOError:
+            pass
+
+
+def _run_job(function, argument, seed, args, kwargs):
+    """
+    Runs a job in a worker of the persistent pool. The random number generator is seeded by each
+    job, so the random numbers don't depend on the jobs previously run by the worker.
+
+    :param function: f(argument, *args, **kwargs)
+    :param argument:
+    :param seed: int
+    :param args: tuple, the objects broadcast are BroadcastReference
+    :param kwargs: dict
+    :return: output of f
+    """
+    np.random.seed(seed)
+    args = tuple(_load_reference(arg) if isinstance(arg, BroadcastReference) else arg
+                 for arg in args)
+    return function(argument, *args, **kwargs)
+
 
 class Parallel(object):
 
+    # Persistent pool of processes, and the process that created it.
+    _pool = None
+    _pool_pid = None
+
+    # Objects broadcast to the workers: {token: [weak reference to the object, version of the
+    # state of the object, BroadcastReference]}
+    _broadcast = {}
+
+    # Tokens of the objects broadcast: {object: token}. The tokens aren't reused, unlike the ids
+    # of the objects garbage collected.
+    _tokens = weakref.WeakKeyDictionary()
+
+    # Versions of the objects: {object: int}, see update_version.
+    _versions = weakref.WeakKeyDictionary()
+
+    # Number of calls to update_version, used as the versions of the objects.
+    _n_updates = 0
+
+    # Number of objects written, used as the tokens and as the versions of the BroadcastReferences.
+    _n_writes = 0
+
+    @classmethod
+    def start_pool(cls, processes=None, objects=None):
+        """
+        Starts a pool of processes that is reused by run_function_different_arguments_parallel
+        until close_pool is called. The arguments of the function that are objects (e.g. the
+        acquisition function or the bayesian quadrature) are sent to the workers only when they
+        change, instead of being sent with every job. Each worker keeps its copy of the objects
+        between jobs, so the data cached by previous jobs is reused.
+
+        :param processes: (int) Number of processes. By default, it's the number of cpus.
+        :param objects: [object], objects sent to the workers when they are started.
+        """
+
+        if cls._pool is not None:
+            cls.close_pool()
+
+        if processes is None:
+            processes = mp.cpu_count()
+
+        references = []
+        if objects is not None:
+            references = [cls._broadcast_object(obj) for obj in objects]
+
+        cls._pool = mp.Pool(processes=processes, initializer=_initialize_worker,
+                            initargs=(references, ))
+        cls._pool_pid = os.getpid()
+
+    @classmethod
+    def persistent_pool(cls, method):
+        """
+        Decorator of the methods of objects with the attribute parallel. If parallel is True, the
+        persistent pool is open while the method runs, and it's closed when the method returns or
+        raises an exception.
+
+        :param method: f(self, *args, **kwargs)
+        :return: f(self, *args, **kwargs)
+        """
+
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not self.parallel:
+                return method(self, *args, **kwargs)
+
+            cls.start_pool()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                cls.close_pool()
+
+        return wrapper
+
+    @classmethod
+    def close_pool(cls):
+        """
+        Closes the persistent pool, and closes the files of the objects broadcast.
+        """
+
+        if cls._pool is not None and cls._pool_pid == os.getpid():
+            cls._pool.terminate()
+            cls._pool.join()
+
+        for entry in cls._broadcast.values():
+            cls._remove_reference(entry[2])
+
+        SharedArrays.clear()
+
+        cls._pool = None
+        cls._pool_pid = None
+        cls._broadcast = {}
+
+    @classmethod
+    def update_version(cls, obj):
+        """
+        Must be called by the methods that modify the object, e.g. when new data is added, the
+        hyperparameters change or a cache is written. The objects that contain obj are broadcast
+        again to the workers the next time they're used. Otherwise, the workers keep their copies
+        of the objects.
+
+        :param obj: object
+        """
+        cls._n_updates += 1
+        cls._versions[obj] = cls._n_updates
+
+    @classmethod
+    def _state_version(cls, obj):
+        """
+        The version of the state of an object is given by its version and by the versions of the
+        objects in its attributes, e.g. the version of an SBO changes when its bayesian quadrature,
+        its Gaussian process or their caches are modified.
+
+        :param obj: object
+        :return: tuple
+        """
+        versions = []
+        visited = set()
+        objects = [obj]
+
+        while objects:
+            obj = objects.pop()
+            if id(obj) in visited:
+                continue
+            visited.add(id(obj))
+            versions.append(cls._versions.get(obj, 0))
+            objects.extend(value for value in vars(obj).itervalues() if cls._is_broadcast(value))
+
+        return tuple(versions)
+
+    @staticmethod
+    def _remove_reference(reference):
+        """
+        Closes the file of the reference.
+
+        :param reference: BroadcastReference
+        """
+        if reference.shared_file is not None:
+            reference.shared_file.close()
+
+    @classmethod
+    def _persistent_pool_is_available(cls):
+        """
+        The persistent pool can only be used by the process that created it.
+
+        :return: boolean
+        """
+        return cls._pool is not None and cls._pool_pid == os.getpid()
+
+    @staticmethod
+    def _is_broadcast(argument):
+        """
+        Objects of classes defined by the user are broadcast, while functions, numbers, arrays and
+        so on are sent with each job.
+
+        :param argument:
+        :return: boolean
+        """
+        return hasattr(argument, '__dict__') and not callable(argument)
+
+    @classmethod
+    def _discard(cls, token):
+        """
+        Removes the object from the objects broadcast when it's garbage collected.
+
+        :param token: int
+        """
+        entry = cls._broadcast.pop(token, None)
+        if entry is not None:
+            cls._remove_reference(entry[2])
+
+    @classmethod
+    def _broadcast_object(cls, obj):
+        """
+        Writes the object in the shared memory file system if its state changed since the last
+        time it was broadcast (see update_version). If the file system is full, the pickled object
+        is kept in memory and sent with every job.
+
+        :param obj: object
+        :return: BroadcastReference
+        """
+        version = cls._state_version(obj)
+
+        key = cls._tokens.get(obj)
+        entry = cls._broadcast.get(key)
+        if entry is not None and entry[1] == version:
+            return entry[2]
+
+        file_ = StringIO()
+        pickler = cPickle.Pickler(file_, cPickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = SharedArrays.persistent_id
+        pickler.dump(obj)
+        data = file_.getvalue()
+
+        cls._n_writes += 1
+
+        if entry is None:
+            key = cls._n_writes
+            cls._tokens[obj] = key
+
+        shared_file = write_shared_file('sbo_broadcast_', lambda f: f.write(data))
+
+        if shared_file is None:
+            logger.info("The shared memory file system is full, the object is sent with each job.")
+            reference = BroadcastReference(key, cls._n_writes, None, data=data)
+        else:
+            reference = BroadcastReference(key, cls._n_writes, shared_file)
+
+        if entry is not None:
+            cls._remove_reference(entry[2])
+            cls._broadcast[key][1:] = [version, reference]
+        else:
+            reference_obj = weakref.ref(obj, lambda ref, key=key: cls._discard(key))
+            cls._broadcast[key] = [reference_obj, version, reference]
+
+        return reference
+
+    @classmethod
+    def _broadcast_arguments(cls, args):
+        """
+        Replaces the objects in args by references to their broadcast files. The files of the
+        objects that aren't in args are kept until the objects are garbage collected, because they
+        can be used again by the next calls.
+
+        :param args: tuple
+        :return: tuple
+        """
+        return tuple(cls._broadcast_object(arg) if cls._is_broadcast(arg) else arg
+                     for arg in args)
+
+    @classmethod
+    def _run_persistent_pool(cls, function, arguments, all_success, signal, *args, **kwargs):
+        """
+        Call functions in parallel using the persistent pool. See
+        run_function_different_arguments_parallel.
+        """
+        args_ = cls._broadcast_arguments(args)
+        seeds = np.random.randint(0, 2 ** 31 - 1, size=len(arguments))
+
+        jobs = {}
+
+        try:
+            for seed, (key, argument) in zip(seeds, arguments.iteritems()):
+                jobs[key] = cls._pool.apply_async(
+                    _run_job, args=(function, argument, seed, args_, kwargs))
+            for job in jobs.itervalues():
+                job.wait()
+            if signal is not None:
+                signal(1)
+        except KeyboardInterrupt:
+            logger.info("Ctrl+c received, terminating and joining pool.")
+            cls.close_pool()
+            return -1
+
+        return cls._get_results(jobs, arguments, all_success, *args, **kwargs)
+
     @classmethod
     def run_function_different_arguments_parallel(cls, function, arguments, all_success=False,
                                                   signal=None, parallel=True, threads=0,
@@ -39,6 +390,10 @@ class Parallel(object):
             return cls.run_function_different_arguments_sequentially(function, arguments, *args,
                                                                      **kwargs)
 
+        if threads == 0 and cls._persistent_pool_is_available():
+            return cls._run_persistent_pool(function, arguments, all_success, signal, *args,
+                                            **kwargs)
+
         n_jobs = min(len(arguments), mp.cpu_count())
 
         if threads > 0:
@@ -60,8 +415,22 @@ class Parallel(object):
             pool.join()
             return -1
 
+        return cls._get_results(jobs, arguments, all_success, *args, **kwargs)
+
+    @staticmethod
+    def _get_results(jobs, arguments, all_success, *args, **kwargs):
+        """
+        Gets the outputs of the jobs.
+
+        :param jobs: {int: AsyncResult}
+        :param arguments: {i: argument}
+        :param all_success: (boolean) raises an exception if one of the jobs failed.
+        :param args: additional arguments of function
+        :param kwargs: additional arguments of function
+        :return: {int: output of f(arguments[i])}
+        """
         results = {}
-        for key in arguments.keys():
+        for key, argument in arguments.iteritems():
             try:
                 results[key] = jobs[key].get()
             except Exception as e:
@@ -107,3 +476,6 @@ class NoDaemonProcess(mp.Process):
 
 class MyPool(multiprocessing.pool.Pool):
     Process = NoDaemonProcess
+
+
+atexit.register(Parallel.close_pool)
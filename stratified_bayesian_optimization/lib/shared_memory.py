@@ -0,0 +1,230 @@
+from __future__ import absolute_import
+
+import errno
+import mmap
+import os
+import tempfile
+import weakref
+
+import numpy as np
+
+from stratified_bayesian_optimization.lib.constant import SHARED_ARRAYS_MIN_BYTES
+
+
+class SharedArrays(object):
+    """
+    Registry of the numpy arrays that are shared with the workers of Parallel. The model objects
+    publish their large arrays (e.g. training data, Cholesky decompositions, solves and
+    quadratures). When an object is sent to the workers, each published array is written once in
+    a file of a shared memory file system (see SharedFile), and only a reference to the file is
+    pickled. The workers map the file instead of receiving a copy of the array, so all the workers
+    use the same memory.
+
+    The published arrays are marked read-only, so they can't be modified in place after they're
+    written: the models replace them by new arrays.
+    """
+
+    # {id(array): [weak reference to the array, SharedFile with the array]}
+    _arrays = {}
+
+    @classmethod
+    def publish(cls, value):
+        """
+        Registers the numpy arrays in value that use at least SHARED_ARRAYS_MIN_BYTES bytes, and
+        marks them read-only.
+
+        :param value: np.array, or list, tuple or dict whose values are published.
+        :return: value
+        """
+        if isinstance(value, np.ndarray):
+            if value.nbytes >= SHARED_ARRAYS_MIN_BYTES and value.dtype != np.object and \
+                    id(value) not in cls._arrays:
+                key = id(value)
+                reference = weakref.ref(value, lambda ref, key=key: cls._remove(key))
+                value.flags.writeable = False
+                cls._arrays[key] = [reference, None]
+        elif isinstance(value, (list, tuple)):
+            for element in value:
+                cls.publish(element)
+        elif isinstance(value, dict):
+            for element in value.itervalues():
+                cls.publish(element)
+
+        return value
+
+    @classmethod
+    def persistent_id(cls, obj):
+        """
+        Used by the pickler of Parallel. The published arrays are written in the shared memory
+        file system the first time they're pickled. If the file system is full, the array is
+        pickled with the object.
+
+        :param obj: object pickled
+        :return: (SharedFile, dtype, shape) if obj is a published array, otherwise None
+        """
+        if not isinstance(obj, np.ndarray):
+            return None
+
+        entry = cls._arrays.get(id(obj))
+
+        if entry is None or entry[0]() is not obj:
+            return None
+
+        if entry[1] is None:
+            entry[1] = write_shared_file('sbo_array_', np.ascontiguousarray(obj).tofile)
+
+            if entry[1] is None:
+                return None
+
+        return (entry[1], obj.dtype.str, obj.shape)
+
+    @staticmethod
+    def persistent_loader():
+        """
+        Used by the unpicklers of the workers. The arrays are mapped read-only, so the memory is
+        shared by all the workers. An array referenced several times by the pickled object is only
+        mapped once.
+
+        :return: function f((SharedFile, dtype, shape)) that returns the array
+        """
+        arrays = {}
+
+        def persistent_load(persistent_id):
+            shared_file, dtype, shape = persistent_id
+            key = (shared_file.filename, shared_file.inode)
+
+            if key not in arrays:
+                size = np.dtype(dtype).itemsize * int(np.prod(shape))
+                if size == 0:
+                    array = np.zeros(shape, dtype=dtype)
+                else:
+                    with shared_file.open() as f:
+                        buffer_ = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+                    array = np.frombuffer(buffer_, dtype=dtype).reshape(shape)
+                arrays[key] = array
+
+            return arrays[key]
+
+        return persistent_load
+
+    @classmethod
+    def _remove(cls, key):
+        """
+        Removes the array from the registry when it's garbage collected.
+
+        :param key: int
+        """
+        entry = cls._arrays.pop(key, None)
+        if entry is not None and entry[1] is not None:
+            entry[1].close()
+
+    @classmethod
+    def clear(cls):
+        """
+        Closes the files of the published arrays. They are written again if the arrays are sent
+        to the workers.
+        """
+        for entry in cls._arrays.itervalues():
+            if entry[1] is not None:
+                entry[1].close()
+                entry[1] = None
+
+
+class SharedFile(object):
+    """
+    File of the shared memory file system. Its name is removed as soon as it's written, and it's
+    kept open by the process that wrote it, which is the only one that owns the file: the workers
+    open it through the descriptor of that process (/proc/<pid>/fd/<descriptor>). So the memory is
+    released when the file is closed, or when the process ends, even if it's killed. If /proc
+    isn't available, the file keeps its name until it's closed.
+
+    Only filename and inode are pickled, so the workers can open the file but not close it.
+    """
+
+    def __init__(self, file_, name):
+        """
+        :param file_: file opened by write_shared_file
+        :param name: (str) name of the file
+        """
+        self.file_ = file_
+        self.inode = os.fstat(file_.fileno()).st_ino
+        self.name = name
+        self.filename = name
+
+        path = '/proc/%d/fd/%d' % (os.getpid(), file_.fileno())
+        if os.path.exists(path):
+            os.remove(name)
+            self.name = None
+            self.filename = path
+
+    def open(self):
+        """
+        Opens the file for reading.
+
+        :return: file
+        """
+        file_ = open(self.filename, 'rb')
+
+        # The descriptor of a closed file can be reused by another file.
+        if os.fstat(file_.fileno()).st_ino != self.inode:
+            file_.close()
+            raise IOError(errno.ENOENT, 'The shared file was closed', self.filename)
+
+        return file_
+
+    def close(self):
+        """
+        Closes the file, and removes it if it still has a name. The files are only closed by the
+        process that wrote them.
+        """
+        if self.file_ is None:
+            return
+
+        self.file_.close()
+        self.file_ = None
+
+        if self.name is not None and os.path.exists(self.name):
+            os.remove(self.name)
+
+    def __getstate__(self):
+        return {'filename': self.filename, 'inode': self.inode}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.file_ = None
+        self.name = None
+
+
+def write_shared_file(prefix, write):
+    """
+    Writes a file in the shared memory file system, or in the temporary directory if there isn't
+    one.
+
+    :param prefix: (str) prefix of the name of the file
+    :param write: f(file), writes the data in the file
+    :return: SharedFile, or None if the file system is full or the process can't open more files
+    """
+    directory = None
+    if os.path.isdir('/dev/shm'):
+        directory = '/dev/shm'
+
+    try:
+        descriptor, name = tempfile.mkstemp(prefix=prefix, dir=directory)
+    except (IOError, OSError) as e:
+        if e.errno != errno.EMFILE:
+            raise
+        return None
+
+    file_ = os.fdopen(descriptor, 'w+b')
+
+    try:
+        write(file_)
+        file_.flush()
+    except (IOError, OSError) as e:
+        file_.close()
+        os.remove(name)
+        if e.errno != errno.ENOSPC:
+            raise
+        return None
+
+    return SharedFile(file_, name)
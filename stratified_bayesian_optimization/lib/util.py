@@ -16,10 +16,7 @@ from stratified_bayesian_optimization.lib.constant import(
     BAYESIAN_QUADRATURE,
     ORNSTEIN_KERNEL,
     LENGTH_SCALE_ORNSTEIN_NAME,
-)
-from stratified_bayesian_optimization.lib.affine_break_points import (
-    AffineBreakPointsPrep,
-    AffineBreakPoints,
+    RESTARTS_SCREENING_CHUNK_SIZE,
 )
 from stratified_bayesian_optimization.lib.parallel import Parallel
 from stratified_bayesian_optimization.initializers.log import SBOLog
@@ -89,6 +86,21 @@ def separate_numpy_arrays_in_lists(array, division):
         return [array[0: division], array[division: len(array)]]
 
 
+def screen_points(f, points, chunk_size=RESTARTS_SCREENING_CHUNK_SIZE):
+    """
+    Evaluates f on the rows of points, in chunks of chunk_size rows.
+
+    :param f: function that evaluates np.array(txk) and returns np.array(t)
+    :param points: np.array(nxk)
+    :param chunk_size: (int) maximum number of rows evaluated by each call of f
+    :return: np.array(n)
+    """
+    values = [f(points[start: start + chunk_size, :])
+              for start in xrange(0, points.shape[0], chunk_size)]
+
+    return np.concatenate(values)
+
+
 def wrapper_fit_gp_regression(self, **kwargs):
     """
     Wrapper of fit_gp_regression
@@ -102,6 +114,18 @@ def wrapper_fit_gp_regression(self, **kwargs):
     return self.fit_gp_regression(**kwargs)
 
 
+def wrapper_sample_parameters_chain(arguments, self, n_samples):
+    """
+    Wrapper of _sample_chain, used to run the chains of the MCMC in parallel.
+    :param arguments: (np.array(n_parameters), int) start point and random seed of the chain
+    :param self: instance of class GPFittingGaussian
+    :param n_samples: (int) number of samples before thinning
+    :return: [np.array(n_parameters)]
+    """
+    start_point, random_seed = arguments
+    return self._sample_chain(n_samples, start_point, random_seed=random_seed)
+
+
 def wrapper_evaluate_objective_function(
         point, cls_, name_module, n_samples, objective_function=None):
     """
@@ -514,53 +538,8 @@ def wrapper_evaluate_sbo(candidate_points, task, self):
 
     candidate_points = np.concatenate((candidate_points, tasks), axis=1)
 
-    vectors = self.bq.compute_posterior_parameters_kg_many_cp(
-        self.discretization, candidate_points
-    )
-
-    a = vectors['a']
-    b = vectors['b']
-
-    r = candidate_points.shape[0]
-
-    values = np.zeros(r)
-
-
-    b_vectors = {}
-    for i in xrange(r):
-        b_vectors[i] = b[:, i]
-
-    args = (False, None, True, 0, a, self,)
-    val = Parallel.run_function_different_arguments_parallel(
-        wrapper_hvoi, b_vectors, *args)
-
-    for i in xrange(r):
-        if val.get(i) is None:
-            logger.info("Computation of VOI failed for new_point %d" % i)
-            continue
-        values[i] = val[i]
-
-    return values
-
-
-def wrapper_hvoi(b, a, self):
-    """
-
-    :param b:
-    :param a:
-    :param self:
-    :return:
-    """
-
-    if not np.all(np.isfinite(b)):
-        return 0.0
-
-    a, b, keep = AffineBreakPointsPrep(a, b)
-
-    keep1, c = AffineBreakPoints(a, b)
-    keep1 = keep1.astype(np.int64)
+    return self.evaluate_candidate_points(candidate_points)['evaluations']
 
-    return self.hvoi(b, c, keep1)
 
 def wrapper_GPFittingGaussian(training_data_sets, model, type_kernel, dimensions, bounds_domain,
                               thinning, n_burning, max_steps_out, random_seed, problem_name,
@@ -848,6 +827,10 @@ def wrapper_objective_acquisition_function(point, self, n_samples_parameters=0,
 
     if n_samples_parameters == 0:
         value = self.evaluate(point, *params)
+    elif self.gp.name_model != BAYESIAN_QUADRATURE and len(params) == 0 and \
+            hasattr(self, 'evaluate_samples_parameters'):
+        parameters = self.gp.samples_parameters[-n_samples_parameters:]
+        value = np.mean(self.evaluate_samples_parameters(point, np.array(parameters)), axis=0)
     else:
         if self.gp.name_model == BAYESIAN_QUADRATURE:
             gp_model = self.gp.gp
@@ -864,6 +847,10 @@ def wrapper_posterior_mean_gp_model(point, self, n_samples_parameters=0, *params
 
     if n_samples_parameters == 0:
         value = self.compute_posterior_parameters(point, *params, only_mean=True)['mean']
+    elif len(params) == 0:
+        parameters = np.array(self.samples_parameters[-n_samples_parameters:])
+        value = np.mean(self.compute_posterior_parameters_samples(
+            point, parameters, only_mean=True)['mean'], axis=0)
     else:
         def evaluate(point, var_noise=None, mean=None, parameters_kernel=None):
             return self.compute_posterior_parameters(
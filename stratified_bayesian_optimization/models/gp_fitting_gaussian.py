@@ -3,6 +3,7 @@ from __future__ import absolute_import
 from os import path
 import os
 import sys
+import multiprocessing
 
 from numpy.linalg.linalg import LinAlgError
 import numpy as np
@@ -29,6 +30,9 @@ from stratified_bayesian_optimization.lib.constant import (
     SGD_NAME,
     DEBUGGING_DIR,
     DEFAULT_N_PARAMETERS,
+    CACHE_MAX_SIZE_FACTORIZATIONS,
+    MIN_SAMPLES_CHAINS_DIAGNOSTICS,
+    KRONECKER_MAX_MISSING_FRACTION,
 )
 from stratified_bayesian_optimization.lib.util_gp_fitting import (
     get_kernel_default,
@@ -39,6 +43,7 @@ from stratified_bayesian_optimization.lib.util_gp_fitting import (
 )
 from stratified_bayesian_optimization.lib.util import (
     separate_numpy_arrays_in_lists,
+    screen_points,
     wrapper_fit_gp_regression,
     get_default_values_kernel,
     get_number_parameters_kernel,
@@ -51,11 +56,15 @@ from stratified_bayesian_optimization.lib.util import (
     wrapper_optimize,
     wrapper_sgd,
     wrapper_evaluate_gradient_sample_params_gp,
+    wrapper_sample_parameters_chain,
 )
+from stratified_bayesian_optimization.lib.shared_memory import SharedArrays
 from stratified_bayesian_optimization.services.domain import (
     DomainService,
 )
 from stratified_bayesian_optimization.lib.optimization import Optimization
+from stratified_bayesian_optimization.lib.lru_cache import LRUCache
+from stratified_bayesian_optimization.samplers.diagnostics import MCMCDiagnostics
 from stratified_bayesian_optimization.initializers.log import SBOLog
 from stratified_bayesian_optimization.lib.parallel import Parallel
 from stratified_bayesian_optimization.entities.parameter import ParameterEntity
@@ -68,6 +77,10 @@ from stratified_bayesian_optimization.util.json_file import JSONFile
 from stratified_bayesian_optimization.lib.la_functions import (
     cholesky,
     cho_solve,
+    posterior_cov_solve,
+    cholesky_append,
+    log_determinant,
+    KroneckerFactorization,
 )
 
 logger = SBOLog(__name__)
@@ -83,7 +96,8 @@ class GPFittingGaussian(object):
                  start_point_sampler=None, max_steps_out=1, data=None, random_seed=None,
                  type_bounds=None, training_name=None, problem_name=None,
                  name_model='gp_fitting_gaussian', samples_parameters=None, noise=False,
-                 simplex_domain=None, define_samplers=True, **kernel_parameters):
+                 simplex_domain=None, define_samplers=True, n_chains=1, start_points_chains=None,
+                 chains_diagnostics=None, **kernel_parameters):
         """
         :param type_kernel: [str] Must be in possible_kernels. If it's a product of kernels it
             should be a list as: [PRODUCT_KERNELS_SEPARABLE, NAME_1_KERNEL, NAME_2_KERNEL].
@@ -120,6 +134,12 @@ class GPFittingGaussian(object):
         :param samples_parameters: [[float]]
         :param define_samplers: (boolean) If False, samplers for the hyperparameters are not
             defined.
+        :param n_chains: (int) Number of independent chains of the MCMC. If it's bigger than one,
+            the chains are run in parallel and their samples are pooled.
+        :param start_points_chains: [[float]], last sample of each chain of the MCMC. They're used
+            as warm starts of the chains.
+        :param chains_diagnostics: {'r_hat': [float], 'ess': [float]}, R-hat and effective sample
+            size of each parameter computed from the last samples of the chains.
 
         """
 
@@ -154,7 +174,7 @@ class GPFittingGaussian(object):
 
         if data is None:
             data = training_data
-        self.data = self.convert_from_list_to_numpy(data)
+        self.data = SharedArrays.publish(self.convert_from_list_to_numpy(data))
 
         if mean_value == []:
             mean_value = None
@@ -191,8 +211,23 @@ class GPFittingGaussian(object):
         self.slice_samplers = []
         self.start_point_sampler = start_point_sampler
 
-        self.cache_chol_cov = {}
-        self.cache_sol_chol_y_unbiased = {}
+        self.n_chains = n_chains
+        self.start_points_chains = []
+        if start_points_chains is not None:
+            self.start_points_chains = [np.array(point) for point in start_points_chains]
+        # Chain advanced by the next sample when fewer samples than chains are drawn
+        self.next_chain = 0
+        # R-hat and effective sample size of the last samples of the chains
+        self.chains_diagnostics = {}
+        if chains_diagnostics:
+            self.chains_diagnostics = {key: np.array(value) for key, value in
+                                       chains_diagnostics.iteritems()}
+
+        # Cached data of the samples of the hyperparameters
+        self.cache_chol_cov = LRUCache(max_size=CACHE_MAX_SIZE_FACTORIZATIONS)
+        self.cache_sol_chol_y_unbiased = LRUCache(max_size=CACHE_MAX_SIZE_FACTORIZATIONS)
+        # Arrays of self.data used to compute the cached Cholesky decompositions.
+        self.cache_data_arrays = None
 
         self.best_solution = {} # Historical best solution for EI.
         self.cache_cov_n = {} # Cache computations of the cov_n
@@ -261,13 +296,15 @@ class GPFittingGaussian(object):
             self.samples_parameters = []
             self.samples_parameters.append(self.get_value_parameters_model)
             if self.n_burning > 0:
-                parameters = self.sample_parameters(float(self.n_burning) / (self.thinning + 1))
+                parameters = self._burning_samples()
                 self.samples_parameters = []
                 self.samples_parameters.append(parameters[-1])
                 self.start_point_sampler = parameters[-1]
             else:
                 self.start_point_sampler = self.get_value_parameters_model
 
+        Parallel.update_version(self)
+
     def start_new_chain(self, random_seed=None):
         """
         Starts a new chain of sampled parameters.
@@ -278,7 +315,7 @@ class GPFittingGaussian(object):
             np.random.seed(random_seed)
 
         if self.n_burning > 0:
-            parameters = self.sample_parameters(float(self.n_burning) / (self.thinning + 1))
+            parameters = self._burning_samples()
         else:
             parameters = [self.samples_parameters[-1]]
 
@@ -286,9 +323,28 @@ class GPFittingGaussian(object):
         self.samples_parameters.append(parameters[-1])
         self.start_point_sampler = parameters[-1]
 
+        Parallel.update_version(self)
+
+    def _burning_samples(self):
+        """
+        Computes the burning samples of the MCMC. If there are several chains, all of them are
+        burned and the last sample of the first chain is returned last.
+
+        :return: [np.array(n_parameters)]
+        """
+        n_samples = float(self.n_burning) / (self.thinning + 1)
+
+        if self.n_chains > 1:
+            chains = self.sample_chains(n_samples)
+            return chains[0]
+
+        return self.sample_parameters(n_samples)
+
     def sample_parameters(self, n_samples, start_point=None, random_seed=None):
         """
-        Sample parameters of the model from the posterior without considering burning.
+        Sample parameters of the model from the posterior without considering burning. If there
+        are several chains and start_point is None, the samples are drawn from the chains (see
+        _sample_from_chains).
 
         :param n_samples: (int)
         :param start_point: np.array(n_parameters)
@@ -300,11 +356,133 @@ class GPFittingGaussian(object):
         if random_seed is not None:
             np.random.seed(random_seed)
 
+        if self.n_chains > 1 and start_point is None:
+            samples = self._sample_from_chains(int(n_samples))
+        else:
+            if start_point is None:
+                start_point = self.samples_parameters[-1]
+            samples = self._sample_chain(n_samples, start_point)
+
+        if len(self.slice_samplers) > 1:
+            self.samples_parameters += samples
+
+        Parallel.update_version(self)
+
+        return samples
+
+    def _sample_from_chains(self, n_samples):
+        """
+        Draws n_samples from the chains of the MCMC, starting at their warm starts. If there are
+        fewer samples than chains (e.g. the one sample drawn at each step of SGD), the chains are
+        advanced in turns in this process. Otherwise, all the chains are run in parallel, and
+        their samples are pooled.
+
+        :param n_samples: (int)
+        :return: n_samples * [np.array(float)]
+        """
+
+        self._set_start_points_chains()
+
+        if n_samples < self.n_chains:
+            samples = []
+            for sample in xrange(n_samples):
+                chain = self.next_chain % self.n_chains
+                samples += self._sample_chain(1, self.start_points_chains[chain])
+                self.start_points_chains[chain] = samples[-1]
+                self.next_chain = chain + 1
+            return samples
+
+        n_samples_chain = int(np.ceil(float(n_samples) / self.n_chains))
+        chains = self.sample_chains(n_samples_chain)
+
         samples = []
+        for sample in xrange(n_samples_chain):
+            for chain in chains:
+                samples.append(chain[sample])
+        return samples[0: n_samples]
 
-        if start_point is None:
+    def _set_start_points_chains(self):
+        """
+        Chains without a warm start begin at the last sampled parameters.
+        """
+        if len(self.start_points_chains) != self.n_chains:
             start_point = self.samples_parameters[-1]
+            self.start_points_chains = \
+                self.start_points_chains[0: self.n_chains] + \
+                (self.n_chains - len(self.start_points_chains)) * [start_point]
+
+    def sample_chains(self, n_samples, parallel=True):
+        """
+        Runs self.n_chains independent chains of the MCMC from their warm starts. The warm starts
+        are updated to the last sample of each chain, and the R-hat and the effective sample size
+        of the samples are stored in self.chains_diagnostics.
+
+        :param n_samples: (int) number of samples of each chain without considering thinning
+        :param parallel: (boolean) run the chains in parallel if it's True. The chains are run
+            sequentially in the workers of a pool, because they can't start their own pools.
+        :return: [[np.array(n_parameters)]] samples of each chain
+        """
+
+        self._set_start_points_chains()
+
+        parallel = parallel and not multiprocessing.current_process().daemon
+
+        seeds = np.random.randint(0, 2 ** 31 - 1, self.n_chains)
+
+        arguments = {}
+        for chain in xrange(self.n_chains):
+            arguments[chain] = (self.start_points_chains[chain], seeds[chain])
+
+        args = (True, None, parallel, 0, self, n_samples)
+        results = Parallel.run_function_different_arguments_parallel(
+            wrapper_sample_parameters_chain, arguments, *args)
+
+        chains = [results[chain] for chain in xrange(self.n_chains)]
+        self.start_points_chains = [samples[-1] for samples in chains]
+
+        if len(chains[0]) >= MIN_SAMPLES_CHAINS_DIAGNOSTICS:
+            self.chains_diagnostics = MCMCDiagnostics.diagnostics(np.array(chains))
+            self._log_chains_diagnostics()
+
+        Parallel.update_version(self)
+
+        return chains
+
+    def _log_chains_diagnostics(self):
+        """
+        Logs the R-hat and the effective sample size of each parameter of the model.
+        """
+        names = []
+        for parameter in self.get_parameters_model:
+            if parameter.dimension == 1:
+                names.append(parameter.name)
+            else:
+                names += ['%s_%d' % (parameter.name, i) for i in xrange(parameter.dimension)]
+
+        diagnostics = {}
+        for name, r_hat, ess in zip(names, self.chains_diagnostics['r_hat'],
+                                    self.chains_diagnostics['ess']):
+            diagnostics[name] = {'r_hat': r_hat, 'ess': ess}
+
+        logger.info("Diagnostics of the chains of the MCMC: ")
+        logger.info(diagnostics)
+
+    def _sample_chain(self, n_samples, start_point, random_seed=None):
+        """
+        Sample parameters of the model from the posterior using a chain that starts at
+        start_point. The samples aren't stored.
+
+        :param n_samples: (int)
+        :param start_point: np.array(n_parameters)
+        :param random_seed: int
+
+        :return: n_samples * [np.array(float)]
+        """
 
+        if random_seed is not None:
+            np.random.seed(random_seed)
+
+        samples = []
 
         n_samples *= (self.thinning + 1)
         n_samples = int(n_samples)
@@ -347,10 +525,8 @@ class GPFittingGaussian(object):
                 points[1 - index] = new_point_
             start_point = combine_vectors(points[0], points[1], self.length_scale_indexes)
             samples.append(start_point)
-        samples_return = samples[::self.thinning + 1]
-        self.samples_parameters += samples_return
 
-        return samples_return
+        return samples[::self.thinning + 1]
 
     def set_parameters_kernel(self):
         """
@@ -491,24 +667,107 @@ class GPFittingGaussian(object):
 
     def add_points_evaluations(self, point, evaluation, var_noise_eval=None):
         """
+        Adds the new points to the data. The cached Cholesky decompositions are extended with the
+        rows of the new points, so they don't have to be computed again from scratch.
 
         :param point: np.array(kxm)
         :param evaluation: np.array(k)
         :param var_noise_eval: np.array(k)
         """
 
+        update_cache = self._cached_data_is_current() and len(self.cache_chol_cov) > 0
+        if update_cache:
+            n_points = self.data['points'].shape[0]
+
         self.data['points'] = np.append(self.data['points'], point, axis=0)
         self.data['evaluations'] = np.append(self.data['evaluations'], evaluation)
 
         if var_noise_eval is not None:
             self.data['var_noise'] = np.append(self.data['var_noise'], var_noise_eval)
 
-        # TODO: updated cache in a smart way
-        # https://math.stackexchange.com/questions/955874/cholesky-factor-when-adding-a-row-and-
-        # column-to-already-factorized-matrix
+        SharedArrays.publish(self.data)
+
+        if update_cache:
+            self._extend_cached_data(n_points)
+        else:
+            self.cache_chol_cov.clear()
+            self.cache_sol_chol_y_unbiased.clear()
+
+        self.best_solution = {}
+        self.cache_cov_n = {}
+
+        Parallel.update_version(self)
+
+    def _extend_cached_data(self, n_points):
+        """
+        Updates the cached Cholesky decompositions and solves after adding new points to the data.
+        See https://math.stackexchange.com/questions/955874/cholesky-factor-when-adding-a-row-and-
+        column-to-already-factorized-matrix
+
+        :param n_points: (int) number of points in the data before adding the new points.
+        """
+
+        old_points = self.data['points'][0: n_points, :]
+        new_points = self.data['points'][n_points:, :]
+        k = new_points.shape[0]
+
+        for index, (chol, cov) in self.cache_chol_cov.items():
+            if not isinstance(chol, np.ndarray):
+                # Structured factorizations are recomputed from the new data.
+                del self.cache_chol_cov[index]
+                continue
+
+            var_noise = index[0]
+            parameters_kernel = np.array(index[1])
+
+            cross_cov = self.evaluate_cross_cov(old_points, new_points, parameters_kernel)
+            cov_new = self.evaluate_cov(new_points, parameters_kernel)
+
+            if self.data.get('var_noise') is not None:
+                cov_new += np.diag(self.data['var_noise'][n_points:])
+
+            cov_new += np.diag(var_noise * np.ones(k))
+
+            try:
+                chol = cholesky_append(chol, cross_cov, cov_new, max_tries=7)
+            except LinAlgError:
+                del self.cache_chol_cov[index]
+                continue
+
+            cov = np.concatenate(
+                [np.concatenate([cov, cross_cov], axis=1),
+                 np.concatenate([cross_cov.transpose(), cov_new], axis=1)], axis=0)
+            self.cache_chol_cov[index] = SharedArrays.publish((chol, cov))
+
+        for index in self.cache_sol_chol_y_unbiased.keys():
+            if index[0: 2] not in self.cache_chol_cov:
+                del self.cache_sol_chol_y_unbiased[index]
+                continue
+            chol = self.cache_chol_cov.get(index[0: 2])[0]
+            self.cache_sol_chol_y_unbiased[index] = SharedArrays.publish(
+                cho_solve(chol, self.data['evaluations'] - index[2]))
 
-        self.cache_chol_cov = {}
-        self.cache_sol_chol_y_unbiased = {}
+        self.cache_data_arrays = self._get_data_arrays()
+
+    def _get_data_arrays(self):
+        """
+        :return: (np.array(nxm), np.array(n), np.array(n) or None)
+        """
+        return (self.data['points'], self.data['evaluations'], self.data.get('var_noise'))
+
+    def _cached_data_is_current(self):
+        """
+        Checks if the cached Cholesky decompositions were computed using the current data.
+
+        :return: boolean
+        """
+        if self.cache_data_arrays is None:
+            return False
+
+        for cached_array, array in zip(self.cache_data_arrays, self._get_data_arrays()):
+            if cached_array is not array:
+                return False
+        return True
 
     @staticmethod
     def convert_from_list_to_numpy(data_as_list):
@@ -596,6 +855,7 @@ class GPFittingGaussian(object):
 
         if self.start_point_sampler is None:
             self.start_point_sampler = []
+            Parallel.update_version(self)
 
         return {
             'type_kernel': self.type_kernel,
@@ -616,6 +876,10 @@ class GPFittingGaussian(object):
             'same_correlation': same_correlation,
             'start_point_sampler': list(self.start_point_sampler),
             'samples_parameters': samples_parameters,
+            'n_chains': self.n_chains,
+            'start_points_chains': [list(point) for point in self.start_points_chains],
+            'chains_diagnostics': {key: list(value) for key, value in
+                                   self.chains_diagnostics.iteritems()},
         }
 
     @classmethod
@@ -631,7 +895,8 @@ class GPFittingGaussian(object):
 
         model = cls(**s)
         if use_only_training_points:
-            model.data = model.convert_from_list_to_numpy(model.training_data)
+            model.data = SharedArrays.publish(
+                model.convert_from_list_to_numpy(model.training_data))
         return model
 
     @property
@@ -670,32 +935,52 @@ class GPFittingGaussian(object):
         if cache is False:
             return False
 
+        if not self._cached_data_is_current():
+            self.cache_chol_cov.clear()
+            self.cache_sol_chol_y_unbiased.clear()
+            return False
+
+        value = None
         if name == CHOL_COV:
-            if index in self.cache_chol_cov:
-                return self.cache_chol_cov[index]
+            value = self.cache_chol_cov.get(index)
         if name == SOL_CHOL_Y_UNBIASED:
-            if index in self.cache_sol_chol_y_unbiased:
-                return self.cache_sol_chol_y_unbiased[index]
-        return False
+            value = self.cache_sol_chol_y_unbiased.get(index)
+
+        if value is None:
+            return False
+        return value
 
-    def _updated_cached_data(self, index, value, name, clear_cache=True):
+    def _updated_cached_data(self, index, value, name, clear_cache=False):
         """
+        The data is saved in LRU caches, so the data of several samples of the hyperparameters
+        can be cached at the same time.
 
         :param index: tuple associated to the type.
             -(var_noise, parameters_kernel) if CHOL_COV
             -(var_noise, parameters_kernel, mean) if SOL_CHOL_Y_UNBIASED
         :param value: value to be cached
         :param name: (str) SOL_CHOL_Y_UNBIASED or CHOL_COV
+        :param clear_cache: (boolean) If True, the cached data of the other indexes is removed.
+            It's False by default, because the caches are bounded and keep the data of several
+            samples of the hyperparameters.
 
         """
+        SharedArrays.publish(value)
+
+        if not self._cached_data_is_current():
+            self.cache_chol_cov.clear()
+            self.cache_sol_chol_y_unbiased.clear()
+            self.cache_data_arrays = self._get_data_arrays()
+            Parallel.update_version(self)
+
         if name == CHOL_COV:
             if clear_cache:
-                self.cache_chol_cov = {}
-                self.cache_sol_chol_y_unbiased = {}
+                self.cache_chol_cov.clear()
+                self.cache_sol_chol_y_unbiased.clear()
             self.cache_chol_cov[index] = value
         if name == SOL_CHOL_Y_UNBIASED:
             if clear_cache:
-                self.cache_sol_chol_y_unbiased = {}
+                self.cache_sol_chol_y_unbiased.clear()
             self.cache_sol_chol_y_unbiased[index] = value
 
     def evaluate_cov(self, points, parameters_kernel):
@@ -730,8 +1015,41 @@ class GPFittingGaussian(object):
 
         return cov
 
+    def evaluate_cov_diagonal(self, points, parameters_kernel):
+        """
+        Evaluate the diagonal of the covariance of the kernel of the model on the points, without
+        computing the other entries.
+
+        :param points: np.array(nxk)
+        :param parameters_kernel: np.array(l)
+
+        :return: np.array(n)
+        """
+
+        if self.type_kernel[0] == PRODUCT_KERNELS_SEPARABLE:
+            inputs = separate_numpy_arrays_in_lists(points, self.kernel_dimensions[1])
+            inputs_dict = {}
+            for index, input in enumerate(inputs):
+                inputs_dict[self.type_kernel[index + 1]] = input
+
+            cov = self.class_kernel.evaluate_cov_diagonal_defined_by_params(
+                separate_numpy_arrays_in_lists(parameters_kernel, self.number_parameters[1]),
+                inputs_dict,
+                self.dimensions[1:], self.type_kernel[1:], **self.additional_kernel_parameters)
+        elif self.type_kernel[0] == SCALED_KERNEL:
+            cov = self.class_kernel.evaluate_cov_diagonal_defined_by_params(
+                parameters_kernel, points, self.dimensions[0],
+                *([self.type_kernel[1]],)
+            )
+        else:
+            cov = self.class_kernel.evaluate_cov_diagonal_defined_by_params(
+                parameters_kernel, points, self.dimensions[0], **self.additional_kernel_parameters
+            )
+
+        return cov
+
     def _chol_cov_including_noise(self, var_noise, parameters_kernel, historical_points=None,
-                                  cache=True, clear_cache=True):
+                                  cache=True, clear_cache=False, cov_kernel=None):
         """
         Compute the Cholesky decomposition of
         covariance = cov_kernel + np.diag(var_noise_observations) + np.diag(var_noise), and the
@@ -740,6 +1058,9 @@ class GPFittingGaussian(object):
         :param parameters_kernel: np.array(k)
         :param historical_points: np.array(nxk)
         :param cache: (boolean) get cached data only if cache is True
+        :param clear_cache: (boolean) If True, the cached data of the other samples of the
+            hyperparameters is removed.
+        :param cov_kernel: np.array(nxn), cov_kernel if it was already computed
         :return: np.array(nxn) (chol), np.array(nxn) (cov)
         """
 
@@ -752,9 +1073,21 @@ class GPFittingGaussian(object):
 
         historical_points = np.array(historical_points)
 
+        factorization = self._kronecker_factorization(
+            var_noise, parameters_kernel, historical_points)
+        if factorization is not None:
+            if cache:
+                self._updated_cached_data((var_noise, tuple(parameters_kernel)),
+                                          (factorization, None), CHOL_COV,
+                                          clear_cache=clear_cache)
+            return factorization, None
+
         n = historical_points.shape[0]
 
-        cov = self.evaluate_cov(historical_points, parameters_kernel)
+        if cov_kernel is None:
+            cov = self.evaluate_cov(historical_points, parameters_kernel)
+        else:
+            cov = np.array(cov_kernel)
 
         if self.data.get('var_noise') is not None:
             cov += np.diag(self.data['var_noise'])
@@ -769,6 +1102,156 @@ class GPFittingGaussian(object):
 
         return chol, cov
 
+    def _kronecker_layout(self, historical_points):
+        """
+        Checks if the kernel is the product of a Matern52 kernel and a tasks kernel, and if
+        historical_points are the grid of some points times all the tasks, where each pair appears
+        at most once and at most KRONECKER_MAX_MISSING_FRACTION of the pairs are missing.
+
+        :param historical_points: np.array(nxk)
+        :return: (np.array(n), np.array(n_x x (k - 1))) or None. The second array contains the
+            different points, and the training point i is the entry positions[i] of the grid, where
+            the entry a * n_tasks + b is (points[a], task b). None if the layout isn't a grid.
+        """
+        if self.type_kernel != [PRODUCT_KERNELS_SEPARABLE, MATERN52_NAME, TASKS_KERNEL_NAME]:
+            return None
+
+        n = historical_points.shape[0]
+        n_tasks = self.dimensions[2]
+
+        if n_tasks < 2 or n < 2 * n_tasks:
+            return None
+
+        tasks = historical_points[:, -1]
+        if np.any(tasks != np.round(tasks)) or np.any(tasks < 0) or np.any(tasks >= n_tasks):
+            return None
+
+        coordinates = historical_points[:, 0: -1]
+        order = np.lexsort([coordinates[:, j] for j in reversed(xrange(coordinates.shape[1]))])
+        sorted_coordinates = coordinates[order, :]
+
+        new_point = np.ones(n, dtype=bool)
+        new_point[1:] = np.any(sorted_coordinates[1:, :] != sorted_coordinates[0: -1, :], axis=1)
+
+        index_points = np.empty(n, dtype=int)
+        index_points[order] = np.cumsum(new_point) - 1
+        points = sorted_coordinates[new_point, :]
+
+        positions = index_points * n_tasks + tasks.astype(int)
+        n_grid = points.shape[0] * n_tasks
+
+        if len(np.unique(positions)) != n:
+            return None
+
+        if n_grid - n > KRONECKER_MAX_MISSING_FRACTION * n_grid:
+            return None
+
+        return positions, points
+
+    def _kronecker_factorization(self, var_noise, parameters_kernel, historical_points):
+        """
+        Computes the Kronecker factorization of the covariance of the training data when the
+        training points are the grid of points times tasks, or most of it (see _kronecker_layout),
+        the kernel is the product of a Matern52 kernel and a tasks kernel, and the noise is
+        homoscedastic. Irregular data uses the dense Cholesky decomposition.
+
+        :param var_noise: float
+        :param parameters_kernel: np.array(k)
+        :param historical_points: np.array(nxk)
+        :return: KroneckerFactorization or None
+        """
+        var_noise_data = self.data.get('var_noise')
+        if var_noise_data is not None and len(var_noise_data) == 0:
+            var_noise_data = None
+
+        if var_noise_data is not None:
+            if len(var_noise_data) != historical_points.shape[0]:
+                return None
+            if np.any(var_noise_data != var_noise_data[0]):
+                return None
+
+        layout = self._kronecker_layout(historical_points)
+        if layout is None:
+            return None
+
+        positions, points = layout
+
+        noise = var_noise
+        if var_noise_data is not None:
+            noise += var_noise_data[0]
+
+        kernel = self.class_kernel.define_kernel_from_array(
+            self.dimensions[1:],
+            separate_numpy_arrays_in_lists(parameters_kernel, self.number_parameters[1]),
+            self.type_kernel[1:], **self.additional_kernel_parameters)
+
+        tasks = np.arange(self.dimensions[2]).reshape((self.dimensions[2], 1))
+        cov_points = kernel.kernels[MATERN52_NAME].cov(points)
+        cov_tasks = kernel.kernels[TASKS_KERNEL_NAME].cov(tasks)
+
+        return KroneckerFactorization(cov_points, cov_tasks, noise, positions)
+
+    def _grad_log_likelihood_kronecker(self, factorization, var_noise, mean, parameters_kernel):
+        """
+        Computes the gradient of the log likelihood from the Kronecker factorization of the
+        covariance (see _kronecker_factorization). The derivatives of the covariance are
+        dcov_points kron cov_tasks and cov_points kron dcov_tasks, so the n x n matrices are never
+        computed.
+
+        :param factorization: KroneckerFactorization
+        :param var_noise: (float) variance of the noise
+        :param mean: (float)
+        :param parameters_kernel: np.array(k)
+        :return: {'var_noise': float, 'mean': float, 'kernel_params': np.array(n)}
+        """
+        points = self._kronecker_layout(self.data['points'])[1]
+
+        kernel = self.class_kernel.define_kernel_from_array(
+            self.dimensions[1:],
+            separate_numpy_arrays_in_lists(parameters_kernel, self.number_parameters[1]),
+            self.type_kernel[1:], **self.additional_kernel_parameters)
+        kernel_points = kernel.kernels[MATERN52_NAME]
+        kernel_tasks = kernel.kernels[TASKS_KERNEL_NAME]
+
+        tasks = np.arange(self.dimensions[2]).reshape((self.dimensions[2], 1))
+        cov_points, grad_points = kernel_points.cov_and_gradient_respect_parameters(points)
+        cov_tasks = kernel_tasks.cov(tasks)
+        grad_tasks = kernel_tasks.gradient_respect_parameters(tasks)
+
+        y_unbiased = self.data['evaluations'] - mean
+
+        cached_solve = self._get_cached_data((var_noise, tuple(parameters_kernel), mean),
+                                             SOL_CHOL_Y_UNBIASED)
+        if cached_solve is False:
+            solve = factorization.cho_solve(y_unbiased)
+            self._updated_cached_data((var_noise, tuple(parameters_kernel), mean), solve,
+                                      SOL_CHOL_Y_UNBIASED)
+        else:
+            solve = cached_solve
+
+        derivatives = \
+            [(grad_points[kernel_points.length_scale.name][i], cov_tasks)
+             for i in xrange(kernel_points.length_scale.dimension)] + \
+            [(cov_points, grad_tasks[kernel_tasks.lower_triang.name][i])
+             for i in xrange(kernel_tasks.lower_triang.dimension)]
+
+        gradient_kernel_params = np.zeros(len(parameters_kernel))
+        for i, (matrix_points, matrix_tasks) in enumerate(derivatives):
+            gradient_kernel_params[i] = 0.5 * (
+                factorization.quadratic_form(solve, matrix_points, matrix_tasks) -
+                factorization.trace_solve(matrix_points, matrix_tasks))
+
+        identity_points = np.identity(points.shape[0])
+        identity_tasks = np.identity(self.dimensions[2])
+
+        gradient = {}
+        gradient['kernel_params'] = gradient_kernel_params
+        gradient['mean'] = np.sum(solve)
+        gradient['var_noise'] = 0.5 * (
+            np.dot(solve, solve) - factorization.trace_solve(identity_points, identity_tasks))
+
+        return gradient
+
     def log_likelihood(self, var_noise, mean, parameters_kernel):
         """
         GP log likelihood: y(x) ~ f(x) + epsilon, where epsilon(x) are iid N(0,var_noise), and
@@ -795,7 +1278,7 @@ class GPFittingGaussian(object):
         else:
             solve = cached_solve
 
-        return -np.sum(np.log(np.diag(chol))) - 0.5 * np.dot(y_unbiased, solve)
+        return -0.5 * log_determinant(chol) - 0.5 * np.dot(y_unbiased, solve)
 
     def evaluate_grad_cov(self, parameters_kernel, points):
         """
@@ -828,6 +1311,39 @@ class GPFittingGaussian(object):
 
         return grad_cov
 
+    def evaluate_cov_and_grad_cov(self, parameters_kernel, points):
+        """
+        Evaluate the covariance and its gradient using the kernel of the model on the points.
+        The kernels compute both of them sharing the pairwise distances.
+
+        :param points: np.array(nxk)
+        :param parameters_kernel: np.array(l)
+
+        :return: (np.array(nxn), {
+            (int) i: (nxn), derivative respect to the ith parameter
+        })
+        """
+
+        evaluate = self.class_kernel.evaluate_cov_and_grad_defined_by_params_respect_params
+
+        if self.type_kernel[0] == PRODUCT_KERNELS_SEPARABLE:
+            inputs = separate_numpy_arrays_in_lists(points, self.kernel_dimensions[1])
+            inputs_dict = {}
+            for index, input in enumerate(inputs):
+                inputs_dict[self.type_kernel[index + 1]] = input
+            cov, grad_cov = evaluate(
+                separate_numpy_arrays_in_lists(parameters_kernel, self.number_parameters[1]),
+                inputs_dict,
+                self.dimensions[1:], self.type_kernel[1:], **self.additional_kernel_parameters)
+        elif self.type_kernel[0] == SCALED_KERNEL:
+            cov, grad_cov = evaluate(
+                parameters_kernel, points, self.dimensions[0],
+                *([self.type_kernel[1]],))
+        else:
+            cov, grad_cov = evaluate(
+                parameters_kernel, points, self.dimensions[0], **self.additional_kernel_parameters)
+
+        return cov, grad_cov
 
     def grad_log_likelihood_dict(self, var_noise, mean, parameters_kernel):
         """
@@ -840,9 +1356,17 @@ class GPFittingGaussian(object):
         :return: {'var_noise': float, 'mean': float, 'kernel_params': np.array(n)}
         """
 
-        grad_cov = self.evaluate_grad_cov(parameters_kernel, self.data['points'])
+        if self._kronecker_layout(self.data['points']) is not None:
+            chol = self._chol_cov_including_noise(var_noise, parameters_kernel)[0]
+            if isinstance(chol, KroneckerFactorization):
+                return self._grad_log_likelihood_kronecker(chol, var_noise, mean,
+                                                           parameters_kernel)
 
-        chol, cov = self._chol_cov_including_noise(var_noise, parameters_kernel)
+        cov_kernel, grad_cov = self.evaluate_cov_and_grad_cov(
+            parameters_kernel, self.data['points'])
+
+        chol, cov = self._chol_cov_including_noise(var_noise, parameters_kernel,
+                                                   cov_kernel=cov_kernel)
 
         y_unbiased = self.data['evaluations'] - mean
 
@@ -855,22 +1379,25 @@ class GPFittingGaussian(object):
         else:
             solve = cached_solve
 
+        n_training_points = self.data['points'].shape[0]
+
+        # cov^-1 is computed only once, and then each partial derivative costs O(n^2).
+        inverse_cov = cho_solve(chol, np.identity(n_training_points))
+        matrix_grad_llh = GradientGPFittingGaussian.compute_matrix_gradient_llh(
+            inverse_cov, solve)
+
         gradient_kernel_params = np.zeros(len(parameters_kernel))
         for i in xrange(len(parameters_kernel)):
             gradient_kernel_params[i] = GradientGPFittingGaussian.\
-                compute_gradient_llh_given_grad_cov(grad_cov[i], chol, solve)
-
-        n_training_points = self.data['points'].shape[0]
+                compute_gradient_llh_given_matrix(grad_cov[i], matrix_grad_llh)
 
         gradient = {}
         gradient['kernel_params'] = gradient_kernel_params
         gradient['mean'] = GradientGPFittingGaussian.compute_gradient_mean(
             chol, y_unbiased, n_training_points)
 
-        grad_var_noise = GradientGPFittingGaussian.compute_gradient_kernel_respect_to_noise(
-            n_training_points)
-        gradient['var_noise'] = GradientGPFittingGaussian.compute_gradient_llh_given_grad_cov(
-            grad_var_noise, chol, solve)
+        # The derivative of the kernel respect to the noise is the identity.
+        gradient['var_noise'] = 0.5 * np.trace(matrix_grad_llh)
 
         return gradient
 
@@ -1049,11 +1576,14 @@ class GPFittingGaussian(object):
         self.mean_value = vector[1:2]
         self.var_noise_value = vector[0:1]
 
+        Parallel.update_version(self)
+
     @classmethod
     def train(cls, type_kernel, dimensions, mle, training_data, bounds_domain, thinning=0,
               n_burning=0, max_steps_out=1, random_seed=None, type_bounds=None, training_name=None,
               problem_name=None, kernel_values=None, mean_value=None, var_noise_value=None,
-              same_correlation=False, simplex_domain=None, define_samplers=True):
+              same_correlation=False, simplex_domain=None, define_samplers=True, n_chains=1,
+              **model_parameters):
         """
         :param type_kernel: [(str)] Must be in possible_kernels. If it's a product of kernels it
             should be a list as: [PRODUCT_KERNELS_SEPARABLE, NAME_1_KERNEL, NAME_2_KERNEL]
@@ -1080,10 +1610,15 @@ class GPFittingGaussian(object):
             kernel.
         :param define_samplers: (boolean) If False, samplers for the hyperparameters are not
             defined.
+        :param n_chains: (int) Number of chains of the MCMC.
+        :param model_parameters: additional parameters of the subclasses of GPFittingGaussian,
+            e.g. n_inducing_points of SparseGPFittingGaussian.
 
         :return: GPFittingGaussian
         """
 
+        model_parameters[SAME_CORRELATION] = same_correlation
+
         if mle:
             if random_seed is not None:
                 np.random.seed(random_seed)
@@ -1093,7 +1628,7 @@ class GPFittingGaussian(object):
                      type_bounds=type_bounds, random_seed=random_seed, training_name=training_name,
                      problem_name=problem_name, kernel_values=kernel_values, mean_value=mean_value,
                      var_noise_value=var_noise_value, simplex_domain=simplex_domain,
-                     define_samplers=define_samplers, **{SAME_CORRELATION: same_correlation})
+                     define_samplers=define_samplers, n_chains=n_chains, **model_parameters)
 
             return gp.fit_gp_regression()
 
@@ -1102,7 +1637,7 @@ class GPFittingGaussian(object):
                    type_bounds=type_bounds, random_seed=random_seed, training_name=training_name,
                    problem_name=problem_name, kernel_values=kernel_values, mean_value=mean_value,
                    var_noise_value=var_noise_value, simplex_domain=simplex_domain,
-                   define_samplers=define_samplers, **{SAME_CORRELATION: same_correlation})
+                   define_samplers=define_samplers, n_chains=n_chains, **model_parameters)
 
     def evaluate_cross_cov(self, points_1, points_2, parameters_kernel):
         """
@@ -1199,9 +1734,66 @@ class GPFittingGaussian(object):
 
         return hessian
 
+    def evaluate_grad_cross_cov_respect_points(self, points_1, points_2, parameters_kernel):
+        """
+        Evaluate the gradient of the cross covariance of the kernel of the model respect to
+        each one of the rows of points_1.
+
+        :param points_1: np.array(mxk)
+        :param points_2: np.array(nxk)
+        :param parameters_kernel: np.array(l)
+        :return: np.array(mxnxk)
+        """
+
+        if self.type_kernel[0] == PRODUCT_KERNELS_SEPARABLE:
+            grad = self.class_kernel.evaluate_grad_respect_points(
+                separate_numpy_arrays_in_lists(parameters_kernel, self.number_parameters[1]),
+                points_1, points_2,
+                self.dimensions[1:], self.type_kernel[1:], **self.additional_kernel_parameters)
+        elif self.type_kernel[0] == SCALED_KERNEL:
+            grad = self.class_kernel.evaluate_grad_respect_points(
+                parameters_kernel, points_1, points_2, self.dimensions[0],
+                *([self.type_kernel[1]],)
+            )
+        else:
+            grad = self.class_kernel.evaluate_grad_respect_points(
+                parameters_kernel, points_1, points_2, self.dimensions[0],
+                **self.additional_kernel_parameters
+            )
+
+        return grad
+
+    def evaluate_hessian_cross_cov_respect_points(self, points_1, points_2, parameters_kernel):
+        """
+        Evaluate the hessian of the cross covariance of the kernel of the model respect to
+        each one of the rows of points_1.
+
+        :param points_1: np.array(mxk)
+        :param points_2: np.array(nxk)
+        :param parameters_kernel: np.array(l)
+        :return: np.array(mxnxkxk)
+        """
+        if self.type_kernel[0] == PRODUCT_KERNELS_SEPARABLE:
+            hessian = self.class_kernel.evaluate_hessian_respect_points(
+                separate_numpy_arrays_in_lists(parameters_kernel, self.number_parameters[1]),
+                points_1, points_2,
+                self.dimensions[1:], self.type_kernel[1:], **self.additional_kernel_parameters)
+        elif self.type_kernel[0] == SCALED_KERNEL:
+            hessian = self.class_kernel.evaluate_hessian_respect_points(
+                parameters_kernel, points_1, points_2, self.dimensions[0],
+                *([self.type_kernel[1]],)
+            )
+        else:
+            hessian = self.class_kernel.evaluate_hessian_respect_points(
+                parameters_kernel, points_1, points_2, self.dimensions[0],
+                **self.additional_kernel_parameters
+            )
+
+        return hessian
+
     def _cholesky_solve_vectors_for_posterior(self, var_noise, mean, parameters_kernel,
                                               historical_points=None, historical_evaluations=None,
-                                              cache=True, clear_cache=True):
+                                              cache=True, clear_cache=False):
         """
         Solves the system cov(historical_points) * x = historical_evaluations - mean, and returns
         the Cholesky decomposition of cov(historical_points) too.
@@ -1212,6 +1804,8 @@ class GPFittingGaussian(object):
         :param historical_points: np.array(nxk)
         :param historical_evaluations: np.array(n)
         :param cache: (boolean) get cached data only if cache is True
+        :param clear_cache: (boolean) If True, the cached data of the other samples of the
+            hyperparameters is removed.
 
         :return: {
             'chol': np.array(nxn),
@@ -1251,7 +1845,7 @@ class GPFittingGaussian(object):
         }
 
     def compute_posterior_parameters(self, points, var_noise=None, mean=None,
-                                     parameters_kernel=None, only_mean=False):
+                                     parameters_kernel=None, only_mean=False, only_variance=False):
         """
         Compute the posterior mean and cov of the GP at points:
             f(points) ~ GP(mu_n(points), cov_n(points, points))
@@ -1261,10 +1855,12 @@ class GPFittingGaussian(object):
         :param mean: float
         :param parameters_kernel: np.array(k)
         :param only_mean: boolean
+        :param only_variance: (boolean) If it's True, only the diagonal of the posterior covariance
+            is computed, so the memory used is O(n * n_data) instead of O(n^2).
         :return: {
             'mean': np.array(n),
             'cov': np.array(nxn)
-        }
+        }, or {'mean': np.array(n), 'var': np.array(n)} if only_variance is True.
         """
         # TODO: cache solve, and np.dot(vec_cov, solve_2). We can just save it here with some
         # TODO: names like: self.mean_product = vec_cov
@@ -1292,24 +1888,107 @@ class GPFittingGaussian(object):
                 'cov': None,
             }
 
+        if only_variance:
+            solve_2 = posterior_cov_solve(chol, vec_cov.transpose())
+            var_n = self.evaluate_cov_diagonal(points, parameters_kernel) - \
+                np.einsum('ij,ji->i', vec_cov, solve_2)
+            return {
+                'mean': mu_n,
+                'var': var_n,
+            }
+
         if points.shape[0] == 1:
             index = (tuple(points[0, :]), tuple(parameters_kernel))
 
         if points.shape[0] == 1 and index in self.cache_cov_n:
             cov_n = self.cache_cov_n[index]
         else:
-            solve_2 = cho_solve(chol, vec_cov.transpose())
+            solve_2 = posterior_cov_solve(chol, vec_cov.transpose())
             cov_n = self.evaluate_cov(points, parameters_kernel) - np.dot(vec_cov, solve_2)
 
             if points.shape[0] == 1:
                 self.cache_cov_n = {}
                 self.cache_cov_n[index] = cov_n
+                Parallel.update_version(self)
 
         return {
             'mean': mu_n,
             'cov': cov_n,
         }
 
+    def compute_posterior_parameters_samples(self, points, parameters, only_mean=False):
+        """
+        Compute the posterior means and variances of the GP at points for several samples of the
+        parameters of the model. The cross covariances, the factorizations and the solves are
+        computed in a loop over the samples, because the kernels are evaluated for one vector of
+        parameters at a time, and the factorizations are cached per sample. The results of the
+        loop are stacked, so only the final contractions that give the means and variances are
+        vectorized across the samples.
+
+        :param points: np.array(mxk)
+        :param parameters: np.array(Sxl), each row is [var_noise, mean, parameters_kernel]
+        :param only_mean: boolean
+        :return: {
+            'mean': np.array(Sxm),
+            'var': np.array(Sxm) or None
+        }
+        """
+        n_samples = parameters.shape[0]
+        n_points = points.shape[0]
+        n_data = self.data['points'].shape[0]
+
+        vec_covs = np.zeros((n_samples, n_points, n_data))
+        solves = np.zeros((n_samples, n_data))
+
+        if not only_mean:
+            solves_vec_covs = np.zeros((n_samples, n_data, n_points))
+            prior_vars = np.zeros((n_samples, n_points))
+
+        for index, parameter in enumerate(parameters):
+            parameters_kernel = parameter[2:]
+            chol_solve = self._cholesky_solve_vectors_for_posterior(
+                parameter[0], parameter[1], parameters_kernel)
+            solves[index, :] = chol_solve['solve']
+            vec_covs[index, :, :] = self.evaluate_cross_cov(
+                points, self.data['points'], parameters_kernel)
+
+            if not only_mean:
+                solves_vec_covs[index, :, :] = posterior_cov_solve(
+                    chol_solve['chol'], vec_covs[index, :, :].transpose())
+                prior_vars[index, :] = self.evaluate_cov_diagonal(points, parameters_kernel)
+
+        means = parameters[:, 1: 2] + np.einsum('smn,sn->sm', vec_covs, solves)
+
+        if only_mean:
+            return {
+                'mean': means,
+                'var': None,
+            }
+
+        variances = prior_vars - np.einsum('smn,snm->sm', vec_covs, solves_vec_covs)
+
+        return {
+            'mean': means,
+            'var': variances,
+        }
+
+    def _screen_posterior_mean(self, points):
+        """
+        Computes the posterior mean at points averaged over the last DEFAULT_N_PARAMETERS samples
+        of the parameters of the model. The points are evaluated in chunks of
+        RESTARTS_SCREENING_CHUNK_SIZE points.
+
+        :param points: np.array(txk)
+        :return: np.array(t)
+        """
+        parameters = np.array(self.samples_parameters[-DEFAULT_N_PARAMETERS:])
+
+        f = lambda x: np.mean(
+            self.compute_posterior_parameters_samples(x, parameters, only_mean=True)['mean'],
+            axis=0)
+
+        return screen_points(f, points)
+
     def gradient_posterior_parameters(self, point, var_noise=None, mean=None,
                                       parameters_kernel=None, parallel=True, only_mean=False):
         """
@@ -1347,7 +2026,7 @@ class GPFittingGaussian(object):
             {'mean': grad_mu, 'cov': None}
 
         vec_cov = self.evaluate_cross_cov(point, self.data['points'], parameters_kernel)
-        solve_2 = cho_solve(chol, grad_cross_cov)
+        solve_2 = posterior_cov_solve(chol, grad_cross_cov)
         grad_cov = -2.0 * np.dot(vec_cov, solve_2)
 
         return {'mean': grad_mu, 'cov': grad_cov}
@@ -1433,19 +2112,11 @@ class GPFittingGaussian(object):
             n_restart_ = start.shape[0]
 
             if n_restart_ > n_best_restarts and n_best_restarts > 0:
-                point_dict = {}
-                for j in xrange(start.shape[0]):
-                    point_dict[j] = start[j, :]
-                args = (False, None, True, 0, self, DEFAULT_N_PARAMETERS)
-                ei_values = Parallel.run_function_different_arguments_parallel(
-                    wrapper_posterior_mean_gp_model, point_dict, *args)
-                values = [ei_values[i] for i in ei_values]
+                # The starting points are screened with chunked vectorized evaluations.
+                values = self._screen_posterior_mean(start)
                 values_index = sorted(range(len(values)), key=lambda k: values[k])
                 values_index = values_index[-n_best_restarts:]
-                start = []
-                for j in values_index:
-                    start.append(point_dict[j])
-                start = np.array(start)
+                start = start[values_index, :]
                 n_restart_ = start.shape[0]
         else:
             n_restart_ = 1
@@ -1511,20 +2182,11 @@ class GPFittingGaussian(object):
         max_ = np.max(maximum_values)
 
         if candidate_solutions is not None:
-            n = len(candidate_values)
-            candidate_solutions_2 = candidate_solutions
-            values = []
+            candidate_solutions_2 = np.array(candidate_solutions, dtype=np.float64)
+            values_candidates = self._screen_posterior_mean(candidate_solutions_2)
             point_dict = {}
-
-            args = (False, None, parallel, 0, self, DEFAULT_N_PARAMETERS)
-            for j in range(n):
-                point_dict[j] = np.array(candidate_solutions_2[j])
-            values = Parallel.run_function_different_arguments_parallel(
-                wrapper_posterior_mean_gp_model, point_dict, *args)
-
-            values_candidates = []
-            for j in range(n):
-                values_candidates.append(values[j])
+            for j in xrange(candidate_solutions_2.shape[0]):
+                point_dict[j] = candidate_solutions_2[j, :]
             ind_max_2 = np.argmax(values_candidates)
 
             if np.max(values_candidates) > max_:
@@ -1537,6 +2199,7 @@ class GPFittingGaussian(object):
         logger.info(optimal_solutions.get(ind_max))
 
         self.optimization_results.append(optimal_solutions.get(ind_max))
+        Parallel.update_version(self)
 
         return optimal_solutions.get(ind_max)
 
@@ -1622,17 +2285,21 @@ class GPFittingGaussian(object):
 
         best = np.max(evaluations)
         self.best_solution[index] = best
+        Parallel.update_version(self)
 
         return best
 
     def clean_cache(self):
         """
-        Cleans the cache
+        Cleans the cache. The Cholesky decompositions are kept if they were computed using the
+        current data, because they are updated by add_points_evaluations.
         """
-        self.cache_chol_cov = {}
-        self.cache_sol_chol_y_unbiased = {}
+        if not self._cached_data_is_current():
+            self.cache_chol_cov.clear()
+            self.cache_sol_chol_y_unbiased.clear()
         self.best_solution = {}
         self.cache_cov_n = {}
+        Parallel.update_version(self)
 
     def write_debug_data(self, problem_name, model_type, training_name, n_training, random_seed,
                          method=EI_METHOD, n_samples_parameters=0):
@@ -1672,6 +2339,33 @@ class GradientGPFittingGaussian(object):
 
         return sol
 
+    @staticmethod
+    def compute_matrix_gradient_llh(inverse_cov, solve):
+        """
+        Computes the matrix solve * solve^T - cov^-1, which is used to compute the gradient of the
+        llh: d(llh)/d(theta) = 0.5 * trace((solve * solve^T - cov^-1) * d(cov)/d(theta)).
+
+        :param inverse_cov: np.array(nxn)
+        :param solve: (np.array(n)) cov^-1 (y-mean)
+        :return: np.array(nxn)
+        """
+
+        return np.outer(solve, solve) - inverse_cov
+
+    @staticmethod
+    def compute_gradient_llh_given_matrix(grad_cov, matrix_grad_llh):
+        """
+        Computes the derivative of the llh using an elementwise product instead of the product of
+        matrices.
+
+        :param grad_cov: np.array(nxn)
+        :param matrix_grad_llh: (np.array(nxn)) solve * solve^T - cov^-1 (see
+            compute_matrix_gradient_llh)
+        :return: float
+        """
+
+        return 0.5 * np.einsum('ij,ji->', matrix_grad_llh, grad_cov)
+
     @staticmethod
     def compute_gradient_kernel_respect_to_noise(n):
         """
@@ -1709,11 +2403,16 @@ class ValidationGPModel(object):
     def cross_validation_mle_parameters(cls, type_kernel, training_data, dimensions, problem_name,
                                         bounds_domain=None, thinning=0, n_burning=0,
                                         max_steps_out=1, start=None, random_seed=None,
-                                        training_name=None, **kernel_parameters):
+                                        training_name=None, closed_form=False,
+                                        **kernel_parameters):
         """
         A json file with the percentage of success is generated. The output can be used to create
         a histogram and a diagnostic plot.
 
+        If closed_form is True, the GP is fitted only once with all the data, and the leave-one-out
+        posterior parameters are computed in closed form with the inverse of its covariance
+        matrix. Otherwise, a GP is fitted for each fold.
+
         The histogram would be of the vector (y_eval-means)/std_vec. We'd expect to have an
         histogram similar to the one of a standard Gaussian random variable.
 
@@ -1737,6 +2436,8 @@ class ValidationGPModel(object):
         :param start: (np.array(n)) starting point of the optimization of the llh.
         :param random_seed: int
         :param training_name: (str)
+        :param closed_form: (boolean) If True, the hyperparameters are fixed, and the folds aren't
+            refitted.
         :param kernel_parameters: additional kernel parameters,
             - SAME_CORRELATION: (boolean) True or False. Parameter used only for task kernel.
 
@@ -1768,48 +2469,16 @@ class ValidationGPModel(object):
         if training_data.get('var_noise') is None:
             noise = False
 
-        training_data_sets = {}
-        test_points = {}
-        gp_objects = {}
-
-        for i in xrange(n_data):
-            selector = [x for x in range(n_data) if x != i]
-            training_data_sets[i] = {}
-            test_points[i] = {}
-
-            training_data_sets[i]['evaluations'] = training_data['evaluations'][selector]
-            test_points[i]['evaluations'] = training_data['evaluations'][i]
-
-            training_data_sets[i]['points'] = training_data['points'][selector, :]
-            test_points[i]['points'] = training_data['points'][[i], :]
-
-            if noise:
-                training_data_sets[i]['var_noise'] = training_data['var_noise'][selector]
-                test_points[i]['var_noise'] = training_data['var_noise'][i]
-            else:
-                training_data_sets[i]['var_noise'] = []
-                test_points[i]['var_noise'] = []
-
-        args = (False, None, True, 0, GPFittingGaussian, type_kernel, dimensions, bounds_domain,
-                thinning, n_burning, max_steps_out, random_seed, problem_name, training_name)
-        gp_results = Parallel.run_function_different_arguments_parallel(
-            wrapper_GPFittingGaussian, training_data_sets, *args, **kernel_parameters
-        )
-
-        for i in xrange(n_data):
-            if gp_results.get(i) is None:
-                logger.info("It wasn't possible to create the GP instance for fold %d" % i)
-                continue
-            gp_objects[i] = gp_results[i]
-
-
-        kwargs = {
-            'start': start,
-            'random_seed': random_seed,
-        }
-
-        new_gp_objects = Parallel.run_function_different_arguments_parallel(
-            wrapper_fit_gp_regression, gp_objects, all_success=False, **kwargs)
+        if closed_form:
+            posteriors = cls.leave_one_out_closed_form(
+                type_kernel, training_data, dimensions, problem_name, bounds_domain=bounds_domain,
+                thinning=thinning, n_burning=n_burning, max_steps_out=max_steps_out, start=start,
+                random_seed=random_seed, training_name=training_name, **kernel_parameters)
+        else:
+            posteriors = cls.leave_one_out_refitting(
+                type_kernel, training_data, dimensions, problem_name, bounds_domain=bounds_domain,
+                thinning=thinning, n_burning=n_burning, max_steps_out=max_steps_out, start=start,
+                random_seed=random_seed, training_name=training_name, **kernel_parameters)
 
         number_correct = 0
         success_runs = 0
@@ -1820,26 +2489,22 @@ class ValidationGPModel(object):
         y_eval = np.zeros(n_data)
 
         for i in xrange(n_data):
-            if new_gp_objects.get(i) is None:
+            if posteriors.get(i) is None:
                 logger.info("It wasn't possible to fit the GP for %d" % i)
                 continue
             success_runs += 1
-            posterior = new_gp_objects[i].compute_posterior_parameters(test_points[i]['points'])
 
-            cov = posterior['cov']
-            mean = posterior['mean']
+            mean, variance = posteriors[i]
 
-            means[i] = mean[0]
-            std_vec[i] = np.sqrt(cov[0, 0])
-            y_eval[i] = test_points[i]['evaluations']
+            means[i] = mean
+            std_vec[i] = np.sqrt(variance)
+            y_eval[i] = training_data['evaluations'][i]
 
             if noise:
                 correct[i] = cls.check_value_within_ci(
-                    test_points[i]['evaluations'], mean[0], cov[0, 0],
-                    var_noise=test_points[i]['var_noise'])
+                    y_eval[i], mean, variance, var_noise=training_data['var_noise'][i])
             else:
-                correct[i] = cls.check_value_within_ci(
-                    test_points[i]['evaluations'], mean[0], cov[0, 0])
+                correct[i] = cls.check_value_within_ci(y_eval[i], mean, variance)
             if correct[i]:
                 number_correct += 1
 
@@ -1898,6 +2563,132 @@ class ValidationGPModel(object):
 
         return results
 
+    @staticmethod
+    def leave_one_out_refitting(type_kernel, training_data, dimensions, problem_name,
+                                bounds_domain=None, thinning=0, n_burning=0, max_steps_out=1,
+                                start=None, random_seed=None, training_name=None,
+                                **kernel_parameters):
+        """
+        Fits a GP for each fold, i.e. for each training set that excludes one of the points, and
+        computes its posterior parameters at the excluded point.
+
+        See cross_validation_mle_parameters for the description of the parameters.
+
+        :return: {i: (float, float)}, posterior mean and variance at the i-th point. Folds whose
+            GP couldn't be fitted are not included.
+        """
+        n_data = len(training_data['evaluations'])
+
+        noise = True
+
+        if training_data.get('var_noise') is None:
+            noise = False
+
+        training_data_sets = {}
+        test_points = {}
+        gp_objects = {}
+
+        for i in xrange(n_data):
+            selector = [x for x in range(n_data) if x != i]
+            training_data_sets[i] = {}
+            test_points[i] = training_data['points'][[i], :]
+
+            training_data_sets[i]['evaluations'] = training_data['evaluations'][selector]
+            training_data_sets[i]['points'] = training_data['points'][selector, :]
+
+            if noise:
+                training_data_sets[i]['var_noise'] = training_data['var_noise'][selector]
+            else:
+                training_data_sets[i]['var_noise'] = []
+
+        args = (False, None, True, 0, GPFittingGaussian, type_kernel, dimensions, bounds_domain,
+                thinning, n_burning, max_steps_out, random_seed, problem_name, training_name)
+        gp_results = Parallel.run_function_different_arguments_parallel(
+            wrapper_GPFittingGaussian, training_data_sets, *args, **kernel_parameters
+        )
+
+        for i in xrange(n_data):
+            if gp_results.get(i) is None:
+                logger.info("It wasn't possible to create the GP instance for fold %d" % i)
+                continue
+            gp_objects[i] = gp_results[i]
+
+        kwargs = {
+            'start': start,
+            'random_seed': random_seed,
+        }
+
+        new_gp_objects = Parallel.run_function_different_arguments_parallel(
+            wrapper_fit_gp_regression, gp_objects, all_success=False, **kwargs)
+
+        posteriors = {}
+        for i in new_gp_objects:
+            posterior = new_gp_objects[i].compute_posterior_parameters(test_points[i])
+            posteriors[i] = (posterior['mean'][0], posterior['cov'][0, 0])
+
+        return posteriors
+
+    @staticmethod
+    def leave_one_out_closed_form(type_kernel, training_data, dimensions, problem_name,
+                                  bounds_domain=None, thinning=0, n_burning=0, max_steps_out=1,
+                                  start=None, random_seed=None, training_name=None,
+                                  **kernel_parameters):
+        """
+        Fits one GP with all the data, and computes the leave-one-out posterior parameters using
+        the inverse of the covariance matrix K (including noise) at the fitted hyperparameters:
+            mean_i = y_i - (K^-1 (y - mean))_i / (K^-1)_ii
+            var_i = 1 / (K^-1)_ii - noise_i,
+        where noise_i is the variance of the noise of the i-th observation.
+
+        See cross_validation_mle_parameters for the description of the parameters.
+
+        :return: {i: (float, float)}, posterior mean and variance at the i-th point. It's empty if
+            the GP couldn't be fitted.
+        """
+        n_data = len(training_data['evaluations'])
+
+        data = {
+            'evaluations': training_data['evaluations'],
+            'points': training_data['points'],
+            'var_noise': training_data.get('var_noise'),
+        }
+
+        if data['var_noise'] is None:
+            data['var_noise'] = []
+
+        try:
+            gp = wrapper_GPFittingGaussian(
+                data, GPFittingGaussian, type_kernel, dimensions, bounds_domain, thinning,
+                n_burning, max_steps_out, random_seed, problem_name, training_name,
+                **kernel_parameters)
+            gp = gp.fit_gp_regression(start=start, random_seed=random_seed)
+
+            var_noise = gp.var_noise.value[0]
+            mean = gp.mean.value[0]
+            parameters_kernel = gp.kernel.hypers_values_as_array
+
+            chol_solve = gp._cholesky_solve_vectors_for_posterior(
+                var_noise, mean, parameters_kernel, cache=False)
+        except Exception as e:
+            logger.info("It wasn't possible to fit the GP: %s" % e)
+            return {}
+
+        inverse_cov = cho_solve(chol_solve['chol'], np.identity(n_data))
+        diag_inverse = np.diag(inverse_cov)
+
+        noise = var_noise * np.ones(n_data)
+        if gp.data.get('var_noise') is not None:
+            noise += gp.data['var_noise']
+
+        means = gp.data['evaluations'] - chol_solve['solve'] / diag_inverse
+        variances = 1.0 / diag_inverse - noise
+
+        posteriors = {}
+        for i in xrange(n_data):
+            posteriors[i] = (means[i], variances[i])
+
+        return posteriors
+
     @staticmethod
     def check_value_within_ci(value, mean, variance, var_noise=None):
         """
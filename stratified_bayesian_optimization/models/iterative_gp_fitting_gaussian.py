@@ -0,0 +1,356 @@
+from __future__ import absolute_import
+
+import numpy as np
+
+from stratified_bayesian_optimization.lib.constant import (
+    CHOL_COV,
+    ITERATIVE_GP_FITTING_GAUSSIAN,
+    CG_TOLERANCE,
+    CG_MAX_ITERATIONS,
+    CG_BLOCK_SIZE,
+    CG_JITTER,
+    DEFAULT_N_PROBE_VECTORS,
+    DEFAULT_LANCZOS_ITERATIONS,
+    DEFAULT_RANDOM_SEED,
+)
+from stratified_bayesian_optimization.models.gp_fitting_gaussian import GPFittingGaussian
+
+
+class ConjugateGradientFactorization(object):
+    """
+    Matrix-free representation of the covariance matrix of the observations
+        C = K + L,
+    where K is the covariance of the kernel and L is the diagonal matrix with the variances of
+    the noise. C is never stored: the products C * v are computed in blocks of rows of K, so they
+    need O(n * block_size) memory.
+
+    The linear systems are solved by conjugate gradients with the Jacobi preconditioner, and
+    log|C| is estimated by stochastic Lanczos quadrature with Rademacher probe vectors. The probe
+    vectors are fixed by a random seed, so the estimates are deterministic functions of the
+    parameters.
+    """
+
+    def __init__(self, model, parameters_kernel, points, noise, tolerance=CG_TOLERANCE,
+                 max_iterations=CG_MAX_ITERATIONS, n_probe_vectors=DEFAULT_N_PROBE_VECTORS,
+                 lanczos_iterations=DEFAULT_LANCZOS_ITERATIONS, block_size=CG_BLOCK_SIZE,
+                 random_seed=DEFAULT_RANDOM_SEED):
+        """
+        :param model: GPFittingGaussian, used to evaluate the kernel
+        :param parameters_kernel: np.array(k)
+        :param points: np.array(nxd)
+        :param noise: np.array(n), diagonal of L. It must be positive.
+        :param tolerance: (float) relative tolerance of the residuals of conjugate gradients
+        :param max_iterations: (int) maximum number of iterations of conjugate gradients
+        :param n_probe_vectors: (int) number of probe vectors of the stochastic estimators
+        :param lanczos_iterations: (int) number of Lanczos iterations per probe vector
+        :param block_size: (int) number of rows of K computed at the same time
+        :param random_seed: (int) seed of the probe vectors
+        """
+        self.model = model
+        self.parameters_kernel = np.array(parameters_kernel, dtype=float)
+        self.points = points
+        self.noise = noise
+        self.n = points.shape[0]
+
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.n_probe_vectors = n_probe_vectors
+        self.lanczos_iterations = lanczos_iterations
+        self.block_size = block_size
+        self.random_seed = random_seed
+
+        self.diagonal = model.evaluate_cov_diagonal(points, self.parameters_kernel) + noise
+
+        self._log_determinant = None
+
+    def matvec_kernel(self, vectors, parameters_kernel=None):
+        """
+        Computes K * vectors by blocks of rows.
+
+        :param vectors: np.array(nxk)
+        :param parameters_kernel: np.array(l), the parameters of the factorization by default
+        :return: np.array(nxk)
+        """
+        if parameters_kernel is None:
+            parameters_kernel = self.parameters_kernel
+
+        products = np.zeros(vectors.shape)
+        for start in xrange(0, self.n, self.block_size):
+            end = min(start + self.block_size, self.n)
+            rows = self.model.evaluate_cross_cov(
+                self.points[start: end, :], self.points, parameters_kernel)
+            products[start: end, :] = np.dot(rows, vectors)
+
+        return products
+
+    def matvec(self, vectors):
+        """
+        Computes C * vectors.
+
+        :param vectors: np.array(nxk)
+        :return: np.array(nxk)
+        """
+        return self.matvec_kernel(vectors) + self.noise[:, None] * vectors
+
+    def probe_vectors(self):
+        """
+        :return: np.array(n x n_probe_vectors), Rademacher vectors
+        """
+        random_state = np.random.RandomState(self.random_seed)
+        return 2.0 * random_state.randint(2, size=(self.n, self.n_probe_vectors)) - 1.0
+
+    def cho_solve(self, y):
+        """
+        Solves C * x = y by preconditioned conjugate gradients. All the columns of y are solved
+        at the same time, so each iteration computes only one batched product with C.
+
+        :param y: np.array(n) or np.array(nxk)
+        :return: np.array(n) or np.array(nxk)
+        """
+        vector = len(y.shape) == 1
+        b = np.array(y, dtype=float).reshape((self.n, -1))
+
+        solution = np.zeros(b.shape)
+        residual = b.copy()
+        preconditioned = residual / self.diagonal[:, None]
+        direction = preconditioned.copy()
+        product_residuals = np.sum(residual * preconditioned, axis=0)
+
+        threshold = self.tolerance * np.sqrt(np.sum(b ** 2, axis=0))
+
+        for iteration in xrange(self.max_iterations):
+            active = np.sqrt(np.sum(residual ** 2, axis=0)) > threshold
+            if not np.any(active):
+                break
+
+            product = self.matvec(direction)
+            curvature = np.sum(direction * product, axis=0)
+
+            step = np.zeros(b.shape[1])
+            step[active] = product_residuals[active] / curvature[active]
+
+            solution += step * direction
+            residual -= step * product
+
+            preconditioned = residual / self.diagonal[:, None]
+            new_product_residuals = np.sum(residual * preconditioned, axis=0)
+
+            beta = np.zeros(b.shape[1])
+            beta[active] = new_product_residuals[active] / product_residuals[active]
+
+            direction = preconditioned + beta * direction
+            product_residuals = new_product_residuals
+
+        if vector:
+            return solution[:, 0]
+        return solution
+
+    def log_determinant(self):
+        """
+        Estimates log|C| = tr(log(C)) by stochastic Lanczos quadrature: for each probe vector z,
+        z^T * log(C) * z is approximated by the Gauss quadrature given by the tridiagonal matrix
+        of the Lanczos iterations started at z.
+
+        :return: float
+        """
+        if self._log_determinant is not None:
+            return self._log_determinant
+
+        probes = self.probe_vectors()
+        n_iterations = min(self.lanczos_iterations, self.n)
+
+        alphas = np.zeros((n_iterations, self.n_probe_vectors))
+        betas = np.zeros((n_iterations, self.n_probe_vectors))
+
+        basis = [probes / np.sqrt(self.n)]
+        previous = np.zeros(probes.shape)
+        beta = np.zeros(self.n_probe_vectors)
+
+        for j in xrange(n_iterations):
+            current = basis[-1]
+            w = self.matvec(current) - beta * previous
+            alphas[j, :] = np.sum(w * current, axis=0)
+            w -= alphas[j, :] * current
+
+            # Full reorthogonalization keeps the quadrature nodes accurate.
+            for vector in basis:
+                w -= np.sum(w * vector, axis=0) * vector
+
+            if j == n_iterations - 1:
+                break
+
+            beta = np.sqrt(np.sum(w ** 2, axis=0))
+            # The Krylov subspace of a probe is exhausted when beta vanishes, and then the rest of
+            # its tridiagonal matrix is decoupled from the first node.
+            converged = beta <= 1e-10 * np.abs(alphas[j, :])
+            beta[converged] = 0.0
+            betas[j, :] = beta
+
+            previous = current
+            basis.append(np.where(converged, 0.0, w / np.where(converged, 1.0, beta)))
+
+        estimates = np.zeros(self.n_probe_vectors)
+        for i in xrange(self.n_probe_vectors):
+            tridiagonal = np.diag(alphas[:, i]) + np.diag(betas[0: -1, i], 1) + \
+                np.diag(betas[0: -1, i], -1)
+            nodes, vectors = np.linalg.eigh(tridiagonal)
+            nodes = np.clip(nodes, np.min(self.noise), None)
+            estimates[i] = self.n * np.sum(vectors[0, :] ** 2 * np.log(nodes))
+
+        self._log_determinant = np.mean(estimates)
+
+        return self._log_determinant
+
+
+class IterativeGPFittingGaussian(GPFittingGaussian):
+    """
+    GP model whose Cholesky decompositions are replaced by ConjugateGradientFactorization objects,
+    so the nxn covariance matrix is never computed nor stored. The products with the covariance
+    matrix are computed in blocks, the linear systems are solved by conjugate gradients, and the
+    log determinant and the traces of the gradient of the log likelihood are estimated with
+    probe vectors. It's useful when there are thousands of observations.
+
+    The methods of GPFittingGaussian, and the models and acquisition functions that use
+    cho_solve (e.g. BayesianQuadrature, EI, SBO), work unchanged.
+    """
+
+    def __init__(self, type_kernel, training_data, dimensions=None, bounds_domain=None,
+                 n_probe_vectors=None, lanczos_iterations=None, cg_tolerance=None,
+                 max_iterations_cg=None, block_size=None, **kwargs):
+        """
+        See GPFittingGaussian for the description of the other parameters.
+
+        :param n_probe_vectors: (int) the default value is DEFAULT_N_PROBE_VECTORS
+        :param lanczos_iterations: (int) the default value is DEFAULT_LANCZOS_ITERATIONS
+        :param cg_tolerance: (float) the default value is CG_TOLERANCE
+        :param max_iterations_cg: (int) the default value is CG_MAX_ITERATIONS
+        :param block_size: (int) the default value is CG_BLOCK_SIZE
+        """
+        if n_probe_vectors is None:
+            n_probe_vectors = DEFAULT_N_PROBE_VECTORS
+
+        if lanczos_iterations is None:
+            lanczos_iterations = DEFAULT_LANCZOS_ITERATIONS
+
+        if cg_tolerance is None:
+            cg_tolerance = CG_TOLERANCE
+
+        if max_iterations_cg is None:
+            max_iterations_cg = CG_MAX_ITERATIONS
+
+        if block_size is None:
+            block_size = CG_BLOCK_SIZE
+
+        self.n_probe_vectors = n_probe_vectors
+        self.lanczos_iterations = lanczos_iterations
+        self.cg_tolerance = cg_tolerance
+        self.max_iterations_cg = max_iterations_cg
+        self.block_size = block_size
+
+        if kwargs.get('name_model') is None:
+            kwargs['name_model'] = ITERATIVE_GP_FITTING_GAUSSIAN
+
+        super(IterativeGPFittingGaussian, self).__init__(
+            type_kernel, training_data, dimensions=dimensions, bounds_domain=bounds_domain,
+            **kwargs)
+
+    def serialize(self):
+        data = super(IterativeGPFittingGaussian, self).serialize()
+        data['n_probe_vectors'] = self.n_probe_vectors
+        data['lanczos_iterations'] = self.lanczos_iterations
+        data['cg_tolerance'] = self.cg_tolerance
+        data['max_iterations_cg'] = self.max_iterations_cg
+        data['block_size'] = self.block_size
+        return data
+
+    def _chol_cov_including_noise(self, var_noise, parameters_kernel, historical_points=None,
+                                  cache=True, clear_cache=False):
+        """
+        Compute the matrix-free factorization of
+        covariance = cov_kernel + np.diag(var_noise_observations) + np.diag(var_noise).
+        The covariance matrix isn't computed.
+
+        :param var_noise: float
+        :param parameters_kernel: np.array(k)
+        :param historical_points: np.array(nxk)
+        :param cache: (boolean) get cached data only if cache is True
+        :return: ConjugateGradientFactorization, None
+        """
+
+        if historical_points is None:
+            historical_points = self.data['points']
+
+        cached = self._get_cached_data((var_noise, tuple(parameters_kernel)), CHOL_COV, cache=cache)
+        if cached is not False:
+            return cached
+
+        historical_points = np.array(historical_points)
+
+        n = historical_points.shape[0]
+
+        noise = var_noise * np.ones(n)
+        if self.data.get('var_noise') is not None:
+            noise += self.data['var_noise']
+
+        # Conjugate gradients converges slowly without noise, so a small jitter is added.
+        diagonal = self.evaluate_cov_diagonal(historical_points, parameters_kernel)
+        noise = np.clip(noise, CG_JITTER * np.mean(diagonal), None)
+
+        factorization = ConjugateGradientFactorization(
+            self, parameters_kernel, historical_points, noise, tolerance=self.cg_tolerance,
+            max_iterations=self.max_iterations_cg, n_probe_vectors=self.n_probe_vectors,
+            lanczos_iterations=self.lanczos_iterations, block_size=self.block_size)
+
+        if cache:
+            self._updated_cached_data((var_noise, tuple(parameters_kernel)), (factorization, None),
+                                      CHOL_COV, clear_cache=clear_cache)
+
+        return factorization, None
+
+    def grad_log_likelihood_dict(self, var_noise, mean, parameters_kernel):
+        """
+        Computes the gradient of the log likelihood. The traces tr(C^-1 * dC) are estimated by
+        z^T * C^-1 * dC * z, averaged over the probe vectors z. The products with the derivatives
+        of the kernel are computed by forward differences of the blocked products, because the
+        kernels only provide the derivatives of the nxn covariance matrix.
+
+        :param var_noise: (float) variance of the noise
+        :param mean: (float)
+        :param parameters_kernel: np.array(k), The order of the parameters is given in the
+            definition of the class kernel.
+        :return: {'var_noise': float, 'mean': float, 'kernel_params': np.array(n)}
+        """
+        factorization = self._chol_cov_including_noise(var_noise, parameters_kernel)[0]
+
+        y_unbiased = self.data['evaluations'] - mean
+
+        probes = factorization.probe_vectors()
+        vectors = np.concatenate((y_unbiased[:, None], probes), axis=1)
+        solves = factorization.cho_solve(vectors)
+        solve = solves[:, 0]
+        solve_probes = solves[:, 1:]
+
+        # Products with dC are computed for [C^-1 * y, z_1, ..., z_p] at the same time.
+        vectors = np.concatenate((solve[:, None], probes), axis=1)
+        products = factorization.matvec_kernel(vectors)
+
+        parameters_kernel = np.array(parameters_kernel, dtype=float)
+        dh = 1e-6 * np.maximum(1.0, np.abs(parameters_kernel))
+
+        gradient_kernel_params = np.zeros(len(parameters_kernel))
+        for i in xrange(len(parameters_kernel)):
+            parameters = parameters_kernel.copy()
+            parameters[i] += dh[i]
+            derivatives = (factorization.matvec_kernel(vectors, parameters) - products) / dh[i]
+            trace = np.mean(np.sum(solve_probes * derivatives[:, 1:], axis=0))
+            gradient_kernel_params[i] = 0.5 * np.dot(solve, derivatives[:, 0]) - 0.5 * trace
+
+        gradient = {}
+        gradient['kernel_params'] = gradient_kernel_params
+        gradient['mean'] = np.sum(solve)
+
+        # The derivative of the kernel respect to the noise is the identity.
+        trace_inverse = np.mean(np.sum(solve_probes * probes, axis=0))
+        gradient['var_noise'] = 0.5 * (np.dot(solve, solve) - trace_inverse)
+
+        return gradient
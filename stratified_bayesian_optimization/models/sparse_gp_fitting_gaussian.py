@@ -0,0 +1,350 @@
+from __future__ import absolute_import
+
+import numpy as np
+from scipy import linalg
+
+from stratified_bayesian_optimization.lib.constant import (
+    CHOL_COV,
+    SOL_CHOL_Y_UNBIASED,
+    SPARSE_GP_FITTING_GAUSSIAN,
+    DEFAULT_N_INDUCING_POINTS,
+    DTC_JITTER,
+)
+from stratified_bayesian_optimization.lib.finite_differences import FiniteDifferences
+from stratified_bayesian_optimization.lib.la_functions import (
+    cholesky,
+    cho_solve,
+)
+from stratified_bayesian_optimization.models.gp_fitting_gaussian import GPFittingGaussian
+
+
+class SparseFactorization(object):
+    """
+    Factorization of the covariance matrix of the observations under the Deterministic Training
+    Conditional (DTC) approximation:
+        C = K_nu * K_uu^-1 * K_un + L,
+    where u are the inducing points, n are the observed points, and L is the diagonal matrix with
+    the variances of the noise. Only mxm matrices are factorized, where m is the number of
+    inducing points, so all the operations cost O(nm^2).
+
+    To keep it well conditioned, it uses V = chol(K_uu)^-1 * K_un * L^(-1/2), and
+    B = I + V * V^T.
+    """
+
+    def __init__(self, indexes, cov_inducing, cross_cov, noise):
+        """
+        :param indexes: np.array(m), indexes of the inducing points among the observed points
+        :param cov_inducing: np.array(mxm), K_uu
+        :param cross_cov: np.array(mxn), K_un
+        :param noise: np.array(n), diagonal of L. It must be positive.
+        """
+        self.indexes = indexes
+        self.noise = noise
+        self.sqrt_noise = np.sqrt(noise)
+
+        self.chol_inducing = cholesky(cov_inducing, max_tries=7)
+        self.v_matrix = linalg.solve_triangular(
+            self.chol_inducing, cross_cov, lower=True) / self.sqrt_noise[None, :]
+
+        m = cov_inducing.shape[0]
+        self.chol = cholesky(np.identity(m) + np.dot(self.v_matrix, self.v_matrix.transpose()),
+                             max_tries=7)
+
+    def _scale(self, y):
+        """
+        :param y: np.array(n) or np.array(nxk)
+        :return: L^(-1/2) * y
+        """
+        if len(y.shape) == 1:
+            return y / self.sqrt_noise
+        return y / self.sqrt_noise[:, None]
+
+    def solve_cov(self, y):
+        """
+        Solves C * x = y using the Woodbury identity:
+            C^-1 = L^(-1/2) * (I - V^T * B^-1 * V) * L^(-1/2)
+
+        :param y: np.array(n) or np.array(nxk)
+        :return: np.array(n) or np.array(nxk)
+        """
+        scaled_y = self._scale(y)
+        solve = cho_solve(self.chol, np.dot(self.v_matrix, scaled_y))
+        return self._scale(scaled_y - np.dot(self.v_matrix.transpose(), solve))
+
+    def log_determinant(self):
+        """
+        Computes log|C| = log|L| + log|B|.
+
+        :return: float
+        """
+        return np.sum(np.log(self.noise)) + 2.0 * np.sum(np.log(np.diag(self.chol)))
+
+    def trace_inverse(self):
+        """
+        Computes tr(C^-1) = tr(L^-1) - tr(B^-1 * V * L^-1 * V^T).
+
+        :return: float
+        """
+        scaled_v = self.v_matrix / self.sqrt_noise[None, :]
+        solve = cho_solve(self.chol, scaled_v)
+        return np.sum(1.0 / self.noise) - np.sum(scaled_v * solve)
+
+    def log_likelihood(self, y_unbiased):
+        """
+        Log likelihood of the observations without the constant term, as in GPFittingGaussian.
+
+        :param y_unbiased: np.array(n), observations minus the mean
+        :return: float
+        """
+        return -0.5 * self.log_determinant() - \
+            0.5 * np.dot(y_unbiased, self.solve_cov(y_unbiased))
+
+    def solve_posterior(self, y_unbiased):
+        """
+        Computes the vector a such that the DTC posterior mean is mean + cov(x, X) * a, i.e.
+        a_u = chol(K_uu)^-T * B^-1 * V * L^(-1/2) * (y - mean), and a is zero out of the inducing
+        points.
+
+        :param y_unbiased: np.array(n), observations minus the mean
+        :return: np.array(n)
+        """
+        solve = cho_solve(self.chol, np.dot(self.v_matrix, self._scale(y_unbiased)))
+
+        solve_posterior = np.zeros(len(y_unbiased))
+        solve_posterior[self.indexes] = linalg.solve_triangular(
+            self.chol_inducing, solve, lower=True, trans='T')
+        return solve_posterior
+
+    def cho_solve(self, y):
+        """
+        Solves C * x = y, so la_functions.cho_solve has the same meaning for the exact and the
+        sparse models.
+
+        :param y: np.array(n) or np.array(nxk)
+        :return: np.array(n) or np.array(nxk)
+        """
+        return self.solve_cov(y)
+
+    def posterior_cov_solve(self, y):
+        """
+        Computes A * y, where A is the matrix such that the DTC posterior covariance is
+        cov(x, y) - cov(x, X) * A * cov(X, y), i.e.
+        A_uu = chol(K_uu)^-T * (I - B^-1) * chol(K_uu)^-1, and A is zero out of the inducing
+        points. It replaces the solve cov^-1 * y of the exact GP in
+        la_functions.posterior_cov_solve.
+
+        :param y: np.array(n) or np.array(nxk)
+        :return: np.array(n) or np.array(nxk)
+        """
+        y_inducing = linalg.solve_triangular(self.chol_inducing, y[self.indexes], lower=True)
+        y_inducing -= cho_solve(self.chol, y_inducing)
+
+        solve = np.zeros(y.shape)
+        solve[self.indexes] = linalg.solve_triangular(
+            self.chol_inducing, y_inducing, lower=True, trans='T')
+        return solve
+
+
+class SparseGPFittingGaussian(GPFittingGaussian):
+    """
+    GP model that uses the Deterministic Training Conditional (DTC) approximation, whose inducing
+    points are a subset of the observed points. The log likelihood and the posterior parameters
+    cost O(nm^2) instead of O(n^3), and the nxn covariance matrix is never computed. If there are
+    at most m observations, it's the exact GP.
+
+    The Cholesky decompositions of the exact model are replaced by SparseFactorization objects,
+    so the methods of GPFittingGaussian, and the models and acquisition functions that use
+    posterior_cov_solve (e.g. BayesianQuadrature, EI, SBO), work unchanged. cho_solve solves the
+    systems with the DTC covariance matrix of the observations.
+    """
+
+    def __init__(self, type_kernel, training_data, dimensions=None, bounds_domain=None,
+                 n_inducing_points=None, **kwargs):
+        """
+        See GPFittingGaussian for the description of the other parameters.
+
+        :param n_inducing_points: (int) m, the default value is DEFAULT_N_INDUCING_POINTS
+        """
+        if n_inducing_points is None:
+            n_inducing_points = DEFAULT_N_INDUCING_POINTS
+
+        self.n_inducing_points = n_inducing_points
+
+        if kwargs.get('name_model') is None:
+            kwargs['name_model'] = SPARSE_GP_FITTING_GAUSSIAN
+
+        super(SparseGPFittingGaussian, self).__init__(
+            type_kernel, training_data, dimensions=dimensions, bounds_domain=bounds_domain,
+            **kwargs)
+
+    def serialize(self):
+        data = super(SparseGPFittingGaussian, self).serialize()
+        data['n_inducing_points'] = self.n_inducing_points
+        return data
+
+    def get_inducing_indexes(self, n_points):
+        """
+        Gets the indexes of the observed points used as inducing points. They are evenly spaced
+        among the observations.
+
+        :param n_points: (int) number of observed points
+        :return: np.array(m)
+        """
+        if n_points <= self.n_inducing_points:
+            return np.arange(n_points)
+
+        return np.unique(np.linspace(0, n_points - 1, self.n_inducing_points).astype(int))
+
+    def _chol_cov_including_noise(self, var_noise, parameters_kernel, historical_points=None,
+                                  cache=True, clear_cache=False):
+        """
+        Compute the DTC factorization of
+        covariance = Q + np.diag(var_noise_observations) + np.diag(var_noise),
+        where Q is the Nystrom approximation of cov_kernel. The covariance matrix isn't computed.
+
+        :param var_noise: float
+        :param parameters_kernel: np.array(k)
+        :param historical_points: np.array(nxk)
+        :param cache: (boolean) get cached data only if cache is True
+        :return: SparseFactorization, None
+        """
+
+        if historical_points is None:
+            historical_points = self.data['points']
+
+        cached = self._get_cached_data((var_noise, tuple(parameters_kernel)), CHOL_COV, cache=cache)
+        if cached is not False:
+            return cached
+
+        historical_points = np.array(historical_points)
+
+        n = historical_points.shape[0]
+        indexes = self.get_inducing_indexes(n)
+        inducing_points = historical_points[indexes, :]
+
+        cov_inducing = self.evaluate_cov(inducing_points, parameters_kernel)
+        cross_cov = self.evaluate_cross_cov(inducing_points, historical_points, parameters_kernel)
+
+        noise = var_noise * np.ones(n)
+        if self.data.get('var_noise') is not None:
+            noise += self.data['var_noise']
+
+        # The DTC covariance is singular without noise, so a small jitter is added.
+        noise = np.clip(noise, DTC_JITTER * np.mean(np.diag(cov_inducing)), None)
+
+        factorization = SparseFactorization(indexes, cov_inducing, cross_cov, noise)
+
+        if cache:
+            self._updated_cached_data((var_noise, tuple(parameters_kernel)), (factorization, None),
+                                      CHOL_COV, clear_cache=clear_cache)
+
+        return factorization, None
+
+    def _extend_cached_data(self, n_points):
+        """
+        The inducing points change when new points are added, so the cached factorizations are
+        discarded. They are recomputed in O(nm^2).
+
+        :param n_points: (int) number of points in the data before adding the new points.
+        """
+        self.cache_chol_cov.clear()
+        self.cache_sol_chol_y_unbiased.clear()
+        self.cache_data_arrays = self._get_data_arrays()
+
+    def log_likelihood(self, var_noise, mean, parameters_kernel):
+        """
+        DTC approximation of the GP log likelihood. See GPFittingGaussian.log_likelihood.
+
+        :param var_noise: (float) variance of the noise
+        :param mean: (float)
+        :param parameters_kernel: np.array(k), The order of the parameters is given in the
+            definition of the class kernel.
+        :return: float
+        """
+        factorization = self._chol_cov_including_noise(var_noise, parameters_kernel)[0]
+
+        return factorization.log_likelihood(self.data['evaluations'] - mean)
+
+    def grad_log_likelihood_dict(self, var_noise, mean, parameters_kernel):
+        """
+        Computes the gradient of the DTC log likelihood. The derivatives respect to the mean and
+        var_noise are computed in closed form, and the derivatives respect to the parameters of
+        the kernel are computed by forward differences, because the kernels only provide the
+        derivatives of the nxn covariance matrix.
+
+        :param var_noise: (float) variance of the noise
+        :param mean: (float)
+        :param parameters_kernel: np.array(k), The order of the parameters is given in the
+            definition of the class kernel.
+        :return: {'var_noise': float, 'mean': float, 'kernel_params': np.array(n)}
+        """
+        factorization = self._chol_cov_including_noise(var_noise, parameters_kernel)[0]
+
+        y_unbiased = self.data['evaluations'] - mean
+        solve = factorization.solve_cov(y_unbiased)
+
+        def log_likelihood(params):
+            return self._chol_cov_including_noise(
+                var_noise, params, cache=False)[0].log_likelihood(y_unbiased)
+
+        parameters_kernel = np.array(parameters_kernel, dtype=float)
+        dh = 1e-6 * np.maximum(1.0, np.abs(parameters_kernel))
+        finite_differences = FiniteDifferences.forward_difference(
+            log_likelihood, parameters_kernel, dh)
+
+        gradient = {}
+        gradient['kernel_params'] = np.array(
+            [finite_differences[i] for i in xrange(len(parameters_kernel))])
+        gradient['mean'] = np.sum(solve)
+        gradient['var_noise'] = 0.5 * (np.dot(solve, solve) - factorization.trace_inverse())
+
+        return gradient
+
+    def _cholesky_solve_vectors_for_posterior(self, var_noise, mean, parameters_kernel,
+                                              historical_points=None, historical_evaluations=None,
+                                              cache=True, clear_cache=False):
+        """
+        Computes the DTC factorization, and the vector a such that the posterior mean is
+        mean + cov(x, historical_points) * a.
+
+        :param var_noise: float
+        :param mean: float
+        :param parameters_kernel: np.array(k)
+        :param historical_points: np.array(nxk)
+        :param historical_evaluations: np.array(n)
+        :param cache: (boolean) get cached data only if cache is True
+
+        :return: {
+            'chol': SparseFactorization,
+            'solve': np.array(n)
+        }
+        """
+
+        if historical_points is None:
+            historical_points = self.data['points']
+
+        if historical_evaluations is None:
+            historical_evaluations = self.data['evaluations']
+
+        factorization = self._chol_cov_including_noise(
+            var_noise, parameters_kernel, historical_points=historical_points, cache=cache,
+            clear_cache=clear_cache)[0]
+
+        if cache:
+            cached_solve = self._get_cached_data((var_noise, tuple(parameters_kernel), mean),
+                                                 SOL_CHOL_Y_UNBIASED, cache=cache)
+        else:
+            cached_solve = False
+
+        if cached_solve is False:
+            solve = factorization.solve_posterior(historical_evaluations - mean)
+            if cache:
+                self._updated_cached_data((var_noise, tuple(parameters_kernel), mean), solve,
+                                          SOL_CHOL_Y_UNBIASED, clear_cache=clear_cache)
+        else:
+            solve = cached_solve
+
+        return {
+            'chol': factorization,
+            'solve': solve,
+        }
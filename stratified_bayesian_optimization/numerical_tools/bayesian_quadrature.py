@@ -31,25 +31,43 @@ from stratified_bayesian_optimization.lib.constant import (
     DEFAULT_N_SAMPLES,
     DEFAULT_N_PARAMETERS,
     MULTINOMIAL_DISTRIBUTION,
+    QUADRATURE_MEMORY_BUDGET,
+    UNIFORM_BOX,
+    LOWER_BOUNDS,
+    UPPER_BOUNDS,
+    PRODUCT_KERNELS_SEPARABLE,
+    MATERN52_NAME,
 )
 from stratified_bayesian_optimization.lib.la_functions import (
-    cho_solve,
+    posterior_cov_solve,
 )
 from stratified_bayesian_optimization.services.domain import (
     DomainService,
 )
 from stratified_bayesian_optimization.lib.expectations import (
     uniform_finite,
+    uniform_finite_points,
     multi_expect,
     gradient_uniform_finite,
     gradient_uniform_finite_resp_candidate,
     hessian_uniform_finite,
     gamma_expect,
+    gamma_expect_points,
     gradient_gamma,
     gradient_gamma_resp_candidate,
     hessian_gamma,
+    uniform_box_expect,
+    uniform_box_expect_points,
+    gradient_uniform_box,
+    gradient_uniform_box_resp_candidate,
+    hessian_uniform_box,
+    matern52_uniform_expect,
+    gradient_matern52_uniform_expect,
+    matern52_uniform_double_expect,
 )
 from stratified_bayesian_optimization.lib.optimization import Optimization
+from stratified_bayesian_optimization.lib.lru_cache import LRUCache
+from stratified_bayesian_optimization.lib.shared_memory import SharedArrays
 from stratified_bayesian_optimization.util.json_file import JSONFile
 from stratified_bayesian_optimization.lib.parallel import Parallel
 from stratified_bayesian_optimization.lib.util import (
@@ -60,6 +78,8 @@ from stratified_bayesian_optimization.lib.util import (
     wrapper_optimize,
     wrapper_hessian_posterior_mean_bq,
     wrapper_sgd,
+    separate_numpy_arrays_in_lists,
+    screen_points,
     wrapper_evaluate_gradient_sample_params_bq,
 )
 
@@ -83,6 +103,7 @@ class BayesianQuadrature(object):
     _expectations_map = {
         UNIFORM_FINITE: {
             'expectation': uniform_finite,
+            'expectation_points': uniform_finite_points,
             'grad_expectation': gradient_uniform_finite,
             'parameter': TASKS,
             'grad_expectation_candidate': gradient_uniform_finite_resp_candidate,
@@ -90,13 +111,31 @@ class BayesianQuadrature(object):
         },
         GAMMA: {
             'expectation': gamma_expect,
+            'expectation_points': gamma_expect_points,
             'grad_expectation': gradient_gamma,
             'grad_expectation_candidate': gradient_gamma_resp_candidate,
             'hessian_expectation': hessian_gamma,
             'parameter': None,
         },
+        EXPONENTIAL: {
+            'expectation': gamma_expect,
+            'expectation_points': gamma_expect_points,
+            'grad_expectation': gradient_gamma,
+            'grad_expectation_candidate': gradient_gamma_resp_candidate,
+            'hessian_expectation': hessian_gamma,
+            'parameter': None,
+        },
+        UNIFORM_BOX: {
+            'expectation': uniform_box_expect,
+            'expectation_points': uniform_box_expect_points,
+            'grad_expectation': gradient_uniform_box,
+            'grad_expectation_candidate': gradient_uniform_box_resp_candidate,
+            'hessian_expectation': hessian_uniform_box,
+            'parameter': None,
+        },
         WEIGHTED_UNIFORM_FINITE: {
             'expectation': uniform_finite,
+            'expectation_points': uniform_finite_points,
             'grad_expectation': gradient_uniform_finite,
             'grad_expectation_candidate': gradient_uniform_finite_resp_candidate,
             'hessian_expectation': hessian_uniform_finite,
@@ -120,9 +159,17 @@ class BayesianQuadrature(object):
         :param gp_model: gp_fitting_gaussian instance
         :param x_domain: [int], indices of the x domain
         :param distribution: (str), it must be in the list of distributions:
-            [UNIFORM_FINITE]
+            [UNIFORM_FINITE, GAMMA, EXPONENTIAL, WEIGHTED_UNIFORM_FINITE]
         :param parameters_distribution: (dict) dictionary with parameters of the distribution.
             -UNIFORM_FINITE: dict{TASKS: int}
+            -GAMMA: dict{'a': [float], 'scale': [float]}, and optionally the quadrature rule
+                QUADRATURE_RULE: (str) and its order 'n_samples': (int)
+            -EXPONENTIAL: dict{'scale': [float]}, with the same optional entries as GAMMA
+            -UNIFORM_BOX: dict{LOWER_BOUNDS: [float], UPPER_BOUNDS: [float]}, and optionally
+                the order 'n_samples': (int) and the number of panels N_PANELS: (int) of the
+                composite Gauss-Legendre rule. The bounds of the domain of W are used if the box
+                isn't given. If the kernel is the product of a kernel of x and a Matern52 kernel
+                of a one dimensional W, the integrals are computed in closed form instead.
         :param model_only_x (boolean) If True, we keep only the type bounds and bounds of x. So,
             we can use BQ with other methods like EI.
         :param tasks (boolean)
@@ -140,11 +187,19 @@ class BayesianQuadrature(object):
                     break
             parameters_distribution = {TASKS: n}
 
-        self.parameters_distribution = parameters_distribution
         self.dimension_domain = self.gp.dimension_domain
         self.x_domain = x_domain
         # Indices of the w_domain
         self.w_domain = [i for i in range(self.gp.dimension_domain) if i not in x_domain]
+
+        if distribution == UNIFORM_BOX:
+            parameters_distribution = self._parameters_uniform_box(parameters_distribution)
+
+        self.parameters_distribution = parameters_distribution
+
+        # The integrals respect to W are computed in closed form for the uniform box if the
+        # kernel is the product of a kernel of x and a Matern52 kernel of a one dimensional W.
+        self.closed_form_w = distribution == UNIFORM_BOX and self._separable_matern52_w()
         self.expectation = self._expectations_map[distribution]
         self.distribution = distribution
 
@@ -181,13 +236,16 @@ class BayesianQuadrature(object):
         elif self.parameters_distribution is not None:
             self.arguments_expectation['parameters_dist'] = self.parameters_distribution
 
-        self.cache_quadratures = {}
-        self.cache_posterior_mean = {}
-        self.cache_quadrature_with_candidate = {}
+        # Cached data of the samples of the hyperparameters
+        self.cache_quadratures = LRUCache()
+        self.cache_posterior_mean = LRUCache()
+        self.cache_quadrature_with_candidate = LRUCache()
+        # Historical points used to compute the cached quadratures
+        self.history_quadratures = None
         self.optimal_solutions = {} # The optimal solutions are written here
 
         # Cached data for the MC estimation of the SBO.
-        self.cache_sample = {}
+        self.cache_sample = LRUCache()
         self.max_mean = {}
 
 
@@ -246,39 +304,235 @@ class BayesianQuadrature(object):
         """
 
         if name == QUADRATURES:
-            if index in self.cache_quadratures:
-                return self.cache_quadratures[index]
+            return self.cache_quadratures.get(index)
         if name == POSTERIOR_MEAN:
-            if index in self.cache_posterior_mean:
-                return self.cache_posterior_mean[index]
+            return self.cache_posterior_mean.get(index)
         if name == B_NEW:
-            if index in self.cache_quadrature_with_candidate:
-                return self.cache_quadrature_with_candidate[index]
+            return self.cache_quadrature_with_candidate.get(index)
         return None
 
-    def _updated_cached_data(self, index, value, name, thread=False, clear_cache=True):
+    def _updated_cached_data(self, index, value, name, thread=False, clear_cache=False):
         """
+        The data is saved in LRU caches, so the data of several samples of the hyperparameters
+        can be cached at the same time.
 
         :param index: tuple. (parameters_kernel, )
         :param value: value to be cached
         :param name: (str) QUADRATURES or POSTERIOR_MEAN or B_NEW
         :param thread: (boolean) True if memory is shared between threads.
+        :param clear_cache: (boolean) If True, the cached data of the other indexes is removed.
+            It's False by default, because the caches are bounded and keep the data of several
+            samples of the hyperparameters.
 
         """
 
         if name == QUADRATURES:
             if not thread and clear_cache:
-                 self.cache_quadratures = {}
-            self.cache_quadratures[index] = value
+                self.cache_quadratures.clear()
+            if not thread:
+                self._update_history_quadratures()
+            self.cache_quadratures[index] = SharedArrays.publish(value)
         if name == POSTERIOR_MEAN:
             if not thread and clear_cache:
-                 self.cache_posterior_mean = {}
+                self.cache_posterior_mean.clear()
             self.cache_posterior_mean[index] = value
         if name == B_NEW:
             if not thread and clear_cache:
-                 self.cache_quadrature_with_candidate = {}
+                self.cache_quadrature_with_candidate.clear()
             self.cache_quadrature_with_candidate[index] = value
 
+    def _update_history_quadratures(self):
+        """
+        Saves the historical points used to compute the cached quadratures. If the current
+        historical points don't extend the previous ones, the cached quadratures and posterior
+        means are removed.
+        """
+        history = self.gp.data['points']
+        previous = self.history_quadratures
+
+        if previous is not None and not self._extends_history(previous, previous.shape[0]):
+            self.cache_quadratures.clear()
+            self.cache_posterior_mean.clear()
+
+        if history is None:
+            self.history_quadratures = None
+        else:
+            self.history_quadratures = history.copy()
+
+        Parallel.update_version(self)
+
+    def _extends_history(self, previous, n_points):
+        """
+        Checks if the first n_points historical points of the GP are equal to the first n_points
+        of previous.
+
+        :param previous: np.array(kxm)
+        :param n_points: int
+        :return: boolean
+        """
+        history = self.gp.data['points']
+
+        if history is None or n_points > history.shape[0] or n_points > previous.shape[0]:
+            return False
+
+        return np.array_equal(previous[0: n_points, :], history[0: n_points, :])
+
+    def _get_cached_quadratures(self, index, points, parameters_kernel, keep_indexes=None,
+                                thread=False):
+        """
+        Get the matrix of quadratures B(x, i) from the cache. If new points were added to the
+        data of the GP after caching the matrix, only the columns of the new points are computed
+        and the extended matrix is cached again.
+
+        :param index: tuple. (parameters_kernel, ) or (parameters_kernel, point)
+        :param points: np.array(nxk), points of the rows of the matrix
+        :param parameters_kernel: np.array(l)
+        :param keep_indexes: [int], indexes of the rows of the cached matrix that are kept. points
+            are the points of those rows, and the extended matrix is not cached.
+        :param thread: (boolean) True if memory is shared between threads.
+
+        :return: np.array(nxm) or None if the matrix is not cached or the cached matrix was
+            computed with other data.
+        """
+
+        vec_covs = self._get_cached_data(index, QUADRATURES)
+
+        if vec_covs is None:
+            return None
+
+        if keep_indexes is None and vec_covs.shape[0] != points.shape[0]:
+            # The matrix was cached for other points with the same index.
+            return None
+
+        n_cached = vec_covs.shape[1]
+
+        if self.history_quadratures is None or \
+                not self._extends_history(self.history_quadratures, n_cached):
+            if not thread:
+                self.cache_quadratures.clear()
+                self.cache_posterior_mean.clear()
+            return None
+
+        if keep_indexes is not None:
+            vec_covs = vec_covs[keep_indexes, :]
+
+        new_points = self.gp.data['points'][n_cached:, :]
+
+        if new_points.shape[0] == 0:
+            return vec_covs
+
+        new_columns = self.compute_vectors_b(points, None, new_points, parameters_kernel, True,
+                                             False, False)['vec_covs']
+        vec_covs = np.concatenate((vec_covs, new_columns), axis=1)
+
+        if keep_indexes is None:
+            self._updated_cached_data(index, vec_covs, QUADRATURES, thread=thread)
+
+        return vec_covs
+
+    def _parameters_uniform_box(self, parameters_distribution):
+        """
+        Gets the parameters of the uniform box distribution of W. The bounds of the domain of W are
+        used if the box isn't given.
+
+        :param parameters_distribution: dict or None
+        :return: {LOWER_BOUNDS: [float], UPPER_BOUNDS: [float], ...}
+        """
+        parameters_distribution = dict(parameters_distribution or {})
+
+        lower_bounds = parameters_distribution.get(LOWER_BOUNDS)
+        upper_bounds = parameters_distribution.get(UPPER_BOUNDS)
+
+        if lower_bounds is None and upper_bounds is None:
+            if self.gp.bounds is None:
+                raise ValueError("The uniform box of W must be given by %s and %s, because the "
+                                 "domain of the GP doesn't have bounds" %
+                                 (LOWER_BOUNDS, UPPER_BOUNDS))
+            lower_bounds = [self.gp.bounds[i][0] for i in self.w_domain]
+            upper_bounds = [self.gp.bounds[i][-1] for i in self.w_domain]
+        elif lower_bounds is None or upper_bounds is None:
+            raise ValueError("Both %s and %s of the uniform box of W must be given" %
+                             (LOWER_BOUNDS, UPPER_BOUNDS))
+
+        if len(lower_bounds) != len(self.w_domain) or len(upper_bounds) != len(self.w_domain):
+            raise ValueError("The uniform box of W must have %d dimensions" % len(self.w_domain))
+
+        if any(lower >= upper for lower, upper in zip(lower_bounds, upper_bounds)):
+            raise ValueError("The lower bounds of the uniform box of W must be smaller than its "
+                             "upper bounds")
+
+        parameters_distribution[LOWER_BOUNDS] = lower_bounds
+        parameters_distribution[UPPER_BOUNDS] = upper_bounds
+
+        return parameters_distribution
+
+    def _separable_matern52_w(self):
+        """
+        Checks if the kernel is the product of a kernel of x and a Matern52 kernel of W, where W is
+        one dimensional.
+
+        :return: boolean
+        """
+        type_kernel = self.gp.type_kernel
+
+        if type_kernel[0] != PRODUCT_KERNELS_SEPARABLE or len(type_kernel) != 3 or \
+                type_kernel[2] != MATERN52_NAME:
+            return False
+
+        dimension_x = self.gp.kernel_dimensions[1]
+
+        return list(self.x_domain) == range(dimension_x) and self.w_domain == [dimension_x]
+
+    def _separable_kernels(self, parameters_kernel):
+        """
+        Gets the kernel of x and the length scale of the Matern52 kernel of W, when the kernel is
+        separable (see _separable_matern52_w).
+
+        :param parameters_kernel: np.array(l)
+        :return: (AbstractKernel, float)
+        """
+        kernel = self.gp.class_kernel.compiled_kernel(
+            self.gp.dimensions[1:],
+            separate_numpy_arrays_in_lists(parameters_kernel, self.gp.number_parameters[1]),
+            self.gp.type_kernel[1:], **self.gp.additional_kernel_parameters)
+
+        kernel_x = kernel.kernels[self.gp.type_kernel[1]]
+        length_scale = kernel.kernels[MATERN52_NAME].length_scale.value[0]
+
+        return kernel_x, length_scale
+
+    def _expectation_matern52_w(self, points_w, length_scale, gradient=False):
+        """
+        Computes the expectation of the Matern52 kernel of W, or its derivative, in closed form.
+
+        :param points_w: np.array(m)
+        :param length_scale: float
+        :param gradient: (boolean) If True, the derivative respect to points_w is computed.
+        :return: np.array(m)
+        """
+        lower = self.parameters_distribution[LOWER_BOUNDS][0]
+        upper = self.parameters_distribution[UPPER_BOUNDS][0]
+
+        if gradient:
+            return gradient_matern52_uniform_expect(points_w, lower, upper, length_scale)
+
+        return matern52_uniform_expect(points_w, lower, upper, length_scale)
+
+    def _closed_form_quadrature_cross_cov(self, points, points_2, parameters_kernel):
+        """
+        Computes B(x, j) for each x in points in closed form (see _separable_matern52_w).
+
+        :param points: np.array(nxk)
+        :param points_2: np.array(mxk')
+        :param parameters_kernel: np.array(l)
+        :return: np.array(nxm)
+        """
+        kernel_x, length_scale = self._separable_kernels(parameters_kernel)
+
+        expectation = self._expectation_matern52_w(points_2[:, self.w_domain[0]], length_scale)
+
+        return kernel_x.cross_cov(points, points_2[:, self.x_domain]) * expectation[np.newaxis, :]
+
     def evaluate_quadrate_cov(self, point, parameters_kernel):
         """
         Evaluate the quadrature cov, i.e.
@@ -289,6 +543,13 @@ class BayesianQuadrature(object):
         :return: np.array(m)
         """
 
+        if self.closed_form_w:
+            kernel_x, length_scale = self._separable_kernels(parameters_kernel)
+            expectation = matern52_uniform_double_expect(
+                self.parameters_distribution[LOWER_BOUNDS][0],
+                self.parameters_distribution[UPPER_BOUNDS][0], length_scale)
+            return kernel_x.cross_cov(point, point)[0, 0] * expectation
+
         n = self.dimension_domain
 
         f = lambda x: self.gp.evaluate_cross_cov(x[:, 0:n], x[:, n:], parameters_kernel)
@@ -305,6 +566,46 @@ class BayesianQuadrature(object):
 
         return self.expectation['expectation'](**parameters)
 
+    def evaluate_quadrate_cov_points(self, points, parameters_kernel, max_evaluations=None):
+        """
+        Evaluate the quadrature cov of each point in points, i.e. evaluate_quadrate_cov(x) for each
+        x in points. The kernel is evaluated in blocks of pairs of points that fit in
+        QUADRATURE_MEMORY_BUDGET.
+
+        :param points: np.array(nxk)
+        :param parameters_kernel: np.array(l)
+        :param max_evaluations: (int) maximum number of points evaluated by the kernel in each
+            block. It's computed from QUADRATURE_MEMORY_BUDGET by default.
+        :return: np.array(n)
+        """
+
+        if self.closed_form_w:
+            kernel_x, length_scale = self._separable_kernels(parameters_kernel)
+            expectation = matern52_uniform_double_expect(
+                self.parameters_distribution[LOWER_BOUNDS][0],
+                self.parameters_distribution[UPPER_BOUNDS][0], length_scale)
+            return kernel_x.cov_diagonal(points) * expectation
+
+        if max_evaluations is None:
+            max_evaluations = max(1, int(np.sqrt(QUADRATURE_MEMORY_BUDGET / 8)))
+
+        n = self.dimension_domain
+
+        f = lambda x: self.gp.evaluate_cross_cov(x[:, 0:n], x[:, n:], parameters_kernel)
+
+        parameters = {
+            'f': f,
+            'points': points,
+            'index_points': self.x_domain,
+            'index_random': self.w_domain,
+            'max_evaluations': max_evaluations,
+            'double': True,
+        }
+
+        parameters.update(self.arguments_expectation)
+
+        return self.expectation['expectation_points'](**parameters)
+
     def evaluate_quadrature_cross_cov(self, point, points_2, parameters_kernel):
         """
         Evaluate the quadrature cross cov respect to point, i.e.
@@ -318,6 +619,10 @@ class BayesianQuadrature(object):
         :return: np.array(txm)
         """
 
+        if self.closed_form_w:
+            return self._closed_form_quadrature_cross_cov(
+                point[0:1, :], points_2, parameters_kernel)[0, :]
+
         f = lambda x: self.gp.evaluate_cross_cov(x, points_2, parameters_kernel)
 
         parameters = {
@@ -333,6 +638,41 @@ class BayesianQuadrature(object):
 
         return B
 
+    def evaluate_quadrature_cross_cov_points(self, points, points_2, parameters_kernel,
+                                             max_evaluations=None):
+        """
+        Evaluate the quadrature cross cov respect to each point in points, i.e. B(x, j) for each
+        x in points. The kernel is evaluated in blocks of points whose cross covariances with
+        points_2 fit in QUADRATURE_MEMORY_BUDGET.
+
+        :param points: np.array(nxk)
+        :param points_2: np.array(mxk')
+        :param parameters_kernel: np.array(l)
+        :param max_evaluations: (int) maximum number of points evaluated by the kernel in each
+            block. It's computed from QUADRATURE_MEMORY_BUDGET by default.
+        :return: np.array(nxm)
+        """
+
+        if self.closed_form_w:
+            return self._closed_form_quadrature_cross_cov(points, points_2, parameters_kernel)
+
+        if max_evaluations is None:
+            max_evaluations = max(1, QUADRATURE_MEMORY_BUDGET / (8 * max(points_2.shape[0], 1)))
+
+        f = lambda x: self.gp.evaluate_cross_cov(x, points_2, parameters_kernel)
+
+        parameters = {
+            'f': f,
+            'points': points,
+            'index_points': self.x_domain,
+            'index_random': self.w_domain,
+            'max_evaluations': max_evaluations,
+        }
+
+        parameters.update(self.arguments_expectation)
+
+        return self.expectation['expectation_points'](**parameters)
+
     def evaluate_grad_quadrature_cross_cov(self, point, points_2, parameters_kernel):
         """
         Evaluate the gradient respect to the point of the quadrature cross cov i.e.
@@ -346,6 +686,13 @@ class BayesianQuadrature(object):
         :return: np.array(kxm)
         """
 
+        if self.closed_form_w:
+            kernel_x, length_scale = self._separable_kernels(parameters_kernel)
+            expectation = self._expectation_matern52_w(points_2[:, self.w_domain[0]],
+                                                       length_scale)
+            gradient = kernel_x.grad_respect_point(point, points_2[:, self.x_domain])
+            return gradient.transpose() * expectation[np.newaxis, :]
+
         parameters = {
             'f': self.gp.evaluate_grad_cross_cov_respect_point,
             'point': point,
@@ -370,6 +717,13 @@ class BayesianQuadrature(object):
         :param parameters_kernel: np.array(l)
         :return: np.array(mxkxk)
         """
+        if self.closed_form_w:
+            kernel_x, length_scale = self._separable_kernels(parameters_kernel)
+            expectation = self._expectation_matern52_w(points_2[:, self.w_domain[0]],
+                                                       length_scale)
+            hessian = kernel_x.hessian_respect_point(point, points_2[:, self.x_domain])
+            return hessian * expectation[:, np.newaxis, np.newaxis]
+
         parameters = {
             'f': self.gp.evaluate_hessian_cross_cov_respect_point,
             'point': point,
@@ -399,6 +753,20 @@ class BayesianQuadrature(object):
         :return: np.array(kxm)
         """
 
+        if self.closed_form_w:
+            kernel_x, length_scale = self._separable_kernels(parameters_kernel)
+            candidate_w = candidate_point[0, self.w_domain]
+            candidate_x = candidate_point[:, self.x_domain]
+
+            gradient = np.zeros((candidate_point.shape[1], points.shape[0]))
+            gradient[self.x_domain, :] = \
+                kernel_x.grad_respect_point(candidate_x, points).transpose() * \
+                self._expectation_matern52_w(candidate_w, length_scale)
+            gradient[self.w_domain, :] = \
+                kernel_x.cross_cov(candidate_x, points)[0, :] * \
+                self._expectation_matern52_w(candidate_w, length_scale, gradient=True)
+            return gradient
+
         parameters = {
             'f': self.gp.evaluate_grad_cross_cov_respect_point,
             'candidate_point': candidate_point,
@@ -449,12 +817,13 @@ class BayesianQuadrature(object):
     def compute_posterior_parameters(self, points, var_noise=None, mean=None,
                                      parameters_kernel=None, historical_points=None,
                                      historical_evaluations=None, only_mean=False, cache=True,
-                                     parallel=False):
+                                     parallel=False, only_variance=False):
         """
         Compute posterior mean and covariance of the GP on G(x) = E[F(x, w)] evaluated at each point
         of points.
 
-        :param points: np.array(txk) More than one point only if only_mean is True!
+        :param points: np.array(txk) More than one point only if only_mean or only_variance is
+            True!
         :param var_noise: float
         :param mean: float
         :param parameters_kernel: np.array(l)
@@ -464,11 +833,13 @@ class BayesianQuadrature(object):
         :param only_mean: (boolean) computes only the mean if it's True.
         :param parallel: (boolean) computes the vector B(x, i) in parallel for every point in
             points
+        :param only_variance: (boolean) If it's True, only the posterior variances of the points
+            are computed.
 
         :return: {
             'mean': np.array(t),
             'cov': float,
-        }
+        }, or {'mean': np.array(t), 'var': np.array(t)} if only_variance is True.
         """
 
         if var_noise is None:
@@ -499,8 +870,8 @@ class BayesianQuadrature(object):
 
         compute_vec_covs = False
         if cache and points.shape[0] == 1:
-            vec_covs = self._get_cached_data(
-                (tuple(parameters_kernel), tuple(points[0, :])), QUADRATURES)
+            vec_covs = self._get_cached_quadratures(
+                (tuple(parameters_kernel), tuple(points[0, :])), points, parameters_kernel)
         else:
             vec_covs = None
 
@@ -527,7 +898,14 @@ class BayesianQuadrature(object):
             'cov': None,
         }
 
-        solve_2 = cho_solve(chol, vec_covs.transpose())
+        solve_2 = posterior_cov_solve(chol, vec_covs.transpose())
+
+        if only_variance:
+            prior_var = self.evaluate_quadrate_cov_points(points, parameters_kernel)
+            return {
+                'mean': mu_n,
+                'var': prior_var - np.einsum('ij,ji->i', vec_covs, solve_2),
+            }
 
         cov_n = self.evaluate_quadrate_cov(points, parameters_kernel) - np.dot(vec_covs, solve_2)
 
@@ -536,6 +914,61 @@ class BayesianQuadrature(object):
             'cov': cov_n[0, 0],
         }
 
+    def compute_posterior_parameters_samples(self, points, parameters, only_mean=False):
+        """
+        Compute the posterior means and variances of G(x) = E[F(x, w)] at points for several
+        samples of the parameters of the model. The vectors B(x, i) of all the points are computed
+        at once for each sample.
+
+        :param points: np.array(txk)
+        :param parameters: np.array(Sxl), each row is [var_noise, mean, parameters_kernel]
+        :param only_mean: boolean
+        :return: {
+            'mean': np.array(Sxt),
+            'var': np.array(Sxt) or None
+        }
+        """
+        n_samples = parameters.shape[0]
+        n_points = points.shape[0]
+
+        means = np.zeros((n_samples, n_points))
+        variances = None
+
+        if not only_mean:
+            variances = np.zeros((n_samples, n_points))
+
+        for index, parameter in enumerate(parameters):
+            post_parameters = self.compute_posterior_parameters(
+                points, var_noise=parameter[0], mean=parameter[1],
+                parameters_kernel=parameter[2:], only_mean=only_mean,
+                only_variance=not only_mean)
+            means[index, :] = post_parameters['mean']
+
+            if not only_mean:
+                variances[index, :] = post_parameters['var']
+
+        return {
+            'mean': means,
+            'var': variances,
+        }
+
+    def _screen_posterior_mean(self, points):
+        """
+        Computes the posterior mean at points averaged over the last DEFAULT_N_PARAMETERS samples
+        of the parameters of the model. The points are evaluated in chunks of
+        RESTARTS_SCREENING_CHUNK_SIZE points.
+
+        :param points: np.array(txk)
+        :return: np.array(t)
+        """
+        parameters = np.array(self.gp.samples_parameters[-DEFAULT_N_PARAMETERS:])
+
+        f = lambda x: np.mean(
+            self.compute_posterior_parameters_samples(x, parameters, only_mean=True)['mean'],
+            axis=0)
+
+        return screen_points(f, points)
+
     def gradient_posterior_mean(self, point, var_noise=None, mean=None, parameters_kernel=None,
                                 historical_points=None, historical_evaluations=None, cache=True):
         """
@@ -613,8 +1046,8 @@ class BayesianQuadrature(object):
 
         compute_vec_covs = False
         if cache:
-            vec_covs = self._get_cached_data(
-                (tuple(parameters_kernel), tuple(point[0, :])), QUADRATURES)
+            vec_covs = self._get_cached_quadratures(
+                (tuple(parameters_kernel), tuple(point[0, :])), point, parameters_kernel)
         else:
             vec_covs = None
 
@@ -637,7 +1070,7 @@ class BayesianQuadrature(object):
         chol = chol_solve['chol']
 
         grad_mu = np.dot(gradient, solve)
-        solve_3 = cho_solve(chol, gradient.transpose())
+        solve_3 = posterior_cov_solve(chol, gradient.transpose())
         grad_cov = - 2.0 * np.dot(vec_covs, solve_3)
 
         return {'mean': grad_mu, 'cov': grad_cov}
@@ -775,14 +1208,8 @@ class BayesianQuadrature(object):
             n_restart_ = start.shape[0]
 
             if n_restart_ > n_best_restarts and n_best_restarts > 0:
-                values = []
-                point_dict = {}
-                args = (False, None, True, 0, self, var_noise, mean, parameters_kernel,
-                        DEFAULT_N_PARAMETERS)
-                for j in xrange(n_restart_):
-                    point_dict[j] = start[j, :]
-                values = Parallel.run_function_different_arguments_parallel(
-                    wrapper_objective_posterior_mean_bq, point_dict, *args)
+                # The starting points are screened with chunked vectorized evaluations.
+                values = self._screen_posterior_mean(start)
                 values_index = sorted(range(len(values)), key=lambda k: values[k])
                 values_index = values_index[-n_best_restarts:]
                 start_ = []
@@ -877,20 +1304,11 @@ class BayesianQuadrature(object):
                 candidate_solutions = []
                 candidate_values = []
 
-            n = len(candidate_values) + len(vertex)
-            candidate_solutions_2 = candidate_solutions + vertex
-            values = []
+            candidate_solutions_2 = np.array(candidate_solutions + vertex, dtype=np.float64)
+            values_candidates = self._screen_posterior_mean(candidate_solutions_2)
             point_dict = {}
-            args = (False, None, parallel, 0, self, var_noise, mean, parameters_kernel,
-                    DEFAULT_N_PARAMETERS)
-            for j in range(n):
-                point_dict[j] = np.array(candidate_solutions_2[j])
-            values = Parallel.run_function_different_arguments_parallel(
-                wrapper_objective_posterior_mean_bq, point_dict, *args)
-
-            values_candidates = []
-            for j in range(n):
-                values_candidates.append(values[j])
+            for j in xrange(candidate_solutions_2.shape[0]):
+                point_dict[j] = candidate_solutions_2[j, :]
             ind_max_2 = np.argmax(values_candidates)
 
             if np.max(values_candidates) > max_:
@@ -907,6 +1325,7 @@ class BayesianQuadrature(object):
 
         self.optimal_solutions[index_cache].append(optimal_solutions.get(ind_max))
         self.max_mean[index_cache] = max_
+        Parallel.update_version(self)
         return optimal_solutions.get(ind_max)
 
     def compute_vectors_b(self, points, candidate_points, historical_points, parameters_kernel,
@@ -914,6 +1333,10 @@ class BayesianQuadrature(object):
         """
         Compute B(x, i) for ever x in points, and B(candidate_point, i) for each i.
 
+        If the distribution of W has a vectorized expectation, all the vectors are computed with
+        one evaluation of the kernel for each block of points. Otherwise, they're computed point
+        by point.
+
         :param points: np.array(nxk)
         :param candidate_points: np.array(kxm), (new_x, new_w)
         :param parameters_kernel: np.array(l)
@@ -921,7 +1344,7 @@ class BayesianQuadrature(object):
         :param parameters_kernel: np.array(l)
         :param compute_vec_covs: boolean
         :param compute_b_new: boolean
-        :param parallel: boolean
+        :param parallel: (boolean) only used when the expectation isn't vectorized
         :param n_threads: (int)
 
         :return: {
@@ -944,7 +1367,23 @@ class BayesianQuadrature(object):
             n_candidate_points = candidate_points.shape[0]
             b_new = np.zeros((n, n_candidate_points))
 
-        if parallel:
+        if 'expectation_points' in self.expectation:
+            points_2 = []
+            if compute_vec_covs:
+                points_2.append(historical_points)
+            if compute_b_new:
+                points_2.append(candidate_points)
+
+            if len(points_2) > 0:
+                b_vectors = self.evaluate_quadrature_cross_cov_points(
+                    points, np.concatenate(points_2, axis=0), parameters_kernel)
+
+                if compute_vec_covs:
+                    vec_covs = b_vectors[:, 0: m]
+                    b_vectors = b_vectors[:, m:]
+                if compute_b_new:
+                    b_new = b_vectors
+        elif parallel:
             point_dict = {}
             for i in xrange(n):
                 point_dict[i] = points[i:i + 1, :]
@@ -976,7 +1415,8 @@ class BayesianQuadrature(object):
 
 
     def compute_posterior_parameters_kg_many_cp(self, points, candidate_points, cache=True,
-                                                parallel=True):
+                                                parallel=True, var_noise=None, mean=None,
+                                                parameters_kernel=None):
         """
         Compute posterior parameters of the GP after integrating out the random parameters needed
         to compute the knowledge gradient (vectors "a" and "b" in the SBO paper).
@@ -985,16 +1425,29 @@ class BayesianQuadrature(object):
         :param candidate_points: np.array(rxm), (new_x, new_w)
         :param cache: (boolean) Use cached data and cache data if cache is True
         :param parallel: (boolean) compute B(x, i) in parallel for all x in points
+        :param var_noise: float
+        :param mean: float
+        :param parameters_kernel: np.array(l)
 
         :return: {
             'a': np.array(n),
-            'b': np.array(nxr)
+            'b': np.array(nxr),
+            'numerator': np.array(nxr),
+            'denominator': np.array(r),
+            'vec_covs': np.array(nxm),
+            'solve_2': cov(historical_points)^-1 * cov(historical_points, candidate_points),
+            'chol': np.array(mxm),
         }
         """
 
-        var_noise = self.gp.var_noise.value[0]
-        parameters_kernel = self.gp.kernel.hypers_values_as_array
-        mean = self.gp.mean.value[0]
+        if var_noise is None:
+            var_noise = self.gp.var_noise.value[0]
+
+        if parameters_kernel is None:
+            parameters_kernel = self.gp.kernel.hypers_values_as_array
+
+        if mean is None:
+            mean = self.gp.mean.value[0]
 
         chol_solve = self.gp._cholesky_solve_vectors_for_posterior(
             var_noise, mean, parameters_kernel, cache=cache)
@@ -1013,7 +1466,8 @@ class BayesianQuadrature(object):
 
         compute_vec_covs = False
         if cache:
-            vec_covs = self._get_cached_data((tuple(parameters_kernel, )), QUADRATURES)
+            vec_covs = self._get_cached_quadratures((tuple(parameters_kernel, )), points,
+                                                    parameters_kernel)
         else:
             vec_covs = None
 
@@ -1037,20 +1491,21 @@ class BayesianQuadrature(object):
                 self._updated_cached_data((tuple(parameters_kernel), ), vec_covs, QUADRATURES)
 
         if cache:
-            mu_n = self._get_cached_data((tuple(parameters_kernel),), POSTERIOR_MEAN)
+            mu_n = self._get_cached_data((tuple(parameters_kernel), mean, m), POSTERIOR_MEAN)
         else:
             mu_n = None
 
         if mu_n is None:
             mu_n = mean + np.dot(vec_covs, solve)
             if cache:
-                self._updated_cached_data((tuple(parameters_kernel),), mu_n, POSTERIOR_MEAN)
+                self._updated_cached_data((tuple(parameters_kernel), mean, m), mu_n,
+                                          POSTERIOR_MEAN)
 
         # TODO: CACHE SO WE DON'T COMPUTE MU_N ALL THE TIME
         cross_cov = self.gp.evaluate_cross_cov(self.gp.data['points'], candidate_points,
                                                 parameters_kernel)
 
-        solve_2 = cho_solve(chol, cross_cov)
+        solve_2 = posterior_cov_solve(chol, cross_cov)
 
         numerator = b_new - np.dot(vec_covs, solve_2)
 
@@ -1069,10 +1524,69 @@ class BayesianQuadrature(object):
         return {
             'a': mu_n,
             'b': b_value,
+            'numerator': numerator,
+            'denominator': denominator,
+            'vec_covs': vec_covs,
+            'solve_2': solve_2,
+            'chol': chol,
         }
 
+    def gradient_vector_b_many_cp(self, points, candidate_points, lines, columns,
+                                  posterior_parameters, parameters_kernel=None):
+        """
+        Compute the gradient of b(points[lines[i]], candidate_points[columns[i]]) respect to the
+        candidate point, for each i. The quantities shared by all the candidate points are taken
+        from the output of compute_posterior_parameters_kg_many_cp.
+
+        :param points: np.array(nxk)
+        :param candidate_points: np.array(rxm), (new_x, new_w)
+        :param lines: np.array(s), indexes of the rows of points
+        :param columns: np.array(s), indexes of the rows of candidate_points
+        :param posterior_parameters: output of compute_posterior_parameters_kg_many_cp for points
+            and candidate_points.
+        :param parameters_kernel: np.array(l)
+
+        :return: np.array(sxm)
+        """
+        # We assume that the gradient of cov(x, x) respect to x is equal to zero.
+        # We assume that cov(x, y) = cov(y, x).
+
+        if parameters_kernel is None:
+            parameters_kernel = self.gp.kernel.hypers_values_as_array
+
+        historical_points = self.gp.data['points']
+        dimension = candidate_points.shape[1]
+
+        grad_gamma = self.gp.evaluate_grad_cross_cov_respect_points(
+            candidate_points, historical_points, parameters_kernel)
+
+        grad_b_new = np.zeros((len(lines), dimension))
+        for j in np.unique(columns):
+            index = np.where(columns == j)[0]
+            grad_b_new[index, :] = self.evaluate_grad_quadrature_cross_cov_resp_candidate(
+                candidate_points[j:j + 1, :], points[lines[index], :],
+                parameters_kernel).transpose()
+
+        solve_1 = posterior_parameters['solve_2']
+        solve_2 = posterior_cov_solve(posterior_parameters['chol'],
+                                      posterior_parameters['vec_covs'][lines, :].transpose())
+
+        with np.errstate(divide='ignore'):
+            beta_1 = posterior_parameters['denominator'] ** (-1.0)
+
+        beta_2 = posterior_parameters['numerator'][lines, columns]
+
+        beta_3 = grad_b_new - np.einsum('ijk,ji->ik', grad_gamma[columns, :, :], solve_2)
+
+        beta_4 = 2.0 * np.einsum('ijk,ji->ik', grad_gamma, solve_1)
+
+        gradients = beta_1[columns][:, None] * beta_3 + \
+            0.5 * (beta_1[columns] ** 3)[:, None] * beta_2[:, None] * beta_4[columns, :]
+
+        return gradients
+
     def get_parameters_for_samples(self, cache, candidate_point, parameters_kernel,
-                                           var_noise, mean, clear_cache=True):
+                                           var_noise, mean, clear_cache=False):
         """
         Computes additional parameters needed for sample of SBO.
 
@@ -1081,6 +1595,8 @@ class BayesianQuadrature(object):
         :param parameters_kernel: np.array(l)
         :param var_noise: float
         :param mean: float
+        :param clear_cache: (boolean) If True, the cached data of the other samples of the
+            hyperparameters is removed.
         :return: {
             'gamma': cov(historical_points, candidate_point),
             'solve_2': cov(historical_points)^-1 * gamma,
@@ -1106,16 +1622,20 @@ class BayesianQuadrature(object):
         solve = chol_solve['solve']
 
         index_cache = (tuple(candidate_point[0, :]), tuple(parameters_kernel))
-        if cache and index_cache in self.cache_sample:
-            solve_2 = self.cache_sample[index_cache]['solve_2']
-            denominator = self.cache_sample[index_cache]['denominator']
-            cross_cov = self.cache_sample[index_cache]['gamma']
+        cached_sample = None
+        if cache:
+            cached_sample = self.cache_sample.get(index_cache)
+
+        if cached_sample is not None:
+            solve_2 = cached_sample['solve_2']
+            denominator = cached_sample['denominator']
+            cross_cov = cached_sample['gamma']
         else:
 
             cross_cov = self.gp.evaluate_cross_cov(self.gp.data['points'], candidate_point,
                                                    parameters_kernel)  # cache this
 
-            solve_2 = cho_solve(chol, cross_cov)
+            solve_2 = posterior_cov_solve(chol, cross_cov)
 
             new_cross_cov = np.diag(self.gp.evaluate_cross_cov(candidate_point, candidate_point,
                                                        parameters_kernel))
@@ -1127,11 +1647,12 @@ class BayesianQuadrature(object):
             denominator = np.sqrt(denominator)
             if cache:
                 if clear_cache:
-                    self.cache_sample = {}
-                self.cache_sample[index_cache] = {}
-                self.cache_sample[index_cache]['denominator'] = denominator
-                self.cache_sample[index_cache]['solve_2'] = solve_2
-                self.cache_sample[index_cache]['gamma'] = cross_cov
+                    self.cache_sample.clear()
+                self.cache_sample[index_cache] = {
+                    'denominator': denominator,
+                    'solve_2': solve_2,
+                    'gamma': cross_cov,
+                }
 
         return {
             'gamma': cross_cov,
@@ -1147,7 +1668,7 @@ class BayesianQuadrature(object):
 
     def compute_parameters_for_sample(
             self, point, candidate_point, var_noise=None, mean=None,
-            parameters_kernel=None, cache=True, n_threads=0, clear_cache=True):
+            parameters_kernel=None, cache=True, n_threads=0, clear_cache=False):
         """
         Compute posterior parameters of a_n+1(point) given the candidate_point. Caching is different
         than in the other functions.
@@ -1159,6 +1680,8 @@ class BayesianQuadrature(object):
         :param parameters_kernel: np.array(l)
         :param cache: (boolean) Use cached data and cache data if cache is True
         :param n_threads: (int) Threads are used if n_threads > 0
+        :param clear_cache: (boolean) If True, the cached data of the other samples of the
+            hyperparameters is removed.
         :return: {'a': float, 'b': float}
         """
 
@@ -1286,7 +1809,7 @@ class BayesianQuadrature(object):
         return {'a': hessian_a, 'b': hessian_b}
 
     def get_vec_covs(self, cache, points, parameters_kernel, candidate_point, parallel,
-                     keep_indexes=None, monte_carlo=False, n_threads=0, clear_cache=True):
+                     keep_indexes=None, monte_carlo=False, n_threads=0, clear_cache=False):
         """
         Get vectors b from cache if possible.
 
@@ -1300,6 +1823,8 @@ class BayesianQuadrature(object):
         :param monte_carlo: If True, we cache the data using the indexes to cache the data of the
             monte carlo samples.
         :param n_threads: (int) If n_threads > 0, memory is shared between threads
+        :param clear_cache: (boolean) If True, the cached data of the other samples of the
+            hyperparameters is removed.
 
         :return: (vec_covs, b_new)
         """
@@ -1335,15 +1860,18 @@ class BayesianQuadrature(object):
             else:
                 index_vec_covs = (tuple(parameters_kernel), tuple(points[0, :]))
 
-            vec_covs = self._get_cached_data(index_vec_covs, QUADRATURES)
+            if not monte_carlo:
+                vec_covs = self._get_cached_quadratures(
+                    index_vec_covs, points, parameters_kernel, keep_indexes=keep_indexes)
+            else:
+                vec_covs = self._get_cached_quadratures(
+                    index_vec_covs, points, parameters_kernel, thread=n_threads > 0)
         else:
             vec_covs = None
 
         if vec_covs is None:
             compute_vec_covs = True
             vec_covs = np.zeros((n, m))
-        elif not monte_carlo and keep_indexes is not None:
-            vec_covs = vec_covs[keep_indexes, :]
 
         if compute_vec_covs or compute_b_new:
             computations = self.compute_vectors_b(points, candidate_point, self.gp.data['points'],
@@ -1413,20 +1941,22 @@ class BayesianQuadrature(object):
                                             parallel, n_threads=n_threads)
 
         if cache:
-            mu_n = self._get_cached_data((tuple(parameters_kernel), mean), POSTERIOR_MEAN)
+            mu_n = self._get_cached_data(
+                (tuple(parameters_kernel), mean, vec_covs.shape[1]), POSTERIOR_MEAN)
         else:
             mu_n = None
 
         if mu_n is None:
             mu_n = mean + np.dot(vec_covs, solve)
             if cache:
-                self._updated_cached_data((tuple(parameters_kernel), mean), mu_n, POSTERIOR_MEAN)
+                self._updated_cached_data(
+                    (tuple(parameters_kernel), mean, vec_covs.shape[1]), mu_n, POSTERIOR_MEAN)
 
         # TODO: CACHE SO WE DON'T COMPUTE MU_N ALL THE TIME
         cross_cov = self.gp.evaluate_cross_cov(candidate_point, self.gp.data['points'],
                                                 parameters_kernel)
 
-        solve_2 = cho_solve(chol, cross_cov[0, :])
+        solve_2 = posterior_cov_solve(chol, cross_cov[0, :])
         numerator = b_new[:, 0] - np.dot(vec_covs, solve_2)
 
         new_cross_cov = self.gp.evaluate_cross_cov(candidate_point, candidate_point,
@@ -1501,7 +2031,7 @@ class BayesianQuadrature(object):
                                              parallel, keep_indexes=keep_indexes,
                                              monte_carlo=monte_carlo, n_threads=n_threads)
 
-        solve_2 = cho_solve(chol, vec_covs.transpose())
+        solve_2 = posterior_cov_solve(chol, vec_covs.transpose())
 
         beta_1 = beta_1 ** (-0.5)
 
@@ -1573,6 +2103,7 @@ class BayesianQuadrature(object):
 
         best = np.max(evaluations)
         self.best_solution[index] = best
+        Parallel.update_version(self)
 
         return best
 
@@ -1618,21 +2149,73 @@ class BayesianQuadrature(object):
 
     def clean_cache(self):
         """
-        Cleans the cache
+        Cleans the cache. The quadratures B(x, i) are kept, because only the columns of the new
+        points are computed if points are added to the data of the GP.
         """
-        self.cache_quadratures = {}
-        self.cache_posterior_mean = {}
-        self.cache_quadrature_with_candidate = {}
+        self.cache_posterior_mean.clear()
+        self.cache_quadrature_with_candidate.clear()
         self.gp.clean_cache()
         self.max_mean = {}  # max_{x} a_{n} (x)
         # (a solution for every set of parameters of the model)
         self.best_solution = {}
-        self.cache_sample = {}
+        self.cache_sample.clear()
 
         self.var_noise = None
         if self.gp.noise and self.gp.data.get('var_noise') is not None:
             self.var_noise = np.mean(self.gp.data.get('var_noise'))
         self.optimal_solutions = {}
+        Parallel.update_version(self)
+
+    def change_points_cached_quadratures(self, rows, new_points, known_rows=None, indexes=None):
+        """
+        Changes the points of the cached matrices of quadratures B(x, i) of a discretization, i.e.
+        the entries of cache_quadratures indexed by (parameters_kernel, ). The new points are the
+        points of the given rows, followed by new_points. The rows of the points that aren't kept
+        are dropped, and only the rows of new_points are computed. The posterior means and the
+        vectors B(x, candidate_point) of the discretization are removed.
+
+        :param rows: np.array(int), rows of the cached matrices that are kept
+        :param new_points: np.array(rxk)
+        :param known_rows: {index: np.array(rxt)}, rows of new_points that are already computed
+            for the entry index. Their first columns are used if t is bigger than the number of
+            columns of the cached matrix.
+        :param indexes: [(parameters_kernel, )], entries that are changed. If it's None, all the
+            entries indexed by (parameters_kernel, ) are changed.
+        """
+
+        if known_rows is None:
+            known_rows = {}
+
+        for index, vec_covs in self.cache_quadratures.items():
+            if len(index) != 1 or (indexes is not None and index not in indexes):
+                continue
+
+            n_cached = vec_covs.shape[1]
+
+            if self.history_quadratures is None or \
+                    not self._extends_history(self.history_quadratures, n_cached):
+                del self.cache_quadratures[index]
+                continue
+
+            new_rows = known_rows.get(index)
+
+            if new_rows is not None and new_rows.shape[1] >= n_cached:
+                new_rows = new_rows[:, 0: n_cached]
+            elif new_points.shape[0] == 0:
+                new_rows = np.zeros((0, n_cached))
+            else:
+                new_rows = self.compute_vectors_b(
+                    new_points, None, self.gp.data['points'][0: n_cached, :], np.array(index[0]),
+                    True, False, True)['vec_covs']
+
+            self._updated_cached_data(
+                index, np.concatenate((vec_covs[rows, :], new_rows), axis=0), QUADRATURES)
+
+        for index in self.cache_quadrature_with_candidate.keys():
+            if len(index) == 2:
+                del self.cache_quadrature_with_candidate[index]
+
+        self.cache_posterior_mean.clear()
 
     def generate_evaluations(self, problem_name, model_type, training_name, n_training,
                              random_seed, iteration, n_points_by_dimension=None):
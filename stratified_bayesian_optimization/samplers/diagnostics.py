@@ -0,0 +1,94 @@
+from __future__ import absolute_import
+
+import numpy as np
+
+
+class MCMCDiagnostics(object):
+    """
+    Convergence diagnostics of several MCMC chains. See Bayesian Data Analysis (Gelman et al.),
+    section 11.4 and 11.5.
+    """
+
+    @staticmethod
+    def _variances(chains):
+        """
+        Computes the within-chain and the pooled variance estimates of each parameter.
+
+        :param chains: np.array(m x n x p), m chains with n samples of p parameters
+        :return: (np.array(p), np.array(p)) within-chain variance, pooled variance
+        """
+        n = chains.shape[1]
+
+        within = np.mean(np.var(chains, axis=1, ddof=1), axis=0)
+        between = n * np.var(np.mean(chains, axis=1), axis=0, ddof=1)
+
+        pooled = (n - 1.0) / n * within + between / n
+
+        return within, pooled
+
+    @staticmethod
+    def potential_scale_reduction(chains):
+        """
+        Computes the potential scale reduction factor (R-hat) of each parameter. Values close to
+        one mean that the chains have mixed.
+
+        :param chains: np.array(m x n x p), m chains with n samples of p parameters
+        :return: np.array(p)
+        """
+        chains = np.asarray(chains, dtype=float)
+        within, pooled = MCMCDiagnostics._variances(chains)
+
+        r_hat = np.ones(chains.shape[2])
+        positive = within > 0
+        r_hat[positive] = np.sqrt(pooled[positive] / within[positive])
+
+        return r_hat
+
+    @staticmethod
+    def effective_sample_size(chains):
+        """
+        Computes the effective sample size of each parameter. The autocorrelations are summed
+        until the sum of two consecutive autocorrelations is negative.
+
+        :param chains: np.array(m x n x p), m chains with n samples of p parameters
+        :return: np.array(p)
+        """
+        chains = np.asarray(chains, dtype=float)
+        m, n, p = chains.shape
+
+        within, pooled = MCMCDiagnostics._variances(chains)
+        centered = chains - np.mean(chains, axis=1)[:, np.newaxis, :]
+
+        ess = float(m * n) * np.ones(p)
+
+        for j in xrange(p):
+            if pooled[j] <= 0:
+                continue
+
+            correlations = []
+            for lag in xrange(1, n):
+                autocov = np.mean(
+                    np.sum(centered[:, lag:, j] * centered[:, 0: n - lag, j], axis=1) / n)
+                correlations.append(1.0 - (within[j] - autocov) / pooled[j])
+
+            sum_correlations = 0.0
+            for t in xrange(0, len(correlations) - 1, 2):
+                pair = correlations[t] + correlations[t + 1]
+                if pair < 0:
+                    break
+                sum_correlations += pair
+
+            ess[j] = min(float(m * n), m * n / (1.0 + 2.0 * sum_correlations))
+
+        return ess
+
+    @staticmethod
+    def diagnostics(chains):
+        """
+        :param chains: np.array(m x n x p), m chains with n samples of p parameters
+        :return: {'r_hat': np.array(p), 'ess': np.array(p)}
+        """
+        return {
+            'r_hat': MCMCDiagnostics.potential_scale_reduction(chains),
+            'ess': MCMCDiagnostics.effective_sample_size(chains),
+        }
@@ -21,6 +21,7 @@ from stratified_bayesian_optimization.lib.constant import (
     SDE_METHOD,
 )
 from stratified_bayesian_optimization.lib.distances import Distances
+from stratified_bayesian_optimization.lib.parallel import Parallel
 from stratified_bayesian_optimization.entities.objective import Objective
 from stratified_bayesian_optimization.acquisition_functions.sbo import SBO
 from stratified_bayesian_optimization.acquisition_functions.ei import EI
@@ -73,7 +74,9 @@ class BGO(object):
             quadrature = BayesianQuadrature(gp_model, x_domain, distribution,
                                             parameters_distribution=parameters_distribution)
 
-            acquisition_function = SBO(quadrature, np.array(domain.discretization_domain_x))
+            acquisition_function = SBO(
+                quadrature, np.array(domain.discretization_domain_x),
+                adaptive_discretization=spec.get('adaptive_discretization', False))
         elif method_optimization == MULTI_TASK_METHOD:
             x_domain = spec.get('x_domain')
             distribution = spec.get('distribution')
@@ -172,6 +175,7 @@ class BGO(object):
         self.n_samples = n_samples
         self.number_points_each_dimension_debug = number_points_each_dimension_debug
 
+    @Parallel.persistent_pool
     def optimize(self, random_seed=None, start=None, debug=False, monte_carlo_sbo=False,
                  n_samples_mc=1, n_restarts_mc=1, n_best_restarts_mc=0,
                  n_restarts=10, n_best_restarts=0, n_samples_parameters=0, n_restarts_mean=1000,
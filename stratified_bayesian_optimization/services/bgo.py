@@ -43,7 +43,8 @@ def bgo(objective_function, bounds_domain_x, integrand_function=None, simplex_do
         monte_carlo_sbo=True, n_samples_mc=5, n_restarts_mc=5, n_best_restarts_mc=0, factr_mc=1e12,
         maxiter_mc=10, method_opt_mc=LBFGS_NAME, n_restarts_mean=100, n_best_restarts_mean=10,
         n_samples_parameters_mean=5, maxepoch_mean=50, parallel_training=False,
-        default_n_samples_parameters=None, default_n_samples=None):
+        default_n_samples_parameters=None, default_n_samples=None, n_chains=1,
+        adaptive_discretization=False):
     """
     Maximizes the objective function.
 
@@ -116,6 +117,10 @@ def bgo(objective_function, bounds_domain_x, integrand_function=None, simplex_do
     :param default_n_samples_parameters: (int) Number of samples of Z for the discretization-free
         estimation of the VOI.
     :param default_n_samples: (int) Number of samples of the hyperparameters to estimate the VOI.
+    :param n_chains: (int) Number of chains of the slice sampler, they're run in parallel.
+    :param adaptive_discretization: (boolean) If True, the SBO is computed only on the points of
+        the discretization of the domain of x that can be in the upper envelope of the lines
+        a(x) + b(x, candidate)z. It's ignored when the SBO is estimated by Monte Carlo.
     :return: {'optimal_solution': np.array(n),
             'optimal_value': float}
     """
@@ -205,6 +210,7 @@ def bgo(objective_function, bounds_domain_x, integrand_function=None, simplex_do
         'mle': mle,
         'thinning': thinning,
         'n_burning': n_burning,
+        'n_chains': n_chains,
         'max_steps_out': max_steps_out,
         'n_samples': n_samples_noise,
         'random_seed': random_seed,
@@ -238,7 +244,8 @@ def bgo(objective_function, bounds_domain_x, integrand_function=None, simplex_do
         quadrature = BayesianQuadrature(gp_model, x_domain, distribution,
                                         parameters_distribution=parameters_distribution)
 
-        acquisition_function = SBO(quadrature, np.array(domain.discretization_domain_x))
+        acquisition_function = SBO(quadrature, np.array(domain.discretization_domain_x),
+                                   adaptive_discretization=adaptive_discretization)
     elif method_optimization == EI_METHOD:
         acquisition_function = EI(gp_model, noisy_evaluations=noise)
 
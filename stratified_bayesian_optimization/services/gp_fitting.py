@@ -7,8 +7,20 @@ from stratified_bayesian_optimization.initializers.log import SBOLog
 from stratified_bayesian_optimization.lib.constant import GP_DIR
 from stratified_bayesian_optimization.util.json_file import JSONFile
 from stratified_bayesian_optimization.models.gp_fitting_gaussian import GPFittingGaussian
+from stratified_bayesian_optimization.models.sparse_gp_fitting_gaussian import (
+    SparseGPFittingGaussian,
+)
+from stratified_bayesian_optimization.models.iterative_gp_fitting_gaussian import (
+    IterativeGPFittingGaussian,
+)
 from stratified_bayesian_optimization.services.training_data import TrainingDataService
-from stratified_bayesian_optimization.lib.constant import DEFAULT_RANDOM_SEED, SBO_METHOD
+from stratified_bayesian_optimization.lib.constant import (
+    DEFAULT_RANDOM_SEED,
+    SBO_METHOD,
+    GP_FITTING_GAUSSIAN,
+    SPARSE_GP_FITTING_GAUSSIAN,
+    ITERATIVE_GP_FITTING_GAUSSIAN,
+)
 
 logger = SBOLog(__name__)
 
@@ -19,7 +31,9 @@ class GPFittingService(object):
                               '{method}_samples_parameters_{n_samples_parameters}.json'.format
 
     _model_map = {
-        'gp_fitting_gaussian': GPFittingGaussian,
+        GP_FITTING_GAUSSIAN: GPFittingGaussian,
+        SPARSE_GP_FITTING_GAUSSIAN: SparseGPFittingGaussian,
+        ITERATIVE_GP_FITTING_GAUSSIAN: IterativeGPFittingGaussian,
     }
 
     @classmethod
@@ -46,6 +60,7 @@ class GPFittingService(object):
             'mle': spec.get('mle', True),
             'thinning': spec.get('thinning', 0),
             'n_burning': spec.get('n_burning', 0),
+            'n_chains': spec.get('n_chains', 1),
             'max_steps_out': spec.get('max_steps_out', 1),
             'n_samples': spec.get('n_samples'),
             'random_seed': spec.get('random_seed', DEFAULT_RANDOM_SEED),
@@ -61,6 +76,7 @@ class GPFittingService(object):
             'simplex_domain': spec.get('simplex_domain', None),
             'objective_function': spec.get('objective_function', None),
             'define_samplers':  spec.get('define_samplers', True),
+            'n_inducing_points': spec.get('n_inducing_points'),
         }
 
         return cls.get_gp(**entry)
@@ -126,11 +142,12 @@ class GPFittingService(object):
                var_noise_value=None, cache=True, same_correlation=False,
                use_only_training_points=True, optimization_method=None, n_samples_parameters=0,
                parallel_training=True, simplex_domain=None, objective_function=None,
-               define_samplers=True):
+               define_samplers=True, n_chains=1, n_inducing_points=None):
         """
         Fetch a GP model from file if it exists, otherwise train a new model and save it locally.
 
-        :param name_model: str
+        :param name_model: str, GP_FITTING_GAUSSIAN, SPARSE_GP_FITTING_GAUSSIAN or
+            ITERATIVE_GP_FITTING_GAUSSIAN
         :param problem_name: str
         :param type_kernel: [(str)] Must be in possible_kernels. If it's a product of kernels it
             should be a list as: [PRODUCT_KERNELS_SEPARABLE, NAME_1_KERNEL, NAME_2_KERNEL]
@@ -170,11 +187,18 @@ class GPFittingService(object):
         :param parallel_training: (boolean)
         :param define_samplers: (boolean) If False, samplers for the hyperparameters are not
             defined.
+        :param n_chains: (int) Number of chains of the MCMC, they're run in parallel.
+        :param n_inducing_points: (int) Number of inducing points of the sparse GP model. It's only
+            used if name_model is SPARSE_GP_FITTING_GAUSSIAN.
 
         :return: (GPFittingGaussian) - An instance of GPFittingGaussian
         """
         model_type = cls._model_map[name_model]
 
+        model_parameters = {}
+        if name_model == SPARSE_GP_FITTING_GAUSSIAN and n_inducing_points is not None:
+            model_parameters['n_inducing_points'] = n_inducing_points
+
         if training_name is None:
             training_name = 'default_training_data_%d_points_rs_%d' % (n_training, random_seed)
 
@@ -228,7 +252,8 @@ class GPFittingService(object):
                                     problem_name=problem_name, kernel_values=kernel_values,
                                     mean_value=mean_value, var_noise_value=var_noise_value,
                                     same_correlation=same_correlation,
-                                    simplex_domain=simplex_domain, define_samplers=define_samplers)
+                                    simplex_domain=simplex_domain, define_samplers=define_samplers,
+                                    n_chains=n_chains, **model_parameters)
 
         JSONFile.write(gp_model.serialize(), gp_path)
 
@@ -18,7 +18,7 @@ class ValidateGPService(object):
     def validate_gp_model(cls, type_kernel, n_training, problem_name, bounds_domain, type_bounds,
                           dimensions, thinning=0, n_burning=0, max_steps_out=1,
                           random_seed=None, training_name=None, points=None, noise=False,
-                          n_samples=0, cache=True, **kernel_parameters):
+                          n_samples=0, cache=True, closed_form=False, **kernel_parameters):
         """
 
         :param type_kernel: [(str)] Must be in possible_kernels. If it's a product of kernels it
@@ -44,6 +44,8 @@ class ValidateGPService(object):
         :param n_samples: (int) If the objective is noisy, we take n_samples of the function to
             estimate its value.
         :param cache: (boolean)  Try to get trainng_data from cache if it's True
+        :param closed_form: (boolean) If True, the leave-one-out posterior parameters are computed
+            in closed form with the hyperparameters fitted on all the data.
         :param kernel_parameters: additional kernel parameters,
             - SAME_CORRELATION: (boolean) True or False. Parameter used only for task kernel.
 
@@ -77,7 +79,7 @@ class ValidateGPService(object):
         results = ValidationGPModel.cross_validation_mle_parameters(
             type_kernel, training_data, dimensions, problem_name, bounds_domain, thinning,
             n_burning, max_steps_out, start=None, random_seed=random_seed,
-            training_name=training_name, **kernel_parameters
+            training_name=training_name, closed_form=closed_form, **kernel_parameters
         )
 
         logger.info('Percentage of success is: %f' % results['success_proportion'])
@@ -98,6 +98,14 @@ class TestEI(unittest.TestCase):
 
         npt.assert_almost_equal(val, np.mean(evals), decimal=2)
 
+    def test_evaluate_several_points(self):
+        points = np.array([[97.5, 0], [10.0, 0], [50.5, 0]])
+        values = self.ei.evaluate(points)
+
+        assert values.shape == (3,)
+        for i in xrange(3):
+            npt.assert_almost_equal(values[i], self.ei.evaluate(points[i: i + 1, :])[0])
+
     def test_evaluate_bq(self):
         point =  np.array([[97.5]])
         val = self.ei_2.evaluate(point)
@@ -165,6 +173,34 @@ class TestEI(unittest.TestCase):
 
         npt.assert_almost_equal(val_1, val_2)
 
+    def test_evaluate_samples_parameters(self):
+        point = np.array([[97.5, 0], [20.0, 1]])
+        parameters = np.array([[1.0, 5.0, 50.0, 8.6, -3.0, -0.1],
+                               [0.5, 1.0, 20.0, 2.0, 1.0, -0.5]])
+
+        values = self.ei.evaluate_samples_parameters(point, parameters)
+        assert values.shape == (2, 2)
+
+        for i in xrange(2):
+            for j in xrange(2):
+                val = self.ei.evaluate(point[j: j + 1, :], parameters[i, 0], parameters[i, 1],
+                                       parameters[i, 2:])
+                npt.assert_almost_equal(values[i, j], val[0])
+
+    def test_evaluate_samples_parameters_bq(self):
+        point = np.array([[97.5], [20.0], [51.3]])
+        parameters = np.array([[1.0, 5.0, 50.0, 8.6, -3.0, -0.1],
+                               [0.5, 1.0, 20.0, 2.0, 1.0, -0.5]])
+
+        values = self.ei_2.evaluate_samples_parameters(point, parameters)
+        assert values.shape == (2, 3)
+
+        for i in xrange(2):
+            for j in xrange(3):
+                val = self.ei_2.evaluate(point[j: j + 1, :], parameters[i, 0], parameters[i, 1],
+                                         parameters[i, 2:])
+                npt.assert_almost_equal(values[i, j], val[0])
+
     def test_evaluate_bq_parameters(self):
         point =  np.array([[97.5]])
 
@@ -9,6 +9,7 @@ import warnings
 
 import numpy as np
 import numpy.testing as npt
+from scipy.stats import norm
 
 from copy import deepcopy
 
@@ -23,6 +24,7 @@ from stratified_bayesian_optimization.lib.constant import (
     NEWTON_CG_NAME,
     TRUST_N_CG,
     DOGLEG,
+    SBO_SCREENING_STD,
 )
 from stratified_bayesian_optimization.services.bayesian_global_optimization import BGO
 from stratified_bayesian_optimization.services.gp_fitting import GPFittingService
@@ -38,7 +40,9 @@ from stratified_bayesian_optimization.entities.run_spec import RunSpecEntity
 from stratified_bayesian_optimization.services.domain import DomainService
 from stratified_bayesian_optimization.lib.finite_differences import FiniteDifferences
 from stratified_bayesian_optimization.lib.affine_break_points import (
+    AffineBreakPointsPrep,
     AffineBreakPoints,
+    upper_envelope,
 )
 from stratified_bayesian_optimization.lib.parallel import Parallel
 from stratified_bayesian_optimization.lib.util import (
@@ -148,6 +152,19 @@ class TestSBO(unittest.TestCase):
         self.sbo_med = SBO(gp_med, np.array(domain.discretization_domain_x))
         self.sbo_med.clean_cache()
 
+        training_data_fixed = {
+            'evaluations': list(function[0:100:10]),
+            'points': points[0:100:10, :],
+            "var_noise": [],
+        }
+        self.gaussian_p_fixed = GPFittingGaussian(
+            [PRODUCT_KERNELS_SEPARABLE, MATERN52_NAME, TASKS_KERNEL_NAME],
+            training_data_fixed, [2, 1, 2], bounds_domain=[[0, 100], [0, 1]], type_bounds=[0, 1],
+            kernel_values=[20.0, 2.0, 0.5, 0.0], mean_value=[0.0], var_noise_value=[0.5])
+        gp_fixed = BayesianQuadrature(self.gaussian_p_fixed, [0], UNIFORM_FINITE, {TASKS: 2})
+
+        self.sbo_fixed = SBO(gp_fixed, np.array(domain.discretization_domain_x))
+
 
     def test_evaluate(self):
         point = np.array([[52.5, 0]])
@@ -223,6 +240,130 @@ class TestSBO(unittest.TestCase):
         z = self.sbo.hvoi(b, c, keep)
         assert z == 0
 
+    def test_hvoi_batch(self):
+        np.random.seed(1)
+        a = np.random.normal(0, 1, 50)
+        b = np.random.normal(0, 1, (50, 4))
+        b[:, 3] = 1.0
+
+        values = self.sbo.hvoi_batch(b, upper_envelope(a, b))
+
+        z = np.linspace(-12, 12, 240001)
+        for j in xrange(4):
+            a_, b_, keep = AffineBreakPointsPrep(a, b[:, j])
+            keep1, c = AffineBreakPoints(a_, b_)
+            npt.assert_almost_equal(values[j], self.sbo.hvoi(b_, c, keep1))
+
+            maximum = np.max(a[:, np.newaxis] + b[:, j: j + 1] * z[np.newaxis, :], axis=0)
+            expectation = np.trapz(maximum * norm.pdf(z), z)
+            npt.assert_almost_equal(values[j], expectation - np.max(a), decimal=5)
+
+        assert values[3] == 0
+
+    def test_evaluate_candidate_points(self):
+        candidates = np.array([[52.5, 0], [33.3, 0], [99.0, 1], [75.0, 1], self.points[0, :]])
+        output = self.sbo_fixed.evaluate_candidate_points(candidates, compute_gradient=True)
+
+        assert output['evaluations'][2] > 0.1
+        for i in xrange(4):
+            candidate = candidates[i: i + 1, :]
+            npt.assert_almost_equal(output['evaluations'][i], self.sbo_fixed.evaluate(candidate))
+            npt.assert_almost_equal(output['gradient'][i, :],
+                                    self.sbo_fixed.evaluate_gradient(candidate))
+
+        # The vector b isn't finite at the training points, and so the VOI is zero.
+        assert output['evaluations'][4] == 0
+        assert np.all(output['gradient'][4, :] == [0, 0])
+
+        parameters = (1.0, 5.0, np.array([50.0, 9.6, -3.0, -0.1]))
+        output = self.sbo_fixed.evaluate_candidate_points(candidates[0:4, :], *parameters)
+        assert output['gradient'] is None
+
+        for i in xrange(4):
+            candidate = candidates[i: i + 1, :]
+            npt.assert_almost_equal(output['evaluations'][i],
+                                    self.sbo_fixed.evaluate(candidate, *parameters))
+
+    def test_adaptive_discretization(self):
+        gp = BayesianQuadrature(self.gaussian_p_fixed, [0], UNIFORM_FINITE, {TASKS: 2})
+        sbo = SBO(gp, self.sbo_fixed.discretization, adaptive_discretization=True)
+
+        candidates = np.array([[52.5, 0], [33.3, 0], [99.0, 1], [75.0, 1]])
+        values = sbo.evaluate_candidate_points(candidates)['evaluations']
+
+        n_active = len(sbo.active_indexes)
+        active_indexes = sbo.active_indexes.copy()
+        assert n_active < self.sbo_fixed.discretization.shape[0]
+        assert sbo.discretization.shape[0] == n_active
+        assert np.all(sbo.screen_discretization()[sbo.active_indexes])
+        assert np.all(np.in1d(np.where(sbo.envelope_points)[0], sbo.active_indexes))
+
+        post = gp.compute_posterior_parameters(self.sbo_fixed.discretization, only_variance=True)
+        std = np.sqrt(np.clip(post['var'], 0, None))
+        index_max = np.argmax(post['mean'])
+        npt.assert_array_equal(
+            sbo.screen_discretization(),
+            post['mean'] + SBO_SCREENING_STD * (std + std[index_max]) >= post['mean'][index_max])
+
+        for i in xrange(4):
+            candidate = candidates[i: i + 1, :]
+            value = self.sbo_fixed.evaluate(candidate)
+            npt.assert_almost_equal(values[i], value)
+            npt.assert_almost_equal(sbo.evaluate(candidate), value)
+            npt.assert_almost_equal(sbo.evaluate_gradient(candidate),
+                                    self.sbo_fixed.evaluate_gradient(candidate))
+
+        # The active points don't change between the evaluations.
+        npt.assert_array_equal(sbo.active_indexes, active_indexes)
+        assert sbo.state_active[0] == 10
+
+        # Other parameters of the model use the whole discretization.
+        parameters = (1.0, 5.0, np.array([50.0, 9.6, -3.0, -0.1]))
+        value = sbo.evaluate(candidates[0:1, :], *parameters)
+        npt.assert_almost_equal(value, self.sbo_fixed.evaluate(candidates[0:1, :], *parameters))
+        assert sbo.bq.cache_quadratures[(tuple(parameters[2]), )].shape[0] == \
+            self.sbo_fixed.discretization.shape[0]
+        npt.assert_array_equal(sbo.active_indexes, active_indexes)
+
+        # The points of the upper envelope are only added between optimizations.
+        inactive = np.setdiff1d(np.arange(self.sbo_fixed.discretization.shape[0]),
+                                active_indexes)[0]
+        sbo.envelope_points[inactive] = True
+        sbo.update_active_discretization()
+        npt.assert_array_equal(sbo.active_indexes, active_indexes)
+        sbo.update_active_discretization(force=True)
+        assert inactive in sbo.active_indexes
+        assert len(sbo.active_indexes) == n_active + 1
+
+        self.gaussian_p_fixed.add_points_evaluations(np.array([[99.0, 1]]), np.array([10.8]))
+        value = sbo.evaluate(candidates[0:1, :])
+
+        assert sbo.state_active[0] == 11
+        npt.assert_almost_equal(value, self.sbo_fixed.evaluate(candidates[0:1, :]))
+
+        parameters_kernel = self.gaussian_p_fixed.kernel.hypers_values_as_array
+        screening = sbo.screening_quadratures[tuple(parameters_kernel)]
+        assert screening['vec_covs'].shape == (self.sbo_fixed.discretization.shape[0], 11)
+        cached = sbo.bq.cache_quadratures[(tuple(parameters_kernel), )]
+        npt.assert_almost_equal(
+            cached, screening['vec_covs'][sbo.active_indexes, 0: cached.shape[1]])
+
+        prior_var = [gp.evaluate_quadrate_cov(self.sbo_fixed.discretization[i:i + 1, :],
+                                              parameters_kernel)
+                     for i in xrange(self.sbo_fixed.discretization.shape[0])]
+        npt.assert_almost_equal(screening['prior_var'], prior_var)
+
+        # The sampled parameters become the current ones: their quadratures, computed on the
+        # whole discretization, follow the new active points.
+        previous_index = (tuple(parameters_kernel), )
+        self.gaussian_p_fixed.update_value_parameters(
+            np.concatenate(([parameters[0], parameters[1]], parameters[2])))
+        value = sbo.evaluate(candidates[0:1, :])
+        npt.assert_almost_equal(value, self.sbo_fixed.evaluate(candidates[0:1, :]))
+        assert previous_index not in sbo.bq.cache_quadratures
+        assert sbo.discretization.shape[0] == len(sbo.active_indexes)
+        assert np.all(sbo.screen_discretization()[sbo.active_indexes])
+
     def test_optimization(self):
         val = self.sbo_med.optimize(random_seed=1, parallel=False, n_restarts=1, start_ei=False)
         # Benchmark numbers obtained after optimizing the function manually, i.e. plot the function
@@ -57,6 +57,15 @@ class TestMatern52(unittest.TestCase):
         expect(self.matern52).cross_cov.once().and_return(0)
         assert self.matern52.cov(self.inputs) == 0
 
+    def test_cov_diagonal(self):
+        inputs = np.array([[1.0, 0.0], [0.0, 1.0], [3.0, 2.0]])
+        npt.assert_almost_equal(self.matern52.cov_diagonal(inputs),
+                                np.diag(self.matern52.cov(inputs)))
+
+        diagonal = Matern52.evaluate_cov_diagonal_defined_by_params(np.array([1.0, 2.0]), inputs,
+                                                                    2)
+        npt.assert_almost_equal(diagonal, np.ones(3))
+
     def test_cross_cov(self):
         r2 = np.array([[0.0, 1.25], [1.25, 0.0]])
         r = np.sqrt(r2)
@@ -94,8 +103,8 @@ class TestMatern52(unittest.TestCase):
                                 np.array([[0.87752659905500319], [1.0880320585678382]]))
 
     def test_gradient_respect_parameters(self):
-        expect(GradientLSMatern52).gradient_respect_parameters_ls.once().and_return({'a': 0})
-        expect(self.matern52).cov.once().and_return(1.0)
+        expect(GradientLSMatern52).cov_and_gradient_respect_parameters_ls.once().and_return(
+            (1.0/3, {'a': 0}))
 
         assert self.matern52.gradient_respect_parameters(self.inputs) == {'a': 0, 'sigma2': 1.0/3}
 
@@ -131,13 +140,56 @@ class TestMatern52(unittest.TestCase):
             npt.assert_almost_equal(finite_diff[i], gradient[:, i:i+1].transpose())
 
     def test_gradient_respect_parameters_ls(self):
-        expect(GradientLSMatern52).gradient_respect_distance.once().and_return(4)
-        expect(Distances).gradient_distance_length_scale_respect_ls.once().and_return(
-            {0: 3, 1: 2}
-        )
+        inputs = np.array([[1.0, 0.0], [0.0, 1.0], [2.0, 5.0]])
+        gradient = GradientLSMatern52.gradient_respect_parameters_ls(inputs, self.length_scale)
+
+        derivative_r = GradientLSMatern52.gradient_respect_distance(self.length_scale, inputs)
+        grad_distance = Distances.gradient_distance_length_scale_respect_ls(
+            self.length_scale.value, inputs)
+
+        for i in xrange(2):
+            npt.assert_almost_equal(gradient['scale'][i], grad_distance[i] * derivative_r)
+
+    def test_cov_and_gradient_respect_parameters_ls(self):
+        inputs = np.array([[1.0, 0.0], [0.0, 1.0], [1.0, 0.0]])
+        cov, gradient = GradientLSMatern52.cov_and_gradient_respect_parameters_ls(
+            inputs, self.length_scale)
+
+        kernel = Matern52(self.dimension, self.length_scale)
+        npt.assert_almost_equal(cov, kernel.cov(inputs))
+
+        # The derivatives are defined for repeated points.
+        assert np.all(np.isfinite(gradient['scale'][0]))
+        npt.assert_almost_equal(gradient['scale'][0][0, 2], 0.0)
+
+        dh = 0.00000001
+        finite_diff = FiniteDifferences.forward_difference(
+            lambda params: Matern52.evaluate_cov_defined_by_params(params, inputs, 2),
+            self.length_scale.value, np.array([dh]))
+
+        for i in xrange(2):
+            npt.assert_almost_equal(gradient['scale'][i], finite_diff[i])
+
+    def test_evaluate_cov_and_grad_defined_by_params_respect_params(self):
+        inputs = np.array([[2.0, 4.0], [3.0, 5.0], [1.0, 1.0]])
+        params = np.array([2.0, 3.0, 4.0])
+
+        cov, gradient = ScaledKernel.evaluate_cov_and_grad_defined_by_params_respect_params(
+            params, inputs, 2, *([MATERN52_NAME],))
+
+        npt.assert_almost_equal(
+            cov,
+            ScaledKernel.evaluate_cov_defined_by_params(params, inputs, 2, *([MATERN52_NAME],)))
+
+        grad = ScaledKernel.evaluate_grad_defined_by_params_respect_params(
+            params, inputs, 2, *([MATERN52_NAME],))
+        for i in xrange(3):
+            npt.assert_almost_equal(gradient[i], grad[i])
 
-        assert GradientLSMatern52.gradient_respect_parameters_ls(
-            self.inputs, self.length_scale) == {'scale': {0: 12, 1: 8}}
+        cov, gradient = Matern52.evaluate_cov_and_grad_defined_by_params_respect_params(
+            params[0: 2], inputs, 2)
+        npt.assert_almost_equal(cov, Matern52.evaluate_cov_defined_by_params(params, inputs, 2))
+        assert len(gradient) == 2
 
     def test_gradient_respect_distance(self):
         expect(GradientLSMatern52).gradient_respect_distance_cross.once().and_return(0)
@@ -154,14 +206,38 @@ class TestMatern52(unittest.TestCase):
     def test_grad_respect_point_2(self):
         expect(GradientLSMatern52).gradient_respect_distance_cross.once().and_return(
             np.array([[1, 0], [0, 1]]))
-        expect(Distances).gradient_distance_length_scale_respect_point.once().and_return(
+        expect(Distances).gradient_distance_length_scale_respect_points.once().and_return(
             1.0
         )
-        comparisons = GradientLSMatern52.grad_respect_point(self.length_scale,
-                                                            self.inputs, self.inputs) == \
-            np.array([[1, 0], [0, 1]])
+        comparisons = GradientLSMatern52.grad_respect_points(self.length_scale,
+                                                             self.inputs, self.inputs) == \
+            np.array([[[1], [0]], [[0], [1]]])
         assert np.all(comparisons)
 
+    def test_grad_and_hessian_respect_points(self):
+        points = np.array([[4.5, 7.5], [1.0, 2.0], [5.0, 6.0]])
+        inputs = np.array([[5.0, 6.0], [8.0, 9.0]])
+        kernel = Matern52.define_kernel_from_array(2, np.array([1.0, 5.0]))
+
+        gradient = kernel.grad_respect_points(points, inputs)
+        hessian = kernel.hessian_respect_points(points, inputs)
+
+        assert gradient.shape == (3, 2, 2)
+        assert hessian.shape == (3, 2, 2, 2)
+
+        for i in xrange(3):
+            npt.assert_almost_equal(gradient[i], kernel.grad_respect_point(points[i:i + 1, :],
+                                                                           inputs))
+            if i < 2:
+                npt.assert_almost_equal(
+                    hessian[i], kernel.hessian_respect_point(points[i:i + 1, :], inputs))
+
+        result = Matern52.evaluate_grad_respect_points(np.array([1.0, 5.0]), points, inputs, 2)
+        npt.assert_almost_equal(result, gradient)
+        result = Matern52.evaluate_hessian_respect_points(np.array([1.0, 5.0]), points[0:2, :],
+                                                          inputs, 2)
+        npt.assert_almost_equal(result, hessian[0:2])
+
     def test_grad_respect_point_matern(self):
         expect(GradientLSMatern52).grad_respect_point.once().and_return(0.0)
 
@@ -182,6 +258,23 @@ class TestMatern52(unittest.TestCase):
         kernel = Matern52.define_kernel_from_array(2, np.array([1, 3, 5]))
         assert result == kernel.cov(np.array([[4, 5]]))
 
+    def test_compiled_kernel(self):
+        params = np.array([1.0, 3.0])
+        kernel = Matern52.compiled_kernel(2, params)
+
+        assert kernel is Matern52.compiled_kernel(2, np.array([1.0, 3.0]))
+        assert kernel is not Matern52.compiled_kernel(2, np.array([1.0, 4.0]))
+        assert kernel is not ScaledKernel.compiled_kernel(2, np.array([1.0, 3.0, 2.0]),
+                                                          *([MATERN52_NAME],))
+
+        params[0] = 5.0
+        npt.assert_almost_equal(kernel.length_scale.value, np.array([1.0, 3.0]))
+
+        inputs = np.array([[4.0, 5.0], [1.0, 2.0]])
+        npt.assert_almost_equal(
+            Matern52.evaluate_cov_defined_by_params(np.array([1.0, 3.0]), inputs, 2),
+            Matern52.define_kernel_from_array(2, np.array([1.0, 3.0])).cov(inputs))
+
     def test_evaluate_grad_defined_by_params_respect_params(self):
         result = Matern52.evaluate_grad_defined_by_params_respect_params(
             np.array([1, 3]), np.array([[4, 5]]), 2)
@@ -329,6 +422,33 @@ class TestMatern52(unittest.TestCase):
                 npt.assert_almost_equal(finite_diff[i, j],
                                         np.array([[result[0, i, j], result[1, i, j]]]), decimal=5)
 
+    def test_gradient_distance_length_scale_respect_points(self):
+        params = np.array([1.0, 5.0])
+        points = np.array([[4.5, 7.5], [1.0, 2.0]])
+        inputs = np.array([[5.0, 6.0], [8.0, 9.0], [0.0, 1.0]])
+        result = Distances.gradient_distance_length_scale_respect_points(
+            params, points, inputs, second=True
+        )
+
+        assert result['first'].shape == (2, 3, 2)
+        assert result['second'].shape == (2, 3, 2, 2)
+
+        for i in xrange(2):
+            expected = Distances.gradient_distance_length_scale_respect_point(
+                params, points[i:i + 1, :], inputs, second=True)
+            npt.assert_almost_equal(result['first'][i], expected['first'])
+            npt.assert_almost_equal(result['second'][i], expected['second'])
+
+            dh = 0.00001
+            finite_diff = FiniteDifferences.forward_difference(
+                lambda x: np.sqrt(Distances.dist_square_length_scale(
+                    params, x.reshape((1, len(x))), inputs)),
+                points[i, :], np.array([dh])
+            )
+            for j in xrange(2):
+                npt.assert_almost_equal(finite_diff[j][0, :], result['first'][i, :, j],
+                                        decimal=4)
+
     def test_hessian_distance_length_scale_respect_point(self):
         params = np.array([1.0, 5.0])
         point = np.array([[4.5, 7.5]])
@@ -125,16 +125,13 @@ class TestProductKernels(unittest.TestCase):
         assert self.kernel.cross_cov_dict(self.inputs, self.inputs) == 50
 
     def test_gradient_respect_parameters(self):
-        expect(self.matern52).cov.once().and_return(5)
-        expect(self.task_kernel).cov.once().and_return(10)
-
-        expect(self.matern52).gradient_respect_parameters.once().and_return({
+        expect(self.matern52).cov_and_gradient_respect_parameters.once().and_return((5, {
             'scale': 2.0,
             'sigma2': 3.0
-        })
-        expect(self.task_kernel).gradient_respect_parameters.once().and_return({
+        }))
+        expect(self.task_kernel).cov_and_gradient_respect_parameters.once().and_return((10, {
             'lower_triang': -1.0
-        })
+        }))
 
         assert self.kernel.gradient_respect_parameters(self.inputs) == {MATERN52_NAME: {
             'scale': 20.0, 'sigma2': 30.0
@@ -174,6 +171,19 @@ class TestProductKernels(unittest.TestCase):
         for i in range(3):
             assert np.all(result[i + 2] == grad_kernel[TASKS_KERNEL_NAME][LOWER_TRIANG_NAME][i])
 
+    def test_evaluate_cov_and_grad_defined_by_params_respect_params(self):
+        params = [np.array([1.0, 5.0]), np.array([1.0, 5.0, 6.0])]
+        cov, gradient = ProductKernels.evaluate_cov_and_grad_defined_by_params_respect_params(
+            params, self.inputs_, [2, 2], [MATERN52_NAME, TASKS_KERNEL_NAME])
+
+        npt.assert_almost_equal(cov, ProductKernels.evaluate_cov_defined_by_params(
+            params, self.inputs_, [2, 2], [MATERN52_NAME, TASKS_KERNEL_NAME]))
+
+        grad = ProductKernels.evaluate_grad_defined_by_params_respect_params(
+            params, self.inputs_, [2, 2], [MATERN52_NAME, TASKS_KERNEL_NAME])
+        for i in xrange(5):
+            npt.assert_almost_equal(gradient[i], grad[i])
+
     def test_gradient_respect_parameters_finite_differences(self):
         inputs_1 = self.inputs_
         dh = np.array(5 * [0.00000001])
@@ -204,6 +214,21 @@ class TestProductKernels(unittest.TestCase):
         expect(self.kernel).cross_cov.once().and_return(0)
         assert self.kernel.cov(self.inputs) == 0
 
+    def test_cov_diagonal(self):
+        npt.assert_almost_equal(self.kernel_.cov_diagonal_dict(self.inputs_),
+                                np.diag(self.kernel_.cov_dict(self.inputs_)))
+
+        inputs = np.array([[5.0, 6.0, 0], [8.0, 9.0, 1], [1.0, 2.0, 1]])
+        npt.assert_almost_equal(self.kernel_.cov_diagonal(inputs),
+                                np.diag(self.kernel_.cov(inputs)))
+
+        params = [np.array([1.0, 5.0]), np.array([1.0, 5.0, 6.0])]
+        diagonal = ProductKernels.evaluate_cov_diagonal_defined_by_params(
+            params, self.inputs_, [2, 2], [MATERN52_NAME, TASKS_KERNEL_NAME])
+        kernel = ProductKernels.define_kernel_from_array(
+            [2, 2], params, [MATERN52_NAME, TASKS_KERNEL_NAME])
+        npt.assert_almost_equal(diagonal, np.diag(kernel.cov_dict(self.inputs_)))
+
     def test_cross_cov(self):
         inputs = np.array([[5.0, 0]])
         assert self.kernel.cross_cov(inputs, inputs) == \
@@ -332,6 +357,27 @@ class TestProductKernels(unittest.TestCase):
         kernel_.parameters[TASKS_KERNEL_NAME][LOWER_TRIANG_NAME].value = [3]
         assert ProductKernels.compare_kernels(kernel, kernel_) is False
 
+    def test_grad_and_hessian_respect_points(self):
+        points = np.array([[4.5, 7.5, 0], [1.0, 2.0, 1], [5.5, 6.0, 1]])
+        inputs = np.array([[5.0, 6.0, 0], [8.0, 9.0, 1]])
+        params = [np.array([1.0, 5.0]), np.array([1.0, 5.0, 6.0])]
+        args = ([2, 2], [MATERN52_NAME, TASKS_KERNEL_NAME])
+
+        gradient = ProductKernels.evaluate_grad_respect_points(params, points, inputs, *args)
+        hessian = ProductKernels.evaluate_hessian_respect_points(params, points, inputs, *args)
+
+        assert gradient.shape == (3, 2, 3)
+        assert hessian.shape == (3, 2, 3, 3)
+
+        for i in xrange(3):
+            point = points[i:i + 1, :]
+            npt.assert_almost_equal(
+                gradient[i], ProductKernels.evaluate_grad_respect_point(params, point, inputs,
+                                                                        *args))
+            npt.assert_almost_equal(
+                hessian[i], ProductKernels.evaluate_hessian_respect_point(params, point, inputs,
+                                                                          *args))
+
     def test_evaluate_hessian_respect_point(self):
         point = np.array([[4.5, 7.5, 0]])
         inputs = np.array([[5.0, 6.0, 0], [8.0, 9.0, 1]])
@@ -25,6 +25,14 @@ class TestScaledKernel(unittest.TestCase):
         self.matern52 = Matern52(self.dimension, self.length_scale)
         self.matern52 = ScaledKernel(self.dimension, self.matern52, self.sigma2)
 
+    def test_cov_diagonal(self):
+        inputs = np.array([[1.0, 0.0], [0.0, 1.0], [3.0, 2.0]])
+        npt.assert_almost_equal(self.matern52.cov_diagonal(inputs), 3.0 * np.ones(3))
+
+        diagonal = ScaledKernel.evaluate_cov_diagonal_defined_by_params(
+            np.array([1.0, 2.0, 5.0]), inputs, 2, *([MATERN52_NAME],))
+        npt.assert_almost_equal(diagonal, 5.0 * np.ones(3))
+
     def test_define_default_kernel(self):
         kernel = ScaledKernel.define_default_kernel(1, None, np.array([1.0, 1.0]), None,
                                                     *([MATERN52_NAME],))
@@ -78,6 +86,24 @@ class TestScaledKernel(unittest.TestCase):
         kernel = ScaledKernel.define_kernel_from_array(1, np.array([5.0, 1.0]), *([MATERN52_NAME],))
         assert np.all(result == kernel.grad_respect_point(np.array([[1]]), np.array([[4], [5]])))
 
+    def test_evaluate_grad_and_hessian_respect_points(self):
+        points = np.array([[4.5, 7.5], [1.0, 2.0]])
+        inputs = np.array([[5.0, 6.0], [8.0, 9.0], [1.0, 2.5]])
+        params = np.array([1.0, 5.0, 3.0])
+
+        gradient = ScaledKernel.evaluate_grad_respect_points(
+            params, points, inputs, 2, *([MATERN52_NAME],))
+        hessian = ScaledKernel.evaluate_hessian_respect_points(
+            params, points, inputs, 2, *([MATERN52_NAME],))
+
+        for i in xrange(2):
+            npt.assert_almost_equal(
+                gradient[i], ScaledKernel.evaluate_grad_respect_point(
+                    params, points[i:i + 1, :], inputs, 2, *([MATERN52_NAME],)))
+            npt.assert_almost_equal(
+                hessian[i], ScaledKernel.evaluate_hessian_respect_point(
+                    params, points[i:i + 1, :], inputs, 2, *([MATERN52_NAME],)))
+
     def test_evaluate_hessian_respect_point(self):
         point = np.array([[4.5, 7.5]])
         inputs = np.array([[5.0, 6.0], [8.0, 9.0]])
@@ -0,0 +1,65 @@
+from __future__ import absolute_import
+
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+
+from stratified_bayesian_optimization.kernels.swersky import Swk
+from stratified_bayesian_optimization.lib.finite_differences import FiniteDifferences
+
+
+class TestSwersky(unittest.TestCase):
+
+    def setUp(self):
+        self.params = np.array([2.0, 3.0])
+        self.kernel = Swk.define_kernel_from_array(1, self.params)
+        self.inputs = np.array([[1.0], [4.0], [10.0]])
+
+    def test_cross_cov(self):
+        inputs_2 = np.array([[2.0], [7.0]])
+        cov = self.kernel.cross_cov(self.inputs, inputs_2)
+
+        expected = np.zeros((3, 2))
+        for i in xrange(3):
+            for j in xrange(2):
+                expected[i, j] = (3.0 / (self.inputs[i, 0] + inputs_2[j, 0] + 3.0)) ** 2.0
+
+        npt.assert_almost_equal(cov, expected)
+        npt.assert_almost_equal(self.kernel.cov(self.inputs),
+                                self.kernel.cross_cov(self.inputs, self.inputs))
+
+    def test_evaluate_grad_defined_by_params_respect_params(self):
+        gradient = Swk.evaluate_grad_defined_by_params_respect_params(self.params, self.inputs, 1)
+
+        dh = 0.00000001
+        finite_diff = FiniteDifferences.forward_difference(
+            lambda params: Swk.evaluate_cov_defined_by_params(params, self.inputs, 1),
+            self.params, np.array([dh]))
+
+        for i in xrange(2):
+            npt.assert_almost_equal(finite_diff[i], gradient[i], decimal=5)
+
+    def test_evaluate_grad_respect_point(self):
+        point = np.array([[5.0]])
+        gradient = Swk.evaluate_grad_respect_point(self.params, point, self.inputs, 1)
+        assert gradient.shape == (3, 1)
+
+        dh = 0.00000001
+        finite_diff = FiniteDifferences.forward_difference(
+            lambda x: self.kernel.cross_cov(x.reshape((1, 1)), self.inputs)[0, :],
+            point[0, :], np.array([dh]))
+
+        npt.assert_almost_equal(finite_diff[0], gradient[:, 0], decimal=5)
+
+    def test_evaluate_hessian_respect_point(self):
+        point = np.array([[5.0]])
+        hessian = Swk.evaluate_hessian_respect_point(self.params, point, self.inputs, 1)
+        assert hessian.shape == (3, 1, 1)
+
+        dh = 0.000001
+        finite_diff = FiniteDifferences.forward_difference(
+            lambda x: self.kernel.grad_respect_point(x.reshape((1, 1)), self.inputs)[:, 0],
+            point[0, :], np.array([dh]))
+
+        npt.assert_almost_equal(finite_diff[0], hessian[:, 0, 0], decimal=5)
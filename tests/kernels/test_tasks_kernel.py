@@ -17,6 +17,7 @@ from stratified_bayesian_optimization.lib.constant import (
     LARGEST_NUMBER,
     TASKS_KERNEL_NAME,
     LOWER_TRIANG_NAME,
+    SAME_CORRELATION,
 )
 
 
@@ -78,6 +79,17 @@ class TestTasksKernel(unittest.TestCase):
         npt.assert_almost_equal(self.task_kernel.cross_cov(self.inputs, self.inputs),
                                 np.array([[np.exp(2.0)]]))
 
+    def test_cov_diagonal(self):
+        kernel = TasksKernel.define_kernel_from_array(3, np.array([0.1, 0.2, 0.3, -0.1, 0.2, 0.1]))
+        inputs = np.array([[2], [0], [1], [2]])
+        npt.assert_almost_equal(kernel.cov_diagonal(inputs), np.diag(kernel.cov(inputs)))
+
+        diagonal = TasksKernel.evaluate_cov_diagonal_defined_by_params(
+            np.array([0.0, 0.0]), inputs, 3, **{SAME_CORRELATION: True})
+        kernel = TasksKernel.define_kernel_from_array(3, np.array([0.0, 0.0]),
+                                                      same_correlation=True)
+        npt.assert_almost_equal(diagonal, np.diag(kernel.cov(inputs)))
+
     def test_gradient_respect_parameters(self):
         expect(GradientTasksKernel).gradient_respect_parameters.once().and_return(
             {0: np.array([[0]])})
@@ -130,6 +142,62 @@ class TestTasksKernel(unittest.TestCase):
         assert len(grad) == 1
         npt.assert_almost_equal(grad[0], np.array([[2.0 * np.exp(2.0)]]))
 
+    def test_compute_cov_matrix_several_tasks(self):
+        np.random.seed(1)
+        n_tasks = 4
+        params = np.random.normal(0, 1, n_tasks * (n_tasks + 1) / 2)
+        kernel = TasksKernel.define_kernel_from_array(n_tasks, params)
+        kernel.compute_cov_matrix()
+
+        L = np.zeros((n_tasks, n_tasks))
+        count = 0
+        for i in xrange(n_tasks):
+            for j in xrange(i + 1):
+                L[i, j] = np.exp(params[count + j])
+            count += i + 1
+
+        npt.assert_almost_equal(kernel.chol_base_cov_matrix, L)
+        npt.assert_almost_equal(kernel.base_cov_matrix, np.dot(L, L.transpose()))
+
+        inputs_1 = np.array([[3], [0], [2]])
+        inputs_2 = np.array([[1], [3]])
+        cov = kernel.cross_cov(inputs_1, inputs_2)
+        for i in xrange(3):
+            for j in xrange(2):
+                assert cov[i, j] == kernel.base_cov_matrix[inputs_1[i, 0], inputs_2[j, 0]]
+
+        kernel_same_cor = TasksKernel.define_kernel_from_array(
+            n_tasks, np.array([0.5, -1.0]), **{SAME_CORRELATION: True})
+        kernel_same_cor.compute_cov_matrix()
+        expected = np.exp(-1.0) * np.ones((n_tasks, n_tasks))
+        for i in xrange(n_tasks):
+            expected[i, i] = np.exp(0.5) + np.exp(-1.0) * (n_tasks - 1)
+        npt.assert_almost_equal(kernel_same_cor.base_cov_matrix, expected)
+
+    def test_gradient_respect_parameters_several_tasks(self):
+        np.random.seed(1)
+        n_tasks = 3
+        params = np.random.normal(0, 1, 6)
+        kernel = TasksKernel.define_kernel_from_array(n_tasks, params)
+        inputs = np.array([[0], [2], [1], [2]])
+
+        gradient = kernel.gradient_respect_parameters(inputs)[LOWER_TRIANG_NAME]
+        base_gradient = kernel.gradient_base_cov_matrix
+
+        dh = 0.00000001
+        finite_diff = FiniteDifferences.forward_difference(
+            lambda params: TasksKernel.evaluate_cov_defined_by_params(params, inputs, n_tasks),
+            params, np.array([dh]))
+
+        for i in xrange(6):
+            npt.assert_almost_equal(gradient[i], finite_diff[i], decimal=5)
+
+        kernel.gradient_respect_parameters(inputs)
+        assert kernel.gradient_base_cov_matrix is base_gradient
+
+        kernel.update_value_parameters(params + 1.0)
+        assert kernel.gradient_base_cov_matrix is None
+
     def test_evaluate_cov_defined_by_params(self):
         result = TasksKernel.evaluate_cov_defined_by_params(
             np.array([1.0, 2.0, 3.0]), self.inputs_, 2)
@@ -137,6 +205,21 @@ class TestTasksKernel(unittest.TestCase):
         kernel = TasksKernel.define_kernel_from_array(2, np.array([1.0, 2.0, 3.0]))
         assert np.all(result == kernel.cov(np.array(self.inputs_)))
 
+    def test_compiled_kernel(self):
+        params = np.array([1.0, 2.0, 3.0])
+        TasksKernel.evaluate_cov_defined_by_params(params, self.inputs_, 2)
+
+        kernel = TasksKernel.compiled_kernel(2, params, same_correlation=False)
+        assert kernel.base_cov_matrix is not None
+
+        kernel_same_correlation = TasksKernel.compiled_kernel(
+            2, np.array([1.0, 2.0]), same_correlation=True)
+        assert kernel_same_correlation is not kernel
+        npt.assert_almost_equal(
+            TasksKernel.evaluate_cov_defined_by_params(
+                np.array([1.0, 2.0]), self.inputs_, 2, **{SAME_CORRELATION: True}),
+            kernel_same_correlation.cov(self.inputs_))
+
     def test_evaluate_grad_defined_by_params_respect_params(self):
         result = TasksKernel.evaluate_grad_defined_by_params_respect_params(
             np.array([1.0, 2.0, 3.0]), self.inputs_, 2)
@@ -0,0 +1,88 @@
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+
+from stratified_bayesian_optimization.lib.affine_break_points import (
+    AffineBreakPointsPrep,
+    AffineBreakPoints,
+    upper_envelope,
+)
+
+
+class TestAffineBreakPoints(unittest.TestCase):
+
+    def test_affine_break_points(self):
+        a = np.array([0.0, 1.0, 0.0])
+        b = np.array([-1.0, 0.0, 1.0])
+        keep, c = AffineBreakPoints(a, b)
+        npt.assert_equal(keep, [0, 1, 2])
+        npt.assert_almost_equal(c, [-np.inf, -1.0, 1.0, np.inf])
+
+        a = np.array([0.0, -1.0, 0.0])
+        keep, c = AffineBreakPoints(a, b)
+        npt.assert_equal(keep, [0, 2])
+        npt.assert_almost_equal(c[keep + 1], [0.0, np.inf])
+
+        a = np.array([0.0, 0.0, 0.0])
+        keep, c = AffineBreakPoints(a, b)
+        npt.assert_equal(keep, [0, 2])
+
+        keep, c = AffineBreakPoints(np.array([2.0]), np.array([1.0]))
+        npt.assert_equal(keep, [0])
+        npt.assert_almost_equal(c, [-np.inf, np.inf])
+
+    def test_affine_break_points_prep(self):
+        a = np.array([1.0, 3.0, 2.0, -5.0, 0.0])
+        b = np.array([1.0, 1.0, 0.0, 2.0, -1.0])
+
+        a_, b_, keep = AffineBreakPointsPrep(a, b)
+        npt.assert_equal(b_, [-1.0, 0.0, 1.0, 2.0])
+        npt.assert_equal(a_, [0.0, 2.0, 3.0, -5.0])
+        npt.assert_equal(keep, [4, 2, 1, 3])
+
+    def test_upper_envelope(self):
+        np.random.seed(1)
+        n = 200
+        r = 5
+        a = np.random.normal(0, 1, n)
+        b = np.random.normal(0, 1, (n, r))
+        b[0: 10, 0] = b[10: 20, 0]
+
+        envelope = upper_envelope(a, b)
+
+        z = np.linspace(-20, 20, 20001)
+        for j in xrange(r):
+            values = a[:, np.newaxis] + b[:, j: j + 1] * z[np.newaxis, :]
+            lines = np.unique(np.argmax(values, axis=0))
+            npt.assert_equal(np.nonzero(envelope['envelope'][:, j])[0], np.sort(lines))
+
+            a_, b_, keep = AffineBreakPointsPrep(a, b[:, j])
+            keep1, c = AffineBreakPoints(a_, b_)
+            npt.assert_equal(np.sort(keep[keep1]), np.sort(lines))
+
+            index = envelope['columns'] == j
+            breakpoints = envelope['breakpoints'][index]
+            assert np.all(np.diff(breakpoints) > 0)
+            npt.assert_almost_equal(breakpoints, c[keep1[0: -1] + 1])
+
+            line_values = a[envelope['lines'][index]] + \
+                b[envelope['lines'][index], j] * breakpoints
+            next_values = a[envelope['next_lines'][index]] + \
+                b[envelope['next_lines'][index], j] * breakpoints
+            npt.assert_almost_equal(line_values, next_values)
+            npt.assert_almost_equal(
+                np.max(a[:, np.newaxis] + b[:, j: j + 1] * breakpoints[np.newaxis, :], axis=0),
+                line_values)
+
+    def test_upper_envelope_intercepts_matrix(self):
+        np.random.seed(2)
+        a = np.random.normal(0, 1, (30, 3))
+        b = np.random.normal(0, 1, (30, 3))
+
+        envelope = upper_envelope(a, b)
+        for j in xrange(3):
+            envelope_j = upper_envelope(a[:, j], b[:, j])
+            npt.assert_equal(envelope['envelope'][:, j], envelope_j['envelope'][:, 0])
+            npt.assert_almost_equal(envelope['breakpoints'][envelope['columns'] == j],
+                                    envelope_j['breakpoints'])
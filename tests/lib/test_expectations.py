@@ -12,6 +12,17 @@ from stratified_bayesian_optimization.lib.expectations import (
     gradient_uniform_finite,
     gradient_uniform_finite_resp_candidate,
     hessian_uniform_finite,
+    halton_sequence,
+    gamma_quadrature_rule,
+    gamma_expect,
+    gamma_expect_points,
+    gradient_gamma,
+    uniform_box_quadrature_rule,
+    hessian_uniform_box,
+    gradient_uniform_box_resp_candidate,
+    matern52_uniform_expect,
+    gradient_matern52_uniform_expect,
+    matern52_uniform_double_expect,
 )
 from stratified_bayesian_optimization.lib.finite_differences import FiniteDifferences
 from stratified_bayesian_optimization.lib.constant import (
@@ -20,6 +31,14 @@ from stratified_bayesian_optimization.lib.constant import (
     PRODUCT_KERNELS_SEPARABLE,
     UNIFORM_FINITE,
     TASKS,
+    GAMMA,
+    EXPONENTIAL,
+    QUADRATURE_RULE,
+    QMC_HALTON,
+    UNIFORM_BOX,
+    LOWER_BOUNDS,
+    UPPER_BOUNDS,
+    N_PANELS,
 )
 from stratified_bayesian_optimization.numerical_tools.bayesian_quadrature import BayesianQuadrature
 
@@ -98,3 +117,261 @@ class TestExpectations(unittest.TestCase):
 
         assert np.all(hessian[0, :] == hessian_[0])
         assert np.all(hessian[1, :] == hessian_[1])
+
+
+class TestGammaQuadrature(unittest.TestCase):
+
+    def test_halton_sequence(self):
+        sequence = halton_sequence(4, 2)
+        npt.assert_almost_equal(sequence[:, 0], [0.5, 0.25, 0.75, 0.125])
+        npt.assert_almost_equal(sequence[:, 1], [1.0 / 3.0, 2.0 / 3.0, 1.0 / 9.0, 4.0 / 9.0])
+
+    def test_gamma_quadrature_rule(self):
+        parameters_dist = {'a': [2.5], 'scale': [2.0]}
+        nodes, weights = gamma_quadrature_rule(parameters_dist, 1)
+
+        assert nodes.shape == (10, 1)
+        npt.assert_almost_equal(np.sum(weights), 1.0)
+        # The Gauss-Laguerre rule of order 10 is exact for polynomials of degree 19
+        npt.assert_almost_equal(np.dot(weights, nodes[:, 0]), 5.0)
+        npt.assert_almost_equal(np.dot(weights, nodes[:, 0] ** 3), 2.5 * 3.5 * 4.5 * 8.0)
+
+        nodes_2, weights_2 = gamma_quadrature_rule(parameters_dist, 1)
+        assert nodes_2 is nodes
+        assert weights_2 is weights
+
+        nodes, weights = gamma_quadrature_rule({'scale': [3.0], 'n_samples': 4}, 2)
+        assert nodes.shape == (16, 2)
+        npt.assert_almost_equal(np.dot(weights, nodes[:, 0] * nodes[:, 1]), 9.0)
+
+        parameters_dist = {'a': [2.5], 'scale': [2.0], QUADRATURE_RULE: QMC_HALTON,
+                           'n_samples': 2000}
+        nodes, weights = gamma_quadrature_rule(parameters_dist, 1)
+        assert nodes.shape == (2000, 1)
+        npt.assert_almost_equal(np.dot(weights, nodes[:, 0]), 5.0, decimal=2)
+
+        with self.assertRaises(ValueError):
+            gamma_quadrature_rule({'scale': [3.0], QUADRATURE_RULE: 'rule'}, 1)
+
+    def test_gamma_expect(self):
+        parameters_dist = {'a': [2.0], 'scale': [0.5]}
+        f = lambda x: np.array([[x[i, 0] + x[i, 1] ** 2] for i in xrange(x.shape[0])])
+
+        value = gamma_expect(f, np.array([[1.5]]), [0], [1], parameters_dist)
+        npt.assert_almost_equal(value, np.array([1.5 + 1.5]))
+        assert np.all(value == gamma_expect(f, np.array([[1.5]]), [0], [1], parameters_dist))
+
+        f = lambda x: np.outer(x[:, 1], x[:, 3])
+        value = gamma_expect(f, np.array([[1.5]]), [0], [1], parameters_dist, double=True)
+        npt.assert_almost_equal(value, 1.0)
+
+        value = gamma_expect_points(f, np.array([[1.5], [2.0], [3.0]]), [0], [1],
+                                    parameters_dist, max_evaluations=30, double=True)
+        npt.assert_almost_equal(value, np.ones(3))
+
+    def test_bayesian_quadrature_gamma(self):
+        np.random.seed(1)
+        points = np.random.uniform(0, 10, (10, 2))
+        training_data = {
+            "evaluations": list(np.sin(points[:, 0]) + points[:, 1]),
+            "points": points,
+            "var_noise": []}
+        gp = GPFittingGaussian([MATERN52_NAME], training_data, [2], kernel_values=[2.0, 3.0],
+                               mean_value=[0.0], var_noise_value=[0.01],
+                               bounds_domain=[[0, 10], [0, 10]])
+        parameters_kernel = gp.kernel.hypers_values_as_array
+
+        bq = BayesianQuadrature(gp, [0], GAMMA, {'a': [2.0], 'scale': [1.5]})
+        bq_qmc = BayesianQuadrature(gp, [0], GAMMA, {'a': [2.0], 'scale': [1.5],
+                                                     QUADRATURE_RULE: QMC_HALTON,
+                                                     'n_samples': 3000})
+        point = np.array([[4.0]])
+
+        value = bq.evaluate_quadrature_cross_cov(point, points, parameters_kernel)
+        assert np.all(value == bq.evaluate_quadrature_cross_cov(point, points, parameters_kernel))
+        npt.assert_almost_equal(
+            value, bq_qmc.evaluate_quadrature_cross_cov(point, points, parameters_kernel),
+            decimal=3)
+
+        gradient = gradient_gamma(gp.evaluate_grad_cross_cov_respect_point, point, [0], [1],
+                                  points, parameters_kernel, bq.parameters_distribution)
+        dh = 0.0000001
+        finite_diff = FiniteDifferences.forward_difference(
+            lambda x: bq.evaluate_quadrature_cross_cov(x.reshape((1, 1)), points,
+                                                       parameters_kernel),
+            point[0, :], np.array([dh]))
+        npt.assert_almost_equal(gradient[0, :], finite_diff[0], decimal=5)
+
+        bq_exponential = BayesianQuadrature(gp, [0], EXPONENTIAL, {'scale': [1.5]})
+        bq_gamma = BayesianQuadrature(gp, [0], GAMMA, {'a': [1.0], 'scale': [1.5]})
+        npt.assert_almost_equal(
+            bq_exponential.evaluate_quadrature_cross_cov(point, points, parameters_kernel),
+            bq_gamma.evaluate_quadrature_cross_cov(point, points, parameters_kernel))
+
+
+class TestUniformBoxQuadrature(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(1)
+        self.points = np.random.uniform(0, 10, (10, 2))
+        training_data = {
+            "evaluations": list(np.sin(self.points[:, 0]) + self.points[:, 1]),
+            "points": self.points,
+            "var_noise": []}
+        self.gp = GPFittingGaussian([MATERN52_NAME], training_data, [2], kernel_values=[2.0, 3.0],
+                                    mean_value=[0.0], var_noise_value=[0.01],
+                                    bounds_domain=[[0, 10], [2, 5]])
+        self.parameters_kernel = self.gp.kernel.hypers_values_as_array
+        self.bq = BayesianQuadrature(self.gp, [0], UNIFORM_BOX)
+
+    def test_uniform_box_quadrature_rule(self):
+        parameters_dist = {LOWER_BOUNDS: [1.0, -1.0], UPPER_BOUNDS: [3.0, 0.0], 'n_samples': 3,
+                           N_PANELS: 1}
+        nodes, weights = uniform_box_quadrature_rule(parameters_dist, 2)
+
+        assert nodes.shape == (9, 2)
+        npt.assert_almost_equal(np.sum(weights), 1.0)
+        # The Gauss-Legendre rule of order 3 is exact for polynomials of degree 5
+        npt.assert_almost_equal(np.dot(weights, nodes[:, 0] ** 5 * nodes[:, 1] ** 2),
+                                (3.0 ** 6 - 1.0) / 12.0 / 3.0)
+
+        assert uniform_box_quadrature_rule(parameters_dist, 2)[0] is nodes
+
+        del parameters_dist[N_PANELS]
+        nodes, weights = uniform_box_quadrature_rule(parameters_dist, 2)
+        assert nodes.shape == (144, 2)
+        assert np.all(nodes[:, 0] > 1.0) and np.all(nodes[:, 0] < 3.0)
+        npt.assert_almost_equal(np.dot(weights, nodes[:, 0] ** 5 * nodes[:, 1] ** 2),
+                                (3.0 ** 6 - 1.0) / 12.0 / 3.0)
+
+    def test_matern52_uniform_expect(self):
+        points = np.array([-1.0, 2.5, 3.0, 4.2, 7.0])
+        w = np.linspace(2, 5, 200001)
+        kernel = lambda t: (1.0 + np.sqrt(5.0) * np.abs(t) / 0.3 + 5.0 * t ** 2 / 0.27) * \
+            np.exp(-np.sqrt(5.0) * np.abs(t) / 0.3)
+
+        expected = np.trapz(kernel(w[:, np.newaxis] - points[np.newaxis, :]), w, axis=0) / 3.0
+        npt.assert_almost_equal(matern52_uniform_expect(points, 2.0, 5.0, 0.3), expected)
+
+        dh = 0.0000001
+        finite_diff = (matern52_uniform_expect(points + dh, 2.0, 5.0, 0.3) -
+                       matern52_uniform_expect(points, 2.0, 5.0, 0.3)) / dh
+        npt.assert_almost_equal(gradient_matern52_uniform_expect(points, 2.0, 5.0, 0.3),
+                                finite_diff, decimal=5)
+
+        expected = np.trapz(matern52_uniform_expect(w, 2.0, 5.0, 0.3), w) / 3.0
+        npt.assert_almost_equal(matern52_uniform_double_expect(2.0, 5.0, 0.3), expected)
+
+    def test_separable_matern52(self):
+        points = np.concatenate([np.random.randint(0, 3, (10, 1)),
+                                 np.random.uniform(2, 5, (10, 1))], axis=1)
+        training_data = {
+            "evaluations": list(points[:, 0] + np.sin(points[:, 1])),
+            "points": points,
+            "var_noise": []}
+        gp = GPFittingGaussian([PRODUCT_KERNELS_SEPARABLE, TASKS_KERNEL_NAME, MATERN52_NAME],
+                               training_data, [2, 3, 1], kernel_values=[0.1] * 6 + [0.3],
+                               bounds_domain=[[0, 1, 2], [2, 5]])
+        parameters_kernel = gp.kernel.hypers_values_as_array
+
+        bq = BayesianQuadrature(gp, [0], UNIFORM_BOX)
+        assert bq.closed_form_w
+        assert not self.bq.closed_form_w
+
+        bq_rule = BayesianQuadrature(gp, [0], UNIFORM_BOX, {N_PANELS: 50})
+        bq_rule.closed_form_w = False
+
+        point = np.array([[1.0]])
+        npt.assert_almost_equal(
+            bq.evaluate_quadrature_cross_cov(point, points, parameters_kernel),
+            bq_rule.evaluate_quadrature_cross_cov(point, points, parameters_kernel))
+        npt.assert_almost_equal(
+            bq.evaluate_quadrature_cross_cov_points(points[:, 0:1], points, parameters_kernel),
+            bq_rule.evaluate_quadrature_cross_cov_points(points[:, 0:1], points,
+                                                         parameters_kernel))
+        npt.assert_almost_equal(bq.evaluate_quadrate_cov(point, parameters_kernel),
+                                bq_rule.evaluate_quadrate_cov(point, parameters_kernel))
+        npt.assert_almost_equal(
+            bq.evaluate_quadrate_cov_points(points[:, 0:1], parameters_kernel),
+            bq_rule.evaluate_quadrate_cov_points(points[:, 0:1], parameters_kernel))
+        npt.assert_almost_equal(
+            bq.evaluate_grad_quadrature_cross_cov(point, points, parameters_kernel),
+            bq_rule.evaluate_grad_quadrature_cross_cov(point, points, parameters_kernel))
+        npt.assert_almost_equal(
+            bq.evaluate_hessian_cross_cov(point, points, parameters_kernel),
+            bq_rule.evaluate_hessian_cross_cov(point, points, parameters_kernel))
+
+        candidate = np.array([[1.0, 3.3]])
+        npt.assert_almost_equal(
+            bq.evaluate_grad_quadrature_cross_cov_resp_candidate(candidate, points[:, 0:1],
+                                                                 parameters_kernel),
+            bq_rule.evaluate_grad_quadrature_cross_cov_resp_candidate(candidate, points[:, 0:1],
+                                                                      parameters_kernel))
+
+    def test_invalid_uniform_box(self):
+        with self.assertRaises(ValueError):
+            BayesianQuadrature(self.gp, [0], UNIFORM_BOX, {LOWER_BOUNDS: [2]})
+        with self.assertRaises(ValueError):
+            BayesianQuadrature(self.gp, [0], UNIFORM_BOX, {LOWER_BOUNDS: [2], UPPER_BOUNDS: [1]})
+        with self.assertRaises(ValueError):
+            BayesianQuadrature(self.gp, [0], UNIFORM_BOX,
+                               {LOWER_BOUNDS: [2, 0], UPPER_BOUNDS: [5, 1]})
+
+        self.gp.bounds = None
+        with self.assertRaises(ValueError):
+            BayesianQuadrature(self.gp, [0], UNIFORM_BOX)
+        bq = BayesianQuadrature(self.gp, [0], UNIFORM_BOX, {LOWER_BOUNDS: [2], UPPER_BOUNDS: [5]})
+        assert bq.parameters_distribution == {LOWER_BOUNDS: [2], UPPER_BOUNDS: [5]}
+
+    def test_quadratures(self):
+        assert self.bq.parameters_distribution == {LOWER_BOUNDS: [2], UPPER_BOUNDS: [5]}
+        point = np.array([[4.0]])
+        w = np.linspace(2, 5, 20001)
+        new_points = np.concatenate([4.0 * np.ones((len(w), 1)), w.reshape((len(w), 1))], axis=1)
+
+        value = self.bq.evaluate_quadrature_cross_cov(point, self.points, self.parameters_kernel)
+        expected = np.trapz(
+            self.gp.evaluate_cross_cov(new_points, self.points, self.parameters_kernel), w,
+            axis=0) / 3.0
+        npt.assert_almost_equal(value, expected, decimal=5)
+
+        bq = BayesianQuadrature(self.gp, [0], UNIFORM_BOX, {'n_samples': 40})
+        npt.assert_almost_equal(self.bq.evaluate_quadrate_cov(point, self.parameters_kernel),
+                                bq.evaluate_quadrate_cov(point, self.parameters_kernel),
+                                decimal=5)
+
+    def test_gradient_and_hessian(self):
+        point = np.array([[4.0]])
+        gradient = self.bq.evaluate_grad_quadrature_cross_cov(point, self.points,
+                                                              self.parameters_kernel)
+        hessian = self.bq.evaluate_hessian_cross_cov(point, self.points, self.parameters_kernel)
+
+        dh = 0.0000001
+        finite_diff = FiniteDifferences.forward_difference(
+            lambda x: self.bq.evaluate_quadrature_cross_cov(
+                x.reshape((1, 1)), self.points, self.parameters_kernel),
+            point[0, :], np.array([dh]))
+        npt.assert_almost_equal(gradient[0, :], finite_diff[0], decimal=5)
+
+        finite_diff = FiniteDifferences.forward_difference(
+            lambda x: self.bq.evaluate_grad_quadrature_cross_cov(
+                x.reshape((1, 1)), self.points, self.parameters_kernel),
+            point[0, :], np.array([dh]))
+        npt.assert_almost_equal(hessian[:, 0, 0], finite_diff[0][0, :], decimal=4)
+        npt.assert_almost_equal(
+            hessian_uniform_box(self.gp.evaluate_hessian_cross_cov_respect_point, point, [0], [1],
+                                self.points, self.parameters_kernel,
+                                self.bq.parameters_distribution),
+            hessian)
+
+        candidate = np.array([[3.0, 2.5]])
+        gradient = gradient_uniform_box_resp_candidate(
+            self.gp.evaluate_grad_cross_cov_respect_point, candidate, [0], [1],
+            self.points[:, 0:1], self.parameters_kernel, self.bq.parameters_distribution)
+        for j in xrange(2):
+            finite_diff = FiniteDifferences.forward_difference(
+                lambda x: self.bq.evaluate_quadrature_cross_cov(
+                    self.points[j:j + 1, 0:1], x.reshape((1, 2)), self.parameters_kernel),
+                candidate[0, :], np.array([dh]))
+            for i in xrange(2):
+                npt.assert_almost_equal(gradient[i, j], finite_diff[i][0], decimal=5)
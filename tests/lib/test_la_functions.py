@@ -8,6 +8,9 @@ from stratified_bayesian_optimization.lib.la_functions import (
     cholesky,
     linalg,
     cho_solve,
+    cholesky_append,
+    log_determinant,
+    KroneckerFactorization,
 )
 from stratified_bayesian_optimization.kernels.matern52 import Matern52
 
@@ -54,3 +57,52 @@ class TestLAFunctions(unittest.TestCase):
         y = np.linspace(1.0, 100.0, self.cov.shape[0])
         sol = cho_solve(chol, y)
         npt.assert_almost_equal(np.dot(self.cov, sol), y)
+
+    def test_cholesky_append(self):
+        chol = cholesky(self.cov[0: 45, 0: 45])
+        new_chol = cholesky_append(chol, self.cov[0: 45, 45:], self.cov[45:, 45:])
+        npt.assert_almost_equal(new_chol, cholesky(self.cov))
+
+    def test_log_determinant(self):
+        chol = cholesky(self.cov)
+        npt.assert_almost_equal(log_determinant(chol), np.linalg.slogdet(self.cov)[1])
+
+    def test_kronecker_factorization(self):
+        np.random.seed(1)
+        cov_1 = self.cov[0: 6, 0: 6]
+        matrix = np.random.normal(0, 1, (3, 3))
+        cov_2 = np.dot(matrix, matrix.transpose())
+        positions = np.random.permutation(18)
+
+        factorization = KroneckerFactorization(cov_1, cov_2, 0.5, positions)
+
+        grid_cov = np.kron(cov_1, cov_2) + 0.5 * np.identity(18)
+        cov = grid_cov[np.ix_(positions, positions)]
+
+        y = np.random.normal(0, 1, 18)
+        npt.assert_almost_equal(factorization.cho_solve(y), np.linalg.solve(cov, y))
+        npt.assert_almost_equal(cho_solve(factorization, y), np.linalg.solve(cov, y))
+
+        z = np.random.normal(0, 1, (18, 2))
+        npt.assert_almost_equal(factorization.cho_solve(z), np.linalg.solve(cov, z))
+
+        npt.assert_almost_equal(log_determinant(factorization), np.linalg.slogdet(cov)[1])
+
+        # Some entries of the grid are missing
+        positions = positions[0: 13]
+        factorization = KroneckerFactorization(cov_1, cov_2, 0.5, positions)
+        cov = grid_cov[np.ix_(positions, positions)]
+
+        npt.assert_almost_equal(factorization.cho_solve(y[0: 13]),
+                                np.linalg.solve(cov, y[0: 13]))
+        npt.assert_almost_equal(factorization.cho_solve(z[0: 13, :]),
+                                np.linalg.solve(cov, z[0: 13, :]))
+        npt.assert_almost_equal(log_determinant(factorization), np.linalg.slogdet(cov)[1])
+
+        matrix_1 = np.random.normal(0, 1, (6, 6))
+        matrix_2 = np.random.normal(0, 1, (3, 3))
+        matrix = np.kron(matrix_1, matrix_2)[np.ix_(positions, positions)]
+        npt.assert_almost_equal(factorization.trace_solve(matrix_1, matrix_2),
+                                np.trace(np.linalg.solve(cov, matrix)))
+        npt.assert_almost_equal(factorization.quadratic_form(y[0: 13], matrix_1, matrix_2),
+                                np.dot(y[0: 13], np.dot(matrix, y[0: 13])))
@@ -0,0 +1,78 @@
+import unittest
+
+from mock import patch
+
+import numpy as np
+
+from stratified_bayesian_optimization.lib.lru_cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = LRUCache(max_size=3, max_memory=1000)
+
+    def test_get(self):
+        self.cache['a'] = 1
+        assert self.cache.get('a') == 1
+        assert self.cache.get('b') is None
+        assert self.cache.get('b', 2) == 2
+        assert self.cache['a'] == 1
+
+        with self.assertRaises(KeyError):
+            self.cache['b']
+
+        assert self.cache.hits == 2
+        assert self.cache.misses == 3
+
+    def test_size_bound(self):
+        self.cache['a'] = 1
+        self.cache['b'] = 2
+        self.cache['c'] = 3
+        self.cache.get('a')
+        self.cache['d'] = 4
+
+        assert self.cache.keys() == ['c', 'a', 'd']
+        assert 'b' not in self.cache
+        assert len(self.cache) == 3
+
+    def test_memory_bound(self):
+        self.cache['a'] = np.zeros(50)
+        self.cache['b'] = (np.zeros(50), np.zeros(10))
+        assert self.cache.memory == 880
+
+        self.cache['c'] = {'solve': np.zeros(20)}
+        assert self.cache.keys() == ['b', 'c']
+        assert self.cache.memory == 640
+
+        self.cache['d'] = np.zeros(200)
+        assert self.cache.keys() == ['d']
+        assert self.cache.memory == 1600
+
+        del self.cache['d']
+        assert self.cache.memory == 0
+
+    def test_clear(self):
+        self.cache['a'] = np.zeros(10)
+        self.cache.get('a')
+        self.cache.clear()
+
+        assert len(self.cache) == 0
+        assert self.cache.statistics == {'hits': 1, 'misses': 0, 'size': 0, 'memory': 0}
+
+    def test_total_memory_bound(self):
+        cache = LRUCache()
+        self.cache['a'] = np.zeros(10)
+
+        cache['a'] = np.zeros(10000)
+        cache['b'] = np.zeros(10000)
+        total_memory = LRUCache.total_memory()
+
+        with patch.object(LRUCache, 'max_total_memory', total_memory + 8000):
+            self.cache['b'] = np.zeros(10)
+            assert self.cache.keys() == ['a', 'b']
+            cache['c'] = np.zeros(10000)
+
+        assert cache.keys() == ['b', 'c']
+        assert self.cache.keys() == ['a', 'b']
+        assert LRUCache.total_memory() == total_memory + 80
@@ -2,7 +2,12 @@ from __future__ import absolute_import
 
 import unittest
 
-from mock import Mock
+from mock import Mock, patch
+
+import gc
+import os
+
+import numpy as np
 
 from stratified_bayesian_optimization.lib.parallel import Parallel
 
@@ -15,6 +20,31 @@ def g(x):
     return x[1]
 
 
+def h(x, counter):
+    counter.value += x
+    return counter.value, os.getpid()
+
+
+def random_number(x):
+    return np.random.rand()
+
+
+class Counter(object):
+    def __init__(self, value):
+        self.value = value
+
+
+class Model(object):
+    def __init__(self, parallel):
+        self.parallel = parallel
+
+    @Parallel.persistent_pool
+    def optimize(self, fail=False):
+        if fail:
+            raise ValueError
+        return Parallel._pool is not None
+
+
 class TestParallel(unittest.TestCase):
 
     def test_run_function_different_arguments_parallel(self):
@@ -33,3 +63,147 @@ class TestParallel(unittest.TestCase):
 
         assert -1 == Parallel.run_function_different_arguments_parallel(
             mock, arguments, all_success=False, signal=mock)
+
+    def test_persistent_pool(self):
+        arguments = {0: 1, 1: 2, 2: 3, 3: 4}
+        counter = Counter(10)
+
+        Parallel.start_pool(processes=2, objects=[counter])
+        reference = Parallel._broadcast[Parallel._tokens[counter]][2]
+
+        result = Parallel.run_function_different_arguments_parallel(
+            h, arguments, False, None, True, 0, counter)
+
+        # The workers keep their copy of the counter between jobs
+        values = sorted(result[i][0] - 10 for i in arguments)
+        assert values[-1] >= 5
+        assert counter.value == 10
+        assert Parallel._broadcast[Parallel._tokens[counter]][2] is reference
+
+        result_2 = Parallel.run_function_different_arguments_parallel(
+            h, arguments, False, None, True, 0, counter)
+        pids = set(result[i][1] for i in arguments) | set(result_2[i][1] for i in arguments)
+        assert len(pids) <= 2
+        assert os.getpid() not in pids
+
+        # The counter is only sent again when its version changes
+        counter.value = 100
+        Parallel.run_function_different_arguments_parallel(
+            h, arguments, False, None, True, 0, counter)
+        assert Parallel._broadcast[Parallel._tokens[counter]][2] is reference
+
+        Parallel.update_version(counter)
+        result = Parallel.run_function_different_arguments_parallel(
+            h, arguments, False, None, True, 0, counter)
+        assert min(result[i][0] for i in arguments) > 100
+
+        new_reference = Parallel._broadcast[Parallel._tokens[counter]][2]
+        assert new_reference.version != reference.version
+        assert reference.shared_file.file_ is None
+
+        with self.assertRaises(Exception):
+            Parallel.run_function_different_arguments_parallel(g, arguments, all_success=True)
+
+        Parallel.close_pool()
+        assert Parallel._pool is None
+        assert new_reference.shared_file.file_ is None
+
+        mock = Mock(side_effect=KeyboardInterrupt)
+        Parallel.start_pool(processes=2)
+        assert -1 == Parallel.run_function_different_arguments_parallel(
+            mock, arguments, all_success=False, signal=mock)
+        assert Parallel._pool is None
+
+    def test_broadcast_arguments(self):
+        arguments = {0: 1, 1: 2}
+        counter = Counter(10)
+        counter_2 = Counter(20)
+
+        Parallel.start_pool(processes=2)
+        try:
+            Parallel.run_function_different_arguments_parallel(
+                h, arguments, False, None, True, 0, counter)
+            reference = Parallel._broadcast[Parallel._tokens[counter]][2]
+
+            token = Parallel._tokens[counter]
+
+            # The files of the objects that aren't in the call are kept while they're alive
+            Parallel.run_function_different_arguments_parallel(
+                h, arguments, False, None, True, 0, counter_2)
+            assert Parallel._broadcast[token][2] is reference
+            assert reference.shared_file.file_ is not None
+
+            del counter
+            gc.collect()
+            assert token not in Parallel._broadcast
+            assert reference.shared_file.file_ is None
+
+            # The tokens aren't reused by new objects
+            counter_3 = Counter(30)
+            Parallel.run_function_different_arguments_parallel(
+                h, arguments, False, None, True, 0, counter_3)
+            assert Parallel._tokens[counter_3] != token
+        finally:
+            Parallel.close_pool()
+
+    def test_broadcast_shared_memory_full(self):
+        arguments = {0: 1, 1: 2, 2: 3, 3: 4}
+        counter = Counter(10)
+
+        Parallel.start_pool(processes=2)
+        try:
+            with patch('stratified_bayesian_optimization.lib.parallel.write_shared_file',
+                       return_value=None):
+                result = Parallel.run_function_different_arguments_parallel(
+                    h, arguments, False, None, True, 0, counter)
+            reference = Parallel._broadcast[Parallel._tokens[counter]][2]
+        finally:
+            Parallel.close_pool()
+
+        assert reference.shared_file is None
+        assert reference.data is not None
+        assert min(result[i][0] for i in arguments) > 10
+        assert counter.value == 10
+
+    def test_state_version(self):
+        counter = Counter(10)
+        counter.counter = Counter(20)
+        counter.function = f
+
+        version = Parallel._state_version(counter)
+        assert Parallel._state_version(counter) == version
+
+        # The version changes when an object in the attributes is updated
+        Parallel.update_version(counter.counter)
+        version_2 = Parallel._state_version(counter)
+        assert version_2 != version
+
+        Parallel.update_version(counter)
+        assert Parallel._state_version(counter) not in [version, version_2]
+
+    def test_persistent_pool_seeds(self):
+        arguments = {0: 1, 1: 2, 2: 3, 3: 4}
+
+        Parallel.start_pool(processes=2)
+        try:
+            np.random.seed(1)
+            result = Parallel.run_function_different_arguments_parallel(
+                random_number, arguments)
+            np.random.seed(1)
+            result_2 = Parallel.run_function_different_arguments_parallel(
+                random_number, arguments)
+        finally:
+            Parallel.close_pool()
+
+        assert result == result_2
+        assert len(set(result.values())) == len(arguments)
+
+    def test_persistent_pool_decorator(self):
+        assert Model(True).optimize()
+        assert Parallel._pool is None
+
+        assert not Model(False).optimize()
+
+        with self.assertRaises(ValueError):
+            Model(True).optimize(fail=True)
+        assert Parallel._pool is None
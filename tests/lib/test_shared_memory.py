@@ -0,0 +1,181 @@
+from __future__ import absolute_import
+
+import unittest
+
+from mock import patch
+
+import cPickle
+from cStringIO import StringIO
+import errno
+import gc
+import mmap
+import multiprocessing as mp
+import os
+import signal
+import tempfile
+
+import numpy as np
+import numpy.testing as npt
+
+from stratified_bayesian_optimization.lib.shared_memory import (
+    SharedArrays,
+    SharedFile,
+    write_shared_file,
+)
+from stratified_bayesian_optimization.lib.parallel import Parallel
+
+
+def dumps(obj):
+    file_ = StringIO()
+    pickler = cPickle.Pickler(file_, cPickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = SharedArrays.persistent_id
+    pickler.dump(obj)
+    return file_.getvalue()
+
+
+def loads(data):
+    unpickler = cPickle.Unpickler(StringIO(data))
+    unpickler.persistent_load = SharedArrays.persistent_loader()
+    return unpickler.load()
+
+
+def is_mapped(array):
+    while isinstance(array, np.ndarray):
+        array = array.base
+    return isinstance(array, mmap.mmap)
+
+
+def sum_data(index, model):
+    return np.sum(model.data['points'][index, :]), is_mapped(model.data['points'])
+
+
+def write_and_kill(points):
+    Model(points)
+    SharedArrays.persistent_id(points)
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+def shared_files():
+    directory = tempfile.gettempdir()
+    if os.path.isdir('/dev/shm'):
+        directory = '/dev/shm'
+    return set(name for name in os.listdir(directory) if name.startswith('sbo_'))
+
+
+class Model(object):
+    def __init__(self, points):
+        self.data = SharedArrays.publish({'points': points, 'evaluations': np.zeros(3)})
+
+
+class TestSharedArrays(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(1)
+        self.points = np.random.normal(0, 1, (10000, 2))
+
+    def tearDown(self):
+        SharedArrays.clear()
+
+    def test_publish(self):
+        model = Model(self.points)
+
+        assert id(self.points) in SharedArrays._arrays
+        assert id(model.data['evaluations']) not in SharedArrays._arrays
+        assert SharedArrays.persistent_id(np.zeros(3)) is None
+
+        shared_file, dtype, shape = SharedArrays.persistent_id(self.points)
+        assert isinstance(shared_file, SharedFile)
+        assert shape == (10000, 2)
+
+        # The published arrays are read-only
+        assert not self.points.flags.writeable
+        with self.assertRaises(ValueError):
+            self.points[0, 0] = 100.0
+
+        data = dumps([model, model.data['points']])
+        assert len(data) < self.points.nbytes / 10
+
+        model_2, points = loads(data)
+        assert model_2.data['points'] is points
+        assert is_mapped(points)
+        npt.assert_almost_equal(points, self.points)
+
+        # The arrays are mapped read-only
+        assert not points.flags.writeable
+        with self.assertRaises(ValueError):
+            points[0, 0] = 100.0
+
+    def test_shared_file(self):
+        Model(self.points)
+        shared_file = SharedArrays.persistent_id(self.points)[0]
+
+        # The array is only written once
+        assert SharedArrays.persistent_id(self.points)[0] is shared_file
+
+        # The file doesn't have a name, so it's removed when it's closed
+        if os.path.isdir('/proc'):
+            assert shared_file.name is None
+            assert shared_file.filename.startswith('/proc/')
+        with shared_file.open() as f:
+            assert os.fstat(f.fileno()).st_size == self.points.nbytes
+
+        # Only the process that wrote the file can close it
+        shared_file_2 = cPickle.loads(cPickle.dumps(shared_file, cPickle.HIGHEST_PROTOCOL))
+        shared_file_2.close()
+        assert shared_file.file_ is not None
+
+        key = id(self.points)
+        self.points = None
+        gc.collect()
+        assert key not in SharedArrays._arrays
+        assert shared_file.file_ is None
+        with self.assertRaises(IOError):
+            shared_file_2.open()
+
+    def test_killed_process(self):
+        files = shared_files()
+
+        process = mp.Process(target=write_and_kill, args=(self.points, ))
+        process.start()
+        process.join()
+
+        assert process.exitcode == -signal.SIGKILL
+        assert shared_files() <= files
+
+    def test_shared_memory_full(self):
+        def write(file_):
+            raise IOError(errno.ENOSPC, 'No space left on device')
+
+        assert write_shared_file('sbo_test_', write) is None
+
+        Model(self.points)
+        with patch('stratified_bayesian_optimization.lib.shared_memory.write_shared_file',
+                   return_value=None):
+            assert SharedArrays.persistent_id(self.points) is None
+            points = loads(dumps(self.points))
+
+        assert not is_mapped(points)
+        npt.assert_almost_equal(points, self.points)
+
+    def test_parallel(self):
+        model = Model(self.points)
+        arguments = {0: 0, 1: 1, 2: 2}
+
+        # The one-shot pool pickles the arguments
+        result = Parallel.run_function_different_arguments_parallel(
+            sum_data, arguments, True, None, True, 0, model)
+
+        for i in xrange(3):
+            npt.assert_almost_equal(result[i][0], np.sum(self.points[i, :]))
+            assert not result[i][1]
+
+        Parallel.start_pool(processes=2)
+        result = Parallel.run_function_different_arguments_parallel(
+            sum_data, arguments, True, None, True, 0, model)
+        shared_file = SharedArrays.persistent_id(self.points)[0]
+        Parallel.close_pool()
+
+        for i in xrange(3):
+            npt.assert_almost_equal(result[i][0], np.sum(self.points[i, :]))
+            assert result[i][1]
+        assert shared_file.file_ is None
@@ -5,6 +5,7 @@ from mock import create_autospec
 from doubles import expect
 
 import numpy as np
+import numpy.testing as npt
 
 from stratified_bayesian_optimization.lib.util import (
     convert_dictionary_gradient_to_simple_dictionary,
@@ -19,6 +20,7 @@ from stratified_bayesian_optimization.lib.util import (
     reduce_dimension_vector,
     separate_vector,
     combine_vectors,
+    screen_points,
 )
 from stratified_bayesian_optimization.models.gp_fitting_gaussian import GPFittingGaussian
 from stratified_bayesian_optimization.services.training_data import TrainingDataService
@@ -101,6 +103,17 @@ class TestUtil(unittest.TestCase):
 
         assert np.all(combine_vectors(a, b, indexes) == np.array([1, 2, 5]))
 
+    def test_screen_points(self):
+        points = np.arange(14.0).reshape((7, 2))
+        sizes = []
+
+        def f(x):
+            sizes.append(x.shape[0])
+            return np.sum(x, axis=1)
+
+        npt.assert_almost_equal(screen_points(f, points, chunk_size=3), np.sum(points, axis=1))
+        assert sizes == [3, 3, 1]
+
     def test_separate_vector(self):
         a = np.array([1, 2, 5])
         indexes = [0, 2]
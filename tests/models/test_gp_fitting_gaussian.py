@@ -5,8 +5,11 @@ import numpy.testing as npt
 
 from copy import deepcopy
 
+from mock import patch
+
 from stratified_bayesian_optimization.models.gp_fitting_gaussian import (
     GPFittingGaussian,
+    GradientGPFittingGaussian,
     ValidationGPModel,
 )
 from stratified_bayesian_optimization.lib.constant import (
@@ -22,6 +25,11 @@ from stratified_bayesian_optimization.lib.finite_differences import FiniteDiffer
 from stratified_bayesian_optimization.lib.sample_functions import SampleFunctions
 from stratified_bayesian_optimization.kernels.matern52 import Matern52
 from stratified_bayesian_optimization.kernels.scaled_kernel import ScaledKernel
+from stratified_bayesian_optimization.lib.la_functions import (
+    cho_solve,
+    KroneckerFactorization,
+)
+from stratified_bayesian_optimization.lib.parallel import Parallel
 
 
 class TestGPFittingGaussian(unittest.TestCase):
@@ -138,6 +146,35 @@ class TestGPFittingGaussian(unittest.TestCase):
 
         assert self.gp_noisy.training_data == self.training_data_noisy
 
+    def test_add_points_evaluations_cached_data(self):
+        gp = self.gp_gaussian
+        var_noise = gp.var_noise.value[0]
+        mean = gp.mean.value[0]
+        parameters_kernel = gp.kernel.hypers_values_as_array
+
+        gp.log_likelihood(var_noise, mean, parameters_kernel)
+        gp.clean_cache()
+        assert len(gp.cache_chol_cov) == 1
+
+        gp.add_points_evaluations(np.array([[80.0], [251.3]]), np.array([0.5, -0.3]))
+        assert len(gp.cache_chol_cov) == 1
+        assert len(gp.cache_sol_chol_y_unbiased) == 1
+
+        chol, cov = gp._chol_cov_including_noise(var_noise, parameters_kernel)
+        chol_2, cov_2 = gp._chol_cov_including_noise(var_noise, parameters_kernel, cache=False)
+        npt.assert_almost_equal(chol, chol_2)
+        npt.assert_almost_equal(cov, cov_2)
+
+        solve = gp._get_cached_data((var_noise, tuple(parameters_kernel), mean),
+                                    SOL_CHOL_Y_UNBIASED)
+        npt.assert_almost_equal(np.dot(cov_2, solve), gp.data['evaluations'] - mean,
+                                decimal=4)
+
+        gp.data['points'] = gp.data['points'][0: 50, :]
+        gp.data['evaluations'] = gp.data['evaluations'][0: 50]
+        gp.clean_cache()
+        assert len(gp.cache_chol_cov) == 0
+
     def test_convert_from_list_to_numpy(self):
         data = GPFittingGaussian.convert_from_list_to_numpy(self.training_data_noisy)
         assert np.all(data['points'] == np.array([[42.2851784656]]))
@@ -200,6 +237,8 @@ class TestGPFittingGaussian(unittest.TestCase):
             'same_correlation': False,
             'start_point_sampler': st_sampler,
             'samples_parameters': dict['samples_parameters'],
+            'n_chains': 1,
+            'start_points_chains': [],
         }
 
         gp = GPFittingGaussian([MATERN52_NAME], self.training_data, dimensions=[1])
@@ -253,11 +292,19 @@ class TestGPFittingGaussian(unittest.TestCase):
         self.gp._updated_cached_data((3, 5), 0, CHOL_COV)
         assert self.gp.cache_chol_cov[(3, 5)] == 0
         assert self.gp.cache_chol_cov.keys() == [(3, 5)]
-        assert self.gp.cache_sol_chol_y_unbiased == {}
+        assert self.gp.cache_sol_chol_y_unbiased.keys() == [(3, 5, 1)]
         assert self.gp._get_cached_data((3, 5), CHOL_COV) == 0
 
         assert self.gp._get_cached_data((3, 0), CHOL_COV) is False
 
+        self.gp._updated_cached_data((4, 5), 1, CHOL_COV)
+        assert self.gp._get_cached_data((3, 5), CHOL_COV) == 0
+        assert self.gp._get_cached_data((4, 5), CHOL_COV) == 1
+
+        self.gp._updated_cached_data((4, 6), 2, CHOL_COV, clear_cache=True)
+        assert self.gp.cache_chol_cov.keys() == [(4, 6)]
+        assert len(self.gp.cache_sol_chol_y_unbiased) == 0
+
     def test_chol_cov_including_noise(self):
         chol, cov = self.simple_gp._chol_cov_including_noise(1.0, np.array([1.0, 1.0]))
         assert cov == np.array([[2.0]])
@@ -331,6 +378,22 @@ class TestGPFittingGaussian(unittest.TestCase):
         assert grad_2[1] == grad['mean']
         assert np.all(grad_2[2:] == grad['kernel_params'])
 
+    def test_compute_gradient_llh_given_matrix(self):
+        gp = self.complex_gp_2
+        parameters_kernel = np.array([5.0, 1.0, -5.5, 10.0])
+        chol, cov = gp._chol_cov_including_noise(1.82, parameters_kernel)
+        solve = cho_solve(chol, gp.data['evaluations'] - 123.1)
+        grad_cov = gp.evaluate_grad_cov(parameters_kernel, gp.data['points'])
+
+        matrix = GradientGPFittingGaussian.compute_matrix_gradient_llh(
+            cho_solve(chol, np.identity(3)), solve)
+
+        for i in xrange(len(parameters_kernel)):
+            npt.assert_almost_equal(
+                GradientGPFittingGaussian.compute_gradient_llh_given_matrix(grad_cov[i], matrix),
+                GradientGPFittingGaussian.compute_gradient_llh_given_grad_cov(
+                    grad_cov[i], chol, solve))
+
     def test_mle_parameters(self):
         # Results compared with the ones given by GPy
 
@@ -553,6 +616,29 @@ class TestGPFittingGaussian(unittest.TestCase):
         npt.assert_almost_equal(mean, np.array([0.30891226, 0.60256237]))
         npt.assert_almost_equal(cov, np.array([[0.48844879, 0.16799927], [0.16799927, 0.16536313]]))
 
+    def test_compute_posterior_parameters_samples(self):
+        points = np.array([[1.0], [100.0], [432.5]])
+        parameters = np.array([[0.5, 1.0, 100.0, 1.0], [0.1, 2.0, 50.0, 2.0],
+                               [1.0, -1.0, 30.0, 0.5]])
+
+        post = self.gp_gaussian.compute_posterior_parameters_samples(points, parameters)
+        means = post['mean']
+        variances = post['var']
+
+        assert means.shape == (3, 3)
+        assert variances.shape == (3, 3)
+
+        for index, parameter in enumerate(parameters):
+            z = self.gp_gaussian.compute_posterior_parameters(
+                points, parameter[0], parameter[1], parameter[2:])
+            npt.assert_almost_equal(means[index, :], z['mean'])
+            npt.assert_almost_equal(variances[index, :], np.diag(z['cov']))
+
+        post = self.gp_gaussian.compute_posterior_parameters_samples(
+            points, parameters, only_mean=True)
+        npt.assert_almost_equal(post['mean'], means)
+        assert post['var'] is None
+
     def test_sample_new_observations(self):
         np.random.seed(5)
         n_points = 10
@@ -671,6 +757,68 @@ class TestGPFittingGaussian(unittest.TestCase):
                                                               start=np.array([-1]))
         assert result['success_proportion'] == -1
 
+    def test_cross_validation_mle_parameters_closed_form(self):
+        type_kernel = [MATERN52_NAME]
+
+        np.random.seed(5)
+        n_points = 10
+        normal_noise = np.random.normal(0, 0.01, n_points)
+        points = np.linspace(0, 100, n_points)
+        points = points.reshape([n_points, 1])
+
+        kernel = Matern52.define_kernel_from_array(1, np.array([100.0]))
+        function = SampleFunctions.sample_from_gp(points, kernel)
+        function = function[0, :]
+        evaluations = function + normal_noise
+
+        training_data = {
+            "evaluations": evaluations,
+            "points": points,
+            "var_noise": np.array(n_points * [0.01**2])}
+
+        dimensions = [1]
+        problem_name = 'a'
+
+        result = \
+            ValidationGPModel.cross_validation_mle_parameters(type_kernel, training_data,
+                                                              dimensions, problem_name,
+                                                              bounds_domain=[[0, 100]],
+                                                              start=np.array([0.01**2, 0.0, 100.0]),
+                                                              closed_form=True)
+        assert np.all(result['y_eval'] == evaluations)
+        assert result['n_data'] == n_points
+        assert result['number_correctly_fitted_models'] == n_points
+        assert result['success_proportion'] >= 0.9
+
+        posteriors = ValidationGPModel.leave_one_out_closed_form(
+            type_kernel, training_data, dimensions, problem_name, bounds_domain=[[0, 100]],
+            start=np.array([0.01**2, 0.0, 100.0]))
+
+        gp = GPFittingGaussian(type_kernel, training_data, dimensions, bounds_domain=[[0, 100]])
+        gp = gp.fit_gp_regression(start=np.array([0.01**2, 0.0, 100.0]))
+        parameters = gp.get_value_parameters_model
+
+        for i in xrange(n_points):
+            selector = [x for x in range(n_points) if x != i]
+            data = {
+                "evaluations": evaluations[selector],
+                "points": points[selector, :],
+                "var_noise": training_data['var_noise'][selector]}
+            gp_fold = GPFittingGaussian(type_kernel, data, dimensions, bounds_domain=[[0, 100]])
+            posterior = gp_fold.compute_posterior_parameters(
+                points[[i], :], parameters[0], parameters[1], parameters[2:])
+
+            npt.assert_almost_equal(posteriors[i][0], posterior['mean'][0], decimal=5)
+            npt.assert_almost_equal(posteriors[i][1], posterior['cov'][0, 0], decimal=5)
+
+        result = \
+            ValidationGPModel.cross_validation_mle_parameters(type_kernel, training_data,
+                                                              dimensions, problem_name,
+                                                              bounds_domain=[[0, 100]],
+                                                              start=np.array([-1]),
+                                                              closed_form=True)
+        assert result['success_proportion'] == -1
+
     def test_check_value_within_ci(self):
         assert ValidationGPModel.check_value_within_ci(0, 1.0, 1.0)
         assert not ValidationGPModel.check_value_within_ci(3.1, 1.0, 1.0)
@@ -767,3 +915,281 @@ class TestGPFittingGaussian(unittest.TestCase):
 
         npt.assert_almost_equal(grad['cov'], finite_diff[0])
 
+
+class TestKroneckerGPFittingGaussian(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(1)
+        points = np.random.uniform(0, 100, (6, 1))
+        points = np.array([[point[0], task] for point in points for task in xrange(3)])
+        self.points = points[np.random.permutation(points.shape[0]), :]
+        self.evaluations = np.sin(self.points[:, 0] / 10.0) + self.points[:, 1]
+
+        self.kwargs = {
+            'kernel_values': [20.0, 0.1, 0.2, 0.3, -0.1, 0.2, 0.1],
+            'mean_value': [0.5],
+            'var_noise_value': [0.01],
+        }
+        self.type_kernel = [PRODUCT_KERNELS_SEPARABLE, MATERN52_NAME, TASKS_KERNEL_NAME]
+
+    def define_gp(self, points, var_noise=None):
+        training_data = {
+            'evaluations': list(np.sin(points[:, 0] / 10.0) + points[:, 1]),
+            'points': points,
+            'var_noise': [] if var_noise is None else var_noise,
+        }
+        return GPFittingGaussian(
+            self.type_kernel, training_data, [2, 1, 3], bounds_domain=[[0, 100], [0, 1, 2]],
+            type_bounds=[0, 1], noise=True, define_samplers=False, **self.kwargs)
+
+    def test_kronecker_factorization(self):
+        gp = self.define_gp(self.points)
+        parameters = gp.get_value_parameters_model
+        chol = gp._chol_cov_including_noise(parameters[0], parameters[2:])[0]
+        assert isinstance(chol, KroneckerFactorization)
+
+        cov = gp.evaluate_cov(self.points, parameters[2:]) + \
+            parameters[0] * np.identity(self.points.shape[0])
+        y_unbiased = self.evaluations - parameters[1]
+
+        llh = gp.log_likelihood(parameters[0], parameters[1], parameters[2:])
+        expected_llh = -0.5 * np.linalg.slogdet(cov)[1] - \
+            0.5 * np.dot(y_unbiased, np.linalg.solve(cov, y_unbiased))
+        npt.assert_almost_equal(llh, expected_llh)
+
+        points = np.array([[3.0, 1.0], [50.0, 2.0]])
+        post = gp.compute_posterior_parameters(points)
+        cross_cov = gp.evaluate_cross_cov(points, self.points, parameters[2:])
+        npt.assert_almost_equal(
+            post['mean'], parameters[1] + np.dot(cross_cov, np.linalg.solve(cov, y_unbiased)))
+        npt.assert_almost_equal(
+            post['cov'], gp.evaluate_cov(points, parameters[2:]) -
+            np.dot(cross_cov, np.linalg.solve(cov, cross_cov.transpose())))
+
+        # After adding a point, the grid has missing entries
+        gp.add_points_evaluations(np.array([[3.0, 1.0]]), np.array([1.0]))
+        chol = gp._chol_cov_including_noise(parameters[0], parameters[2:])[0]
+        assert isinstance(chol, KroneckerFactorization)
+        assert len(chol.missing) == 2
+
+        points = gp.data['points']
+        cov = gp.evaluate_cov(points, parameters[2:]) + \
+            parameters[0] * np.identity(points.shape[0])
+        y_unbiased = gp.data['evaluations'] - parameters[1]
+        llh = gp.log_likelihood(parameters[0], parameters[1], parameters[2:])
+        expected_llh = -0.5 * np.linalg.slogdet(cov)[1] - \
+            0.5 * np.dot(y_unbiased, np.linalg.solve(cov, y_unbiased))
+        npt.assert_almost_equal(llh, expected_llh)
+
+    def test_grad_log_likelihood_kronecker(self):
+        for points in [self.points, self.points[1:, :]]:
+            gp = self.define_gp(points)
+            parameters = gp.get_value_parameters_model
+            grad = gp.grad_log_likelihood_dict(parameters[0], parameters[1], parameters[2:])
+
+            cov_kernel, grad_cov = gp.evaluate_cov_and_grad_cov(parameters[2:], points)
+            inverse_cov = np.linalg.inv(cov_kernel + parameters[0] * np.identity(len(points)))
+            solve = np.dot(inverse_cov, gp.data['evaluations'] - parameters[1])
+            matrix = np.outer(solve, solve) - inverse_cov
+
+            for i in xrange(len(parameters[2:])):
+                npt.assert_almost_equal(grad['kernel_params'][i],
+                                        0.5 * np.sum(matrix * grad_cov[i]))
+            npt.assert_almost_equal(grad['var_noise'], 0.5 * np.trace(matrix))
+            npt.assert_almost_equal(grad['mean'], np.sum(solve))
+
+    def test_compute_posterior_parameters_only_variance(self):
+        gp = self.define_gp(self.points[1:, :])
+        points = np.array([[3.0, 1.0], [50.0, 2.0], [70.0, 0.0]])
+
+        parameters = gp.get_value_parameters_model
+        npt.assert_almost_equal(gp.evaluate_cov_diagonal(points, parameters[2:]),
+                                np.diag(gp.evaluate_cov(points, parameters[2:])))
+
+        post = gp.compute_posterior_parameters(points)
+        post_var = gp.compute_posterior_parameters(points, only_variance=True)
+
+        assert 'cov' not in post_var
+        npt.assert_almost_equal(post_var['mean'], post['mean'])
+        npt.assert_almost_equal(post_var['var'], np.diag(post['cov']))
+
+    def test_evaluate_cov_and_grad_cov(self):
+        gp = self.define_gp(self.points[1:, :])
+        parameters = gp.get_value_parameters_model
+        points = gp.data['points']
+
+        cov, grad_cov = gp.evaluate_cov_and_grad_cov(parameters[2:], points)
+        npt.assert_almost_equal(cov, gp.evaluate_cov(points, parameters[2:]))
+
+        expected_grad = gp.evaluate_grad_cov(parameters[2:], points)
+        for i in xrange(len(parameters[2:])):
+            npt.assert_almost_equal(grad_cov[i], expected_grad[i])
+
+        grad = gp.grad_log_likelihood(parameters[0], parameters[1], parameters[2:])
+        dh = 0.0000001
+        finite_diff = FiniteDifferences.forward_difference(
+            lambda params: gp.log_likelihood(params[0], params[1], params[2:]),
+            parameters, np.array([dh]))
+        for i in xrange(len(parameters)):
+            npt.assert_almost_equal(finite_diff[i], grad[i], decimal=3)
+
+    def test_evaluate_grad_and_hessian_cross_cov_respect_points(self):
+        gp = self.define_gp(self.points)
+        parameters = gp.get_value_parameters_model
+        points = np.array([[3.0, 1.0], [50.0, 2.0], [70.0, 0.0]])
+
+        grad = gp.evaluate_grad_cross_cov_respect_points(points, self.points, parameters[2:])
+        hessian = gp.evaluate_hessian_cross_cov_respect_points(points, self.points,
+                                                               parameters[2:])
+
+        assert grad.shape == (3, self.points.shape[0], 2)
+        assert hessian.shape == (3, self.points.shape[0], 2, 2)
+
+        for i in xrange(3):
+            npt.assert_almost_equal(grad[i], gp.evaluate_grad_cross_cov_respect_point(
+                points[i:i + 1, :], self.points, parameters[2:]))
+            npt.assert_almost_equal(hessian[i], gp.evaluate_hessian_cross_cov_respect_point(
+                points[i:i + 1, :], self.points, parameters[2:]))
+
+    def test_dense_fallback(self):
+        gp = self.define_gp(self.points[1:, :])
+        parameters = gp.get_value_parameters_model
+        chol = gp._chol_cov_including_noise(parameters[0], parameters[2:])[0]
+        assert isinstance(chol, KroneckerFactorization)
+
+        # Duplicated pairs
+        gp = self.define_gp(np.concatenate([self.points, self.points[0:1, :]]))
+        chol = gp._chol_cov_including_noise(parameters[0], parameters[2:])[0]
+        assert isinstance(chol, np.ndarray)
+
+        # More than KRONECKER_MAX_MISSING_FRACTION of the grid is missing
+        gp = self.define_gp(self.points[0: 8, :])
+        assert gp._kronecker_layout(gp.data['points']) is None
+        gp = self.define_gp(self.points[3:, :])
+        assert gp._kronecker_layout(gp.data['points']) is None
+        chol = gp._chol_cov_including_noise(parameters[0], parameters[2:])[0]
+        assert isinstance(chol, np.ndarray)
+
+        var_noise = list(np.linspace(0.1, 0.2, self.points.shape[0]))
+        gp = self.define_gp(self.points, var_noise=var_noise)
+        chol = gp._chol_cov_including_noise(parameters[0], parameters[2:])[0]
+        assert isinstance(chol, np.ndarray)
+
+        var_noise = list(0.1 * np.ones(self.points.shape[0]))
+        gp = self.define_gp(self.points, var_noise=var_noise)
+        chol = gp._chol_cov_including_noise(parameters[0], parameters[2:])[0]
+        assert isinstance(chol, KroneckerFactorization)
+
+        cov = gp.evaluate_cov(self.points, parameters[2:]) + \
+            (parameters[0] + 0.1) * np.identity(self.points.shape[0])
+        npt.assert_almost_equal(chol.log_determinant(), np.linalg.slogdet(cov)[1])
+
+
+class TestChainsGPFittingGaussian(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(5)
+        points = np.linspace(0, 100, 15).reshape((15, 1))
+        evaluations = np.sin(points[:, 0] / 10.0) + np.random.normal(0, 0.1, 15)
+        self.training_data = {
+            'evaluations': list(evaluations),
+            'points': points,
+            'var_noise': [],
+        }
+
+        self.gp = GPFittingGaussian(
+            [SCALED_KERNEL, MATERN52_NAME], self.training_data, [1], bounds_domain=[[0, 100]],
+            n_burning=4, n_chains=3, random_seed=1)
+
+    def test_set_samplers(self):
+        assert len(self.gp.start_points_chains) == 3
+        assert len(self.gp.samples_parameters) == 1
+        npt.assert_almost_equal(self.gp.start_point_sampler, self.gp.start_points_chains[0])
+        npt.assert_almost_equal(self.gp.samples_parameters[0], self.gp.start_points_chains[0])
+
+    def test_sample_parameters(self):
+        start_points = self.gp.start_points_chains
+
+        samples = self.gp.sample_parameters(8)
+        assert len(samples) == 8
+        assert len(self.gp.samples_parameters) == 9
+
+        assert len(self.gp.start_points_chains) == 3
+        for point, start in zip(self.gp.start_points_chains, start_points):
+            assert not np.all(point == start)
+
+        self.gp.chains_diagnostics = {}
+        self.gp.sample_parameters(8)
+        assert self.gp.chains_diagnostics == {}
+
+        with patch('stratified_bayesian_optimization.models.gp_fitting_gaussian.logger') as \
+                mock_logger:
+            self.gp.sample_parameters(12)
+            diagnostics = mock_logger.info.call_args_list[-1][0][0]
+        assert self.gp.chains_diagnostics['r_hat'].shape == (4,)
+        assert self.gp.chains_diagnostics['ess'].shape == (4,)
+        assert sorted(diagnostics.keys()) == sorted(
+            [parameter.name for parameter in self.gp.get_parameters_model])
+        npt.assert_almost_equal(diagnostics[self.gp.mean.name]['r_hat'],
+                                self.gp.chains_diagnostics['r_hat'][1])
+
+        model = GPFittingGaussian.deserialize(self.gp.serialize())
+        npt.assert_almost_equal(model.chains_diagnostics['ess'],
+                                self.gp.chains_diagnostics['ess'])
+
+        start = self.gp.samples_parameters[-1]
+        sample = self.gp.sample_parameters(1, start_point=start, random_seed=1)[0]
+        sample_2 = self.gp._sample_chain(1, start, random_seed=1)[0]
+        npt.assert_almost_equal(sample, sample_2)
+
+    def test_sample_parameters_few_samples(self):
+        start_points = [point.copy() for point in self.gp.start_points_chains]
+        n_samples = len(self.gp.samples_parameters)
+
+        with patch.object(Parallel, 'run_function_different_arguments_parallel') as mock_parallel:
+            samples = self.gp.sample_parameters(1)
+            assert not mock_parallel.called
+
+        assert len(samples) == 1
+        assert len(self.gp.samples_parameters) == n_samples + 1
+        npt.assert_almost_equal(self.gp.start_points_chains[0], samples[0])
+        npt.assert_almost_equal(self.gp.start_points_chains[1], start_points[1])
+
+        samples = self.gp.sample_parameters(2)
+        assert len(self.gp.samples_parameters) == n_samples + 3
+        npt.assert_almost_equal(self.gp.start_points_chains[1], samples[0])
+        npt.assert_almost_equal(self.gp.start_points_chains[2], samples[1])
+        assert self.gp.next_chain == 3
+
+    def test_sample_chains_in_worker(self):
+        with patch('stratified_bayesian_optimization.models.gp_fitting_gaussian.multiprocessing.'
+                   'current_process') as mock_process:
+            mock_process.return_value.daemon = True
+            with patch.object(Parallel, 'run_function_different_arguments_parallel',
+                              wraps=Parallel.run_function_different_arguments_parallel) as \
+                    mock_parallel:
+                samples = self.gp.sample_parameters(3)
+                assert mock_parallel.call_args[0][4] is False
+
+        assert len(samples) == 3
+
+    def test_sample_chains(self):
+        np.random.seed(1)
+        chains = self.gp.sample_chains(2, parallel=False)
+        assert len(chains) == 3
+        assert len(chains[0]) == 2
+        for chain, point in zip(chains, self.gp.start_points_chains):
+            npt.assert_almost_equal(chain[-1], point)
+
+    def test_serialize(self):
+        self.gp.start_new_chain()
+        assert len(self.gp.samples_parameters) == 1
+
+        model = self.gp.serialize()
+        assert model['n_chains'] == 3
+        assert len(model['start_points_chains']) == 3
+
+        gp = GPFittingGaussian.deserialize(model)
+        assert gp.n_chains == 3
+        for point, point_2 in zip(gp.start_points_chains, self.gp.start_points_chains):
+            npt.assert_almost_equal(point, point_2)
@@ -0,0 +1,156 @@
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+
+from stratified_bayesian_optimization.lib.constant import (
+    MATERN52_NAME,
+    ITERATIVE_GP_FITTING_GAUSSIAN,
+    UNIFORM_FINITE,
+    TASKS,
+    PRODUCT_KERNELS_SEPARABLE,
+    TASKS_KERNEL_NAME,
+)
+from stratified_bayesian_optimization.kernels.matern52 import Matern52
+from stratified_bayesian_optimization.lib.sample_functions import SampleFunctions
+from stratified_bayesian_optimization.models.gp_fitting_gaussian import GPFittingGaussian
+from stratified_bayesian_optimization.models.iterative_gp_fitting_gaussian import (
+    IterativeGPFittingGaussian,
+    ConjugateGradientFactorization,
+)
+from stratified_bayesian_optimization.numerical_tools.bayesian_quadrature import BayesianQuadrature
+from stratified_bayesian_optimization.services.gp_fitting import GPFittingService
+
+
+class TestIterativeGPFittingGaussian(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(5)
+        n_points = 30
+        self.points = np.linspace(0, 100, n_points).reshape([n_points, 1])
+        kernel = Matern52.define_kernel_from_array(1, np.array([20.0]))
+        function = SampleFunctions.sample_from_gp(self.points, kernel)[0, :]
+        self.evaluations = function + np.random.normal(0, 0.1, n_points)
+
+        self.training_data = {
+            "evaluations": list(self.evaluations),
+            "points": self.points,
+            "var_noise": []}
+
+        self.parameters = np.array([0.1 ** 2, 0.5, 20.0])
+
+        self.gp = GPFittingGaussian(
+            [MATERN52_NAME], self.training_data, [1], bounds_domain=[[0, 100]],
+            kernel_values=[20.0], mean_value=[0.5], var_noise_value=[0.1 ** 2], noise=True,
+            define_samplers=False)
+        self.iterative_gp = IterativeGPFittingGaussian(
+            [MATERN52_NAME], self.training_data, [1], bounds_domain=[[0, 100]],
+            kernel_values=[20.0], mean_value=[0.5], var_noise_value=[0.1 ** 2], noise=True,
+            define_samplers=False, n_probe_vectors=2000, lanczos_iterations=30, block_size=7)
+
+    def test_name_model(self):
+        assert self.iterative_gp.name_model == ITERATIVE_GP_FITTING_GAUSSIAN
+        assert GPFittingService._model_map[ITERATIVE_GP_FITTING_GAUSSIAN] == \
+            IterativeGPFittingGaussian
+
+        model = self.iterative_gp.serialize()
+        assert model['n_probe_vectors'] == 2000
+        assert model['block_size'] == 7
+        assert model['name_model'] == ITERATIVE_GP_FITTING_GAUSSIAN
+
+        gp = IterativeGPFittingGaussian.deserialize(model)
+        assert gp.n_probe_vectors == 2000
+        assert gp.lanczos_iterations == 30
+
+    def test_conjugate_gradient_factorization(self):
+        params = self.parameters[2:]
+        noise = self.parameters[0] * np.ones(self.points.shape[0])
+        factorization = ConjugateGradientFactorization(
+            self.gp, params, self.points, noise, n_probe_vectors=2000, block_size=4)
+        cov = self.gp.evaluate_cov(self.points, params) + np.diag(noise)
+
+        z = np.random.normal(0, 1, (self.points.shape[0], 3))
+        npt.assert_almost_equal(factorization.matvec(z), np.dot(cov, z))
+
+        npt.assert_almost_equal(factorization.cho_solve(z), np.linalg.solve(cov, z), decimal=5)
+        npt.assert_almost_equal(factorization.cho_solve(z[:, 0]), np.linalg.solve(cov, z[:, 0]),
+                                decimal=5)
+
+        log_det = np.linalg.slogdet(cov)[1]
+        npt.assert_almost_equal(factorization.log_determinant() / log_det, 1.0, decimal=2)
+
+    def test_log_likelihood(self):
+        llh = self.iterative_gp.log_likelihood(self.parameters[0], self.parameters[1],
+                                               self.parameters[2:])
+        llh_exact = self.gp.log_likelihood(self.parameters[0], self.parameters[1],
+                                           self.parameters[2:])
+        npt.assert_almost_equal(llh / llh_exact, 1.0, decimal=2)
+
+    def test_grad_log_likelihood(self):
+        grad = self.iterative_gp.grad_log_likelihood(self.parameters[0], self.parameters[1],
+                                                     self.parameters[2:])
+        grad_exact = self.gp.grad_log_likelihood(self.parameters[0], self.parameters[1],
+                                                 self.parameters[2:])
+
+        npt.assert_almost_equal(grad[1], grad_exact[1], decimal=5)
+        for i in [0, 2]:
+            scale = max(1.0, np.abs(grad_exact[i]))
+            npt.assert_almost_equal(grad[i] / scale, grad_exact[i] / scale, decimal=1)
+
+    def test_compute_posterior_parameters(self):
+        points = np.array([[1.5], [50.3], [99.0]])
+
+        post = self.iterative_gp.compute_posterior_parameters(points)
+        post_exact = self.gp.compute_posterior_parameters(points)
+
+        npt.assert_almost_equal(post['mean'], post_exact['mean'], decimal=5)
+        npt.assert_almost_equal(post['cov'], post_exact['cov'], decimal=5)
+
+    def test_add_points_evaluations(self):
+        self.iterative_gp.log_likelihood(self.parameters[0], self.parameters[1],
+                                         self.parameters[2:])
+        self.iterative_gp.add_points_evaluations(np.array([[33.3]]), np.array([1.0]))
+
+        assert self.iterative_gp.data['points'].shape[0] == 31
+        self.gp.add_points_evaluations(np.array([[33.3]]), np.array([1.0]))
+
+        point = np.array([[40.0]])
+        post = self.iterative_gp.compute_posterior_parameters(point)
+        post_exact = self.gp.compute_posterior_parameters(point)
+        npt.assert_almost_equal(post['mean'], post_exact['mean'], decimal=5)
+
+    def test_bayesian_quadrature(self):
+        np.random.seed(5)
+        n_points = 20
+        points = np.linspace(0, 100, n_points).reshape([n_points, 1])
+        tasks = np.random.randint(2, size=(n_points, 1))
+        points = np.concatenate((points, tasks), axis=1)
+        evaluations = np.sin(points[:, 0] / 10.0) + points[:, 1]
+
+        training_data = {
+            'evaluations': list(evaluations),
+            'points': points,
+            "var_noise": [],
+        }
+
+        kwargs = {
+            'kernel_values': [20.0, 0.0, 0.0, 0.0],
+            'mean_value': [0.0],
+            'var_noise_value': [0.01],
+        }
+        gp = GPFittingGaussian(
+            [PRODUCT_KERNELS_SEPARABLE, MATERN52_NAME, TASKS_KERNEL_NAME], training_data,
+            [2, 1, 2], bounds_domain=[[0, 100], [0, 1]], type_bounds=[0, 1], **kwargs)
+        iterative_gp = IterativeGPFittingGaussian(
+            [PRODUCT_KERNELS_SEPARABLE, MATERN52_NAME, TASKS_KERNEL_NAME], training_data,
+            [2, 1, 2], bounds_domain=[[0, 100], [0, 1]], type_bounds=[0, 1], **kwargs)
+
+        bq = BayesianQuadrature(gp, [0], UNIFORM_FINITE, {TASKS: 2})
+        iterative_bq = BayesianQuadrature(iterative_gp, [0], UNIFORM_FINITE, {TASKS: 2})
+
+        point = np.array([[52.1]])
+        post = bq.compute_posterior_parameters(point)
+        iterative_post = iterative_bq.compute_posterior_parameters(point)
+
+        npt.assert_almost_equal(iterative_post['mean'], post['mean'], decimal=5)
+        npt.assert_almost_equal(iterative_post['cov'], post['cov'], decimal=5)
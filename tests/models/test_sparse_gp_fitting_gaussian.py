@@ -0,0 +1,278 @@
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+
+from mock import patch
+
+from scipy.stats import multivariate_normal
+
+from stratified_bayesian_optimization.lib.constant import (
+    MATERN52_NAME,
+    SPARSE_GP_FITTING_GAUSSIAN,
+    UNIFORM_FINITE,
+    TASKS,
+    PRODUCT_KERNELS_SEPARABLE,
+    TASKS_KERNEL_NAME,
+)
+from stratified_bayesian_optimization.kernels.matern52 import Matern52
+from stratified_bayesian_optimization.lib.sample_functions import SampleFunctions
+from stratified_bayesian_optimization.lib.finite_differences import FiniteDifferences
+from stratified_bayesian_optimization.lib.la_functions import (
+    cho_solve,
+    posterior_cov_solve,
+)
+from stratified_bayesian_optimization.models.gp_fitting_gaussian import GPFittingGaussian
+from stratified_bayesian_optimization.models.sparse_gp_fitting_gaussian import (
+    SparseGPFittingGaussian,
+    SparseFactorization,
+)
+from stratified_bayesian_optimization.numerical_tools.bayesian_quadrature import BayesianQuadrature
+from stratified_bayesian_optimization.services.gp_fitting import GPFittingService
+
+
+class TestSparseGPFittingGaussian(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(5)
+        n_points = 30
+        self.points = np.linspace(0, 100, n_points).reshape([n_points, 1])
+        kernel = Matern52.define_kernel_from_array(1, np.array([20.0]))
+        function = SampleFunctions.sample_from_gp(self.points, kernel)[0, :]
+        self.evaluations = function + np.random.normal(0, 0.1, n_points)
+
+        self.training_data = {
+            "evaluations": list(self.evaluations),
+            "points": self.points,
+            "var_noise": []}
+
+        self.parameters = np.array([0.1 ** 2, 0.5, 20.0])
+
+        self.gp = GPFittingGaussian(
+            [MATERN52_NAME], self.training_data, [1], bounds_domain=[[0, 100]],
+            kernel_values=[20.0], mean_value=[0.5], var_noise_value=[0.1 ** 2], noise=True,
+            define_samplers=False)
+        self.sparse_gp = SparseGPFittingGaussian(
+            [MATERN52_NAME], self.training_data, [1], bounds_domain=[[0, 100]],
+            kernel_values=[20.0], mean_value=[0.5], var_noise_value=[0.1 ** 2], noise=True,
+            define_samplers=False, n_inducing_points=10)
+        self.full_gp = SparseGPFittingGaussian(
+            [MATERN52_NAME], self.training_data, [1], bounds_domain=[[0, 100]],
+            kernel_values=[20.0], mean_value=[0.5], var_noise_value=[0.1 ** 2], noise=True,
+            define_samplers=False, n_inducing_points=30)
+
+    def dtc_cov(self, parameters):
+        indexes = self.sparse_gp.get_inducing_indexes(self.points.shape[0])
+        inducing_points = self.points[indexes, :]
+        cross_cov = self.gp.evaluate_cross_cov(inducing_points, self.points, parameters[2:])
+        cov_inducing = self.gp.evaluate_cov(inducing_points, parameters[2:])
+        cov = np.dot(cross_cov.transpose(), np.linalg.solve(cov_inducing, cross_cov))
+        return cov + parameters[0] * np.identity(self.points.shape[0])
+
+    def test_name_model(self):
+        assert self.sparse_gp.name_model == SPARSE_GP_FITTING_GAUSSIAN
+        assert GPFittingService._model_map[SPARSE_GP_FITTING_GAUSSIAN] == SparseGPFittingGaussian
+
+        model = self.sparse_gp.serialize()
+        assert model['n_inducing_points'] == 10
+        assert model['name_model'] == SPARSE_GP_FITTING_GAUSSIAN
+
+        gp = SparseGPFittingGaussian.deserialize(model)
+        assert gp.n_inducing_points == 10
+
+    @patch('stratified_bayesian_optimization.services.gp_fitting.JSONFile.write')
+    @patch('os.mkdir')
+    def test_get_gp(self, mock_mkdir, mock_write):
+        gp = GPFittingService.from_dict({
+            'name_model': SPARSE_GP_FITTING_GAUSSIAN,
+            'problem_name': 'test_problem_sparse',
+            'type_kernel': [MATERN52_NAME],
+            'dimensions': [1],
+            'bounds_domain': [[0, 100]],
+            'type_bounds': [0],
+            'training_data': self.training_data,
+            'mle': False,
+            'cache': False,
+            'kernel_values': [20.0],
+            'mean_value': [0.5],
+            'var_noise_value': [0.1 ** 2],
+            'define_samplers': False,
+            'n_inducing_points': 7,
+        })
+
+        assert isinstance(gp, SparseGPFittingGaussian)
+        assert gp.n_inducing_points == 7
+        assert mock_write.call_args[0][0]['n_inducing_points'] == 7
+
+    def test_get_inducing_indexes(self):
+        npt.assert_almost_equal(self.sparse_gp.get_inducing_indexes(5), np.arange(5))
+        indexes = self.sparse_gp.get_inducing_indexes(30)
+        assert len(indexes) == 10
+        assert indexes[0] == 0
+        assert indexes[-1] == 29
+
+    def test_sparse_factorization(self):
+        np.random.seed(1)
+        n = 8
+        indexes = np.array([1, 4, 6])
+        matrix = np.random.normal(0, 1, (n, n))
+        cov = np.dot(matrix, matrix.transpose()) + np.identity(n)
+        noise = np.random.uniform(0.5, 1.0, n)
+
+        factorization = SparseFactorization(
+            indexes, cov[np.ix_(indexes, indexes)], cov[indexes, :], noise)
+
+        cross_cov = cov[:, indexes]
+        approx_cov = np.dot(cross_cov, np.linalg.solve(cov[np.ix_(indexes, indexes)],
+                                                       cross_cov.transpose()))
+        approx_cov += np.diag(noise)
+
+        y = np.random.normal(0, 1, n)
+        npt.assert_almost_equal(factorization.solve_cov(y), np.linalg.solve(approx_cov, y))
+        npt.assert_almost_equal(factorization.log_determinant(),
+                                np.log(np.linalg.det(approx_cov)))
+        npt.assert_almost_equal(factorization.trace_inverse(),
+                                np.trace(np.linalg.inv(approx_cov)))
+
+        z = np.random.normal(0, 1, (n, 2))
+        npt.assert_almost_equal(factorization.cho_solve(z), np.linalg.solve(approx_cov, z))
+        npt.assert_almost_equal(cho_solve(factorization, np.identity(n)), np.linalg.inv(approx_cov))
+
+        solve = factorization.posterior_cov_solve(z)
+        assert solve.shape == (n, 2)
+        npt.assert_almost_equal(np.delete(solve, indexes, axis=0), 0.0)
+        npt.assert_almost_equal(posterior_cov_solve(factorization, z), solve)
+        npt.assert_almost_equal(posterior_cov_solve(np.linalg.cholesky(cov), z),
+                                np.linalg.solve(cov, z))
+
+    def test_log_likelihood(self):
+        llh = self.sparse_gp.log_likelihood(self.parameters[0], self.parameters[1],
+                                            self.parameters[2:])
+
+        n = self.points.shape[0]
+        dtc_llh = multivariate_normal.logpdf(
+            self.evaluations, self.parameters[1] * np.ones(n), self.dtc_cov(self.parameters))
+        npt.assert_almost_equal(llh - 0.5 * n * np.log(2.0 * np.pi), dtc_llh, decimal=5)
+
+        llh_full = self.full_gp.log_likelihood(self.parameters[0], self.parameters[1],
+                                               self.parameters[2:])
+        llh_exact = self.gp.log_likelihood(self.parameters[0], self.parameters[1],
+                                           self.parameters[2:])
+        npt.assert_almost_equal(llh_full, llh_exact, decimal=5)
+
+    def test_grad_log_likelihood(self):
+        grad = self.sparse_gp.grad_log_likelihood(self.parameters[0], self.parameters[1],
+                                                  self.parameters[2:])
+
+        dh = 0.00001
+        finite_diff = FiniteDifferences.forward_difference(
+            lambda params: self.sparse_gp.log_likelihood(params[0], params[1], params[2:]),
+            self.parameters, np.array([dh]))
+
+        for i in xrange(len(self.parameters)):
+            scale = max(1.0, np.abs(grad[i]))
+            npt.assert_almost_equal(finite_diff[i] / scale, grad[i] / scale, decimal=3)
+
+    def test_compute_posterior_parameters(self):
+        points = np.array([[1.5], [50.3], [99.0]])
+
+        post = self.full_gp.compute_posterior_parameters(points)
+        post_exact = self.gp.compute_posterior_parameters(points)
+
+        npt.assert_almost_equal(post['mean'], post_exact['mean'], decimal=5)
+        npt.assert_almost_equal(post['cov'], post_exact['cov'], decimal=5)
+
+        post = self.sparse_gp.compute_posterior_parameters(points)
+
+        indexes = self.sparse_gp.get_inducing_indexes(self.points.shape[0])
+        inducing_points = self.points[indexes, :]
+        params = self.parameters[2:]
+        cov_inducing = self.gp.evaluate_cov(inducing_points, params)
+        cross_cov = self.gp.evaluate_cross_cov(inducing_points, self.points, params)
+        cov_points = self.gp.evaluate_cross_cov(points, inducing_points, params)
+
+        matrix = cov_inducing + np.dot(cross_cov, cross_cov.transpose()) / self.parameters[0]
+        mean = self.parameters[1] + np.dot(
+            cov_points, np.linalg.solve(
+                matrix, np.dot(cross_cov, self.evaluations - self.parameters[1]))) / \
+            self.parameters[0]
+        cov = self.gp.evaluate_cov(points, params) - \
+            np.dot(cov_points, np.linalg.solve(cov_inducing, cov_points.transpose())) + \
+            np.dot(cov_points, np.linalg.solve(matrix, cov_points.transpose()))
+
+        npt.assert_almost_equal(post['mean'], mean, decimal=5)
+        npt.assert_almost_equal(post['cov'], cov, decimal=5)
+        assert np.all(np.diag(post['cov']) >= 0)
+
+        post_samples = self.sparse_gp.compute_posterior_parameters_samples(
+            points, self.parameters.reshape((1, 3)))
+        npt.assert_almost_equal(post_samples['mean'][0, :], mean, decimal=5)
+        npt.assert_almost_equal(post_samples['var'][0, :], np.diag(cov), decimal=5)
+
+        grad = self.sparse_gp.gradient_posterior_parameters(points[0: 1, :])
+        dh = 0.0001
+        finite_diff = FiniteDifferences.forward_difference(
+            lambda point: self.sparse_gp.compute_posterior_parameters(
+                point.reshape((1, 1)), only_mean=True)['mean'],
+            points[0, :], np.array([dh]))
+        npt.assert_almost_equal(finite_diff[0], grad['mean'], decimal=4)
+
+    def test_add_points_evaluations(self):
+        self.sparse_gp.log_likelihood(self.parameters[0], self.parameters[1],
+                                      self.parameters[2:])
+        self.sparse_gp.clean_cache()
+        self.sparse_gp.add_points_evaluations(np.array([[33.3]]), np.array([1.0]))
+
+        assert self.sparse_gp.data['points'].shape[0] == 31
+        assert len(self.sparse_gp.cache_chol_cov) == 0
+
+        post = self.sparse_gp.compute_posterior_parameters(np.array([[33.3]]))
+        assert post['cov'][0, 0] >= 0
+
+    def test_bayesian_quadrature(self):
+        np.random.seed(5)
+        n_points = 20
+        points = np.linspace(0, 100, n_points).reshape([n_points, 1])
+        tasks = np.random.randint(2, size=(n_points, 1))
+        points = np.concatenate((points, tasks), axis=1)
+        evaluations = np.sin(points[:, 0] / 10.0) + points[:, 1]
+
+        training_data = {
+            'evaluations': list(evaluations),
+            'points': points,
+            "var_noise": [],
+        }
+
+        kwargs = {
+            'kernel_values': [20.0, 0.0, 0.0, 0.0],
+            'mean_value': [0.0],
+            'var_noise_value': [0.01],
+        }
+        gp = GPFittingGaussian(
+            [PRODUCT_KERNELS_SEPARABLE, MATERN52_NAME, TASKS_KERNEL_NAME], training_data,
+            [2, 1, 2], bounds_domain=[[0, 100], [0, 1]], type_bounds=[0, 1], **kwargs)
+        sparse_gp = SparseGPFittingGaussian(
+            [PRODUCT_KERNELS_SEPARABLE, MATERN52_NAME, TASKS_KERNEL_NAME], training_data,
+            [2, 1, 2], bounds_domain=[[0, 100], [0, 1]], type_bounds=[0, 1],
+            n_inducing_points=20, **kwargs)
+
+        bq = BayesianQuadrature(gp, [0], UNIFORM_FINITE, {TASKS: 2})
+        sparse_bq = BayesianQuadrature(sparse_gp, [0], UNIFORM_FINITE, {TASKS: 2})
+
+        point = np.array([[52.1]])
+        post = bq.compute_posterior_parameters(point)
+        sparse_post = sparse_bq.compute_posterior_parameters(point)
+
+        npt.assert_almost_equal(sparse_post['mean'], post['mean'], decimal=5)
+        npt.assert_almost_equal(sparse_post['cov'], post['cov'], decimal=5)
+
+    def test_noiseless_model(self):
+        gp = SparseGPFittingGaussian(
+            [MATERN52_NAME], self.training_data, [1], bounds_domain=[[0, 100]],
+            kernel_values=[20.0], n_inducing_points=10)
+
+        assert gp.var_noise.value[0] == 0
+        post = gp.compute_posterior_parameters(np.array([[1.5], [50.3]]))
+        assert np.all(np.isfinite(post['mean']))
+        assert np.all(np.diag(post['cov']) >= -1e-6)
+        assert np.isfinite(gp.log_likelihood(0.0, 0.0, np.array([20.0])))
@@ -21,6 +21,8 @@ from stratified_bayesian_optimization.lib.constant import (
     POSTERIOR_MEAN,
     B_NEW,
     DOGLEG,
+    GAMMA,
+    WEIGHTED_UNIFORM_FINITE,
 )
 from stratified_bayesian_optimization.numerical_tools.bayesian_quadrature import BayesianQuadrature
 from stratified_bayesian_optimization.kernels.matern52 import Matern52
@@ -475,3 +477,205 @@ class TestBayesianQuadrature(unittest.TestCase):
 
         npt.assert_almost_equal(finite_diff[(0, 0)], hessian[0, 0])
 
+
+class TestVectorizedQuadratures(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(1)
+        points = np.random.uniform(0, 100, (12, 1))
+        tasks = np.random.randint(3, size=(12, 1))
+        self.points = np.concatenate((points, tasks), axis=1)
+        training_data = {
+            "evaluations": list(np.sin(self.points[:, 0] / 10.0) + self.points[:, 1]),
+            "points": self.points,
+            "var_noise": []}
+        self.gp = GPFittingGaussian(
+            [PRODUCT_KERNELS_SEPARABLE, MATERN52_NAME, TASKS_KERNEL_NAME], training_data,
+            [2, 1, 3], bounds_domain=[[0, 100], [0, 1, 2]], type_bounds=[0, 1],
+            kernel_values=[20.0, 0.1, 0.2, 0.3, -0.1, 0.2, 0.1], mean_value=[0.0],
+            var_noise_value=[0.01])
+        self.bq = BayesianQuadrature(self.gp, [0], UNIFORM_FINITE, {TASKS: 3})
+        self.parameters_kernel = self.gp.kernel.hypers_values_as_array
+        self.discretization = np.linspace(0, 100, 7).reshape((7, 1))
+        self.candidate_points = np.array([[3.0, 1.0], [50.0, 2.0]])
+
+    def test_evaluate_quadrature_cross_cov_points(self):
+        expected = np.array([
+            self.bq.evaluate_quadrature_cross_cov(self.discretization[i:i + 1, :], self.points,
+                                                  self.parameters_kernel)
+            for i in xrange(7)])
+
+        value = self.bq.evaluate_quadrature_cross_cov_points(self.discretization, self.points,
+                                                             self.parameters_kernel)
+        npt.assert_almost_equal(value, expected)
+
+        value = self.bq.evaluate_quadrature_cross_cov_points(
+            self.discretization, self.points, self.parameters_kernel, max_evaluations=4)
+        npt.assert_almost_equal(value, expected)
+
+        points = np.random.uniform(0, 10, (10, 2))
+        training_data = {
+            "evaluations": list(np.sin(points[:, 0]) + points[:, 1]),
+            "points": points,
+            "var_noise": []}
+        gp = GPFittingGaussian([MATERN52_NAME], training_data, [2], kernel_values=[2.0, 3.0],
+                               mean_value=[0.0], var_noise_value=[0.01],
+                               bounds_domain=[[0, 10], [0, 10]])
+        bq = BayesianQuadrature(gp, [0], GAMMA, {'a': [2.0], 'scale': [1.0]})
+        parameters_kernel = gp.kernel.hypers_values_as_array
+        discretization = self.discretization / 10.0
+
+        expected = np.array([
+            bq.evaluate_quadrature_cross_cov(discretization[i:i + 1, :], points,
+                                             parameters_kernel)
+            for i in xrange(7)])
+        value = bq.evaluate_quadrature_cross_cov_points(discretization, points,
+                                                        parameters_kernel, max_evaluations=25)
+        npt.assert_almost_equal(value, expected)
+
+    def test_evaluate_quadrate_cov_points(self):
+        expected = np.array([
+            self.bq.evaluate_quadrate_cov(self.discretization[i:i + 1, :], self.parameters_kernel)
+            for i in xrange(7)])
+
+        value = self.bq.evaluate_quadrate_cov_points(self.discretization, self.parameters_kernel)
+        npt.assert_almost_equal(value, expected)
+
+        value = self.bq.evaluate_quadrate_cov_points(
+            self.discretization, self.parameters_kernel, max_evaluations=4)
+        npt.assert_almost_equal(value, expected)
+
+        parameters_distribution = {
+            'weights': [0.2, 0.3, 0.5],
+            'domain_random': [[0], [1], [2]],
+        }
+        bq = BayesianQuadrature(self.gp, [0], WEIGHTED_UNIFORM_FINITE, parameters_distribution)
+        expected = np.array([
+            bq.evaluate_quadrate_cov(self.discretization[i:i + 1, :], self.parameters_kernel)
+            for i in xrange(7)])
+        value = bq.evaluate_quadrate_cov_points(self.discretization, self.parameters_kernel,
+                                                max_evaluations=6)
+        npt.assert_almost_equal(value, expected)
+
+    def test_weighted_uniform_finite_samples(self):
+        parameters_distribution = {
+            'weights': [0.2, 0.3, 0.5],
+            'domain_random': [[0], [1], [2]],
+        }
+        bq = BayesianQuadrature(self.gp, [0], WEIGHTED_UNIFORM_FINITE, parameters_distribution)
+        expected = np.array([
+            bq.evaluate_quadrature_cross_cov(self.discretization[i:i + 1, :], self.points,
+                                             self.parameters_kernel)
+            for i in xrange(7)])
+        value = bq.evaluate_quadrature_cross_cov_points(self.discretization, self.points,
+                                                        self.parameters_kernel)
+        npt.assert_almost_equal(value, expected)
+
+        parameters_distribution['n_samples'] = 5
+        bq = BayesianQuadrature(self.gp, [0], WEIGHTED_UNIFORM_FINITE, parameters_distribution)
+        value = bq.evaluate_quadrature_cross_cov_points(self.discretization, self.points,
+                                                        self.parameters_kernel)
+        assert value.shape == (7, 12)
+
+    def test_compute_vectors_b(self):
+        vectors = self.bq.compute_vectors_b(
+            self.discretization, self.candidate_points, self.points, self.parameters_kernel,
+            True, True, True)
+
+        for i in xrange(7):
+            point = self.discretization[i:i + 1, :]
+            npt.assert_almost_equal(
+                vectors['vec_covs'][i, :],
+                self.bq.evaluate_quadrature_cross_cov(point, self.points, self.parameters_kernel))
+            npt.assert_almost_equal(
+                vectors['b_new'][i, :],
+                self.bq.evaluate_quadrature_cross_cov(point, self.candidate_points,
+                                                      self.parameters_kernel))
+
+        vectors_b = self.bq.compute_vectors_b(
+            self.discretization, self.candidate_points, self.points, self.parameters_kernel,
+            False, True, False)
+        assert vectors_b['vec_covs'] is None
+        npt.assert_almost_equal(vectors_b['b_new'], vectors['b_new'])
+
+    def test_compute_posterior_parameters_kg_many_cp(self):
+        value = self.bq.compute_posterior_parameters_kg_many_cp(
+            self.discretization, self.candidate_points, cache=False)
+
+        for j in xrange(2):
+            expected = self.bq.compute_posterior_parameters_kg(
+                self.discretization, self.candidate_points[j:j + 1, :], cache=False,
+                parallel=False)
+            npt.assert_almost_equal(value['a'], expected['a'])
+            npt.assert_almost_equal(value['b'][:, j], expected['b'])
+
+    def test_incremental_quadratures(self):
+        candidate_point = self.candidate_points[0:1, :]
+        self.bq.compute_posterior_parameters_kg(self.discretization, candidate_point,
+                                                parallel=False)
+        index = (tuple(self.parameters_kernel), )
+        assert self.bq._get_cached_data(index, QUADRATURES).shape == (7, 12)
+
+        self.bq.clean_cache()
+        self.gp.add_points_evaluations(np.array([[33.0, 1.0]]), np.array([1.5]))
+
+        with patch.object(BayesianQuadrature, 'compute_vectors_b',
+                          wraps=self.bq.compute_vectors_b) as mock_vectors:
+            value = self.bq.compute_posterior_parameters_kg(
+                self.discretization, candidate_point, parallel=False)
+            npt.assert_almost_equal(mock_vectors.call_args_list[0][0][2],
+                                    np.array([[33.0, 1.0]]))
+        assert self.bq._get_cached_data(index, QUADRATURES).shape == (7, 13)
+
+        bq = BayesianQuadrature(self.gp, [0], UNIFORM_FINITE, {TASKS: 3})
+        expected = bq.compute_posterior_parameters_kg(self.discretization, candidate_point,
+                                                      parallel=False)
+        npt.assert_almost_equal(value['a'], expected['a'])
+        npt.assert_almost_equal(value['b'], expected['b'])
+
+        mean = bq.compute_posterior_parameters(self.discretization[0:1, :], cache=False)['mean']
+        npt.assert_almost_equal(value['a'][0], mean)
+
+        self.gp.data['points'] = self.gp.data['points'][::-1, :]
+        assert self.bq._get_cached_quadratures(index, self.discretization,
+                                               self.parameters_kernel) is None
+        assert len(self.bq.cache_quadratures) == 0
+
+    def test_compute_posterior_parameters_samples(self):
+        parameters = np.array([
+            [0.01, 0.0] + list(self.parameters_kernel),
+            [0.1, 0.5, 10.0, 0.2, 0.1, 0.3, 0.0, 0.1, 0.2],
+        ])
+
+        values = self.bq.compute_posterior_parameters_samples(self.discretization, parameters)
+        means = self.bq.compute_posterior_parameters_samples(
+            self.discretization, parameters, only_mean=True)
+        assert values['mean'].shape == (2, 7)
+        assert means['var'] is None
+        npt.assert_almost_equal(means['mean'], values['mean'])
+
+        for i in xrange(2):
+            for j in xrange(7):
+                post = self.bq.compute_posterior_parameters(
+                    self.discretization[j:j + 1, :], parameters[i, 0], parameters[i, 1],
+                    parameters[i, 2:], cache=False)
+                npt.assert_almost_equal(values['mean'][i, j], post['mean'][0])
+                npt.assert_almost_equal(values['var'][i, j], post['cov'])
+
+    def test_clear_cache(self):
+        parameters_kernel = np.array([10.0, 0.2, 0.1, 0.3, 0.0, 0.1, 0.2])
+        candidate_point = self.candidate_points[0:1, :]
+
+        # The data of the other samples of the hyperparameters is kept by default
+        self.bq.get_parameters_for_samples(True, candidate_point, self.parameters_kernel, 0.01,
+                                           0.0)
+        self.bq.get_parameters_for_samples(True, candidate_point, parameters_kernel, 0.01, 0.0)
+        assert len(self.bq.cache_sample) == 2
+        assert len(self.gp.cache_chol_cov) == 2
+
+        parameters_kernel = parameters_kernel + 1.0
+        self.bq.get_parameters_for_samples(True, candidate_point, parameters_kernel, 0.01, 0.0,
+                                           clear_cache=True)
+        assert self.bq.cache_sample.keys() == [
+            (tuple(candidate_point[0, :]), tuple(parameters_kernel))]
+        assert len(self.gp.cache_chol_cov) == 1
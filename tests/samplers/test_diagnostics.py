@@ -0,0 +1,51 @@
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+
+from stratified_bayesian_optimization.samplers.diagnostics import MCMCDiagnostics
+
+
+class TestMCMCDiagnostics(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(1)
+        self.independent_chains = np.random.normal(0, 1, (4, 500, 2))
+
+        chains = np.zeros((4, 500, 1))
+        for i in xrange(1, 500):
+            chains[:, i, :] = 0.95 * chains[:, i - 1, :] + np.random.normal(0, 1, (4, 1))
+        self.correlated_chains = chains
+
+    def test_potential_scale_reduction(self):
+        r_hat = MCMCDiagnostics.potential_scale_reduction(self.independent_chains)
+        assert r_hat.shape == (2,)
+        npt.assert_almost_equal(r_hat, np.ones(2), decimal=2)
+
+        chains = self.independent_chains.copy()
+        chains[0, :, :] += 5.0
+        r_hat = MCMCDiagnostics.potential_scale_reduction(chains)
+        assert np.all(r_hat > 1.5)
+
+        r_hat = MCMCDiagnostics.potential_scale_reduction(np.ones((3, 10, 1)))
+        npt.assert_almost_equal(r_hat, np.ones(1))
+
+    def test_effective_sample_size(self):
+        ess = MCMCDiagnostics.effective_sample_size(self.independent_chains)
+        assert ess.shape == (2,)
+        assert np.all(ess > 1500)
+        assert np.all(ess <= 2000)
+
+        ess = MCMCDiagnostics.effective_sample_size(self.correlated_chains)
+        assert ess[0] < 200
+
+        ess = MCMCDiagnostics.effective_sample_size(np.ones((3, 10, 1)))
+        npt.assert_almost_equal(ess, np.array([30.0]))
+
+    def test_diagnostics(self):
+        diagnostics = MCMCDiagnostics.diagnostics(self.independent_chains)
+        npt.assert_almost_equal(
+            diagnostics['r_hat'],
+            MCMCDiagnostics.potential_scale_reduction(self.independent_chains))
+        npt.assert_almost_equal(
+            diagnostics['ess'], MCMCDiagnostics.effective_sample_size(self.independent_chains))
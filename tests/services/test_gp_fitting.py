@@ -71,6 +71,8 @@ class TestGpFitting(unittest.TestCase):
             'same_correlation': False,
             'start_point_sampler': model['start_point_sampler'],
             'samples_parameters': model['samples_parameters'],
+            'n_chains': 1,
+            'start_points_chains': [],
         }
 
         estimation = gp.compute_posterior_parameters(np.array([[1.4], [2.4], [0], [-9.9], [8.5],
@@ -107,6 +109,8 @@ class TestGpFitting(unittest.TestCase):
             'same_correlation': True,
             'start_point_sampler': model['start_point_sampler'],
             'samples_parameters': model['samples_parameters'],
+            'n_chains': 1,
+            'start_points_chains': [],
         }
 
 
@@ -143,6 +147,8 @@ class TestGpFitting(unittest.TestCase):
             'same_correlation': False,
             'start_point_sampler': model['start_point_sampler'],
             'samples_parameters': model['samples_parameters'],
+            'n_chains': 1,
+            'start_points_chains': [],
         }
 
     @patch('os.path.exists')